@@ -1,6 +1,8 @@
-from fastapi import APIRouter, status, Response
+from fastapi import APIRouter, Depends, status, Response
 from data_response.base_response import APIResponseBase
 from logger import logger
+from helper.auth import AccessTokenData, get_current_user
+from helper.metrics import metrics
 
 
 from api.v1 import customer
@@ -13,6 +15,7 @@ from api.v1 import excel
 from api.v1 import query_suggestions
 from api.v1 import chat
 from api.v1 import chart
+from api.v1 import jobs
 from api.v2 import query as query_v2
 
 router = APIRouter()
@@ -27,6 +30,7 @@ router.include_router(query_suggestions.router, prefix="/v1")
 router.include_router(excel.router, prefix="/v1")
 router.include_router(chart.router, prefix="/v1")
 router.include_router(chat.router, prefix="/v1")
+router.include_router(jobs.router, prefix="/v1")
 
 router.include_router(query_v2.router, prefix="/v2")
 
@@ -54,3 +58,28 @@ async def get_system_health(response: Response) -> APIResponseBase:
         message="System is healthy",
         data={"status": "UP"}
     )
+
+
+@router.get("/metrics")
+async def get_metrics(
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+) -> APIResponseBase:
+    """
+    Get the in-process metrics of this worker.
+
+    The queue depths, pipeline timings and cache statistics are internal, only
+    authenticated users can read them.
+
+    Args:
+        response (Response): The response object to be modified.
+        current_user (AccessTokenData, optional): The current user. Defaults to Depends(get_current_user).
+
+    Returns:
+        APIResponseBase: An APIResponseBase object with the counters and observations.
+    """
+    response.status_code = status.HTTP_200_OK
+    return APIResponseBase.success_response(
+        message="Metrics fetched successfully",
+        data=metrics.snapshot()
+    )
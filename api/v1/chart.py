@@ -8,12 +8,17 @@ from fastapi import (
     Response,
 )
 from fastapi.responses import StreamingResponse
+from typing import Optional
 from data_response.base_response import APIResponseBase
 from helper.auth import get_current_user, AccessTokenData
 from logger import logger
 from db import get_db
 from db.queries.chat_history import ChatHistoryQuery
 from db.queries.chart import ChartQuery
+from db.queries.user_documents import UserDocumentQuery
+from schemas.query import CustomerQueryRequest
+from helper.query_jobs import CHART_QUERY_JOB
+from api.v1.jobs import accept_query_job
 from sqlalchemy.orm import Session
 from config import Config
 import random
@@ -23,6 +28,62 @@ import os, io
 router = APIRouter(prefix="/chart", tags=["chart"])
 
 
+@router.post("/")
+async def create_chart(
+    request: CustomerQueryRequest,
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
+) -> APIResponseBase:
+    """
+    Queue the generation of a chart for a query on a csv or excel document.
+
+    Generating a chart takes several LLM calls, so it always runs on the query worker:
+    the response is a 202 with the id of the job to poll at `/v1/jobs/{job_id}`.
+
+    Args:
+        request (CustomerQueryRequest): The request object containing the query details.
+        response (Response): The response object to be returned.
+        current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        idempotency_key (Optional[str], optional): The `Idempotency-Key` header, a retried
+            request with the same key gets the job of the first one. Defaults to Header(None).
+
+    Returns:
+        APIResponseBase: The API response containing the status of the job.
+    """
+    if request.chat_uuid is None:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(message="chat_uuid is required")
+
+    user_doc = UserDocumentQuery.get_user_document_by_id(db, request.data_source_id)
+    if not user_doc:
+        logger.error("Document not found")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(message="Document not found")
+
+    if str(user_doc.customer_uuid) != current_user.uuid:
+        logger.error("Unauthorized access")
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        return APIResponseBase.unauthorized(message="Unauthorized access")
+
+    if not ChatHistoryQuery.is_valid_chat_history(
+        db,
+        str(request.chat_uuid),
+        user_doc.document_type,
+        current_user.uuid,
+        request.data_source_id,
+    ):
+        logger.error("Invalid chat history")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(message="Invalid chat uuid")
+
+    return await accept_query_job(
+        response, CHART_QUERY_JOB, request, current_user, idempotency_key
+    )
+
+
 @router.get("/chat/{chat_uuid}")
 async def get_chart_by_chat_uuid(
     chat_uuid: str, response: Response, db: Session = Depends(get_db)
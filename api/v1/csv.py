@@ -7,7 +7,6 @@ from fastapi import (
     BackgroundTasks,
     Response,
 )
-from fastapi.responses import StreamingResponse
 from data_response.base_response import APIResponseBase
 from helper.auth import get_current_user, AccessTokenData
 from logger import logger
@@ -15,13 +14,25 @@ from db import get_db
 from db.queries.user_documents import UserDocumentQuery
 from db.models.user_document import UserDocument
 from db.queries.chat_history import ChatHistoryQuery
-from schemas.user_documents import UserDocumentUploadResponse, UserDocumentUpdateRequest
+from schemas.user_documents import (
+    UserDocumentStatusResponse,
+    UserDocumentUploadResponse,
+    UserDocumentUpdateRequest,
+)
 from sqlalchemy.orm import Session
 from config import Config
 import random
 import os, io
 from helper.openai import create_document_embedding
-from helper.aws_s3 import upload_obj_to_s3, download_from_s3, delete_s3_obj
+from helper.aws_s3 import delete_s3_obj
+from helper.dataframe_cache import invalidate_user_document
+from helper.columnar import delete_columnar_copy
+from helper.ingestion import enqueue_document_ingestion
+from helper.concurrency import run_blocking
+from helper.s3_cache import s3_object_cache
+from helper.vector_store import delete_document_vectors
+from helper.s3_upload import UploadFailedError, UploadTooLargeError, upload_file_to_s3
+from helper.downloads import create_download_response
 
 
 router = APIRouter(prefix="/csv", tags=["csv"])
@@ -87,14 +98,22 @@ async def upload_csv(
     # with open(filename, "wb") as f:
     #     f.write(file.file.read())
     # upload the file to s3
-    s3_file_upload_url = upload_obj_to_s3(
-        file.file, file.filename, f"{current_user.uuid}/csv"
-    )
-    if not s3_file_upload_url:
+    try:
+        s3_file_upload_url = await upload_file_to_s3(
+            file, f"{current_user.uuid}/csv/{file.filename}"
+        )
+    except UploadTooLargeError:
+        logger.error("File is too large")
+        response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        return APIResponseBase.payload_too_large(message="File is too large")
+    except UploadFailedError:
         logger.error("Failed to upload file to s3")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return APIResponseBase.internal_server_error(message="Failed to upload file")
 
+    # a re-uploaded file replaces the object under the same key
+    s3_object_cache.invalidate(f"{current_user.uuid}/csv/{file.filename}")
+
     new_csv_doc = UserDocumentQuery.create_user_document(
         db, current_user.uuid, "csv", file.filename, s3_file_upload_url, "processing"
     )
@@ -111,7 +130,9 @@ async def upload_csv(
     )
 
     db.commit()
-    # background_tasks.add_task(process_embedding, db, new_csv_doc)
+
+    # columnar copy, profile, embedding and suggestions are built by the worker
+    await run_blocking(enqueue_document_ingestion, new_csv_doc.id)
 
     response.status_code = status.HTTP_201_CREATED
     return APIResponseBase.created(
@@ -129,20 +150,22 @@ async def upload_csv(
 async def download_csv_document(
     document_id: int,
     response: Response,
+    range: str = Header(None),
     current_user: AccessTokenData = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> StreamingResponse:
+) -> Response:
     """
     Downloads the CSV document with the given ID.
 
     Args:
         document_id (int): The ID of the CSV document to download.
         response (Response): The HTTP response object.
+        range (str, optional): The byte range requested by the client. Defaults to Header(None).
         current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
         db (Session, optional): The database session. Defaults to Depends(get_db).
 
     Returns:
-        StreamingResponse: The streaming response containing the CSV file.
+        Response: The streamed CSV file, or the API response containing the download status.
     """
 
     csv_doc = UserDocumentQuery.get_user_document_by_id(db, document_id, "csv")
@@ -157,29 +180,65 @@ async def download_csv_document(
         response.status_code = status.HTTP_401_UNAUTHORIZED
         return APIResponseBase.unauthorized(message="Unauthorized access")
 
-    # download the file from s3
+    # stream the file in chunks, or redirect to a presigned url
     # extract object url from s3 url
     object_url = csv_doc.document_url.split("amazonaws.com/")[-1]
-    download_status = download_from_s3(object_url)
-    if not download_status:
+    download_response = await run_blocking(
+        create_download_response, object_url, csv_doc.document_name, range
+    )
+    if download_response is None:
         logger.error("Failed to download file from s3")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return APIResponseBase.internal_server_error(
             message="Failed to download file from s3"
         )
 
-    # return the file
-    file_name = csv_doc.document_name
-    file_path = f"./tmp/output/{file_name}"
-    file = open(file_path, "rb")
-    file_content = io.BytesIO(file.read())
-    file.close()
-    os.remove(file_path)
+    return download_response
+
+
+@router.get("/status/{document_id}")
+def get_csv_document_status(
+    document_id: int,
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> APIResponseBase:
+    """
+    Retrieves the ingestion status of the CSV document with the given ID.
+
+    Args:
+        document_id (int): The ID of the CSV document.
+        response (Response): The HTTP response object.
+        current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        APIResponseBase: The API response containing the status and data.
+    """
+
+    csv_doc = UserDocumentQuery.get_user_document_by_id(db, document_id, "csv")
+
+    if not csv_doc:
+        logger.error("CSV document not found")
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return APIResponseBase.not_found(message="CSV document not found")
+
+    if str(csv_doc.customer_uuid) != current_user.uuid:
+        logger.error("Unauthorized access")
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        return APIResponseBase.unauthorized(message="Unauthorized access")
 
-    response.headers["Content-Disposition"] = f"attachment; filename={file_name}"
-    response.headers["Content-Type"] = "application/octet-stream"
     response.status_code = status.HTTP_200_OK
-    return StreamingResponse(file_content, media_type="application/octet-stream")
+    return APIResponseBase.success_response(
+        message="CSV document status retrieved successfully",
+        data=UserDocumentStatusResponse(
+            document_id=csv_doc.id,
+            ingestion_status=csv_doc.ingestion_status,
+            ingestion_error=csv_doc.ingestion_error,
+            is_embedded=bool(csv_doc.is_embedded),
+            profile=csv_doc.profile,
+        ),
+    )
 
 
 @router.get("/{document_id}")
@@ -265,6 +324,7 @@ def update_csv_document_name(
 
     UserDocumentQuery.update_user_document(db, document_id, request.document_name)
     db.commit()
+    invalidate_user_document(document_id)
 
     response.status_code = status.HTTP_200_OK
     return APIResponseBase.success_response(
@@ -317,15 +377,26 @@ def delete_csv_document(
     # os.remove(csv_doc.document_url)
     object_url = csv_doc.document_url.split("amazonaws.com/")[-1]
     s3_delete_status = delete_s3_obj(object_url)
+    delete_columnar_copy(object_url)
+    s3_object_cache.invalidate(object_url)
     if not s3_delete_status:
         logger.error("Failed to delete file from s3")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return APIResponseBase.internal_server_error(message="Failed to delete file")
+
+    # re-uploads of the same file share its vectors, they go with the last of them
+    if (
+        csv_doc.is_embedded
+        and UserDocumentQuery.count_user_documents_by_embedding_path(db, csv_doc.embed_url)
+        == 1
+    ):
+        delete_document_vectors(csv_doc.embed_url)
     
     if chat_history:
         ChatHistoryQuery.delete_chat_history_by_uuid(db, chat_history.uuid)
     UserDocumentQuery.delete_user_document(db, document_id)
     db.commit()
+    invalidate_user_document(document_id)
 
     response.status_code = status.HTTP_200_OK
     return APIResponseBase.success_response(
@@ -12,7 +12,12 @@ from sqlalchemy.orm import Session
 from db.queries.db_config import DBConfigQuery
 from logger import logger
 from helper.pipelines.db_query import get_db_connection_string
+from helper.db_engines import engine_registry
+from helper.schema_cache import get_db_schema_entry, invalidate_db_schema
+from helper.schema_retrieval import drop_schema_index
+from helper.concurrency import run_blocking
 from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
 
 
 router = APIRouter(prefix="/db-operation", tags=["db_operation"])
@@ -138,15 +143,20 @@ async def test_db_connection(
         request.db_config["dbname"],
     )
 
-    engine = create_engine(db_url)
-
+    # an unsaved configuration is checked once, its engine must not be kept in the
+    # registry, nor keep a pool of connections open
+    engine = None
     try:
+        engine = create_engine(db_url, poolclass=NullPool)
         with engine.connect() as connection:
             connection.execute(text("SELECT 1;"))
     except Exception as e:
         logger.error(f"Failed to connect to db: {e}")
         response.status_code = status.HTTP_400_BAD_REQUEST
         return APIResponseBase.bad_request(message="Failed to connect to db")
+    finally:
+        if engine is not None:
+            engine.dispose()
 
     return APIResponseBase.success_response(
         message="DB connection successful", data={"status": "success"}
@@ -182,6 +192,8 @@ async def update_db_config(
         return APIResponseBase.bad_request(message="Failed to update db config")
 
     db.commit()
+    engine_registry.dispose(db_config_id)
+    invalidate_db_schema(db_config_id)
 
     response.status_code = status.HTTP_200_OK
     return APIResponseBase.success_response(
@@ -217,6 +229,9 @@ async def delete_db_config(
     DBConfigQuery.delete_db_config_by_id(db, db_config_id)
     ChatHistoryQuery.delete_chat_history_by_uuid(db, chat_history.uuid)
     db.commit()
+    engine_registry.dispose(db_config_id)
+    invalidate_db_schema(db_config_id)
+    await run_blocking(drop_schema_index, db_config_id)
 
     response.status_code = status.HTTP_200_OK
     return APIResponseBase.success_response(
@@ -225,3 +240,59 @@ async def delete_db_config(
             "message": "DB config deleted successfully",
         },
     )
+
+
+@router.post("/{db_config_id}/refresh-schema")
+async def refresh_db_config_schema(
+    db_config_id: int,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: AccessTokenData = Depends(get_current_user),
+) -> APIResponseBase:
+    """
+    Rebuild the cached schema of a database configuration.
+
+    Args:
+        db_config_id (int): The ID of the database configuration.
+        response (Response): The response object to be returned.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (AccessTokenData, optional): The current user. Defaults to Depends(get_current_user).
+
+    Returns:
+        APIResponseBase: The API response containing the refreshed schema version.
+    """
+
+    db_config = DBConfigQuery.get_db_config_by_id(db, db_config_id, current_user.uuid)
+    if not db_config:
+        logger.error("DB config not found")
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return APIResponseBase.not_found(message="DB config not found")
+
+    db_url = get_db_connection_string(
+        db_config.db_type,
+        db_config.db_config["user"],
+        db_config.db_config["password"],
+        db_config.db_config["hostname"],
+        db_config.db_config["port"],
+        db_config.db_config["dbname"],
+    )
+
+    try:
+        engine = engine_registry.get_engine(db_url, db_config_id)
+        schema_entry = await run_blocking(
+            get_db_schema_entry, engine, db_url, db_config_id, force_refresh=True
+        )
+    except Exception as e:
+        logger.error(f"Failed to refresh db schema: {e}")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(message="Failed to refresh db schema")
+
+    response.status_code = status.HTTP_200_OK
+    return APIResponseBase.success_response(
+        message="DB schema refreshed successfully",
+        data={
+            "db_config_id": db_config_id,
+            "table_count": len(schema_entry["tables"]),
+            "schema_hash": schema_entry["schema_hash"],
+        },
+    )
@@ -7,19 +7,30 @@ from fastapi import (
     BackgroundTasks,
     Response,
 )
-from fastapi.responses import StreamingResponse
 from data_response.base_response import APIResponseBase
 from helper.auth import get_current_user, AccessTokenData
 from logger import logger
 from db import get_db
 from db.queries.user_documents import UserDocumentQuery
 from db.queries.chat_history import ChatHistoryQuery
-from schemas.user_documents import UserDocumentUploadResponse, UserDocumentUpdateRequest
+from schemas.user_documents import (
+    UserDocumentStatusResponse,
+    UserDocumentUploadResponse,
+    UserDocumentUpdateRequest,
+)
 from sqlalchemy.orm import Session
 from config import Config
 import random
 from helper.openai import create_document_embedding
-from helper.aws_s3 import upload_obj_to_s3, download_from_s3, delete_s3_obj
+from helper.aws_s3 import delete_s3_obj
+from helper.dataframe_cache import invalidate_user_document
+from helper.columnar import delete_columnar_copy
+from helper.ingestion import enqueue_document_ingestion
+from helper.concurrency import run_blocking
+from helper.s3_cache import s3_object_cache
+from helper.vector_store import delete_document_vectors
+from helper.s3_upload import UploadFailedError, UploadTooLargeError, upload_file_to_s3
+from helper.downloads import create_download_response
 import os, io
 
 router = APIRouter(prefix="/excel", tags=["excel"])
@@ -50,14 +61,22 @@ async def upload_csv(
     # filename = f"./tmp/{random.randbytes(8).hex()}.xlsx"
     # with open(filename, "wb") as f:
     #     f.write(file.file.read())
-    s3_file_upload_url = upload_obj_to_s3(
-        file.file, file.filename, f"{current_user.uuid}/excel"
-    )
-    if not s3_file_upload_url:
+    try:
+        s3_file_upload_url = await upload_file_to_s3(
+            file, f"{current_user.uuid}/excel/{file.filename}"
+        )
+    except UploadTooLargeError:
+        logger.error("File is too large")
+        response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        return APIResponseBase.payload_too_large(message="File is too large")
+    except UploadFailedError:
         logger.error("Failed to upload file")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return APIResponseBase.internal_server_error(message="Failed to upload file")
 
+    # a re-uploaded file replaces the object under the same key
+    s3_object_cache.invalidate(f"{current_user.uuid}/excel/{file.filename}")
+
     new_excel_doc = UserDocumentQuery.create_user_document(
         db, current_user.uuid, "excel", file.filename, s3_file_upload_url, "processing"
     )
@@ -75,6 +94,9 @@ async def upload_csv(
 
     db.commit()
 
+    # columnar copy, profile, embedding and suggestions are built by the worker
+    await run_blocking(enqueue_document_ingestion, new_excel_doc.id)
+
     response.status_code = status.HTTP_201_CREATED
     return APIResponseBase.created(
         message="Excel file uploaded successfully",
@@ -91,20 +113,22 @@ async def upload_csv(
 async def download_excel_document(
     document_id: int,
     response: Response,
+    range: str = Header(None),
     current_user: AccessTokenData = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> APIResponseBase:
+) -> Response:
     """
     Download the Excel document by its ID.
 
     Args:
         document_id (int): The ID of the document to download.
         response (Response): The response object to be returned.
+        range (str, optional): The byte range requested by the client. Defaults to Header(None).
         current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
         db (Session, optional): The database session. Defaults to Depends(get_db).
 
     Returns:
-        APIResponseBase: The API response containing the download status.
+        Response: The streamed file, or the API response containing the download status.
     """
     excel_doc = UserDocumentQuery.get_user_document_by_id(db, document_id, "excel")
     if not excel_doc:
@@ -117,27 +141,63 @@ async def download_excel_document(
         response.status_code = status.HTTP_401_UNAUTHORIZED
         return APIResponseBase.unauthorized(message="Unauthorized access")
 
-    # download the file from s3
+    # stream the file in chunks, or redirect to a presigned url
     # extract object url from s3 url
     object_url = excel_doc.document_url.split("amazonaws.com/")[-1]
-    download_status = download_from_s3(object_url)
-    if not download_status:
+    download_response = await run_blocking(
+        create_download_response, object_url, excel_doc.document_name, range
+    )
+    if download_response is None:
         logger.error("Failed to download file")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return APIResponseBase.internal_server_error(message="Failed to download file")
 
-    # return the data
-    file_name = excel_doc.document_name
-    file_path = f"./tmp/output/{file_name}"
-    file = open(file_path, "rb")
-    file_content = io.BytesIO(file.read())
-    file.close()
-    os.remove(file_path)
+    return download_response
+
+
+@router.get("/status/{document_id}")
+def get_excel_document_status(
+    document_id: int,
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> APIResponseBase:
+    """
+    Retrieves the ingestion status of the Excel document with the given ID.
+
+    Args:
+        document_id (int): The ID of the Excel document.
+        response (Response): The HTTP response object.
+        current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        APIResponseBase: The API response containing the status and data.
+    """
+
+    excel_doc = UserDocumentQuery.get_user_document_by_id(db, document_id, "excel")
+
+    if not excel_doc:
+        logger.error("Excel document not found")
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return APIResponseBase.not_found(message="Excel document not found")
+
+    if str(excel_doc.customer_uuid) != current_user.uuid:
+        logger.error("Unauthorized access")
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        return APIResponseBase.unauthorized(message="Unauthorized access")
 
-    response.headers["Content-Disposition"] = f"attachment; filename={file_name}"
-    response.headers["Content-Type"] = "application/octet-stream"
     response.status_code = status.HTTP_200_OK
-    return StreamingResponse(file_content, media_type="application/octet-stream")
+    return APIResponseBase.success_response(
+        message="Excel document status retrieved successfully",
+        data=UserDocumentStatusResponse(
+            document_id=excel_doc.id,
+            ingestion_status=excel_doc.ingestion_status,
+            ingestion_error=excel_doc.ingestion_error,
+            is_embedded=bool(excel_doc.is_embedded),
+            profile=excel_doc.profile,
+        ),
+    )
 
 
 @router.get("/{document_id}")
@@ -221,6 +281,7 @@ async def update_excel_document(
     )
 
     db.commit()
+    invalidate_user_document(document_id)
 
     return APIResponseBase.success_response(
         message="Excel document updated",
@@ -265,15 +326,26 @@ async def delete_excel_document(
     # delete the excel file from s3
     object_url = excel_doc.document_url.split("amazonaws.com/")[-1]
     s3_delete_status = delete_s3_obj(object_url)
+    delete_columnar_copy(object_url)
+    s3_object_cache.invalidate(object_url)
     if not s3_delete_status:
         logger.error("Failed to delete file")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return APIResponseBase.internal_server_error(message="Failed to delete file")
 
+    # re-uploads of the same file share its vectors, they go with the last of them
+    if (
+        excel_doc.is_embedded
+        and UserDocumentQuery.count_user_documents_by_embedding_path(db, excel_doc.embed_url)
+        == 1
+    ):
+        delete_document_vectors(excel_doc.embed_url)
+
     if chat_history:
         ChatHistoryQuery.delete_chat_history_by_uuid(db, chat_history.uuid)
     UserDocumentQuery.delete_user_document(db, document_id)
     db.commit()
+    invalidate_user_document(document_id)
 
     return APIResponseBase.success_response(
         message="Excel document deleted",
@@ -0,0 +1,195 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, status, Depends, Response
+from fastapi.responses import StreamingResponse
+from data_response.base_response import APIResponseBase
+from helper.auth import AccessTokenData, get_current_user
+from helper.concurrency import run_blocking
+from helper.query_jobs import (
+    FINISHED_JOB_STATUSES,
+    IdempotencyKeyReusedError,
+    enqueue_query_job,
+    query_queue,
+)
+from helper.sse import format_sse_event, sse_response
+from config import Config
+from logger import logger
+from schemas.jobs import Job, JobStatusResponse
+from schemas.query import CustomerQueryRequest
+
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def wants_async_response(prefer: Optional[str]) -> bool:
+    """
+    Check whether the client asked for a job instead of waiting for the response.
+
+    Args:
+        prefer (Optional[str]): The `Prefer` header of the request.
+
+    Returns:
+        bool: True if the header contains `respond-async`.
+    """
+    return prefer is not None and "respond-async" in prefer.lower()
+
+
+def to_job_status_response(job: Job) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job.id,
+        type=job.type,
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        enqueued_at=job.enqueued_at,
+        updated_at=job.updated_at,
+    )
+
+
+async def accept_query_job(
+    response: Response,
+    job_type: str,
+    request: CustomerQueryRequest,
+    current_user: AccessTokenData,
+    idempotency_key: Optional[str] = None,
+) -> APIResponseBase:
+    """
+    Queue a validated query and respond with 202 and the id of its job.
+
+    Args:
+        response (Response): The response object to be returned.
+        job_type (str): The type of the query job.
+        request (CustomerQueryRequest): The validated request of the customer.
+        current_user (AccessTokenData): The current user's access token data.
+        idempotency_key (Optional[str]): The `Idempotency-Key` header of the request.
+
+    Returns:
+        APIResponseBase: The API response containing the status of the job.
+    """
+    try:
+        job = await run_blocking(
+            enqueue_query_job, job_type, request, current_user.uuid, idempotency_key
+        )
+    except IdempotencyKeyReusedError as e:
+        logger.error(str(e))
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(
+            message="The idempotency key was already used for a different request"
+        )
+    except Exception as e:
+        logger.error(f"Failed to queue the {job_type} job: {e}")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return APIResponseBase.internal_server_error(message="Failed to queue the query")
+
+    response.status_code = status.HTTP_202_ACCEPTED
+    response.headers["Location"] = f"/v1/jobs/{job.id}"
+    return APIResponseBase.success_response(
+        message="Query accepted",
+        data=to_job_status_response(job),
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
+def get_customer_job(job_id: str, customer_uuid: str) -> Optional[Job]:
+    job = query_queue.get(job_id)
+    # the jobs of other customers are reported as missing, not as forbidden
+    if job is None or job.payload.get("customer_uuid") != customer_uuid:
+        return None
+    return job
+
+
+# declared before "/{job_id}", which would match it otherwise
+@router.get("/queue")
+async def get_query_queue_depth(
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+) -> APIResponseBase:
+    """
+    Get the number of query jobs in every state of the queue.
+
+    Args:
+        response (Response): The response object to be returned.
+        current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
+
+    Returns:
+        APIResponseBase: The API response containing the number of ready, delayed and running jobs.
+    """
+    response.status_code = status.HTTP_200_OK
+    return APIResponseBase.success_response(
+        message="Queue depth fetched successfully",
+        data=await run_blocking(query_queue.depth),
+    )
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+) -> APIResponseBase:
+    """
+    Get the status of a query job, and its result once it succeeded.
+
+    Args:
+        job_id (str): The id of the job.
+        response (Response): The response object to be returned.
+        current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
+
+    Returns:
+        APIResponseBase: The API response containing the status of the job.
+    """
+    job = await run_blocking(get_customer_job, job_id, current_user.uuid)
+    if job is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return APIResponseBase.not_found(message="Job not found")
+
+    response.status_code = status.HTTP_200_OK
+    return APIResponseBase.success_response(
+        message="Job fetched successfully", data=to_job_status_response(job)
+    )
+
+
+@router.get("/{job_id}/events", response_model=None)
+async def subscribe_job(
+    job_id: str,
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+) -> StreamingResponse | APIResponseBase:
+    """
+    Follow a query job as Server-Sent Events.
+
+    The stream sends a `status` event whenever the status of the job changes, then a
+    `done` event with the succeeded or failed job, or an `error` event if the job expired.
+
+    Args:
+        job_id (str): The id of the job.
+        response (Response): The response object, used when the job does not exist.
+        current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
+
+    Returns:
+        StreamingResponse | APIResponseBase: The `text/event-stream` response, or the
+        error response if the job does not exist.
+    """
+    job = await run_blocking(get_customer_job, job_id, current_user.uuid)
+    if job is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return APIResponseBase.not_found(message="Job not found")
+
+    async def events():
+        current = job
+        last_status = None
+        while True:
+            if current is None:
+                yield format_sse_event("error", {"message": "Job not found"})
+                return
+            if current.status in FINISHED_JOB_STATUSES:
+                yield format_sse_event("done", to_job_status_response(current).model_dump())
+                return
+            if current.status != last_status:
+                last_status = current.status
+                yield format_sse_event("status", {"job_id": job_id, "status": last_status})
+
+            await asyncio.sleep(Config.QUERY_JOB_POLL_INTERVAL)
+            current = await run_blocking(query_queue.get, job_id)
+
+    return sse_response(events())
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, status, Depends, Response
+from typing import Optional
+from fastapi import APIRouter, status, Depends, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from data_response.base_response import APIResponseBase
 from helper.auth import AccessTokenData, get_current_user
 from schemas.query import CustomerQueryRequest, CustomerQueryResponse
@@ -8,34 +10,116 @@ from db.queries.chat_history import ChatHistoryQuery
 from db import get_db
 from sqlalchemy.orm import Session
 from logger import logger
-from helper.aws_s3 import download_from_s3
-from helper.pipelines.db_query import db_config_pipeline
+from helper.dataframe_cache import DocumentDownloadError, load_user_document
+from helper.pipelines.db_query import adb_config_pipeline, astream_db_config_pipeline
 from helper.pipelines.csv_query import csv_pipeline
-from helper.pipelines.excel_query import excel_pipeline
-from helper.pipelines.simple_chat import simple_chat_pipeline
-import random, os
+from helper.pipelines.excel_query import aexcel_pipeline
+from helper.pipelines import post_processed_html_response
+from helper.pipelines.simple_chat import (
+    astream_simple_chat_pipeline,
+    simple_chat_pipeline,
+)
+from helper.sse import format_sse_event, sse_response
+from helper.query_jobs import DB_QUERY_JOB, EXCEL_QUERY_JOB
+from api.v1.jobs import accept_query_job, wants_async_response
+from helper.concurrency import (
+    ClientDisconnectedError,
+    cancel_on_disconnect,
+    run_blocking,
+)
+from helper.sql_execution import SQLQueryTimeoutError
+from helper.sql_cost_guard import SQLQueryTooExpensiveError
 
 
 router = APIRouter(prefix="/query", tags=["query"])
 
 
+# declared before "/{query_type}", which would match it otherwise
+@router.post("/stream")
+async def chat_stream(
+    request: CustomerQueryRequest,
+    db: Session = Depends(get_db),
+    current_user: AccessTokenData = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Process a chat request and stream the response as Server-Sent Events.
+
+    The stream sends a `token` event for every new tokens of the response, then a `done`
+    event with the whole response, or an `error` event if the response failed.
+
+    Args:
+        request (CustomerQueryRequest): The customer query request object.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (AccessTokenData, optional): The current user access token data. Defaults to Depends(get_current_user).
+
+    Returns:
+        StreamingResponse: The `text/event-stream` response.
+    """
+    logger.debug(f"Received streaming chat request")
+    if request.chat_uuid is None:
+        # create new chat history
+        chat_history = ChatHistoryQuery.create_new_chat_history(
+            db, current_user.uuid, "chat", request.data_source_id, request.query[:100]
+        )
+        db.commit()
+        chat_uuid = str(chat_history.uuid)
+    else:
+        chat_uuid = str(request.chat_uuid)
+
+    async def events():
+        tokens = []
+        try:
+            async for token in astream_simple_chat_pipeline(
+                request.query, chat_uuid, request.model
+            ):
+                tokens.append(token)
+                yield format_sse_event("token", {"token": token})
+        except Exception as e:
+            logger.error(f"Failed to stream chat: {e}")
+            yield format_sse_event("error", {"message": "Failed to generate the response"})
+            return
+
+        yield format_sse_event(
+            "done",
+            CustomerQueryResponse(
+                query=request.query,
+                response=post_processed_html_response("".join(tokens)),
+                chat_uuid=chat_uuid,
+            ).model_dump(),
+        )
+
+    return sse_response(events())
+
+
 @router.post("/{query_type}")
 async def query(
     query_type: str,
     request: CustomerQueryRequest,
     response: Response,
+    http_request: Request,
     current_user: AccessTokenData = Depends(get_current_user),
     db: Session = Depends(get_db),
+    prefer: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
 ) -> APIResponseBase:
     """
     Executes a query based on the provided query type.
 
+    With a `Prefer: respond-async` header, excel and db queries are validated, then run
+    by the query worker: the response is a 202 with the id of the job to poll at
+    `/v1/jobs/{job_id}`.
+
     Args:
         query_type (str): The type of query to execute. Can be "csv" or "db".
         request (CustomerQueryRequest): The request object containing the query details.
         response (Response): The response object to be returned.
+        http_request (Request): The incoming HTTP request, used to cancel the database query
+            when the client disconnects.
         current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
         db (Session, optional): The database session. Defaults to Depends(get_db).
+        prefer (Optional[str], optional): The `Prefer` header. Defaults to Header(None).
+        idempotency_key (Optional[str], optional): The `Idempotency-Key` header, a retried
+            request with the same key gets the job of the first one. Defaults to Header(None).
 
     Returns:
         APIResponseBase: The API response containing the query result.
@@ -44,6 +128,7 @@ async def query(
 
     result = None
     sql_query = None
+    sql_result = None
     if request.chat_uuid is None:
         response.status_code = status.HTTP_400_BAD_REQUEST
         return APIResponseBase.bad_request(message="chat_uuid is required")
@@ -105,25 +190,26 @@ async def query(
             response.status_code = status.HTTP_401_UNAUTHORIZED
             return APIResponseBase.unauthorized(message="Unauthorized access")
 
-        # download the file from s3
-        s3_object_url = excel_file.document_url.split("amazonaws.com/")[-1]
-        file_extension = s3_object_url.split(".")[-1]
-        temp_file_name = random.randbytes(10).hex() + "." + file_extension
-        temp_file_path = f"./tmp/{temp_file_name}"
-        if not download_from_s3(s3_object_url, temp_file_path):
-            logger.error("Failed to download file from s3")
+        if wants_async_response(prefer):
+            return await accept_query_job(
+                response, EXCEL_QUERY_JOB, request, current_user, idempotency_key
+            )
+
+        try:
+            df = await run_blocking(load_user_document, excel_file)
+        except DocumentDownloadError as e:
+            logger.error(f"Failed to download file from s3: {e}")
             response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
             return APIResponseBase.internal_server_error(
                 message="Failed to download file from s3"
             )
 
-        result = excel_pipeline(
-            temp_file_path,
+        result = await aexcel_pipeline(
+            df,
             request.query,
             str(request.chat_uuid),
             request.model,
         )
-        os.remove(temp_file_path)
 
     elif query_type == "db":
         logger.debug(f"Received query for DB")
@@ -136,13 +222,39 @@ async def query(
         if str(db_config.customer_uuid) != current_user.uuid:
             logger.error("Unauthorized access")
             return APIResponseBase.unauthorized(message="Unauthorized access")
+
+        if wants_async_response(prefer):
+            return await accept_query_job(
+                response, DB_QUERY_JOB, request, current_user, idempotency_key
+            )
+
         try:
-            result, sql_query = db_config_pipeline(
-                db_config.db_type,
-                db_config.db_config,
-                request.query,
-                str(request.chat_uuid),
-                request.model,
+            result, sql_query, sql_result = await cancel_on_disconnect(
+                http_request,
+                adb_config_pipeline(
+                    db_config.db_type,
+                    db_config.db_config,
+                    request.query,
+                    str(request.chat_uuid),
+                    request.model,
+                    db_config_id=db_config.id,
+                ),
+            )
+        except ClientDisconnectedError:
+            logger.info("Client disconnected, db query cancelled")
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return APIResponseBase.bad_request(message="Client disconnected")
+        except SQLQueryTooExpensiveError as e:
+            logger.error(f"DB query refused by the cost guard: {e}")
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return APIResponseBase.bad_request(
+                message="The query is estimated to be too expensive to run. Please narrow it down and try again."
+            )
+        except SQLQueryTimeoutError as e:
+            logger.error(f"DB query timed out: {e}")
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return APIResponseBase.bad_request(
+                message="The query took too long to run. Please narrow it down and try again."
             )
         except Exception as e:
             logger.error(f"Failed to query db: {e}")
@@ -159,12 +271,135 @@ async def query(
             query=request.query,
             response=result,
             sql_query=sql_query if query_type == "db" else None,
+            sql_result=sql_result,
             data_source_id=request.data_source_id,
             chat_uuid=str(request.chat_uuid),
         ),
     )
 
 
+@router.post("/db/stream", response_model=None)
+async def query_db_stream(
+    request: CustomerQueryRequest,
+    response: Response,
+    current_user: AccessTokenData = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> StreamingResponse | APIResponseBase:
+    """
+    Executes a database query and streams its stages as Server-Sent Events.
+
+    The stream sends a `sql` event with the generated SQL query, a `result` event with
+    its result rows, a `token` event for every new tokens of the refined response, then
+    a `done` event with the whole response, or an `error` event if a stage failed.
+
+    Args:
+        request (CustomerQueryRequest): The request object containing the query details.
+        response (Response): The response object, used when the request is invalid.
+        current_user (AccessTokenData, optional): The current user's access token data. Defaults to Depends(get_current_user).
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        StreamingResponse | APIResponseBase: The `text/event-stream` response, or the
+        error response if the request is invalid.
+    """
+    if request.chat_uuid is None:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(message="chat_uuid is required")
+
+    if not ChatHistoryQuery.is_valid_chat_history(
+        db,
+        str(request.chat_uuid),
+        "db",
+        current_user.uuid,
+        request.data_source_id,
+    ):
+        logger.error("Invalid chat history")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(message="Invalid chat uuid")
+
+    db_config = DBConfigQuery.get_db_config_by_id(db, request.data_source_id)
+    if not db_config:
+        logger.error("DB not found")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return APIResponseBase.bad_request(message="DB not found")
+
+    if str(db_config.customer_uuid) != current_user.uuid:
+        logger.error("Unauthorized access")
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        return APIResponseBase.unauthorized(message="Unauthorized access")
+
+    # read before the session is closed at the end of the request
+    db_type, db_config_values, db_config_id = (
+        db_config.db_type,
+        db_config.db_config,
+        db_config.id,
+    )
+
+    async def events():
+        sql_query = None
+        sql_result = None
+        try:
+            async for event, data in astream_db_config_pipeline(
+                db_type,
+                db_config_values,
+                request.query,
+                str(request.chat_uuid),
+                request.model,
+                db_config_id=db_config_id,
+            ):
+                if event == "sql":
+                    sql_query = data["sql_query"]
+                    cost_estimate = data["cost_estimate"]
+                    yield format_sse_event(
+                        "sql",
+                        {
+                            "sql_query": sql_query,
+                            "cost_estimate": cost_estimate and cost_estimate.model_dump(),
+                        },
+                    )
+                elif event == "result":
+                    sql_result = data
+                    yield format_sse_event("result", sql_result.model_dump())
+                elif event == "token":
+                    yield format_sse_event("token", {"token": data})
+                elif event == "response":
+                    yield format_sse_event(
+                        "done",
+                        CustomerQueryResponse(
+                            query=request.query,
+                            response=data,
+                            sql_query=sql_query,
+                            sql_result=sql_result,
+                            data_source_id=request.data_source_id,
+                            chat_uuid=str(request.chat_uuid),
+                        ).model_dump(),
+                    )
+        except SQLQueryTooExpensiveError as e:
+            logger.error(f"DB query refused by the cost guard: {e}")
+            yield format_sse_event(
+                "error",
+                {
+                    "message": "The query is estimated to be too expensive to run. Please narrow it down and try again."
+                },
+            )
+        except SQLQueryTimeoutError as e:
+            logger.error(f"DB query timed out: {e}")
+            yield format_sse_event(
+                "error",
+                {
+                    "message": "The query took too long to run. Please narrow it down and try again."
+                },
+            )
+        except Exception as e:
+            logger.error(f"Failed to query db: {e}")
+            yield format_sse_event(
+                "error",
+                {"message": "Failed to query db. Please check your query and try again."},
+            )
+
+    return sse_response(events())
+
+
 @router.post("/")
 def chat(
     request: CustomerQueryRequest,
@@ -6,7 +6,8 @@ from db import get_db
 from sqlalchemy.orm import Session
 from helper.auth import AccessTokenData, get_current_user
 from logger import logger
-from helper.pipelines.suggestion import suggestion_pipeline
+from helper.pipelines.suggestion import get_warm_suggestions, suggestion_pipeline
+from db.models.user_document import UserDocument
 from schemas.ai_suggestion import AISuggestionRequest, AISuggestionResponse
 
 
@@ -57,7 +58,12 @@ def get_suggestion_based_on_query(
                 message="Forbidden"
             )
 
-    suggestions = suggestion_pipeline(request, data_source)
+    suggestions = None
+    # suggestions for the first query on a document are generated at ingestion time
+    if isinstance(data_source, UserDocument) and not request.last_ques:
+        suggestions = get_warm_suggestions(data_source.id)
+    if suggestions is None:
+        suggestions = suggestion_pipeline(request, data_source)
 
     response.status_code = status.HTTP_200_OK
     return APIResponseBase.success_response(
@@ -7,9 +7,9 @@ from db.queries.user_documents import UserDocumentQuery
 from db import get_db
 from sqlalchemy.orm import Session
 from logger import logger
-from helper.pipelines.csv_query import csv_pipeline_v2
-from helper.aws_s3 import download_from_s3
-import random, os
+from helper.pipelines.csv_query import acsv_pipeline_v2
+from helper.dataframe_cache import DocumentDownloadError, load_user_document
+from helper.concurrency import run_blocking
 
 
 router = APIRouter(prefix="/query", tags=["query"])
@@ -63,20 +63,18 @@ async def query(
             logger.error("Unauthorized access")
             return APIResponseBase.unauthorized(message="Unauthorized access")
 
-        s3_object_url = csv_file.document_url.split("amazonaws.com/")[-1]
-        file_extension = s3_object_url.split(".")[-1]
-        temp_file_name = random.randbytes(10).hex() + "." + file_extension
-        temp_file_path = f"./tmp/{temp_file_name}"
-        if not download_from_s3(s3_object_url, temp_file_path):
-            logger.error("Failed to download file from s3")
+        try:
+            df = await run_blocking(load_user_document, csv_file)
+        except DocumentDownloadError as e:
+            logger.error(f"Failed to download file from s3: {e}")
             response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
             return APIResponseBase.internal_server_error(
                 message="Failed to download file from s3"
             )
-        result = csv_pipeline_v2(
-            temp_file_path, request.query, str(request.chat_uuid), request.model
+
+        result = await acsv_pipeline_v2(
+            df, request.query, str(request.chat_uuid), request.model
         )
-        os.remove(temp_file_path)
 
     else:
         # bad request
@@ -1,10 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from api import base
 from config import Config
 from fastapi.middleware.cors import CORSMiddleware
+from helper.code_sandbox import code_sandbox
+from helper.concurrency import run_blocking
 
 
-app = FastAPI(title=Config.PROJECT_NAME, version=Config.PROJECT_VERSION)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # fork the workers running generated code before the first query needs them
+    await run_blocking(code_sandbox.start)
+    yield
+    code_sandbox.shutdown()
+
+
+app = FastAPI(
+    title=Config.PROJECT_NAME, version=Config.PROJECT_VERSION, lifespan=lifespan
+)
 
 app.add_middleware(
     CORSMiddleware,
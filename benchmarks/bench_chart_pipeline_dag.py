@@ -0,0 +1,111 @@
+"""
+Compare the wall time of the chart query pipeline run sequentially, as it used to be run,
+with the concurrent run of `arun_pipeline_dag`, which overlaps the loading of the
+dataframe with the caption and starts every stage as soon as its inputs are ready.
+
+No request is sent to OpenAI, the LLM answers every prompt after `--llm-latency` seconds
+and the dataframe loads in `--load-latency` seconds.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_chart_pipeline_dag.py [--llm-latency 0.5] [--load-latency 0.3]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Sequence
+import pandas as pd
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.llms.openai import OpenAI
+from helper.metrics import metrics
+from helper.pipelines.chart_query import build_chart_query_pipeline
+from helper.pipelines.dag import arun_pipeline_dag
+
+DF = pd.DataFrame({"city": ["Paris", "Rome", "Oslo"], "sales": [3, 4, 5]})
+
+
+class LatencyLLM(OpenAI):
+    latency: float = 0.5
+
+    def _answer(self, prompt: str) -> ChatResponse:
+        if "pick the best chart type" in prompt:
+            content = '```json\n{"chart_type": "bar"}\n```'
+        elif "python code" in prompt:
+            content = (
+                "```python\nchart_data = [{'name': str(r['city']), "
+                "'values': {'sales': float(r['sales'])}} for _, r in df.iterrows()]\n```"
+            )
+        else:
+            content = '```json\n{"caption": "Sales by city"}\n```'
+        return ChatResponse(message=ChatMessage(role="assistant", content=content))
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        time.sleep(self.latency)
+        return self._answer(messages[-1].content)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        await asyncio.sleep(self.latency)
+        return self._answer(messages[-1].content)
+
+
+def run_sequential(pipeline, load_latency: float) -> float:
+    start = time.perf_counter()
+    time.sleep(load_latency)
+    pipeline.run_with_intermediates(
+        query_str="sales by city",
+        chat_history=[],
+        data_schema=f"{DF.head()}",
+        df=DF,
+        current_time="2024-01-01 00:00:00",
+    )
+    return time.perf_counter() - start
+
+
+async def run_dag(pipeline, load_latency: float) -> float:
+    start = time.perf_counter()
+
+    async def load_df():
+        await asyncio.sleep(load_latency)
+        return DF
+
+    df = asyncio.ensure_future(load_df())
+
+    async def get_data_schema():
+        return f"{(await df).head()}"
+
+    await arun_pipeline_dag(
+        pipeline,
+        "chart_query",
+        query_str="sales by city",
+        chat_history=[],
+        data_schema=get_data_schema(),
+        df=df,
+        current_time="2024-01-01 00:00:00",
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--load-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    llm = LatencyLLM(model="gpt-4o", api_key="sk-bench", latency=args.llm_latency)
+    pipeline = build_chart_query_pipeline(llm)
+
+    sequential = run_sequential(pipeline, args.load_latency)
+    metrics.reset()
+    concurrent = asyncio.run(run_dag(pipeline, args.load_latency))
+
+    print(f"llm latency: {args.llm_latency}s, dataframe load latency: {args.load_latency}s")
+    print(f"  sequential:          {sequential:.3f}s")
+    print(f"  arun_pipeline_dag:   {concurrent:.3f}s")
+    print("  stages:")
+    for name, observation in metrics.snapshot()["observations"].items():
+        if name.startswith("chart_query_") and name.endswith("_seconds"):
+            print(f"    {name[len('chart_query_'):-len('_seconds')]}: {observation['last']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare the per-query overhead of opening a Chroma client, collection and index for
+every query with reusing them from the process-wide collection cache.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_chroma_collections.py [--collections 20] [--chunks 200]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import chromadb
+import numpy as np
+from llama_index.core import MockEmbedding, VectorStoreIndex
+from llama_index.core.vector_stores import VectorStoreQuery
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from config import Config
+from helper.vector_store import CollectionCache
+
+DIMENSIONS = 256
+
+
+def create_collections(path: str, collections: int, chunks: int) -> list:
+    rng = np.random.default_rng(0)
+    client = chromadb.PersistentClient(path=path)
+    names = []
+    for i in range(collections):
+        name = f"customer_document_{i:04d}.csv"
+        client.get_or_create_collection(name).add(
+            ids=[f"{i}-{j}" for j in range(chunks)],
+            embeddings=rng.random((chunks, DIMENSIONS)).tolist(),
+            documents=[f"chunk {j} of document {i}" for j in range(chunks)],
+        )
+        names.append(name)
+    return names
+
+
+def query(index: VectorStoreIndex, embedding: list) -> None:
+    index.vector_store.query(
+        VectorStoreQuery(query_embedding=embedding, similarity_top_k=4)
+    )
+
+
+def uncached_query(path: str, name: str, embedding: list) -> None:
+    # what csv_pipeline did for every query
+    client = chromadb.PersistentClient(path=path)
+    index = VectorStoreIndex.from_vector_store(
+        vector_store=ChromaVectorStore(
+            chroma_collection=client.get_or_create_collection(name)
+        ),
+        embed_model=MockEmbedding(embed_dim=DIMENSIONS),
+    )
+    query(index, embedding)
+
+
+def timed(fn, names: list, queries: int) -> float:
+    embedding = [0.5] * DIMENSIONS
+    start = time.perf_counter()
+    for i in range(queries):
+        fn(names[i % len(names)], embedding)
+    return (time.perf_counter() - start) / queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collections", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "chroma")
+        Config.CHROMA_DB_PATH = path
+        names = create_collections(path, args.collections, args.chunks)
+        embed_model = MockEmbedding(embed_dim=DIMENSIONS)
+        cache = CollectionCache(max_collections=args.collections)
+
+        uncached = timed(lambda name, e: uncached_query(path, name, e), names, args.queries)
+        cached = timed(
+            lambda name, e: query(cache.get_index(name, embed_model=embed_model), e),
+            names,
+            args.queries,
+        )
+        query_only = timed(
+            lambda name, e: query(cache.get_index(name, embed_model=embed_model), e),
+            names[:1],
+            args.queries,
+        )
+
+    print(f"collections:           {args.collections} x {args.chunks} chunks")
+    print(f"new client per query:  {uncached * 1000:.2f} ms/query")
+    print(f"collection cache:      {cached * 1000:.2f} ms/query")
+    print(f"single hot collection: {query_only * 1000:.2f} ms/query")
+    print(f"overhead removed:      {(uncached - cached) * 1000:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
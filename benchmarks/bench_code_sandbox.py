@@ -0,0 +1,70 @@
+"""
+Compare generated pandas code run on threads of the calling process, as it used to be
+run, with the same code run by the `CodeSandbox` worker processes.
+
+`--calls` groupbys over a dataframe of `--rows` rows are issued at once. On threads they
+contend for the GIL, in the sandbox they run on up to `--workers` cores, at the cost of
+mapping the dataframe and pickling the result.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_code_sandbox.py [--rows 2000000] [--calls 8] [--workers 4]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from helper.code_sandbox import CodeSandbox, exec_code
+
+CODE = (
+    "grouped = df.groupby('key').agg(total=('value', 'sum'), mean=('value', 'mean'))\n"
+    "result = grouped.sort_values('total').tail(5).to_dict()"
+)
+
+
+def run_calls(run, df: pd.DataFrame, calls: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=calls) as executor:
+        list(executor.map(lambda _: run(exec_code, df, CODE, "result"), range(calls)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--calls", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "key": rng.integers(0, 10_000, args.rows),
+            "value": rng.random(args.rows),
+        }
+    )
+
+    in_process = CodeSandbox(workers=0)
+    sandbox = CodeSandbox(workers=args.workers)
+    start = time.perf_counter()
+    sandbox.start()
+    startup = time.perf_counter() - start
+
+    try:
+        threads = run_calls(in_process.run, df, args.calls)
+        processes = run_calls(sandbox.run, df, args.calls)
+    finally:
+        sandbox.shutdown()
+
+    print(f"{args.calls} concurrent groupbys over {args.rows} rows")
+    for label, seconds in [
+        ("threads in process", threads),
+        (f"sandbox ({args.workers} workers)", processes),
+        ("sandbox startup", startup),
+    ]:
+        print(f"  {label + ':':<24} {seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
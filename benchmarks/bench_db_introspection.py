@@ -0,0 +1,87 @@
+"""
+Compare the bulk catalog introspection with the previous reflect + per-table foreign
+key lookup on a synthetic sqlite database.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_db_introspection.py [--tables 1000]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from sqlalchemy import MetaData, create_engine, inspect
+from helper.db_introspection import reflect_tables, render_db_schema
+
+
+def create_database(path: str, table_count: int) -> None:
+    conn = sqlite3.connect(path)
+    for i in range(table_count):
+        parent = f", parent_id INTEGER REFERENCES table_{i - 1:04d}(id)" if i else ""
+        conn.execute(
+            f"CREATE TABLE table_{i:04d} (id INTEGER PRIMARY KEY, name VARCHAR(64), "
+            f"amount REAL, created_at TIMESTAMP, notes TEXT{parent})"
+        )
+    conn.commit()
+    conn.close()
+
+
+def legacy_db_schema(engine) -> str:
+    # the schema extraction previously done in get_db_schema
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    inspector = inspect(engine)
+
+    db_schema = ""
+    for table_name in sorted(metadata.tables):
+        table = metadata.tables[table_name]
+        db_schema += f"\n\nTable: {table_name}\n"
+        db_schema += "-" * 30 + "\n"
+        fk_dict = {
+            fk["constrained_columns"][0]: fk
+            for fk in inspector.get_foreign_keys(table_name)
+        }
+        for column in table.columns:
+            if column.name in fk_dict:
+                fk = fk_dict[column.name]
+                db_schema += f"  {column.name} ({column.type}) [Foreign Key: {fk['referred_table']}.{fk['referred_columns'][0]}]\n"
+            else:
+                db_schema += f"  {column.name} ({column.type})\n"
+
+    return db_schema
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.db")
+        create_database(path, args.tables)
+
+        # fresh engines so neither run benefits from the other's caches
+        legacy_schema, legacy_time = timed(
+            legacy_db_schema, create_engine(f"sqlite:///{path}")
+        )
+        bulk_schema, bulk_time = timed(
+            lambda engine: render_db_schema(reflect_tables(engine)),
+            create_engine(f"sqlite:///{path}"),
+        )
+
+    print(f"tables:                  {args.tables}")
+    print(f"reflect + per-table FKs: {legacy_time:.3f}s")
+    print(f"bulk catalog queries:    {bulk_time:.3f}s")
+    print(f"speedup:                 {legacy_time / bulk_time:.1f}x")
+    print(f"identical output:        {legacy_schema == bulk_schema}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare loading a document from its parquet copy with parsing the raw csv/xlsx file
+on a synthetic dataset.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_document_loading.py [--rows 200000] [--sheets 3]
+"""
+
+import argparse
+import io
+import time
+import numpy as np
+import pandas as pd
+from helper.columnar import (
+    optimize_dtypes,
+    read_document,
+    read_parquet,
+    to_parquet_bytes,
+)
+
+
+def create_dataframe(rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "order_id": np.arange(rows),
+            "customer_id": rng.integers(0, 10_000, rows),
+            "region": rng.choice(["north", "south", "east", "west"], rows),
+            "product": rng.choice([f"product {i}" for i in range(200)], rows),
+            "quantity": rng.integers(1, 50, rows),
+            "amount": rng.random(rows) * 1000,
+            "created_at": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s"),
+        }
+    )
+
+
+def timed(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_csv(rows: int) -> None:
+    df = create_dataframe(rows, 0)
+    raw = df.to_csv(index=False).encode("utf-8")
+    parquet = to_parquet_bytes(optimize_dtypes(read_document(io.BytesIO(raw), "csv")))
+
+    csv_time = timed(lambda: read_document(io.BytesIO(raw), "csv"))
+    parquet_time = timed(lambda: read_parquet(parquet))
+
+    print(f"csv rows:              {rows}")
+    print(f"raw size:              {len(raw) / 2**20:.1f} MiB")
+    print(f"parquet size:          {len(parquet) / 2**20:.1f} MiB")
+    print(f"pd.read_csv:           {csv_time:.3f}s")
+    print(f"parquet:               {parquet_time:.3f}s")
+    print(f"speedup:               {csv_time / parquet_time:.1f}x")
+
+
+def bench_excel(rows: int, sheets: int) -> None:
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        for i in range(sheets):
+            create_dataframe(rows, i).to_excel(writer, sheet_name=f"Sheet{i}", index=False)
+    raw = buffer.getvalue()
+    parquet = [
+        to_parquet_bytes(optimize_dtypes(df), sheet_name)
+        for sheet_name, df in read_document(io.BytesIO(raw), "excel").items()
+    ]
+
+    excel_time = timed(lambda: read_document(io.BytesIO(raw), "excel"), repeat=1)
+    parquet_time = timed(lambda: [read_parquet(content) for content in parquet])
+
+    print(f"excel rows per sheet:  {rows} x {sheets} sheets")
+    print(f"raw size:              {len(raw) / 2**20:.1f} MiB")
+    print(f"parquet size:          {sum(map(len, parquet)) / 2**20:.1f} MiB")
+    print(f"pd.read_excel:         {excel_time:.3f}s")
+    print(f"parquet:               {parquet_time:.3f}s")
+    print(f"speedup:               {excel_time / parquet_time:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--excel-rows", type=int, default=20_000)
+    parser.add_argument("--sheets", type=int, default=3)
+    args = parser.parse_args()
+
+    bench_csv(args.rows)
+    print()
+    bench_excel(args.excel_rows, args.sheets)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compare building every query pipeline (and its LLM) for each request, as the api used
+to, with getting the prebuilt pipeline from the process-wide pipeline registry.
+
+No request is sent to OpenAI, only the construction of the pipelines is measured.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_pipeline_construction.py [--requests 500]
+"""
+
+import argparse
+import time
+from llama_index.llms.openai import OpenAI
+from config import Config
+from helper.pipelines.registry import pipeline_registry
+
+# importing the pipelines registers them
+import helper.pipelines.chart_query  # noqa: F401
+import helper.pipelines.db_query  # noqa: F401
+import helper.pipelines.excel_query  # noqa: F401
+import helper.pipelines.simple_chat  # noqa: F401
+
+MODEL = "gpt-4o"
+
+
+def timed(fn, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    Config.OPENAI_API_KEY = Config.OPENAI_API_KEY or "sk-bench"
+    print(f"requests per pipeline: {args.requests}")
+    for name in pipeline_registry.names:
+        builder = pipeline_registry._builders[name]
+        per_request = timed(
+            lambda: builder(OpenAI(model=MODEL, api_key=Config.OPENAI_API_KEY)),
+            args.requests,
+        )
+        pipeline_registry.get(name, MODEL)
+        cached = timed(lambda: pipeline_registry.get(name, MODEL), args.requests)
+        print(f"{name}:")
+        print(f"  built per request:   {per_request * 1000:.3f} ms/request")
+        print(f"  pipeline registry:   {cached * 1000:.3f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Compare one Chroma collection per document with the shared, metadata filtered layout
+on query latency, memory and disk usage.
+
+Every layout is built and queried in its own process, so that the peak memory of one
+does not hide the other. Queries hit random documents through the collection cache,
+which keeps CHROMA_COLLECTION_CACHE_SIZE collections open like the api does.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_vector_layout.py [--documents 10000] [--chunks 5]
+        [--layouts collection shared]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+import numpy as np
+from llama_index.core import MockEmbedding
+from llama_index.core.vector_stores import VectorStoreQuery
+from config import Config
+
+
+def get_disk_usage(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def build(layout: str, documents: int, chunks: int, dimensions: int, shards: int) -> float:
+    from helper.vector_store import (
+        get_chroma_client,
+        get_document_key,
+        get_shared_collection_name,
+    )
+
+    rng = np.random.default_rng(0)
+    client = get_chroma_client()
+    start = time.perf_counter()
+    pending = {}
+    for i in range(documents):
+        customer_uuid = f"customer-{i % 1000}"
+        document_key = get_document_key(customer_uuid, f"document_{i}.csv")
+        ids = [f"{document_key}/{j}" for j in range(chunks)]
+        embeddings = rng.random((chunks, dimensions)).tolist()
+        texts = [f"chunk {j} of document {i}" for j in range(chunks)]
+        if layout == "shared":
+            name = get_shared_collection_name(customer_uuid, shards)
+            batch = pending.setdefault(
+                name, {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+            )
+            batch["ids"] += ids
+            batch["embeddings"] += embeddings
+            batch["documents"] += texts
+            batch["metadatas"] += [
+                {
+                    "customer_uuid": customer_uuid,
+                    "document_key": document_key,
+                    "document_id": i,
+                }
+            ] * chunks
+        else:
+            client.get_or_create_collection(document_key).add(
+                ids=ids, embeddings=embeddings, documents=texts
+            )
+
+    for name, batch in pending.items():
+        collection = client.get_or_create_collection(name)
+        for offset in range(0, len(batch["ids"]), 5000):
+            collection.add(
+                ids=batch["ids"][offset : offset + 5000],
+                embeddings=batch["embeddings"][offset : offset + 5000],
+                documents=batch["documents"][offset : offset + 5000],
+                metadatas=batch["metadatas"][offset : offset + 5000],
+            )
+    return time.perf_counter() - start
+
+
+def run_queries(
+    layout: str, documents: int, queries: int, dimensions: int, shards: int
+) -> list:
+    from helper.vector_store import (
+        collection_cache,
+        get_document_filters,
+        get_document_key,
+        get_embedding_path,
+        get_shared_collection_name,
+        parse_embedding_path,
+    )
+
+    rng = np.random.default_rng(1)
+    embed_model = MockEmbedding(embed_dim=dimensions)
+    latencies = []
+    for i in rng.integers(0, documents, queries):
+        customer_uuid = f"customer-{i % 1000}"
+        document_key = get_document_key(customer_uuid, f"document_{i}.csv")
+        if layout == "shared":
+            collection_name = get_shared_collection_name(customer_uuid, shards)
+            path = get_embedding_path(collection_name, document_key)
+        else:
+            path = get_embedding_path(document_key)
+
+        start = time.perf_counter()
+        collection_name, _ = parse_embedding_path(path)
+        index = collection_cache.get_index(collection_name, embed_model=embed_model)
+        result = index.vector_store.query(
+            VectorStoreQuery(
+                query_embedding=rng.random(dimensions).tolist(),
+                similarity_top_k=4,
+                filters=get_document_filters(path),
+            )
+        )
+        latencies.append(time.perf_counter() - start)
+        assert all(node_id.startswith(document_key) for node_id in result.ids)
+    return latencies
+
+
+def bench(layout: str, args: argparse.Namespace, results: dict) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        Config.CHROMA_DB_PATH = tmp_dir
+        build_time = build(layout, args.documents, args.chunks, args.dimensions, args.shards)
+        disk_usage = get_disk_usage(tmp_dir)
+        latencies = run_queries(
+            layout, args.documents, args.queries, args.dimensions, args.shards
+        )
+
+    results[layout] = {
+        "build": build_time,
+        "disk": disk_usage,
+        "p50": statistics.median(latencies),
+        "p95": statistics.quantiles(latencies, n=20)[-1],
+        # kilobytes on linux
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=10_000)
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--layouts", nargs="+", default=["collection", "shared"])
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        results = manager.dict()
+        for layout in args.layouts:
+            process = context.Process(target=bench, args=(layout, args, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                # e.g. killed when the layout does not fit in memory
+                print(f"{layout}: failed with exit code {process.exitcode}")
+        results = dict(results)
+
+    print(
+        f"documents:             {args.documents} x {args.chunks} chunks, "
+        f"{args.dimensions} dims"
+    )
+    for layout, result in results.items():
+        print(f"{layout}:")
+        print(f"  build:               {result['build']:.1f}s")
+        print(f"  disk:                {result['disk'] / 2**20:.1f} MiB")
+        print(f"  query p50:           {result['p50'] * 1000:.2f} ms")
+        print(f"  query p95:           {result['p95'] * 1000:.2f} ms")
+        print(f"  peak rss:            {result['max_rss'] / 2**20:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
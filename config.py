@@ -23,9 +23,23 @@ class Config:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     DEFAULT_OPENAI_MODEL = os.getenv("DEFAULT_OPENAI_MODEL")
     DEFAULT_OPENAI_EMBEDDING_MODEL = os.getenv("DEFAULT_OPENAI_EMBEDDING_MODEL")
+    # chunks per embedding request, and requests in flight per document
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 5))
+    # keep-alive HTTP pool shared by all OpenAI clients of a process
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60))
 
     # CHROMA
     CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH")
+    # opened collections kept by every process
+    CHROMA_COLLECTION_CACHE_SIZE = int(os.getenv("CHROMA_COLLECTION_CACHE_SIZE", 128))
+    # "collection" keeps one collection per document, "shared" stores the documents of
+    # all customers in CHROMA_SHARED_SHARDS collections filtered by metadata
+    CHROMA_LAYOUT = os.getenv("CHROMA_LAYOUT", "collection")
+    CHROMA_SHARED_SHARDS = int(os.getenv("CHROMA_SHARED_SHARDS", 1))
 
     # REDIS
     REDIS_STORE_URL = os.getenv("REDIS_STORE_URL")
@@ -42,5 +56,96 @@ class Config:
     POSTGRES_DB = os.getenv("POSTGRES_DB")
     POSTGRES_HOSTNAME = os.getenv("POSTGRES_HOSTNAME")
 
+    # CONCURRENCY
+    BLOCKING_EXECUTOR_MAX_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_MAX_WORKERS", 32))
+
+    # CUSTOMER DB ENGINES
+    DB_ENGINE_MAX_ENGINES = int(os.getenv("DB_ENGINE_MAX_ENGINES", 64))
+    DB_ENGINE_IDLE_TIMEOUT = int(os.getenv("DB_ENGINE_IDLE_TIMEOUT", 600))
+    DB_ENGINE_POOL_SIZE = int(os.getenv("DB_ENGINE_POOL_SIZE", 2))
+    DB_ENGINE_MAX_OVERFLOW = int(os.getenv("DB_ENGINE_MAX_OVERFLOW", 3))
+    DB_ENGINE_POOL_RECYCLE = int(os.getenv("DB_ENGINE_POOL_RECYCLE", 1800))
+
+    # SCHEMA CACHE
+    SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", 86400))
+    SCHEMA_CACHE_CHECK_INTERVAL = int(os.getenv("SCHEMA_CACHE_CHECK_INTERVAL", 60))
+
+    # SCHEMA RETRIEVAL
+    SCHEMA_RETRIEVAL_MIN_TABLES = int(os.getenv("SCHEMA_RETRIEVAL_MIN_TABLES", 30))
+    SCHEMA_RETRIEVAL_TOP_K = int(os.getenv("SCHEMA_RETRIEVAL_TOP_K", 8))
+    SCHEMA_RETRIEVAL_MAX_TABLES = int(os.getenv("SCHEMA_RETRIEVAL_MAX_TABLES", 20))
+
+    # SQL RESULTS
+    SQL_RESULT_MAX_ROWS = int(os.getenv("SQL_RESULT_MAX_ROWS", 1000))
+    SQL_RESULT_MAX_BYTES = int(os.getenv("SQL_RESULT_MAX_BYTES", 1048576))
+    SQL_RESULT_FETCH_SIZE = int(os.getenv("SQL_RESULT_FETCH_SIZE", 200))
+    SQL_RESULT_PROMPT_ROWS = int(os.getenv("SQL_RESULT_PROMPT_ROWS", 50))
+    SQL_STATEMENT_TIMEOUT = float(os.getenv("SQL_STATEMENT_TIMEOUT", 30))
+    SQL_READ_ONLY = os.getenv("SQL_READ_ONLY", "true").lower() == "true"
+
+    # SQL COST GUARD
+    SQL_COST_GUARD_MAX_ROWS = float(os.getenv("SQL_COST_GUARD_MAX_ROWS", 0))
+    SQL_COST_GUARD_MAX_COST = float(os.getenv("SQL_COST_GUARD_MAX_COST", 0))
+    SQL_COST_GUARD_ACTION = os.getenv("SQL_COST_GUARD_ACTION", "limit")
+
+    # DATAFRAME CACHE
+    DATAFRAME_CACHE_MAX_BYTES = int(os.getenv("DATAFRAME_CACHE_MAX_BYTES", 1073741824))
+    SHARED_DATAFRAME_DIR = os.getenv("SHARED_DATAFRAME_DIR")
+    SHARED_DATAFRAME_MAX_BYTES = int(os.getenv("SHARED_DATAFRAME_MAX_BYTES", 1073741824))
+
+    # GENERATED CODE SANDBOX
+    # worker processes running generated pandas and chart code, 0 runs it in process
+    CODE_SANDBOX_WORKERS = int(os.getenv("CODE_SANDBOX_WORKERS", 4))
+    CODE_SANDBOX_TIMEOUT = float(os.getenv("CODE_SANDBOX_TIMEOUT", 30))
+    CODE_SANDBOX_CPU_SECONDS = float(os.getenv("CODE_SANDBOX_CPU_SECONDS", 20))
+    CODE_SANDBOX_MAX_MEMORY_BYTES = int(os.getenv("CODE_SANDBOX_MAX_MEMORY_BYTES", 2147483648))
+    CODE_SANDBOX_MAX_TASKS_PER_WORKER = int(os.getenv("CODE_SANDBOX_MAX_TASKS_PER_WORKER", 100))
+    CODE_SANDBOX_FRAME_DIR = os.getenv("CODE_SANDBOX_FRAME_DIR")
+
+    # S3 OBJECT CACHE
+    S3_CACHE_DIR = os.getenv("S3_CACHE_DIR")
+    S3_CACHE_MAX_BYTES = int(os.getenv("S3_CACHE_MAX_BYTES", 5368709120))
+    # seconds a validated ETag is trusted without a HEAD request
+    S3_CACHE_TTL = int(os.getenv("S3_CACHE_TTL", 0))
+
+    # BACKGROUND JOBS
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    # seconds a job stays leased to a worker that stopped renewing it
+    JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", 300))
+    JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 10))
+    JOB_RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", 600))
+    # seconds the status of a finished job is kept
+    JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 86400))
+
+    # QUERY JOBS
+    # seconds the result of a query job can be fetched, and its idempotency key is kept
+    QUERY_JOB_RESULT_TTL = int(os.getenv("QUERY_JOB_RESULT_TTL", 3600))
+    # a retried query would run its LLM calls and update the chat memory again
+    QUERY_JOB_MAX_ATTEMPTS = int(os.getenv("QUERY_JOB_MAX_ATTEMPTS", 1))
+    QUERY_WORKER_CONCURRENCY = int(os.getenv("QUERY_WORKER_CONCURRENCY", 8))
+    # seconds between two status checks of a job followed by a client
+    QUERY_JOB_POLL_INTERVAL = float(os.getenv("QUERY_JOB_POLL_INTERVAL", 1))
+
+    # DOCUMENT INGESTION
+    INGESTION_STEPS = os.getenv(
+        "INGESTION_STEPS", "columnar,profile,embedding,suggestions"
+    ).split(",")
+    INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", 5))
+    INGESTION_WORKER_CONCURRENCY = int(os.getenv("INGESTION_WORKER_CONCURRENCY", 4))
+    INGESTION_OPENAI_CONCURRENCY = int(os.getenv("INGESTION_OPENAI_CONCURRENCY", 2))
+    SUGGESTION_CACHE_TTL = int(os.getenv("SUGGESTION_CACHE_TTL", 604800))
+
+    # DOCUMENT UPLOADS
+    UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 104857600))
+    # S3 requires at least 5 MiB for every part but the last
+    UPLOAD_PART_SIZE = max(int(os.getenv("UPLOAD_PART_SIZE", 8388608)), 5242880)
+    UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", 4))
+
+    # DOCUMENT DOWNLOADS
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 1048576))
+    # redirect to a presigned S3 url instead of streaming through the backend
+    DOWNLOAD_REDIRECT = os.getenv("DOWNLOAD_REDIRECT", "false").lower() == "true"
+    DOWNLOAD_PRESIGNED_URL_EXPIRES = int(os.getenv("DOWNLOAD_PRESIGNED_URL_EXPIRES", 300))
+
     # DB
     SQLALCHEMY_DATABASE_URI = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOSTNAME}/{POSTGRES_DB}"
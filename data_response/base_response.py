@@ -117,6 +117,19 @@ class APIResponseBase(BaseModel):
         """
         return cls(status_code=status.HTTP_404_NOT_FOUND, message=message)
 
+    @classmethod
+    def payload_too_large(cls, message: str = "Payload Too Large"):
+        """
+        Creates a response instance for a request body over the size limit.
+
+        Args:
+            message (str, optional): The response message. Defaults to "Payload Too Large".
+
+        Returns:
+            APIResponseBase: The response instance for a request body over the size limit.
+        """
+        return cls(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, message=message)
+
     @classmethod
     def internal_server_error(cls, message: str = "Internal Server Error"):
         """
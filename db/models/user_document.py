@@ -1,5 +1,14 @@
 from db import Base
-from sqlalchemy import Column, Integer, String, TIMESTAMP, UUID, ForeignKey, Boolean
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    TIMESTAMP,
+    UUID,
+    ForeignKey,
+    Boolean,
+    JSON,
+)
 from datetime import datetime
 
 
@@ -15,6 +24,9 @@ class UserDocument(Base):
         document_url (str): The URL of the document.
         is_embedded (bool): Indicates whether the document is embedded.
         embed_url (str): The URL of the embedded document.
+        ingestion_status (str): The status of the background ingestion of the document.
+        ingestion_error (str): The error of the last failed ingestion attempt.
+        profile (dict): The summary of the columns of the document.
         created_at (datetime): The timestamp when the document was created.
         updated_at (datetime): The timestamp when the document was last updated.
     """
@@ -30,6 +42,9 @@ class UserDocument(Base):
     document_url = Column(String, nullable=False)
     is_embedded = Column(Boolean, default=False)
     embed_url = Column(String, nullable=False)
+    ingestion_status = Column(String, nullable=True, default="queued")
+    ingestion_error = Column(String, nullable=True)
+    profile = Column(JSON, nullable=True)
     created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
     updated_at = Column(
         TIMESTAMP, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
@@ -49,6 +64,9 @@ class UserDocument(Base):
             "document_url": self.document_url,
             "is_embedded": self.is_embedded,
             "embed_url": self.embed_url,
+            "ingestion_status": self.ingestion_status,
+            "ingestion_error": self.ingestion_error,
+            "profile": self.profile,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
         }
@@ -109,6 +109,45 @@ class UserDocumentQuery:
         ]
         return dict_data
 
+    @staticmethod
+    def get_embedded_user_documents(db: Session) -> List[UserDocument]:
+        """
+        Retrieve the user documents that have an embedding.
+
+        Args:
+            db (Session): The database session.
+
+        Returns:
+            List[UserDocument]: The embedded user documents, oldest first.
+        """
+        return (
+            db.query(UserDocument)
+            .filter(UserDocument.is_embedded == True)
+            .order_by(UserDocument.id)
+            .all()
+        )
+
+    @staticmethod
+    def count_user_documents_by_embedding_path(db: Session, embedding_path: str) -> int:
+        """
+        Count the embedded user documents sharing an embedding path.
+
+        Args:
+            db (Session): The database session.
+            embedding_path (str): The embedding path.
+
+        Returns:
+            int: The number of user documents.
+        """
+        return (
+            db.query(UserDocument)
+            .filter(
+                UserDocument.is_embedded == True,
+                UserDocument.embed_url == embedding_path,
+            )
+            .count()
+        )
+
     @staticmethod
     def update_embedding_path(db: Session, user_document_id: int, embedding_path: str):
         """
@@ -130,6 +169,52 @@ class UserDocumentQuery:
         db.flush()
         return user_document
 
+    @staticmethod
+    def update_ingestion_status(
+        db: Session, user_document_id: int, ingestion_status: str, error: str = None
+    ) -> UserDocument:
+        """
+        Update the ingestion status of a user document.
+
+        Args:
+            db (Session): The database session.
+            user_document_id (int): The ID of the user document.
+            ingestion_status (str): The new status, "queued", "processing", "retrying", "ready" or "failed".
+            error (str): The error of the last failed attempt.
+
+        Returns:
+            UserDocument: The updated user document, or None if it does not exist.
+        """
+        user_document = (
+            db.query(UserDocument).filter(UserDocument.id == user_document_id).first()
+        )
+        if user_document:
+            user_document.ingestion_status = ingestion_status
+            user_document.ingestion_error = error
+            db.flush()
+        return user_document
+
+    @staticmethod
+    def update_profile(db: Session, user_document_id: int, profile: dict) -> UserDocument:
+        """
+        Update the data profile of a user document.
+
+        Args:
+            db (Session): The database session.
+            user_document_id (int): The ID of the user document.
+            profile (dict): The summary of the columns of the document.
+
+        Returns:
+            UserDocument: The updated user document, or None if it does not exist.
+        """
+        user_document = (
+            db.query(UserDocument).filter(UserDocument.id == user_document_id).first()
+        )
+        if user_document:
+            user_document.profile = profile
+            db.flush()
+        return user_document
+
     @staticmethod
     def delete_user_document(db: Session, user_document_id: int) -> bool:
         """
@@ -1,6 +1,7 @@
 import os
+import shutil
 import boto3
-from botocore.exceptions import NoCredentialsError
+from botocore.exceptions import BotoCoreError, NoCredentialsError
 from logger import logger
 from config import Config
 from botocore.exceptions import ClientError
@@ -44,14 +45,22 @@ def upload_obj_to_s3(file, file_name, bucket_path=None):
         return None
 
 
-def download_from_s3(s3_file_name, output_path=None):
+def download_from_s3(s3_file_name, output_path=None, etag=None):
     file_name = s3_file_name.split("/")[-1]
     file_path = (
         os.getcwd() + f"/tmp/output/{file_name}" if output_path is None else output_path
     )
-
     try:
-        s3_client.download_file(bucket_name, s3_file_name, file_path)
+        if etag is None:
+            s3_client.download_file(bucket_name, s3_file_name, file_path)
+        else:
+            # `download_file` does not accept `IfMatch`, a single conditional get fails
+            # instead of downloading a newer version of the object
+            body = s3_client.get_object(
+                Bucket=bucket_name, Key=s3_file_name, IfMatch=etag
+            )["Body"]
+            with open(file_path, "wb") as f:
+                shutil.copyfileobj(body, f, Config.DOWNLOAD_CHUNK_SIZE)
         logger.info("Download Successful")
         return True
     except ClientError as e:
@@ -67,6 +76,10 @@ def download_from_s3(s3_file_name, output_path=None):
     except NoCredentialsError:
         logger.info("Credentials not available")
         return False
+    except BotoCoreError as e:
+        # e.g. the connection dropped while streaming the body
+        logger.error(f"Failed to download {s3_file_name} due to {e}")
+        return False
 
 
 def check_file_exists(file_path):
@@ -88,4 +101,90 @@ def delete_s3_obj(file_path):
         return True
     except Exception as e:
         logger.error(f"file not found in s3 bucket: {file_path} due to {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+def get_s3_etag(file_path):
+    try:
+        return s3_client.head_object(Bucket=bucket_name, Key=file_path)["ETag"].strip('"')
+    except Exception as e:
+        logger.error(f"Failed to get the ETag of {file_path} due to {e}")
+        return None
+
+
+def upload_bytes_to_s3(data, file_path):
+    try:
+        s3_client.put_object(Bucket=bucket_name, Key=file_path, Body=data)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to upload {file_path} due to {e}")
+        return False
+
+
+def read_s3_obj(file_path):
+    try:
+        return s3_client.get_object(Bucket=bucket_name, Key=file_path)["Body"].read()
+    except Exception as e:
+        logger.error(f"Failed to read {file_path} due to {e}")
+        return None
+
+
+def list_s3_objs(prefix):
+    return list(list_s3_etags(prefix))
+
+
+def list_s3_etags(prefix):
+    etags = {}
+    try:
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                etags[obj["Key"]] = obj["ETag"].strip('"')
+    except Exception as e:
+        logger.error(f"Failed to list {prefix} due to {e}")
+    return etags
+
+
+def delete_s3_prefix(prefix):
+    for key in list_s3_objs(prefix):
+        if not delete_s3_obj(key):
+            return False
+    return True
+
+
+def get_s3_obj_info(file_path):
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=file_path)
+        return {"etag": head["ETag"].strip('"'), "size": head["ContentLength"]}
+    except Exception as e:
+        logger.error(f"file not found in s3 bucket: {file_path} due to {e}")
+        return None
+
+
+def get_s3_obj_body(file_path, byte_range=None, etag=None):
+    kwargs = {"Bucket": bucket_name, "Key": file_path}
+    if byte_range is not None:
+        kwargs["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+    if etag is not None:
+        # fail instead of streaming a newer version than the one described to the client
+        kwargs["IfMatch"] = etag
+
+    try:
+        return s3_client.get_object(**kwargs)["Body"]
+    except Exception as e:
+        logger.error(f"Failed to read {file_path} due to {e}")
+        return None
+
+
+def get_s3_presigned_url(file_path, expires_in, content_disposition=None):
+    params = {"Bucket": bucket_name, "Key": file_path}
+    if content_disposition is not None:
+        params["ResponseContentDisposition"] = content_disposition
+
+    try:
+        return s3_client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires_in
+        )
+    except Exception as e:
+        logger.error(f"Failed to presign {file_path} due to {e}")
+        return None
@@ -0,0 +1,443 @@
+import math
+import multiprocessing
+import os
+import random
+import signal
+import tempfile
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+from llama_index.experimental.query_engine.pandas import PandasInstructionParser
+from config import Config
+from logger import logger
+from helper.columnar import DocumentData, copy_document
+from helper.concurrency import current_cancel_scope, run_blocking
+from helper.metrics import metrics
+from helper.shared_frames import SharedFrameStore, shared_frame_store
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - windows development setups
+    resource = None
+
+
+class CodeSandboxError(Exception):
+    """Raised when generated code fails in the sandbox."""
+
+
+class CodeSandboxTimeoutError(CodeSandboxError):
+    """Raised when generated code runs longer than the sandbox timeout."""
+
+
+class CodeSandboxLimitError(CodeSandboxError):
+    """Raised when generated code exceeds the CPU time or memory limit of its worker."""
+
+
+class CodeSandboxCancelledError(CodeSandboxError):
+    """Raised when running code was cancelled, e.g. the client disconnected."""
+
+
+class CPUTimeLimitExceeded(BaseException):
+    # a BaseException so that generated code and the pandas output parser, which
+    # catch Exception, can not swallow it
+    pass
+
+
+class _CopyOnWriteScope:
+    """
+    Enable pandas copy-on-write while generated code runs in this process.
+
+    Documents are passed to the code as shallow copies of cached or mapped frames,
+    copy-on-write keeps in-place writes of the code from reaching them. pandas options
+    are process-wide, so the option stays enabled until the last of the concurrent
+    calls returned.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = 0
+        self._previous = None
+
+    def __enter__(self) -> None:
+        with self._lock:
+            if self._users == 0:
+                self._previous = pd.get_option("mode.copy_on_write")
+                pd.set_option("mode.copy_on_write", True)
+            self._users += 1
+
+    def __exit__(self, *exc_info) -> None:
+        with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                pd.set_option("mode.copy_on_write", self._previous)
+
+
+_copy_on_write = _CopyOnWriteScope()
+
+
+def get_default_frame_dir() -> str:
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base_dir, "chat-analytics-sandbox")
+
+
+def exec_code(data: DocumentData, code: str, result_name: str) -> Any:
+    """
+    Execute python code with the document bound to `df` and return one of its variables.
+
+    Args:
+        data (DocumentData): The dataframe, or the dataframes keyed by sheet name.
+        code (str): The python code.
+        result_name (str): The name of the variable holding the result.
+
+    Returns:
+        Any: The value of the variable once the code ran.
+    """
+    global_dict = {"df": data}
+    exec(code, global_dict)
+    return global_dict[result_name]
+
+
+def parse_pandas_instructions(data: DocumentData, instructions: str) -> str:
+    """
+    Evaluate pandas instructions on the document, as `PandasInstructionParser` does.
+
+    Args:
+        data (DocumentData): The dataframe, or the dataframes keyed by sheet name.
+        instructions (str): The generated pandas code, its last line being an expression.
+
+    Returns:
+        str: The evaluated expression, or the error raised by the code.
+    """
+    return PandasInstructionParser(data).parse(instructions)
+
+
+def _raise_cpu_time_exceeded(signum, frame):
+    raise CPUTimeLimitExceeded()
+
+
+def _apply_limits(max_memory_bytes: int) -> None:
+    if resource is None:
+        return
+    # RLIMIT_RSS is not enforced by linux. RLIMIT_DATA counts the heap and the private
+    # anonymous mappings, but not the read-only mapped frames shared with the parent.
+    if max_memory_bytes > 0:
+        resource.setrlimit(resource.RLIMIT_DATA, (max_memory_bytes, max_memory_bytes))
+    signal.signal(signal.SIGXCPU, _raise_cpu_time_exceeded)
+
+
+def _set_cpu_time_limit(cpu_seconds: float) -> None:
+    if resource is None or cpu_seconds <= 0:
+        return
+    # the limit applies to the CPU time of the whole process, it is moved forward
+    # before every task
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _map_frames(frames: Tuple) -> DocumentData:
+    kind, value, sheet_names = frames
+    if kind == "pickle":
+        return value
+
+    data = []
+    for path in value:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        # split blocks keeps every column a view of the mapped buffer
+        data.append(table.to_pandas(split_blocks=True))
+    return data[0] if sheet_names is None else dict(zip(sheet_names, data))
+
+
+def _worker_main(conn, cpu_seconds: float, max_memory_bytes: int) -> None:
+    # the pool manages the lifetime of its workers, a Ctrl-C is for the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # mapped frames are read-only, generated code writing to a column gets a copy
+    pd.set_option("mode.copy_on_write", True)
+    _apply_limits(max_memory_bytes)
+
+    while True:
+        try:
+            fn, frames, args = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        try:
+            _set_cpu_time_limit(cpu_seconds)
+            data = _map_frames(frames)
+            message = ("ok", fn(data, *args))
+        except CPUTimeLimitExceeded:
+            message = ("limit", f"The code used more than {cpu_seconds:g}s of CPU time")
+        except MemoryError:
+            message = ("limit", f"The code used more than {max_memory_bytes} bytes of memory")
+        except Exception as e:
+            message = ("error", f"{type(e).__name__}: {e}")
+        finally:
+            data = None
+
+        try:
+            conn.send(message)
+        except (EOFError, OSError):
+            return
+        except Exception as e:
+            # the result could not be pickled
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _SandboxWorker:
+    def __init__(self, context, cpu_seconds: float, max_memory_bytes: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_seconds, max_memory_bytes),
+            name="code-sandbox",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class CodeSandbox:
+    """
+    Pool of worker processes that run LLM generated pandas and chart code.
+
+    Generated code used to run on the threads of the API process: a runaway groupby held
+    the GIL and could use up the memory of the whole process. Here every call runs in a
+    worker process with a CPU time limit (`RLIMIT_CPU`), a memory limit (`RLIMIT_DATA`)
+    and a wall-clock timeout. A worker that times out, crashes or exceeds a limit is
+    killed and replaced, and the calls run in parallel on as many cores as workers.
+
+    `concurrent.futures.ProcessPoolExecutor` can neither kill the worker of a single
+    call nor survive the death of one, hence this pool.
+
+    The documents are memory-mapped by the worker from Arrow IPC files, so only the
+    generated code and its pickled result go through the pipe. A document mapped from
+    the `SharedFrameStore` is passed as the files of its entry, which stays held for
+    the call. Other documents are written once per call in `frame_dir` (on `/dev/shm`
+    by default), or pickled if Arrow can not convert them.
+
+    Workers are forked from a server process that already imported pandas, started on
+    first use or by `start`. With `workers` set to 0 the code runs in the calling
+    process, as it used to, on a shallow copy of the document and with copy-on-write
+    enabled.
+    """
+
+    def __init__(
+        self,
+        workers: int = Config.CODE_SANDBOX_WORKERS,
+        timeout: float = Config.CODE_SANDBOX_TIMEOUT,
+        cpu_seconds: float = Config.CODE_SANDBOX_CPU_SECONDS,
+        max_memory_bytes: int = Config.CODE_SANDBOX_MAX_MEMORY_BYTES,
+        max_tasks_per_worker: int = Config.CODE_SANDBOX_MAX_TASKS_PER_WORKER,
+        frame_dir: Optional[str] = Config.CODE_SANDBOX_FRAME_DIR,
+        frame_store: SharedFrameStore = shared_frame_store,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.frame_dir = frame_dir or get_default_frame_dir()
+        self.frame_store = frame_store
+        self.enabled = workers > 0
+        self._context = None
+        self._idle: List[_SandboxWorker] = []
+        self._slots = threading.BoundedSemaphore(max(workers, 1))
+        self._lock = threading.Lock()
+
+    def _get_context(self):
+        with self._lock:
+            if self._context is None:
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    # forking the API process would copy its threads' locks, a fork
+                    # server is single threaded and imports pandas, and the main module
+                    # that every worker imports, once for all workers
+                    self._context = multiprocessing.get_context("forkserver")
+                    self._context.set_forkserver_preload(["__main__", __name__])
+                else:
+                    self._context = multiprocessing.get_context("spawn")
+            return self._context
+
+    def _new_worker(self) -> _SandboxWorker:
+        worker = _SandboxWorker(
+            self._get_context(), self.cpu_seconds, self.max_memory_bytes
+        )
+        metrics.increment("code_sandbox_workers_started")
+        return worker
+
+    def start(self) -> None:
+        """
+        Start the workers up front instead of on first use.
+        """
+        if not self.enabled:
+            return
+        workers = [self._acquire() for _ in range(self.workers)]
+        for worker in workers:
+            self._release(worker, healthy=True)
+
+    def _acquire(self) -> _SandboxWorker:
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return self._new_worker()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, worker: _SandboxWorker, healthy: bool) -> None:
+        if healthy and worker.tasks < self.max_tasks_per_worker:
+            with self._lock:
+                self._idle.append(worker)
+        else:
+            worker.kill()
+        self._slots.release()
+
+    def _export_frames(self, data: DocumentData) -> Tuple[Tuple, Callable[[], None]]:
+        # documents mapped from the shared store are passed as the files of their entry
+        held_files = self.frame_store.hold_files(data)
+        if held_files is not None:
+            paths, sheet_names, release = held_files
+            metrics.increment("code_sandbox_shared_frames")
+            return ("arrow", paths, sheet_names), release
+
+        sheets = {None: data} if isinstance(data, pd.DataFrame) else data
+        sheet_names = None if None in sheets else list(sheets)
+        token = random.randbytes(8).hex()
+        paths = []
+        try:
+            os.makedirs(self.frame_dir, exist_ok=True)
+            for index, df in enumerate(sheets.values()):
+                table = pa.Table.from_pandas(df)
+                path = os.path.join(self.frame_dir, f"{token}-{index:04d}.arrow")
+                paths.append(path)
+                with pa.OSFile(path, "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+        except (OSError, pa.ArrowException) as e:
+            # mixed types in a column, or no space left on the shared memory
+            logger.debug(f"Sending the document to the sandbox pickled: {e}")
+            self._remove_frames(paths)
+            return ("pickle", data, None), lambda: None
+        return ("arrow", paths, sheet_names), lambda: self._remove_frames(paths)
+
+    @staticmethod
+    def _remove_frames(paths: List[str]) -> None:
+        # the worker keeps the pages it still maps
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def run(self, fn: Callable[..., Any], data: DocumentData, *args: Any) -> Any:
+        """
+        Run a function on a document in a sandbox worker.
+
+        The call is interrupted by the `CancelScope` in `current_cancel_scope`, if any.
+
+        Args:
+            fn (Callable): A module level function, called as `fn(data, *args)`.
+            data (DocumentData): The dataframe, or the dataframes keyed by sheet name.
+            *args: Picklable arguments for the function.
+
+        Returns:
+            Any: The return value of the function.
+
+        Raises:
+            CodeSandboxError: If the function raised an error.
+            CodeSandboxTimeoutError: If the function did not return within the timeout.
+            CodeSandboxLimitError: If the function exceeded the CPU time or memory limit.
+            CodeSandboxCancelledError: If the call was cancelled.
+        """
+        if not self.enabled:
+            with _copy_on_write:
+                return fn(copy_document(data, deep=False), *args)
+
+        cancel_scope = current_cancel_scope.get()
+        if cancel_scope is not None and cancel_scope.cancelled:
+            raise CodeSandboxCancelledError("The code was cancelled")
+
+        frames, release_frames = self._export_frames(data)
+        start = time.perf_counter()
+        try:
+            worker = self._acquire()
+        except BaseException:
+            # e.g. no worker could be started
+            release_frames()
+            raise
+        metrics.observe("code_sandbox_wait_seconds", time.perf_counter() - start)
+
+        healthy = False
+        if cancel_scope is not None:
+            cancel_scope.add_callback(worker.process.kill)
+        try:
+            run_start = time.perf_counter()
+            worker.tasks += 1
+            worker.conn.send((fn, frames, args))
+            if not worker.conn.poll(self.timeout):
+                metrics.increment("code_sandbox_timeouts")
+                raise CodeSandboxTimeoutError(
+                    f"The code did not finish within {self.timeout:g} seconds"
+                )
+            try:
+                status, value = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                if cancel_scope is not None and cancel_scope.cancelled:
+                    raise CodeSandboxCancelledError("The code was cancelled") from e
+                # killed by the kernel, e.g. past the hard limits
+                metrics.increment("code_sandbox_crashes")
+                raise CodeSandboxLimitError("The sandbox worker exited") from e
+            metrics.observe("code_sandbox_run_seconds", time.perf_counter() - run_start)
+
+            if status == "limit":
+                metrics.increment("code_sandbox_limits_exceeded")
+                raise CodeSandboxLimitError(value)
+            healthy = True
+            if status == "error":
+                metrics.increment("code_sandbox_errors")
+                raise CodeSandboxError(value)
+            return value
+        finally:
+            if cancel_scope is not None:
+                cancel_scope.remove_callback(worker.process.kill)
+            self._release(worker, healthy)
+            release_frames()
+
+    async def arun(self, fn: Callable[..., Any], data: DocumentData, *args: Any) -> Any:
+        """
+        Run a function on a document in a sandbox worker without blocking the event loop.
+
+        Args:
+            fn (Callable): A module level function, called as `fn(data, *args)`.
+            data (DocumentData): The dataframe, or the dataframes keyed by sheet name.
+            *args: Picklable arguments for the function.
+
+        Returns:
+            Any: The return value of the function.
+        """
+        return await run_blocking(self.run, fn, data, *args)
+
+    def shutdown(self) -> None:
+        """
+        Stop the idle workers, busy ones are stopped once their call returns.
+        """
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.kill()
+
+
+code_sandbox = CodeSandbox()
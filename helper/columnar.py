@@ -0,0 +1,246 @@
+import io
+import re
+from typing import BinaryIO, Dict, Optional, Union
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from logger import logger
+from helper.aws_s3 import delete_s3_prefix, list_s3_etags, upload_bytes_to_s3
+from helper.metrics import metrics
+from helper.s3_cache import s3_object_cache
+
+
+# a csv document is parsed into a single dataframe, an excel document into one
+# dataframe per sheet
+DocumentData = Union[pd.DataFrame, Dict[str, pd.DataFrame]]
+
+# the parquet copy of `<object>` is stored as `<object>.columnar/<sheet index>.parquet`
+COLUMNAR_SUFFIX = ".columnar/"
+SHEET_NAME_METADATA_KEY = b"sheet_name"
+# the ETag of the raw object a copy was converted from
+SOURCE_ETAG_METADATA_KEY = b"source_etag"
+
+
+# a date, optionally followed by a time and a UTC offset, e.g. "2024-01-05" or
+# "2024-01-05T10:00:00.5+02:00"
+ISO_DATETIME_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}"
+    r"(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?"
+)
+
+
+def get_columnar_prefix(object_url: str) -> str:
+    return object_url + COLUMNAR_SUFFIX
+
+
+def copy_document(data: DocumentData, deep: bool = True) -> DocumentData:
+    """
+    Copy a parsed document.
+
+    Args:
+        data (DocumentData): The dataframe, or the dataframes keyed by sheet name.
+        deep (bool): Copy the data of the columns too. A shallow copy shares them, only
+            adding or replacing columns in it leaves the original unchanged.
+
+    Returns:
+        DocumentData: The copy.
+    """
+    if isinstance(data, pd.DataFrame):
+        return data.copy(deep=deep)
+    return {sheet: df.copy(deep=deep) for sheet, df in data.items()}
+
+
+def read_document(file: Union[str, BinaryIO], document_type: str) -> DocumentData:
+    """
+    Parse a raw csv or excel document.
+
+    Args:
+        file (Union[str, BinaryIO]): The path or file object of the document.
+        document_type (str): The type of the document, "csv" or "excel".
+
+    Returns:
+        DocumentData: The dataframe of a csv file, or the dataframes of an excel file keyed by sheet name.
+    """
+    if document_type == "csv":
+        return pd.read_csv(file)
+    return pd.read_excel(file, sheet_name=None)
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Infer the column types of a parsed document.
+
+    Text columns that only hold full ISO 8601 dates or timestamps are converted to
+    datetimes. Numeric columns are not narrowed as generated pandas code would
+    silently lose precision or overflow on them.
+
+    Args:
+        df (pd.DataFrame): The dataframe to optimize.
+
+    Returns:
+        pd.DataFrame: A dataframe with the optimized column types.
+    """
+    columns = {}
+    for name, column in df.items():
+        if column.dtype == object:
+            values = column.dropna()
+            if values.empty or not values.map(
+                lambda value: isinstance(value, str)
+                and ISO_DATETIME_PATTERN.fullmatch(value) is not None
+            ).all():
+                continue
+            try:
+                columns[name] = pd.to_datetime(column, format="ISO8601")
+            except (ValueError, TypeError, OverflowError):
+                continue
+
+    if not columns:
+        return df
+
+    df = df.copy(deep=False)
+    for name, column in columns.items():
+        df[name] = column
+    return df
+
+
+def to_parquet_bytes(
+    df: pd.DataFrame,
+    sheet_name: Optional[str] = None,
+    source_etag: Optional[str] = None,
+) -> bytes:
+    """
+    Serialize a dataframe into a parquet file.
+
+    Args:
+        df (pd.DataFrame): The dataframe to serialize.
+        sheet_name (Optional[str]): The excel sheet name, stored in the file metadata.
+        source_etag (Optional[str]): The ETag of the raw document, stored in the file metadata.
+
+    Returns:
+        bytes: The content of the parquet file.
+    """
+    table = pa.Table.from_pandas(df)
+    metadata = {}
+    if sheet_name is not None:
+        metadata[SHEET_NAME_METADATA_KEY] = str(sheet_name).encode("utf-8")
+    if source_etag is not None:
+        metadata[SOURCE_ETAG_METADATA_KEY] = source_etag.encode("utf-8")
+    if metadata:
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), **metadata}
+        )
+
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def read_parquet(source: Union[str, bytes]) -> tuple:
+    """
+    Deserialize a parquet file written by `to_parquet_bytes`.
+
+    Args:
+        source (Union[str, bytes]): The path or the content of the parquet file.
+
+    Returns:
+        tuple: The dataframe and the excel sheet name, None for csv documents.
+    """
+    if isinstance(source, bytes):
+        source = pa.BufferReader(source)
+    table = pq.read_table(source)
+    sheet_name = (table.schema.metadata or {}).get(SHEET_NAME_METADATA_KEY)
+    return table.to_pandas(), sheet_name.decode("utf-8") if sheet_name else None
+
+
+def store_columnar_copy(
+    file: Union[str, BinaryIO],
+    object_url: str,
+    document_type: str,
+    source_etag: str,
+) -> bool:
+    """
+    Convert a raw document into parquet, one file per sheet, and store it next to
+    the original in S3.
+
+    Args:
+        file (Union[str, BinaryIO]): The path or file object of the raw document.
+        object_url (str): The S3 key of the raw document.
+        document_type (str): The type of the document, "csv" or "excel".
+        source_etag (str): The ETag of the raw document, the copy is only loaded for it.
+
+    Returns:
+        bool: False if the document could not be converted, queries then keep
+        reading the raw file.
+    """
+    prefix = get_columnar_prefix(object_url)
+    # a re-uploaded file may have fewer sheets than the previous version
+    delete_s3_prefix(prefix)
+
+    try:
+        data = read_document(file, document_type)
+        sheets = {None: data} if document_type == "csv" else data
+        files = [
+            to_parquet_bytes(optimize_dtypes(df), sheet_name, source_etag)
+            for sheet_name, df in sheets.items()
+        ]
+    except Exception as e:
+        # e.g. non string column names or mixed type columns
+        logger.warning(f"Failed to convert {object_url} to parquet: {e}")
+        return False
+
+    for index, content in enumerate(files):
+        if not upload_bytes_to_s3(content, f"{prefix}{index:04d}.parquet"):
+            delete_s3_prefix(prefix)
+            return False
+
+    logger.debug(f"Stored columnar copy of {object_url} with {len(files)} file(s)")
+    return True
+
+
+def load_columnar_copy(
+    object_url: str, document_type: str, source_etag: str
+) -> Optional[DocumentData]:
+    """
+    Load the parquet copy of a document.
+
+    A copy converted from another version of the raw document, e.g. before a re-upload
+    and until the ingestion worker rebuilds it, is ignored.
+
+    Args:
+        object_url (str): The S3 key of the raw document.
+        document_type (str): The type of the document, "csv" or "excel".
+        source_etag (str): The current ETag of the raw document.
+
+    Returns:
+        Optional[DocumentData]: The parsed document, or None if it has no up to date columnar copy.
+    """
+    etags = list_s3_etags(get_columnar_prefix(object_url))
+    keys = sorted(key for key in etags if key.endswith(".parquet"))
+    if not keys:
+        return None
+
+    sheets = {}
+    for key in keys:
+        # the listing already returned the current ETags, no need to revalidate
+        file_path = s3_object_cache.get_path(key, etags[key])
+        if file_path is None:
+            return None
+        try:
+            metadata = pq.read_schema(file_path).metadata or {}
+            if metadata.get(SOURCE_ETAG_METADATA_KEY) != source_etag.encode("utf-8"):
+                metrics.increment("columnar_copy_stale")
+                logger.debug(f"Ignoring the stale columnar copy {key}")
+                return None
+            df, sheet_name = read_parquet(file_path)
+        except Exception as e:
+            logger.warning(f"Failed to read the columnar copy {key}: {e}")
+            return None
+        if document_type == "csv":
+            return df
+        sheets[sheet_name] = df
+
+    return sheets
+
+
+def delete_columnar_copy(object_url: str) -> bool:
+    return delete_s3_prefix(get_columnar_prefix(object_url))
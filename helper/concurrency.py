@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Awaitable, List, Optional
+from starlette.requests import Request
+from config import Config
+from logger import logger
+
+
+# Shared, bounded executor for blocking work (pandas parsing, boto3 transfers,
+# SQLAlchemy calls) issued from async routes and async pipeline components.
+blocking_executor = ThreadPoolExecutor(
+    max_workers=Config.BLOCKING_EXECUTOR_MAX_WORKERS,
+    thread_name_prefix="blocking-io",
+)
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking callable on the shared executor without blocking the event loop.
+
+    Args:
+        fn (Callable): The blocking function to run.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        Any: The return value of the function.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(blocking_executor, call)
+
+
+def make_async(fn: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+    """
+    Wrap a blocking function into a coroutine function that runs on the shared executor.
+
+    The wrapper keeps the signature of the original function so it can be used as the
+    `async_fn` of a llama-index `FnComponent`.
+
+    Args:
+        fn (Callable): The blocking function to wrap.
+
+    Returns:
+        Callable: The coroutine function.
+    """
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await run_blocking(fn, *args, **kwargs)
+
+    return wrapper
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the HTTP client went away before the work finished."""
+
+
+class CancelScope:
+    """
+    Cancellation handle shared between a request and the blocking work it started.
+
+    Blocking code registers callbacks that interrupt what it is currently doing (e.g.
+    cancel a running SQL statement); `cancel` runs them from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+        self.cancelled = False
+
+    def add_callback(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def remove_callback(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    @staticmethod
+    def _run_callback(callback: Callable[[], Any]) -> None:
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Cancel callback failed: {e}")
+
+
+current_cancel_scope: contextvars.ContextVar[Optional[CancelScope]] = (
+    contextvars.ContextVar("current_cancel_scope", default=None)
+)
+
+
+async def cancel_on_disconnect(
+    request: Request, awaitable: Awaitable[Any], poll_interval: float = 0.5
+) -> Any:
+    """
+    Await a coroutine and cancel it if the HTTP client disconnects.
+
+    The coroutine runs with a fresh `CancelScope` in `current_cancel_scope`, which is
+    also visible to the blocking work it starts through `run_blocking`.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        awaitable (Awaitable): The coroutine to run.
+        poll_interval (float): Seconds between disconnect checks. Defaults to 0.5.
+
+    Returns:
+        Any: The result of the coroutine.
+
+    Raises:
+        ClientDisconnectedError: If the client disconnected before the coroutine finished.
+    """
+    scope = CancelScope()
+    token = current_cancel_scope.set(scope)
+    try:
+        task = asyncio.ensure_future(awaitable)
+    finally:
+        current_cancel_scope.reset(token)
+
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll_interval)
+        if done:
+            return task.result()
+
+        if await request.is_disconnected():
+            scope.cancel()
+            task.cancel()
+            raise ClientDisconnectedError()
+
+
+async def run_in_cancel_scope(scope: CancelScope, awaitable: Awaitable[Any]) -> Any:
+    """
+    Await a coroutine with `scope` as its `current_cancel_scope`.
+
+    If the caller is cancelled, e.g. because the client of a streamed response went
+    away, the scope is cancelled as well, which interrupts the blocking work the
+    coroutine started.
+
+    Args:
+        scope (CancelScope): The cancel scope of the request.
+        awaitable (Awaitable): The coroutine to run.
+
+    Returns:
+        Any: The result of the coroutine.
+    """
+    token = current_cancel_scope.set(scope)
+    try:
+        task = asyncio.ensure_future(awaitable)
+    finally:
+        current_cancel_scope.reset(token)
+
+    try:
+        return await task
+    except asyncio.CancelledError:
+        scope.cancel()
+        task.cancel()
+        raise
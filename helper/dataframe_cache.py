@@ -0,0 +1,311 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+import pandas as pd
+from config import Config
+from logger import logger
+from db.models.user_document import UserDocument
+from helper.columnar import (
+    DocumentData,
+    copy_document,
+    load_columnar_copy,
+    optimize_dtypes,
+    read_document,
+)
+from helper.metrics import metrics
+from helper.s3_cache import s3_object_cache
+from helper.shared_frames import shared_frame_store
+
+
+# called once a cache entry is dropped
+ReleaseCallback = Optional[Callable[[], None]]
+
+
+class DocumentDownloadError(Exception):
+    """Raised when a user document can not be downloaded from S3."""
+
+
+def get_dataframe_size(data: DocumentData) -> int:
+    """
+    Get the memory used by a parsed document, including the python objects it holds.
+
+    Columns mapped from the shared store are not counted.
+
+    Args:
+        data (DocumentData): The dataframe, or the dataframes keyed by sheet name.
+
+    Returns:
+        int: The size in bytes.
+    """
+    if isinstance(data, pd.DataFrame):
+        size = int(data.index.memory_usage(deep=True))
+        for _, column in data.items():
+            # read-only columns are mapped from the shared store, their pages are
+            # shared with the other workers rather than held by this one
+            if not column.to_numpy(copy=False).flags.writeable:
+                continue
+            size += int(column.memory_usage(index=False, deep=True))
+        return size
+    return sum(get_dataframe_size(df) for df in data.values())
+
+
+class DataFrameCache:
+    """
+    Process-wide LRU cache of parsed user documents.
+
+    Entries are keyed by the `UserDocument.id` and the S3 ETag of the file so that a
+    replaced file is never served from a stale entry. The cache holds at most
+    `max_bytes` of parsed data, least recently used entries are evicted first.
+
+    An entry can carry a `release` callback, called once it leaves the cache, e.g. to
+    drop the reference an entry mapped from the shared store holds.
+    """
+
+    def __init__(self, max_bytes: int = Config.DATAFRAME_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # (document_id, etag) -> (data, size, release)
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[DocumentData, int, ReleaseCallback]]" = (
+            OrderedDict()
+        )
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, document_id: int, etag: str) -> Optional[DocumentData]:
+        """
+        Get a cached document.
+
+        Args:
+            document_id (int): The ID of the user document.
+            etag (str): The S3 ETag of the document file.
+
+        Returns:
+            Optional[DocumentData]: A shallow copy of the parsed document, or None on a miss.
+            Columns can be added to or replaced in the copy, but writing into one in
+            place changes the cached entry unless copy-on-write is enabled, as it is
+            for generated code run by `CodeSandbox.run`.
+        """
+        key = (document_id, etag)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None:
+            metrics.increment("dataframe_cache_misses")
+            return None
+
+        metrics.increment("dataframe_cache_hits")
+        return copy_document(entry[0], deep=False)
+
+    def put(
+        self,
+        document_id: int,
+        etag: str,
+        data: DocumentData,
+        release: ReleaseCallback = None,
+    ) -> bool:
+        """
+        Cache a parsed document, replacing the entries of older versions of it.
+
+        Args:
+            document_id (int): The ID of the user document.
+            etag (str): The S3 ETag of the document file.
+            data (DocumentData): The parsed document.
+            release (ReleaseCallback): Called when the entry leaves the cache.
+
+        Returns:
+            bool: False if the document is larger than the whole budget and was not cached.
+        """
+        size = get_dataframe_size(data)
+        if size > self.max_bytes:
+            logger.debug(
+                f"Document {document_id} is too large to be cached: {size} bytes"
+            )
+            return False
+
+        with self._lock:
+            released = self._pop_document(document_id)
+            self._entries[(document_id, etag)] = (data, size, release)
+            self._size += size
+
+            evicted = 0
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, evicted_release) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                released.append(evicted_release)
+                evicted += 1
+
+            cache_size = self._size
+
+        self._release(released)
+        if evicted:
+            metrics.increment("dataframe_cache_evictions", evicted)
+        metrics.observe("dataframe_cache_bytes", cache_size)
+        return True
+
+    def invalidate(self, document_id: int) -> int:
+        """
+        Drop every cached version of a document.
+
+        Args:
+            document_id (int): The ID of the user document.
+
+        Returns:
+            int: The number of dropped entries.
+        """
+        with self._lock:
+            released = self._pop_document(document_id)
+
+        self._release(released)
+        if released:
+            logger.debug(f"Invalidated cached dataframes of document: {document_id}")
+        return len(released)
+
+    def clear(self) -> None:
+        """
+        Drop every cached document.
+        """
+        with self._lock:
+            released = [release for _, _, release in self._entries.values()]
+            self._entries.clear()
+            self._size = 0
+
+        self._release(released)
+
+    def _pop_document(self, document_id: int) -> List[ReleaseCallback]:
+        released = []
+        for key in [key for key in self._entries if key[0] == document_id]:
+            _, size, release = self._entries.pop(key)
+            self._size -= size
+            released.append(release)
+        return released
+
+    @staticmethod
+    def _release(released: List[ReleaseCallback]) -> None:
+        for release in released:
+            if release is not None:
+                release()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+dataframe_cache = DataFrameCache()
+
+
+def _load_raw_document(
+    object_url: str, document_type: str, etag: Optional[str] = None
+) -> DocumentData:
+    file_path = s3_object_cache.get_path(object_url, etag)
+    if file_path is None:
+        raise DocumentDownloadError(f"Failed to download {object_url} from s3")
+
+    start = time.perf_counter()
+    data = read_document(file_path, document_type)
+    # the same column types as the columnar copy, answers must not depend on which was read
+    if isinstance(data, pd.DataFrame):
+        data = optimize_dtypes(data)
+    else:
+        data = {sheet_name: optimize_dtypes(df) for sheet_name, df in data.items()}
+    metrics.observe("dataframe_parse_seconds", time.perf_counter() - start)
+    return data
+
+
+def load_user_document(user_doc: UserDocument) -> DocumentData:
+    """
+    Load the parsed content of a user document, downloading it from S3 on a cache miss.
+
+    Documents are looked up in this worker's cache, then in the store shared by the
+    workers of the host, and only then loaded from S3, preferring the parquet copy made
+    at upload time over the raw file.
+
+    Args:
+        user_doc (UserDocument): The csv or excel document.
+
+    Returns:
+        DocumentData: The dataframe of a csv file, or the dataframes of an excel file keyed by sheet name.
+
+    Raises:
+        DocumentDownloadError: If the file could not be downloaded from S3.
+    """
+    object_url = user_doc.document_url.split("amazonaws.com/")[-1]
+    etag = s3_object_cache.get_etag(object_url)
+
+    # without an ETag there is no way to tell a replaced file apart
+    if etag is None:
+        return _load_document(object_url, user_doc.document_type)
+
+    data = dataframe_cache.get(user_doc.id, etag)
+    if data is not None:
+        return data
+
+    shared_frame = shared_frame_store.get(user_doc.id, etag)
+    if shared_frame is None:
+        data = _load_document(object_url, user_doc.document_type, etag)
+        shared_frame = shared_frame_store.put(user_doc.id, etag, data)
+
+    release = None
+    if shared_frame is not None:
+        data, release = shared_frame.data, shared_frame.release
+
+    if dataframe_cache.put(user_doc.id, etag, data, release):
+        return copy_document(data, deep=False)
+
+    if release is not None:
+        release()
+        # nothing keeps the mapped frames referenced once the lock is released
+        return copy_document(data)
+    return data
+
+
+def read_user_document(user_doc: UserDocument) -> DocumentData:
+    """
+    Load the parsed content of a user document from S3, without caching it.
+
+    For one-off reads, e.g. profiling in the ingestion worker, which does not serve
+    queries and does not share its `/dev/shm` with the workers that do.
+
+    Args:
+        user_doc (UserDocument): The csv or excel document.
+
+    Returns:
+        DocumentData: The dataframe of a csv file, or the dataframes of an excel file keyed by sheet name.
+
+    Raises:
+        DocumentDownloadError: If the file could not be downloaded from S3.
+    """
+    object_url = user_doc.document_url.split("amazonaws.com/")[-1]
+    return _load_document(
+        object_url, user_doc.document_type, s3_object_cache.get_etag(object_url)
+    )
+
+
+def _load_document(
+    object_url: str, document_type: str, etag: Optional[str] = None
+) -> DocumentData:
+    # without the ETag of the raw file, the copy could be from a previous upload
+    if etag is not None:
+        start = time.perf_counter()
+        data = load_columnar_copy(object_url, document_type, etag)
+        if data is not None:
+            metrics.observe("dataframe_columnar_load_seconds", time.perf_counter() - start)
+            return data
+
+    # documents uploaded before the columnar conversion, or that could not be converted
+    return _load_raw_document(object_url, document_type, etag)
+
+
+def invalidate_user_document(document_id: int) -> None:
+    """
+    Drop a document from this worker's cache and from the shared store.
+
+    Args:
+        document_id (int): The ID of the user document.
+    """
+    dataframe_cache.invalidate(document_id)
+    shared_frame_store.invalidate(document_id)
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from config import Config
+from logger import logger
+
+
+class EngineRegistry:
+    """
+    Process-wide cache of SQLAlchemy engines for customer databases.
+
+    Engines are keyed by the `DBConfig.id` and a hash of the connection string so that a
+    changed configuration never reuses a stale pool. The registry keeps at most
+    `max_engines` engines (least recently used are disposed first) and disposes engines
+    that have not been used for `idle_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        max_engines: int = Config.DB_ENGINE_MAX_ENGINES,
+        idle_timeout: int = Config.DB_ENGINE_IDLE_TIMEOUT,
+        pool_size: int = Config.DB_ENGINE_POOL_SIZE,
+        max_overflow: int = Config.DB_ENGINE_MAX_OVERFLOW,
+        pool_recycle: int = Config.DB_ENGINE_POOL_RECYCLE,
+    ):
+        self.max_engines = max_engines
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        # (db_config_id, config_hash) -> (engine, last_used)
+        self._engines: "OrderedDict[Tuple[Optional[int], str], Tuple[Engine, float]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_config_hash(db_url: str) -> str:
+        """
+        Get the hash of a connection string.
+
+        Args:
+            db_url (str): The URL of the database.
+
+        Returns:
+            str: The hex digest identifying the configuration.
+        """
+        return hashlib.sha256(db_url.encode("utf-8")).hexdigest()[:16]
+
+    def _create_engine(self, db_url: str) -> Engine:
+        engine_kwargs = {
+            "pool_pre_ping": True,
+            "pool_recycle": self.pool_recycle,
+        }
+        # sqlite uses file/singleton pools which do not accept queue sizing
+        if make_url(db_url).get_backend_name() != "sqlite":
+            engine_kwargs["pool_size"] = self.pool_size
+            engine_kwargs["max_overflow"] = self.max_overflow
+
+        return create_engine(db_url, **engine_kwargs)
+
+    def get_engine(self, db_url: str, db_config_id: Optional[int] = None) -> Engine:
+        """
+        Get a pooled engine for the given database, creating it if needed.
+
+        Args:
+            db_url (str): The URL of the database.
+            db_config_id (Optional[int]): The ID of the database configuration.
+
+        Returns:
+            Engine: The SQLAlchemy engine.
+        """
+        key = (db_config_id, self.get_config_hash(db_url))
+        now = time.monotonic()
+        stale_engines = []
+
+        with self._lock:
+            stale_engines.extend(self._pop_idle(now))
+
+            if key in self._engines:
+                engine, _ = self._engines.pop(key)
+            else:
+                # a new hash for a known config means the config has changed
+                if db_config_id is not None:
+                    stale_engines.extend(self._pop_config(db_config_id))
+                logger.debug(f"Creating engine for db config: {db_config_id}")
+                engine = self._create_engine(db_url)
+
+            self._engines[key] = (engine, now)
+
+            while len(self._engines) > self.max_engines:
+                _, (evicted_engine, _) = self._engines.popitem(last=False)
+                stale_engines.append(evicted_engine)
+
+        for stale_engine in stale_engines:
+            stale_engine.dispose()
+
+        return engine
+
+    def dispose(self, db_config_id: int) -> int:
+        """
+        Dispose all engines of a database configuration.
+
+        Args:
+            db_config_id (int): The ID of the database configuration.
+
+        Returns:
+            int: The number of disposed engines.
+        """
+        with self._lock:
+            stale_engines = self._pop_config(db_config_id)
+
+        for stale_engine in stale_engines:
+            stale_engine.dispose()
+
+        if stale_engines:
+            logger.debug(f"Disposed engines for db config: {db_config_id}")
+        return len(stale_engines)
+
+    def dispose_all(self) -> None:
+        """
+        Dispose every cached engine.
+        """
+        with self._lock:
+            stale_engines = [engine for engine, _ in self._engines.values()]
+            self._engines.clear()
+
+        for stale_engine in stale_engines:
+            stale_engine.dispose()
+
+    def _pop_config(self, db_config_id: int) -> list:
+        keys = [key for key in self._engines if key[0] == db_config_id]
+        return [self._engines.pop(key)[0] for key in keys]
+
+    def _pop_idle(self, now: float) -> list:
+        keys = [
+            key
+            for key, (_, last_used) in self._engines.items()
+            if now - last_used > self.idle_timeout
+        ]
+        return [self._engines.pop(key)[0] for key in keys]
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+
+engine_registry = EngineRegistry()
@@ -0,0 +1,293 @@
+import warnings
+from typing import Dict, List, Optional
+from sqlalchemy import MetaData, inspect, text, bindparam
+from sqlalchemy.dialects.mysql.reflection import ReflectedState
+from sqlalchemy.engine import Dialect, Engine
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.types import NullType
+
+
+POSTGRESQL_COLUMNS_QUERY = """
+    SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod),
+           COALESCE(a.attnum = ANY(pk.conkey), false)
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_constraint pk ON pk.conrelid = c.oid AND pk.contype = 'p'
+    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p') {table_filter}
+    ORDER BY c.relname, a.attnum
+"""
+
+POSTGRESQL_FOREIGN_KEYS_QUERY = """
+    SELECT c.relname, a.attname, rc.relname, ra.attname
+    FROM pg_constraint k
+    JOIN pg_class c ON c.oid = k.conrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_class rc ON rc.oid = k.confrelid
+    JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = k.conkey[1]
+    JOIN pg_attribute ra ON ra.attrelid = k.confrelid AND ra.attnum = k.confkey[1]
+    WHERE k.contype = 'f' AND n.nspname = current_schema() {table_filter}
+    ORDER BY c.relname, k.conname
+"""
+
+MYSQL_COLUMNS_QUERY = """
+    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.COLUMN_TYPE, c.COLUMN_KEY = 'PRI'
+    FROM information_schema.COLUMNS c
+    JOIN information_schema.TABLES t
+        ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+    WHERE c.TABLE_SCHEMA = DATABASE() AND t.TABLE_TYPE = 'BASE TABLE' {table_filter}
+    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+"""
+
+MYSQL_FOREIGN_KEYS_QUERY = """
+    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.REFERENCED_TABLE_NAME, c.REFERENCED_COLUMN_NAME
+    FROM information_schema.KEY_COLUMN_USAGE c
+    WHERE c.TABLE_SCHEMA = DATABASE() AND c.REFERENCED_TABLE_NAME IS NOT NULL
+        AND c.ORDINAL_POSITION = 1 {table_filter}
+    ORDER BY c.TABLE_NAME, c.CONSTRAINT_NAME
+"""
+
+SQLITE_COLUMNS_QUERY = """
+    SELECT m.name, p.name, p.type, p.pk > 0
+    FROM sqlite_master m
+    JOIN pragma_table_info(m.name) p
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' {table_filter}
+    ORDER BY m.name, p.cid
+"""
+
+SQLITE_FOREIGN_KEYS_QUERY = """
+    SELECT m.name, f."from", f."table", f."to"
+    FROM sqlite_master m
+    JOIN pragma_foreign_key_list(m.name) f
+    WHERE m.type = 'table' AND f.seq = 0 {table_filter}
+    ORDER BY m.name, f.id
+"""
+
+# dialect -> (columns query, foreign keys query, table name column)
+BULK_INTROSPECTION_QUERIES = {
+    "postgresql": (
+        POSTGRESQL_COLUMNS_QUERY,
+        POSTGRESQL_FOREIGN_KEYS_QUERY,
+        "c.relname",
+    ),
+    "mysql": (MYSQL_COLUMNS_QUERY, MYSQL_FOREIGN_KEYS_QUERY, "c.TABLE_NAME"),
+    "sqlite": (SQLITE_COLUMNS_QUERY, SQLITE_FOREIGN_KEYS_QUERY, "m.name"),
+}
+
+
+def _parse_postgresql_type(dialect: Dialect, column_type: str):
+    # e.g. "character varying(255)", as returned by format_type()
+    return dialect._reflect_type(column_type, {}, {}, column_type)
+
+
+def _parse_mysql_type(dialect: Dialect, column_type: str):
+    # e.g. "int(11) unsigned", parsed as a column of SHOW CREATE TABLE
+    state = ReflectedState()
+    dialect._tabledef_parser._parse_column(f"  `column` {column_type},", state)
+    return state.columns[0]["type"] if state.columns else None
+
+
+COLUMN_TYPE_PARSERS = {
+    "postgresql": _parse_postgresql_type,
+    "mysql": _parse_mysql_type,
+}
+
+
+def render_column_type(dialect: Dialect, column_type: Optional[str]) -> str:
+    """
+    Render a column type read from the catalog as the SQLAlchemy inspector does.
+
+    Postgres and MySQL spell types differently in their catalogs, e.g. "character
+    varying(255)" or "int(11) unsigned", they are parsed into the SQLAlchemy type
+    reflection would give, "VARCHAR(255)" or "INTEGER", so that the schema in the
+    prompt does not depend on the reflection path. Types SQLAlchemy does not know, e.g.
+    postgres enums and domains, are kept as spelled by the catalog.
+
+    Args:
+        dialect (Dialect): The dialect of the database.
+        column_type (Optional[str]): The column type as spelled by the catalog.
+
+    Returns:
+        str: The rendered column type.
+    """
+    parse = COLUMN_TYPE_PARSERS.get(dialect.name)
+    if parse is not None and column_type:
+        with warnings.catch_warnings():
+            # "Did not recognize type"
+            warnings.simplefilter("ignore", SAWarning)
+            try:
+                type_ = parse(dialect, column_type)
+            except Exception:
+                type_ = None
+        if type_ is not None and not isinstance(type_, NullType):
+            return str(type_)
+    return (column_type or "NULL").upper()
+
+
+def reflect_tables(
+    engine: Engine, table_names: Optional[List[str]] = None
+) -> Dict[str, dict]:
+    """
+    Reflect the columns, primary keys and foreign keys of the database tables.
+
+    Postgres, MySQL and SQLite are read with two catalog queries covering all tables,
+    other dialects fall back to the SQLAlchemy inspector.
+
+    Args:
+        engine (Engine): The engine of the database.
+        table_names (Optional[List[str]]): The tables to reflect. Defaults to all tables.
+
+    Returns:
+        Dict[str, dict]: The table information keyed by table name. Each value has the
+        keys `columns` (list of `{"name", "type"}`), `primary_key` (list of column names)
+        and `foreign_keys` (list of `{"column", "referred_table", "referred_column"}`).
+    """
+    queries = BULK_INTROSPECTION_QUERIES.get(engine.dialect.name)
+    if queries is None:
+        return reflect_tables_with_inspector(engine, table_names)
+
+    columns_query, foreign_keys_query, table_name_column = queries
+    table_filter = ""
+    params = {}
+    if table_names is not None:
+        if not table_names:
+            return {}
+        table_filter = f"AND {table_name_column} IN :table_names"
+        params["table_names"] = list(table_names)
+
+    def prepare(query: str):
+        statement = text(query.format(table_filter=table_filter))
+        if table_names is not None:
+            statement = statement.bindparams(
+                bindparam("table_names", expanding=True)
+            )
+        return statement
+
+    with engine.connect() as conn:
+        column_rows = conn.execute(prepare(columns_query), params).fetchall()
+        foreign_key_rows = conn.execute(prepare(foreign_keys_query), params).fetchall()
+
+    tables = {}
+    for table_name, column_name, column_type, is_primary_key in column_rows:
+        table_info = tables.setdefault(
+            table_name, {"columns": [], "primary_key": [], "foreign_keys": []}
+        )
+        table_info["columns"].append(
+            {"name": column_name, "type": render_column_type(engine.dialect, column_type)}
+        )
+        if is_primary_key:
+            table_info["primary_key"].append(column_name)
+
+    for table_name, column_name, referred_table, referred_column in foreign_key_rows:
+        if table_name not in tables:
+            continue
+        if referred_column is None:
+            # sqlite foreign keys may implicitly reference the primary key
+            referred_column = _get_sqlite_primary_key(engine, tables, referred_table)
+        tables[table_name]["foreign_keys"].append(
+            {
+                "column": column_name,
+                "referred_table": referred_table,
+                "referred_column": referred_column,
+            }
+        )
+
+    return tables
+
+
+def _get_sqlite_primary_key(
+    engine: Engine, tables: Dict[str, dict], table_name: str
+) -> Optional[str]:
+    if table_name in tables:
+        primary_key = tables[table_name]["primary_key"]
+        return primary_key[0] if primary_key else None
+
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT name FROM pragma_table_info(:table_name) WHERE pk = 1"),
+            {"table_name": table_name},
+        ).first()
+    return row[0] if row else None
+
+
+def reflect_tables_with_inspector(
+    engine: Engine, table_names: Optional[List[str]] = None
+) -> Dict[str, dict]:
+    """
+    Reflect the database tables with the SQLAlchemy inspector.
+
+    This issues one foreign key query per table and is only used for dialects without
+    bulk catalog queries.
+
+    Args:
+        engine (Engine): The engine of the database.
+        table_names (Optional[List[str]]): The tables to reflect. Defaults to all tables.
+
+    Returns:
+        Dict[str, dict]: The table information keyed by table name.
+    """
+    metadata = MetaData()
+    metadata.reflect(bind=engine, only=table_names, resolve_fks=False)
+
+    inspector = inspect(engine)
+
+    tables = {}
+    for table_name, table in metadata.tables.items():
+        foreign_keys = inspector.get_foreign_keys(table_name)
+        tables[table_name] = {
+            "columns": [
+                {"name": column.name, "type": str(column.type)}
+                for column in table.columns
+            ],
+            "primary_key": [column.name for column in table.primary_key.columns],
+            "foreign_keys": [
+                {
+                    "column": fk["constrained_columns"][0],
+                    "referred_table": fk["referred_table"],
+                    "referred_column": fk["referred_columns"][0],
+                }
+                for fk in foreign_keys
+            ],
+        }
+
+    return tables
+
+
+def render_table_schema(table_name: str, table_info: dict) -> str:
+    """
+    Render the schema of a single table for the LLM prompt.
+
+    Args:
+        table_name (str): The name of the table.
+        table_info (dict): The table information as returned by `reflect_tables`.
+
+    Returns:
+        str: The rendered table schema.
+    """
+    table_schema = f"\n\nTable: {table_name}\n"
+    table_schema += "-" * 30 + "\n"
+    fk_dict = {fk["column"]: fk for fk in table_info["foreign_keys"]}
+    for column in table_info["columns"]:
+        if column["name"] in fk_dict:
+            fk = fk_dict[column["name"]]
+            table_schema += f"  {column['name']} ({column['type']}) [Foreign Key: {fk['referred_table']}.{fk['referred_column']}]\n"
+        else:
+            table_schema += f"  {column['name']} ({column['type']})\n"
+
+    return table_schema
+
+
+def render_db_schema(tables: Dict[str, dict]) -> str:
+    """
+    Render the schema of the database for the LLM prompt.
+
+    Args:
+        tables (Dict[str, dict]): The table information as returned by `reflect_tables`.
+
+    Returns:
+        str: The rendered database schema, tables ordered by name.
+    """
+    return "".join(
+        render_table_schema(table_name, tables[table_name])
+        for table_name in sorted(tables)
+    )
@@ -0,0 +1,162 @@
+import re
+from typing import BinaryIO, Iterator, Optional, Tuple
+from urllib.parse import quote
+from fastapi import status
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from config import Config
+from helper.aws_s3 import get_s3_obj_body, get_s3_obj_info, get_s3_presigned_url
+from helper.metrics import metrics
+from helper.s3_cache import s3_object_cache
+
+
+class RangeNotSatisfiableError(ValueError):
+    """Raised when a requested byte range lies outside of the file."""
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range of a `Range` header.
+
+    Malformed headers and multiple ranges are ignored, the whole file is then served
+    as allowed by RFC 9110.
+
+    Args:
+        range_header (Optional[str]): The value of the `Range` header.
+        size (int): The size of the file in bytes.
+
+    Returns:
+        Optional[Tuple[int, int]]: The first and last byte of the range, or None to serve the whole file.
+
+    Raises:
+        RangeNotSatisfiableError: If the range starts after the end of the file.
+    """
+    if not range_header:
+        return None
+
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", range_header)
+    if match is None or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # suffix range, the last `end` bytes of the file
+        if int(end) == 0 or size == 0:
+            raise RangeNotSatisfiableError(range_header)
+        return max(size - int(end), 0), size - 1
+
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiableError(range_header)
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def get_content_disposition(file_name: str) -> str:
+    quoted_name = quote(file_name)
+    if quoted_name != file_name:
+        return f"attachment; filename*=utf-8''{quoted_name}"
+    return f'attachment; filename="{file_name}"'
+
+
+def iter_file(file: BinaryIO, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+    try:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def iter_s3_body(body, chunk_size: int) -> Iterator[bytes]:
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+
+def create_download_response(
+    object_url: str, file_name: str, range_header: Optional[str] = None
+) -> Optional[Response]:
+    """
+    Create a response that streams an S3 object to the client in chunks.
+
+    The object is read from the local S3 cache when it is already there, otherwise
+    streamed from `get_object` without touching the disk, so a download holds a single
+    chunk in memory whatever the file size. With `DOWNLOAD_REDIRECT`, the client is
+    redirected to a short-lived presigned url instead.
+
+    Blocking, run it with `run_blocking` from async routes.
+
+    Args:
+        object_url (str): The S3 key of the object.
+        file_name (str): The file name sent to the client.
+        range_header (Optional[str]): The `Range` header of the request.
+
+    Returns:
+        Optional[Response]: The response, or None if the object could not be read from S3.
+    """
+    content_disposition = get_content_disposition(file_name)
+    if Config.DOWNLOAD_REDIRECT:
+        url = get_s3_presigned_url(
+            object_url, Config.DOWNLOAD_PRESIGNED_URL_EXPIRES, content_disposition
+        )
+        if url is None:
+            return None
+        metrics.increment("document_download_redirects")
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    info = get_s3_obj_info(object_url)
+    if info is None:
+        return None
+
+    size = info["size"]
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiableError:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    start, end = byte_range or (0, size - 1)
+
+    content = None
+    file_path = s3_object_cache.get_cached_path(info["etag"])
+    if file_path is not None:
+        try:
+            # an open file keeps its content even if the cache evicts it meanwhile
+            file = open(file_path, "rb")
+            content = iter_file(file, start, end, Config.DOWNLOAD_CHUNK_SIZE)
+            metrics.increment("document_downloads_from_cache")
+        except FileNotFoundError:
+            pass
+
+    if content is None:
+        body = get_s3_obj_body(object_url, byte_range, info["etag"])
+        if body is None:
+            return None
+        content = iter_s3_body(body, Config.DOWNLOAD_CHUNK_SIZE)
+        metrics.increment("document_downloads_from_s3")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition,
+        "Content-Length": str(end - start + 1),
+        "ETag": f'"{info["etag"]}"',
+    }
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    return StreamingResponse(
+        content,
+        status_code=(
+            status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+        ),
+        headers=headers,
+        media_type="application/octet-stream",
+    )
@@ -0,0 +1,227 @@
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Mapping, Optional, Tuple
+import openai
+from openai import OpenAI
+from config import Config
+from logger import logger
+from helper.metrics import metrics
+from helper.llm_clients import llm_clients
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# errors worth another attempt with the same input
+_TRANSIENT_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def get_chunk_hash(text: str, model: str = Config.DEFAULT_OPENAI_EMBEDDING_MODEL) -> str:
+    """
+    Get the content hash of a chunk, used as the id of its vector.
+
+    Args:
+        text (str): The text of the chunk as it is embedded.
+        model (str): The embedding model, so that changing it invalidates the vectors.
+
+    Returns:
+        str: The hex digest of the model and the text.
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse the durations of the OpenAI rate limit headers, e.g. "1s", "6m0s" or "20ms".
+
+    Args:
+        value (Optional[str]): The header value.
+
+    Returns:
+        Optional[float]: The duration in seconds, or None if it can not be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def get_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Get the seconds to wait before the next request from the headers of a response.
+
+    Args:
+        headers (Mapping[str, str]): The response headers.
+
+    Returns:
+        Optional[float]: The seconds to wait, or None if the headers do not say.
+    """
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = parse_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    resets = [
+        parse_duration(headers.get("x-ratelimit-reset-requests")),
+        parse_duration(headers.get("x-ratelimit-reset-tokens")),
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+class EmbeddingRateLimiter:
+    """
+    Shares the rate limit state of the OpenAI api between the threads embedding a document.
+
+    When a response shows that the request or token budget is about to run out, or a
+    request is rate limited, every thread waits for the budget to reset instead of
+    retrying on its own and using up the budget again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def update(self, headers: Mapping[str, str], reserve_tokens: int = 0) -> None:
+        """
+        Pause the requests if the rate limit headers show the budget is nearly used up.
+
+        Args:
+            headers (Mapping[str, str]): The headers of a successful response.
+            reserve_tokens (int): The tokens the requests in flight are expected to use.
+        """
+        try:
+            remaining_requests = int(headers.get("x-ratelimit-remaining-requests", 1))
+            remaining_tokens = int(headers.get("x-ratelimit-remaining-tokens", reserve_tokens + 1))
+        except ValueError:
+            return
+
+        if remaining_requests <= 0:
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        elif remaining_tokens <= reserve_tokens:
+            reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        else:
+            return
+        if reset:
+            logger.debug(f"Embedding rate limit nearly reached, pausing for {reset:.2f}s")
+            self.pause(reset)
+
+
+def _embed_batch(
+    client: OpenAI,
+    texts: List[str],
+    model: str,
+    rate_limiter: EmbeddingRateLimiter,
+    max_retries: int,
+    reserve_batches: int,
+) -> Tuple[List[List[float]], int]:
+    for attempt in range(max_retries + 1):
+        rate_limiter.wait()
+        try:
+            raw_response = client.embeddings.with_raw_response.create(input=texts, model=model)
+        except openai.RateLimitError as e:
+            if attempt == max_retries:
+                raise
+            metrics.increment("embedding_rate_limited")
+            delay = get_retry_after(e.response.headers) or 2**attempt
+            logger.warning(f"Embedding request rate limited, retrying in {delay:.2f}s")
+            rate_limiter.pause(delay)
+            continue
+        except _TRANSIENT_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            logger.warning(f"Embedding request failed, retrying: {e}")
+            time.sleep(2**attempt)
+            continue
+
+        response = raw_response.parse()
+        tokens = response.usage.total_tokens
+        rate_limiter.update(raw_response.headers, reserve_tokens=tokens * reserve_batches)
+        data = sorted(response.data, key=lambda embedding: embedding.index)
+        return [embedding.embedding for embedding in data], tokens
+
+
+def embed_texts(
+    texts: List[str],
+    client: Optional[OpenAI] = None,
+    model: str = Config.DEFAULT_OPENAI_EMBEDDING_MODEL,
+    batch_size: int = Config.EMBEDDING_BATCH_SIZE,
+    concurrency: int = Config.EMBEDDING_CONCURRENCY,
+    max_retries: int = Config.EMBEDDING_MAX_RETRIES,
+) -> Tuple[List[List[float]], int]:
+    """
+    Embed texts in batches, with up to `concurrency` requests in flight.
+
+    Args:
+        texts (List[str]): The texts to embed.
+        client (Optional[OpenAI]): The OpenAI client, the shared one by default.
+        model (str): The embedding model.
+        batch_size (int): The number of texts per request.
+        concurrency (int): The number of requests sent at the same time.
+        max_retries (int): The number of retries of a rate limited or failed request.
+
+    Returns:
+        Tuple[List[List[float]], int]: The embeddings in the order of the texts, and the
+        number of tokens they used.
+    """
+    if not texts:
+        return [], 0
+
+    # retries are handled here, so that rate limited requests wait together
+    client = client or llm_clients.get_openai_client(max_retries=0)
+    rate_limiter = EmbeddingRateLimiter()
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    results: List[Optional[List[List[float]]]] = [None] * len(batches)
+    total_tokens = 0
+    done = 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(batches))), thread_name_prefix="embedding"
+    ) as executor:
+        futures = {
+            executor.submit(
+                _embed_batch, client, batch, model, rate_limiter, max_retries, concurrency
+            ): index
+            for index, batch in enumerate(batches)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            results[index], tokens = future.result()
+            total_tokens += tokens
+            done += len(batches[index])
+
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            logger.info(
+                f"Embedded {done}/{len(texts)} chunks "
+                f"({done / elapsed:.1f} chunks/s, {total_tokens / elapsed:.1f} tokens/s)"
+            )
+
+    return [embedding for batch in results for embedding in batch], total_tokens
@@ -0,0 +1,232 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+import pandas as pd
+from sqlalchemy.orm import Session
+from config import Config
+from logger import logger
+from db import SessionLocal
+from db.models.user_document import UserDocument
+from db.queries.user_documents import UserDocumentQuery
+from helper.columnar import DocumentData, store_columnar_copy
+from helper.dataframe_cache import DocumentDownloadError, read_user_document
+from helper.job_queue import JobQueue
+from helper.metrics import metrics
+from helper.openai import create_document_embedding
+from helper.pipelines.suggestion import warm_document_suggestions
+from helper.s3_cache import s3_object_cache
+from schemas.jobs import Job
+
+
+INGEST_DOCUMENT_JOB = "ingest_document"
+
+ingestion_queue = JobQueue("ingestion")
+
+
+def _to_json_value(value: Any) -> Any:
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value.item() if hasattr(value, "item") else value
+
+
+def profile_dataframe(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Summarize the columns of a dataframe.
+
+    Args:
+        df (pd.DataFrame): The dataframe to profile.
+
+    Returns:
+        Dict[str, Any]: The number of rows, and the type, null count, distinct count and
+        value range of every column.
+    """
+    columns = []
+    for name, column in df.items():
+        profile = {
+            "name": str(name),
+            "dtype": str(column.dtype),
+            "nulls": int(column.isna().sum()),
+            "distinct": int(column.nunique()),
+        }
+        is_numeric = pd.api.types.is_numeric_dtype(column.dtype)
+        if is_numeric and not pd.api.types.is_bool_dtype(column.dtype):
+            profile.update(
+                min=_to_json_value(column.min()),
+                max=_to_json_value(column.max()),
+                mean=_to_json_value(column.mean()),
+            )
+        elif pd.api.types.is_datetime64_any_dtype(column.dtype):
+            profile.update(
+                min=_to_json_value(column.min()), max=_to_json_value(column.max())
+            )
+        columns.append(profile)
+
+    return {"rows": len(df), "columns": columns}
+
+
+def profile_document(data: DocumentData) -> Dict[str, Any]:
+    """
+    Summarize a parsed document.
+
+    Args:
+        data (DocumentData): The dataframe of a csv file, or the dataframes of an excel file keyed by sheet name.
+
+    Returns:
+        Dict[str, Any]: The profile of the dataframe, or the profiles keyed by sheet name.
+    """
+    if isinstance(data, pd.DataFrame):
+        return profile_dataframe(data)
+    return {"sheets": {str(sheet): profile_dataframe(df) for sheet, df in data.items()}}
+
+
+def _get_object_url(user_doc: UserDocument) -> str:
+    return user_doc.document_url.split("amazonaws.com/")[-1]
+
+
+def _get_local_path(object_url: str, etag: Optional[str] = None) -> str:
+    file_path = s3_object_cache.get_path(object_url, etag)
+    if file_path is None:
+        raise DocumentDownloadError(f"Failed to download {object_url} from s3")
+    return file_path
+
+
+def convert_to_columnar(db: Session, user_doc: UserDocument) -> None:
+    object_url = _get_object_url(user_doc)
+    # the copy is tagged with the version it is converted from, a re-upload makes it stale
+    etag = s3_object_cache.get_etag(object_url)
+    if etag is None:
+        raise DocumentDownloadError(f"Failed to download {object_url} from s3")
+    # documents that can not be converted keep being read from the raw file
+    store_columnar_copy(
+        _get_local_path(object_url, etag), object_url, user_doc.document_type, etag
+    )
+
+
+def profile_user_document(db: Session, user_doc: UserDocument) -> None:
+    profile = profile_document(read_user_document(user_doc))
+    UserDocumentQuery.update_profile(db, user_doc.id, profile)
+    db.commit()
+
+
+def embed_user_document(db: Session, user_doc: UserDocument) -> None:
+    object_url = _get_object_url(user_doc)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the reader picks its parser from the file extension, which cached objects do
+        # not have, and the collection is named after the file
+        document_path = os.path.join(tmp_dir, object_url.split("/")[-1])
+        os.symlink(_get_local_path(object_url), document_path)
+        embedding_path = create_document_embedding(
+            document_path=document_path,
+            customer_uuid=str(user_doc.customer_uuid),
+            document_id=user_doc.id,
+        )
+    UserDocumentQuery.update_embedding_path(db, user_doc.id, embedding_path)
+    db.commit()
+
+
+def warm_suggestions(db: Session, user_doc: UserDocument) -> None:
+    warm_document_suggestions(user_doc)
+
+
+IngestionStep = Callable[[Session, UserDocument], None]
+
+INGESTION_STEPS: Dict[str, IngestionStep] = {
+    "columnar": convert_to_columnar,
+    "profile": profile_user_document,
+    "embedding": embed_user_document,
+    "suggestions": warm_suggestions,
+}
+
+# steps calling the rate limited openai api run for fewer jobs at a time than the
+# worker has slots
+_step_limits: Dict[str, threading.Semaphore] = {
+    "embedding": threading.Semaphore(Config.INGESTION_OPENAI_CONCURRENCY),
+    "suggestions": threading.Semaphore(Config.INGESTION_OPENAI_CONCURRENCY),
+}
+
+
+def get_enabled_steps() -> List[str]:
+    return [step for step in Config.INGESTION_STEPS if step in INGESTION_STEPS]
+
+
+def enqueue_document_ingestion(document_id: int) -> Optional[Job]:
+    """
+    Queue the post-upload processing of a document for the ingestion worker.
+
+    Args:
+        document_id (int): The ID of the user document.
+
+    Returns:
+        Optional[Job]: The queued job, or None if the queue is unavailable.
+    """
+    try:
+        return ingestion_queue.enqueue(
+            INGEST_DOCUMENT_JOB,
+            {"document_id": document_id, "completed_steps": []},
+            max_attempts=Config.INGESTION_MAX_ATTEMPTS,
+        )
+    except Exception as e:
+        # queries still work on the raw file, only the ingestion steps are missing
+        logger.error(f"Failed to queue the ingestion of document {document_id}: {e}")
+        return None
+
+
+def ingest_document(job: Job) -> None:
+    """
+    Run the ingestion steps of a document that have not completed in earlier attempts.
+
+    The progress is saved after every step, so a retried job resumes where the previous
+    attempt failed.
+
+    Args:
+        job (Job): The ingestion job.
+    """
+    document_id = job.payload["document_id"]
+    completed_steps = job.payload.setdefault("completed_steps", [])
+
+    db = SessionLocal()
+    try:
+        user_doc = UserDocumentQuery.get_user_document_by_id(db, document_id)
+        if user_doc is None:
+            logger.info(f"Skipping the ingestion of deleted document {document_id}")
+            return
+
+        UserDocumentQuery.update_ingestion_status(db, document_id, "processing")
+        db.commit()
+
+        for step in get_enabled_steps():
+            if step in completed_steps:
+                continue
+
+            start = time.perf_counter()
+            with _step_limits.get(step) or nullcontext():
+                INGESTION_STEPS[step](db, user_doc)
+            metrics.observe(f"ingestion_{step}_seconds", time.perf_counter() - start)
+
+            completed_steps.append(step)
+            ingestion_queue.save_progress(job)
+
+        UserDocumentQuery.update_ingestion_status(db, document_id, "ready")
+        db.commit()
+        logger.debug(f"Ingested document {document_id}")
+    except Exception as e:
+        db.rollback()
+        status = "failed" if job.attempts >= job.max_attempts else "retrying"
+        try:
+            UserDocumentQuery.update_ingestion_status(db, document_id, status, str(e))
+            db.commit()
+        except Exception as status_error:
+            logger.error(
+                f"Failed to update the ingestion status of document {document_id}: {status_error}"
+            )
+        raise
+    finally:
+        db.close()
+
+
+INGESTION_HANDLERS = {INGEST_DOCUMENT_JOB: ingest_document}
@@ -0,0 +1,275 @@
+import random
+import time
+import uuid
+from typing import Any, Dict, Optional
+import redis
+from config import Config
+from logger import logger
+from helper.metrics import metrics
+from helper.redis_client import get_redis_client
+from schemas.jobs import Job
+
+
+def _to_str(value: Any) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class JobQueue:
+    """
+    Durable job queue stored in redis.
+
+    Job ids move from the `ready` list to the `processing` list when a worker reserves
+    them, and the worker holds a lease on the job until it completes or fails it. Jobs
+    whose lease expires, e.g. because the worker process died, are put back in the
+    queue. Failed jobs are retried with exponential backoff through the `delayed`
+    sorted set until they run out of attempts.
+
+    Only plain list, sorted set and string commands are used, so that a local redis
+    stand-in is enough to run the queue in tests.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        redis_client: Optional[redis.Redis] = None,
+        visibility_timeout: float = Config.JOB_VISIBILITY_TIMEOUT,
+        retry_backoff: float = Config.JOB_RETRY_BACKOFF,
+        retry_backoff_max: float = Config.JOB_RETRY_BACKOFF_MAX,
+        result_ttl: int = Config.JOB_RESULT_TTL,
+    ):
+        self.name = name
+        self._redis = redis_client
+        self.visibility_timeout = visibility_timeout
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.result_ttl = result_ttl
+
+        self._ready_key = f"jobs:{name}:ready"
+        self._processing_key = f"jobs:{name}:processing"
+        self._delayed_key = f"jobs:{name}:delayed"
+        self._leases_key = f"jobs:{name}:leases"
+
+    @property
+    def redis(self) -> redis.Redis:
+        return self._redis if self._redis is not None else get_redis_client()
+
+    def _job_key(self, job_id: str) -> str:
+        return f"jobs:{self.name}:job:{job_id}"
+
+    def _save(self, job: Job, ttl: Optional[int] = None) -> None:
+        job.updated_at = time.time()
+        self.redis.set(self._job_key(job.id), job.model_dump_json(), ex=ttl)
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        max_attempts: int = Config.JOB_MAX_ATTEMPTS,
+        job_id: Optional[str] = None,
+    ) -> Job:
+        """
+        Add a job to the queue.
+
+        Args:
+            job_type (str): The name of the handler that runs the job.
+            payload (Dict[str, Any]): The JSON serializable arguments of the job.
+            max_attempts (int): The number of attempts before the job is marked as failed.
+            job_id (Optional[str]): The id of the job, a random one by default. If a job
+                with this id exists and has not expired, it is returned instead of
+                enqueuing a duplicate.
+
+        Returns:
+            Job: The enqueued job, or the existing job with the same id.
+        """
+        now = time.time()
+        job = Job(
+            id=job_id or uuid.uuid4().hex,
+            type=job_type,
+            payload=payload,
+            max_attempts=max_attempts,
+            enqueued_at=now,
+            updated_at=now,
+        )
+        # only the request that creates the job pushes it, even if several race
+        if not self.redis.set(self._job_key(job.id), job.model_dump_json(), nx=True):
+            existing = self.get(job.id)
+            if existing is not None:
+                metrics.increment(f"{self.name}_jobs_deduplicated")
+                return existing
+            self._save(job)
+
+        depth = self.redis.lpush(self._ready_key, job.id)
+        metrics.increment(f"{self.name}_jobs_enqueued")
+        metrics.observe(f"{self.name}_queue_depth", depth)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Get a job by its id.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            Optional[Job]: The job, or None if it does not exist or has expired.
+        """
+        data = self.redis.get(self._job_key(job_id))
+        return Job.model_validate_json(data) if data is not None else None
+
+    def reserve(self, timeout: float = 1) -> Optional[Job]:
+        """
+        Take the next job off the queue and lease it to the calling worker.
+
+        Args:
+            timeout (float): The seconds to wait for a job.
+
+        Returns:
+            Optional[Job]: The job, or None if none became ready in time.
+        """
+        self.requeue_expired()
+        self.promote_delayed()
+
+        job_id = self.redis.blmove(
+            self._ready_key, self._processing_key, timeout, "RIGHT", "LEFT"
+        )
+        if job_id is None:
+            return None
+
+        job_id = _to_str(job_id)
+        job = self.get(job_id)
+        if job is None:
+            logger.warning(f"Dropping unknown job {job_id} from the {self.name} queue")
+            self.redis.lrem(self._processing_key, 0, job_id)
+            return None
+
+        if job.attempts == 0:
+            metrics.observe(f"{self.name}_job_wait_seconds", time.time() - job.enqueued_at)
+        job.attempts += 1
+        job.status = "running"
+        self._save(job)
+        self.extend_lease(job)
+        return job
+
+    def extend_lease(self, job: Job) -> None:
+        """
+        Keep a running job leased to its worker for another `visibility_timeout`.
+
+        Args:
+            job (Job): The running job.
+        """
+        self.redis.zadd(
+            self._leases_key, {job.id: time.time() + self.visibility_timeout}
+        )
+
+    def save_progress(self, job: Job) -> None:
+        """
+        Persist the payload of a running job, so that a retry can resume from it.
+
+        Args:
+            job (Job): The running job.
+        """
+        self._save(job)
+
+    def complete(self, job: Job) -> None:
+        """
+        Mark a job as succeeded and release it.
+
+        Args:
+            job (Job): The running job.
+        """
+        job.status = "succeeded"
+        job.error = None
+        self._save(job, ttl=self.result_ttl)
+        self._release(job.id)
+        metrics.increment(f"{self.name}_jobs_succeeded")
+        metrics.observe(f"{self.name}_job_seconds", time.time() - job.enqueued_at)
+
+    def fail(self, job: Job, error: str) -> bool:
+        """
+        Release a failed job and schedule its retry if it has attempts left.
+
+        Args:
+            job (Job): The running job.
+            error (str): The error of the attempt.
+
+        Returns:
+            bool: True if the job will be retried.
+        """
+        job.error = error
+        self._release(job.id)
+
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            self._save(job, ttl=self.result_ttl)
+            metrics.increment(f"{self.name}_jobs_failed")
+            logger.error(f"Job {job.id} failed after {job.attempts} attempts: {error}")
+            return False
+
+        delay = self.get_retry_delay(job.attempts)
+        job.status = "retrying"
+        self._save(job)
+        self.redis.zadd(self._delayed_key, {job.id: time.time() + delay})
+        metrics.increment(f"{self.name}_jobs_retried")
+        logger.warning(f"Retrying job {job.id} in {delay:.1f}s: {error}")
+        return True
+
+    def get_retry_delay(self, attempts: int) -> float:
+        # exponential backoff with jitter, so jobs that failed together do not all
+        # hit a recovering service at the same time
+        delay = min(self.retry_backoff * 2 ** (attempts - 1), self.retry_backoff_max)
+        return delay * random.uniform(0.5, 1)
+
+    def _release(self, job_id: str) -> None:
+        self.redis.lrem(self._processing_key, 0, job_id)
+        self.redis.zrem(self._leases_key, job_id)
+
+    def promote_delayed(self) -> int:
+        """
+        Move the delayed jobs that are due into the queue.
+
+        Returns:
+            int: The number of promoted jobs.
+        """
+        promoted = 0
+        for job_id in self.redis.zrangebyscore(
+            self._delayed_key, 0, time.time(), start=0, num=100
+        ):
+            # only the worker that removes the id pushes it, even if several race
+            if self.redis.zrem(self._delayed_key, job_id):
+                self.redis.lpush(self._ready_key, job_id)
+                promoted += 1
+        return promoted
+
+    def requeue_expired(self) -> int:
+        """
+        Fail the running jobs whose worker stopped renewing their lease.
+
+        Returns:
+            int: The number of expired jobs.
+        """
+        expired = 0
+        for job_id in self.redis.zrangebyscore(
+            self._leases_key, 0, time.time(), start=0, num=100
+        ):
+            if not self.redis.zrem(self._leases_key, job_id):
+                continue
+            expired += 1
+            job = self.get(_to_str(job_id))
+            if job is None:
+                self.redis.lrem(self._processing_key, 0, job_id)
+                continue
+            self.fail(job, "The worker running the job stopped responding")
+        return expired
+
+    def depth(self) -> Dict[str, int]:
+        """
+        Get the number of jobs in every state of the queue.
+
+        Returns:
+            Dict[str, int]: The number of ready, delayed and running jobs.
+        """
+        return {
+            "ready": self.redis.llen(self._ready_key),
+            "delayed": self.redis.zcard(self._delayed_key),
+            "running": self.redis.llen(self._processing_key),
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+from logger import logger
+from helper.job_queue import JobQueue
+from helper.metrics import metrics
+from schemas.jobs import Job
+
+
+JobHandler = Callable[[Job], Union[None, Awaitable[None]]]
+
+
+class JobWorker:
+    """
+    Runs the jobs of a queue with at most `concurrency` jobs at the same time.
+
+    While a job runs, its lease is renewed in the background so that long jobs are not
+    mistaken for jobs of a dead worker. A handler fails its job by raising, the queue
+    then decides whether the job is retried.
+
+    Handlers may be coroutine functions. They all run on one event loop of the worker, so
+    that the async HTTP pool of the process is only used from that loop.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, JobHandler],
+        concurrency: int = 1,
+        poll_timeout: float = 1,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_timeout = poll_timeout
+        self._stop_event = threading.Event()
+        self._slots = threading.Semaphore(concurrency)
+        self._running: Dict[str, Job] = {}
+        self._running_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name=f"{self.queue.name}-loop",
+                    daemon=True,
+                ).start()
+            return self._loop
+
+    def _call_handler(self, handler: JobHandler, job: Job) -> Any:
+        if inspect.iscoroutinefunction(handler):
+            return asyncio.run_coroutine_threadsafe(handler(job), self._get_loop()).result()
+        return handler(job)
+
+    def run_job(self, job: Job) -> bool:
+        """
+        Run a reserved job and complete or fail it.
+
+        Args:
+            job (Job): The reserved job.
+
+        Returns:
+            bool: True if the job succeeded.
+        """
+        handler = self.handlers.get(job.type)
+        if handler is None:
+            job.attempts = job.max_attempts
+            self.queue.fail(job, f"No handler for jobs of type {job.type}")
+            return False
+
+        with self._running_lock:
+            self._running[job.id] = job
+        start = time.perf_counter()
+        try:
+            self._call_handler(handler, job)
+        except Exception as e:
+            logger.exception(f"Job {job.id} of type {job.type} failed")
+            self.queue.fail(job, f"{type(e).__name__}: {e}")
+            return False
+        finally:
+            with self._running_lock:
+                self._running.pop(job.id, None)
+            metrics.observe(f"{job.type}_job_run_seconds", time.perf_counter() - start)
+
+        self.queue.complete(job)
+        return True
+
+    def run_once(self, timeout: Optional[float] = None) -> Optional[bool]:
+        """
+        Reserve a single job and run it in the calling thread.
+
+        Args:
+            timeout (Optional[float]): The seconds to wait for a job, `poll_timeout` by default.
+
+        Returns:
+            Optional[bool]: None if no job was ready, otherwise whether the job succeeded.
+        """
+        job = self.queue.reserve(self.poll_timeout if timeout is None else timeout)
+        if job is None:
+            return None
+        return self.run_job(job)
+
+    def _heartbeat(self) -> None:
+        interval = max(self.queue.visibility_timeout / 3, 0.1)
+        while not self._stop_event.wait(interval):
+            with self._running_lock:
+                jobs = list(self._running.values())
+            for job in jobs:
+                try:
+                    self.queue.extend_lease(job)
+                except Exception as e:
+                    logger.warning(f"Failed to extend the lease of job {job.id}: {e}")
+
+    def _run_and_release(self, job: Job) -> None:
+        try:
+            self.run_job(job)
+        finally:
+            self._slots.release()
+
+    def run(self) -> None:
+        """
+        Run jobs until `stop` is called, then wait for the running jobs to finish.
+        """
+        logger.info(
+            f"Worker started on the {self.queue.name} queue with {self.concurrency} slot(s)"
+        )
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=f"{self.queue.name}-job"
+        ) as executor:
+            while not self._stop_event.is_set():
+                # only take a job off the queue once a slot is free, so that other
+                # workers can pick up the rest
+                if not self._slots.acquire(timeout=self.poll_timeout):
+                    continue
+                try:
+                    job = self.queue.reserve(self.poll_timeout)
+                except Exception as e:
+                    self._slots.release()
+                    logger.error(f"Failed to reserve a job: {e}")
+                    self._stop_event.wait(self.poll_timeout)
+                    continue
+
+                if job is None:
+                    self._slots.release()
+                    continue
+                executor.submit(self._run_and_release, job)
+
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+        logger.info(f"Worker stopped on the {self.queue.name} queue")
+
+    def stop(self) -> None:
+        self._stop_event.set()
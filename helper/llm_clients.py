@@ -0,0 +1,226 @@
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+import httpx
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.llms.openai import OpenAI as LlamaIndexOpenAI
+from openai import AsyncOpenAI, OpenAI
+from config import Config
+from helper.metrics import metrics
+
+
+def _count_connection_event(name: str) -> None:
+    if name == "connection.connect_tcp.complete":
+        metrics.increment("llm_http_connections_opened")
+    elif name == "connection.start_tls.complete":
+        metrics.increment("llm_http_tls_handshakes")
+
+
+def _trace(name: str, info: Dict[str, Any]) -> None:
+    _count_connection_event(name)
+
+
+async def _atrace(name: str, info: Dict[str, Any]) -> None:
+    _count_connection_event(name)
+
+
+def _on_request(request: httpx.Request) -> None:
+    metrics.increment("llm_http_requests")
+    request.extensions["trace"] = _trace
+
+
+async def _aon_request(request: httpx.Request) -> None:
+    metrics.increment("llm_http_requests")
+    request.extensions["trace"] = _atrace
+
+
+class LLMClientRegistry:
+    """
+    Process-wide cache of OpenAI clients and the llama-index models built on them.
+
+    All clients share one keep-alive HTTP pool per interface (sync and async), so that
+    requests reuse open TLS connections instead of every call paying for its own
+    handshake. Models are keyed by their name and parameters and are safe to share
+    between requests, they keep no state of their own.
+
+    Every request increments `llm_http_requests` and every new connection
+    `llm_http_connections_opened`, the difference is the number of reused connections.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = Config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections: int = Config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = Config.OPENAI_KEEPALIVE_EXPIRY,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+        # (kind, model, parameters) -> client or model
+        self._clients: Dict[Tuple[str, Optional[str], str], Any] = {}
+        self._lock = threading.Lock()
+
+    def get_http_client(self) -> httpx.Client:
+        """
+        Get the shared synchronous HTTP pool.
+
+        Returns:
+            httpx.Client: The HTTP client.
+        """
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(
+                    limits=self.limits,
+                    event_hooks={"request": [_on_request]},
+                    follow_redirects=True,
+                )
+            return self._http_client
+
+    def get_async_http_client(self) -> httpx.AsyncClient:
+        """
+        Get the shared asynchronous HTTP pool.
+
+        Its connections belong to the event loop of the api, it must not be used from
+        other event loops.
+
+        Returns:
+            httpx.AsyncClient: The HTTP client.
+        """
+        with self._lock:
+            if self._async_http_client is None:
+                self._async_http_client = httpx.AsyncClient(
+                    limits=self.limits,
+                    event_hooks={"request": [_aon_request]},
+                    follow_redirects=True,
+                )
+            return self._async_http_client
+
+    def _get_or_create(self, kind: str, model: Optional[str], params: dict, create) -> Any:
+        key = (kind, model, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None:
+            metrics.increment("llm_client_cache_hits")
+            return client
+
+        metrics.increment("llm_client_cache_misses")
+        client = create()
+        with self._lock:
+            # keep the client of a thread that created it at the same time
+            return self._clients.setdefault(key, client)
+
+    def get_openai_client(self, **params: Any) -> OpenAI:
+        """
+        Get an OpenAI client on the shared HTTP pool.
+
+        Args:
+            **params: Options of the client, e.g. `max_retries`.
+
+        Returns:
+            OpenAI: The client.
+        """
+        return self._get_or_create(
+            "openai",
+            None,
+            params,
+            lambda: OpenAI(
+                api_key=Config.OPENAI_API_KEY, http_client=self.get_http_client(), **params
+            ),
+        )
+
+    def get_async_openai_client(self, **params: Any) -> AsyncOpenAI:
+        """
+        Get an asynchronous OpenAI client on the shared HTTP pool.
+
+        Args:
+            **params: Options of the client, e.g. `max_retries`.
+
+        Returns:
+            AsyncOpenAI: The client.
+        """
+        return self._get_or_create(
+            "async_openai",
+            None,
+            params,
+            lambda: AsyncOpenAI(
+                api_key=Config.OPENAI_API_KEY,
+                http_client=self.get_async_http_client(),
+                **params,
+            ),
+        )
+
+    def get_llm(self, model: Optional[str] = None, **params: Any) -> LlamaIndexOpenAI:
+        """
+        Get a llama-index OpenAI model on the shared HTTP pools.
+
+        Args:
+            model (Optional[str]): The OpenAI model, `Config.DEFAULT_OPENAI_MODEL` by default.
+            **params: Parameters of the model, e.g. `temperature`.
+
+        Returns:
+            LlamaIndexOpenAI: The model.
+        """
+        model = model or Config.DEFAULT_OPENAI_MODEL
+        return self._get_or_create(
+            "llm",
+            model,
+            params,
+            lambda: LlamaIndexOpenAI(
+                model=model,
+                api_key=Config.OPENAI_API_KEY,
+                http_client=self.get_http_client(),
+                async_http_client=self.get_async_http_client(),
+                **params,
+            ),
+        )
+
+    def get_embed_model(self, model: Optional[str] = None, **params: Any) -> OpenAIEmbedding:
+        """
+        Get a llama-index OpenAI embedding model on the shared HTTP pools.
+
+        Args:
+            model (Optional[str]): The embedding model,
+                `Config.DEFAULT_OPENAI_EMBEDDING_MODEL` by default.
+            **params: Parameters of the model, e.g. `embed_batch_size`.
+
+        Returns:
+            OpenAIEmbedding: The model.
+        """
+        model = model or Config.DEFAULT_OPENAI_EMBEDDING_MODEL
+
+        def create() -> OpenAIEmbedding:
+            embed_model = OpenAIEmbedding(
+                model=model,
+                api_key=Config.OPENAI_API_KEY,
+                http_client=self.get_http_client(),
+                **params,
+            )
+            # the embedding model hands its only http client to both interfaces
+            embed_model._aclient = AsyncOpenAI(
+                api_key=embed_model.api_key,
+                max_retries=embed_model.max_retries,
+                timeout=embed_model.timeout,
+                http_client=self.get_async_http_client(),
+            )
+            return embed_model
+
+        return self._get_or_create("embedding", model, params, create)
+
+    def clear(self) -> None:
+        """
+        Drop the cached clients and close the HTTP pools.
+        """
+        with self._lock:
+            self._clients.clear()
+            http_client, self._http_client = self._http_client, None
+            # the async pool is closed with its event loop
+            self._async_http_client = None
+        if http_client is not None:
+            http_client.close()
+
+
+llm_clients = LLMClientRegistry()
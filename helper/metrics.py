@@ -0,0 +1,77 @@
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """
+    In-process counters and observations.
+
+    Every worker process keeps its own values, they are exposed on the `/metrics` route.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._observations: Dict[str, dict] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Increment a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (float): The amount to add. Defaults to 1.
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Record a single observation, e.g. a duration or a size.
+
+        Args:
+            name (str): The name of the observation.
+            value (float): The observed value.
+        """
+        with self._lock:
+            observation = self._observations.get(name)
+            if observation is None:
+                self._observations[name] = {
+                    "count": 1,
+                    "sum": value,
+                    "min": value,
+                    "max": value,
+                    "last": value,
+                }
+                return
+
+            observation["count"] += 1
+            observation["sum"] += value
+            observation["min"] = min(observation["min"], value)
+            observation["max"] = max(observation["max"], value)
+            observation["last"] = value
+
+    def snapshot(self) -> dict:
+        """
+        Get the current values of all metrics.
+
+        Returns:
+            dict: The counters and the observations with their mean.
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "observations": {
+                    name: {**observation, "mean": observation["sum"] / observation["count"]}
+                    for name, observation in self._observations.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
+
+
+metrics = Metrics()
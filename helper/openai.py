@@ -1,52 +1,118 @@
-from llama_index.embeddings.openai import OpenAIEmbedding
-import chromadb
 from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.core import VectorStoreIndex, StorageContext, SimpleDirectoryReader
+from llama_index.core import Settings, SimpleDirectoryReader
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import MetadataMode
 from config import Config
 from fastapi import HTTPException, status
 from logger import logger
-from openai import OpenAI
+from helper.embeddings import embed_texts, get_chunk_hash
+from helper.llm_clients import llm_clients
+from helper.metrics import metrics
+from helper.vector_store import (
+    collection_cache,
+    get_document_key,
+    get_embedding_path,
+    get_shared_collection_name,
+)
 import time
+from typing import Optional
 from fastapi import HTTPException, status
 
 
 def create_document_embedding(
     document_path: str,
     customer_uuid: str,
+    document_id: Optional[int] = None,
+    layout: str = Config.CHROMA_LAYOUT,
 ) -> str:
     """
     Create a document embedding for the given document path and customer UUID.
 
+    Chunks are identified by the hash of their content, so re-uploading a document
+    only embeds the chunks that changed, and the vectors of removed chunks are deleted.
+
     Args:
         document_path (str): The path of the document to create the embedding for.
         customer_uuid (str): The UUID of the customer.
+        document_id (Optional[int]): The ID of the user document, stored with the chunks
+            of a shared collection.
+        layout (str): "collection" to store the document in its own collection, or
+            "shared" to store it in the shared collection of the customer.
 
     Returns:
-        str: The name of the chroma collection where the document embedding is stored.
+        str: The embedding path of the document, see `get_embedding_path`.
     """
 
     try:
-        openai_embedding = OpenAIEmbedding(model=Config.DEFAULT_OPENAI_EMBEDDING_MODEL)
         doc = SimpleDirectoryReader(
             input_files=[document_path],
         ).load_data()
+        # the file is read from a temporary directory. The splitter sizes the chunks to
+        # leave room for the metadata, its path would move the chunk boundaries, and
+        # change the embedded text, and so the id of every chunk, on each run
+        for document in doc:
+            document.excluded_embed_metadata_keys.append("file_path")
+            document.excluded_llm_metadata_keys.append("file_path")
+        nodes = run_transformations(doc, Settings.transformations)
 
-        db = chromadb.PersistentClient(path=Config.CHROMA_DB_PATH)
         filename = document_path.split("/")[-1]
-        chroma_collection_name = f"{customer_uuid}_{filename}"
-
-        chroma_collection = db.get_or_create_collection(chroma_collection_name)
-        vector_store = ChromaVectorStore(
-            chroma_collection=chroma_collection,
-        )
-        storage_context = StorageContext.from_defaults(
-            vector_store=vector_store,
-        )
-
-        index = VectorStoreIndex.from_documents(
-            doc,
-            storage_context=storage_context,
-            embed_model=openai_embedding,
+        document_key = get_document_key(customer_uuid, filename)
+        if layout == "shared":
+            chroma_collection_name = get_shared_collection_name(customer_uuid)
+            id_prefix = f"{document_key}/"
+            where = {"document_key": document_key}
+            tenant_metadata = {
+                "customer_uuid": str(customer_uuid),
+                "document_key": document_key,
+            }
+            if document_id is not None:
+                tenant_metadata["document_id"] = document_id
+        else:
+            chroma_collection_name = document_key
+            id_prefix = ""
+            where = None
+            tenant_metadata = {}
+
+        # identical chunks share one vector
+        chunks = {}
+        for node in nodes:
+            node.metadata.update(tenant_metadata)
+            node.excluded_embed_metadata_keys.extend(tenant_metadata)
+            node.excluded_llm_metadata_keys.extend(tenant_metadata)
+            text = node.get_content(metadata_mode=MetadataMode.EMBED)
+            node.id_ = f"{id_prefix}{get_chunk_hash(text)}"
+            chunks.setdefault(node.id_, (node, text))
+
+        chroma_collection = collection_cache.get_collection(chroma_collection_name)
+        stored_ids = set(chroma_collection.get(where=where, include=[])["ids"])
+
+        new_chunks = [chunk for chunk_id, chunk in chunks.items() if chunk_id not in stored_ids]
+        start = time.perf_counter()
+        embeddings, tokens = embed_texts([text for _, text in new_chunks])
+        elapsed = time.perf_counter() - start
+
+        new_nodes = []
+        for (node, _), embedding in zip(new_chunks, embeddings):
+            node.embedding = embedding
+            new_nodes.append(node)
+        if new_nodes:
+            ChromaVectorStore(chroma_collection=chroma_collection).add(new_nodes)
+
+        # removed only once the new vectors are stored, a failed run keeps the old ones
+        stale_ids = list(stored_ids - chunks.keys())
+        if stale_ids:
+            chroma_collection.delete(ids=stale_ids)
+
+        metrics.increment("embedding_chunks_embedded", len(new_nodes))
+        metrics.increment("embedding_chunks_reused", len(chunks) - len(new_nodes))
+        metrics.increment("embedding_tokens", tokens)
+        if new_nodes and elapsed > 0:
+            metrics.observe("embedding_chunks_per_second", len(new_nodes) / elapsed)
+            metrics.observe("embedding_tokens_per_second", tokens / elapsed)
+        logger.info(
+            f"Embedded {document_key}: {len(new_nodes)} new, "
+            f"{len(chunks) - len(new_nodes)} reused and {len(stale_ids)} removed chunks, "
+            f"{tokens} tokens in {elapsed:.2f}s"
         )
     except Exception as e:
         logger.error(f"Failed to create document embedding: {e}")
@@ -55,7 +121,9 @@ def create_document_embedding(
             detail="Failed to create document embedding",
         )
 
-    return chroma_collection_name
+    return get_embedding_path(
+        chroma_collection_name, document_key if layout == "shared" else None
+    )
 
 
 def openai_chat_completion_with_retry(
@@ -81,7 +149,7 @@ def openai_chat_completion_with_retry(
         str: The chat completion response.
     """
 
-    openai_client = OpenAI(api_key=Config.OPENAI_API_KEY)
+    openai_client = llm_clients.get_openai_client()
     retries = 0
 
     while retries < max_retries:
@@ -1,4 +1,7 @@
 import re
+from config import Config
+from llama_index.storage.chat_store.redis import RedisChatStore
+from llama_index.core.memory import ChatMemoryBuffer
 
 
 def post_processed_html_response(response: str) -> str:
@@ -21,3 +24,19 @@ def post_processed_html_response(response: str) -> str:
         return processed_html.group(1)
 
     return response
+
+
+def get_chat_memory(chat_uuid: str) -> ChatMemoryBuffer:
+    """
+    Get the redis backed chat memory for the given chat.
+
+    Args:
+        chat_uuid (str): The UUID of the chat.
+
+    Returns:
+        ChatMemoryBuffer: The chat memory buffer.
+    """
+    chat_store = RedisChatStore(redis_url=Config.REDIS_STORE_URL)
+    return ChatMemoryBuffer.from_defaults(
+        chat_store=chat_store, chat_store_key=chat_uuid, token_limit=5000
+    )
@@ -3,10 +3,11 @@ from typing import Any, Dict, List, Optional
 from llama_index.core.query_pipeline import (
     CustomQueryComponent,
 )
-from pydantic import Field
+from llama_index.core.bridge.pydantic import Field
 from llama_index.core.llms import ChatMessage
 import json
 import pandas as pd
+from helper.code_sandbox import code_sandbox, exec_code
 from helper.pipelines.chart_helper import extract_backticks_content
 from helper.pipelines.chart_helper.schemas import (
     BarChartData,
@@ -33,7 +34,7 @@ class ChartTypeSelector(CustomQueryComponent):
     @property
     def _input_keys(self) -> set:
         """Input keys dict."""
-        return {"chat_history", "query_str", "data_schema"}
+        return {"chat_history", "query_str", "data_schema", "current_time"}
 
     @property
     def _output_keys(self) -> set:
@@ -44,14 +45,18 @@ class ChartTypeSelector(CustomQueryComponent):
         chat_history: List[ChatMessage],
         query_str: str,
         data_schema: str,
+        current_time: str,
     ) -> List[ChatMessage]:
 
-        formatted_context = self.context_prompt.replace(
-            "{query_str}", query_str
-        ).replace("{data_schema}", data_schema)
+        formatted_context = (
+            self.context_prompt.replace("{query_str}", query_str)
+            .replace("{data_schema}", data_schema)
+            .replace("{current_time}", current_time)
+        )
         user_message = ChatMessage(role="user", content=formatted_context)
 
-        chat_history.append(user_message)
+        # a new list, the components running concurrently share the chat history
+        chat_history = chat_history + [user_message]
 
         if self.system_prompt is not None:
             chat_history = [
@@ -66,7 +71,9 @@ class ChartTypeSelector(CustomQueryComponent):
         query_str = kwargs["query_str"]
         data_schema = kwargs["data_schema"]
 
-        prepared_context = self._prepare_context(chat_history, query_str, data_schema)
+        prepared_context = self._prepare_context(
+            chat_history, query_str, data_schema, kwargs["current_time"]
+        )
         response = self.llm.chat(prepared_context)
         return {"chart_type": response}
 
@@ -76,7 +83,9 @@ class ChartTypeSelector(CustomQueryComponent):
         query_str = kwargs["query_str"]
         data_schema = kwargs["data_schema"]
 
-        prepared_context = self._prepare_context(chat_history, query_str, data_schema)
+        prepared_context = self._prepare_context(
+            chat_history, query_str, data_schema, kwargs["current_time"]
+        )
         response = await self.llm.achat(prepared_context)
 
         return {"chart_type": response}
@@ -227,6 +236,7 @@ class ChartDataGeneratorViaPython(CustomQueryComponent):
             "chart_type",
             "chart_schema",
             "data_schema",
+            "current_time",
         }
 
     @property
@@ -240,6 +250,7 @@ class ChartDataGeneratorViaPython(CustomQueryComponent):
         chart_type: str,
         chart_schema: str,
         data_schema: str,
+        current_time: str,
     ) -> List[ChatMessage]:
 
         formatted_context = (
@@ -247,10 +258,12 @@ class ChartDataGeneratorViaPython(CustomQueryComponent):
             .replace("{chart_type}", chart_type)
             .replace("{chart_schema}", chart_schema)
             .replace("{data_schema}", data_schema)
+            .replace("{current_time}", current_time)
         )
         user_message = ChatMessage(role="user", content=formatted_context)
 
-        chat_history.append(user_message)
+        # a new list, the components running concurrently share the chat history
+        chat_history = chat_history + [user_message]
 
         if self.system_prompt is not None:
             chat_history = [
@@ -271,7 +284,12 @@ class ChartDataGeneratorViaPython(CustomQueryComponent):
         chart_type = json.loads(chart_type)["chart_type"]
 
         prepared_context = self._prepare_context(
-            chat_history, query_str, chart_type, chart_schema, data_schema
+            chat_history,
+            query_str,
+            chart_type,
+            chart_schema,
+            data_schema,
+            kwargs["current_time"],
         )
         response = self.llm.chat(prepared_context)
 
@@ -289,7 +307,12 @@ class ChartDataGeneratorViaPython(CustomQueryComponent):
         chart_type = json.loads(chart_type)["chart_type"]
 
         prepared_context = self._prepare_context(
-            chat_history, query_str, chart_type, chart_schema, data_schema
+            chat_history,
+            query_str,
+            chart_type,
+            chart_schema,
+            data_schema,
+            kwargs["current_time"],
         )
         response = await self.llm.achat(prepared_context)
 
@@ -297,7 +320,9 @@ class ChartDataGeneratorViaPython(CustomQueryComponent):
 
 
 class ChartDataCodeExecutor(CustomQueryComponent):
-    df: Any = Field(..., description="The dataframe variable")
+    """
+    Execute the generated python code on the dataframe passed with the run.
+    """
 
     def _validate_component_inputs(self, input: Dict[str, Any]) -> Dict[str, Any]:
         """Validate component inputs during run_component."""
@@ -306,7 +331,7 @@ class ChartDataCodeExecutor(CustomQueryComponent):
     @property
     def _input_keys(self) -> set:
         """Input keys dict."""
-        return {"python_code"}
+        return {"python_code", "df"}
 
     @property
     def _output_keys(self) -> set:
@@ -314,21 +339,17 @@ class ChartDataCodeExecutor(CustomQueryComponent):
 
     def _run_component(self, **kwargs) -> Dict[str, Any]:
         """Run the component."""
-        python_code = kwargs["python_code"]
-        global_dict = {"df": self.df}
-        exec(extract_backticks_content(python_code, "python"), global_dict)
-
-        response = global_dict["chart_data"]
+        python_code = extract_backticks_content(kwargs["python_code"], "python")
+        response = code_sandbox.run(exec_code, kwargs["df"], python_code, "chart_data")
 
         return {"chart_data": response}
 
     async def _arun_component(self, **kwargs: Any) -> Dict[str, Any]:
         """Run the component asynchronously."""
-        python_code = kwargs["python_code"]
-        global_dict = {"df": self.df}
-        exec(extract_backticks_content(python_code, "python"), global_dict)
-
-        response = global_dict["chart_data"]
+        python_code = extract_backticks_content(kwargs["python_code"], "python")
+        response = await code_sandbox.arun(
+            exec_code, kwargs["df"], python_code, "chart_data"
+        )
 
         return {"chart_data": response}
 
@@ -373,6 +394,14 @@ def chart_validator_tool(chart_data: dict, chart_type: Any) -> dict:
     return chart_data
 
 
+def chart_output_tool(validated_chart_data: Any, caption: Any) -> Any:
+    """
+    Join the chart data and caption branches, the pipeline returns the caption once both
+    are done.
+    """
+    return caption
+
+
 class CaptionGenerator(CustomQueryComponent):
     llm: Any = Field(..., description="LLM")
     system_prompt: Optional[str] = Field(
@@ -389,7 +418,7 @@ class CaptionGenerator(CustomQueryComponent):
     @property
     def _input_keys(self) -> set:
         """Input keys dict."""
-        return {"chat_history", "query_str", "validated_chart_data"}
+        return {"chat_history", "query_str", "current_time"}
 
     @property
     def _output_keys(self) -> set:
@@ -399,13 +428,17 @@ class CaptionGenerator(CustomQueryComponent):
         self,
         chat_history: List[ChatMessage],
         query_str: str,
+        current_time: str,
     ) -> List[ChatMessage]:
 
-        formatted_context = self.context_prompt.replace("{query_str}", query_str)
+        formatted_context = self.context_prompt.replace("{query_str}", query_str).replace(
+            "{current_time}", current_time
+        )
 
         user_message = ChatMessage(role="user", content=formatted_context)
 
-        chat_history.append(user_message)
+        # a new list, the components running concurrently share the chat history
+        chat_history = chat_history + [user_message]
 
         if self.system_prompt is not None:
             chat_history = [
@@ -422,6 +455,7 @@ class CaptionGenerator(CustomQueryComponent):
         prepared_context = self._prepare_context(
             chat_history,
             query_str,
+            kwargs["current_time"],
         )
         print("CaptionGenerator: ", prepared_context)
         response = self.llm.chat(prepared_context)
@@ -436,6 +470,7 @@ class CaptionGenerator(CustomQueryComponent):
         prepared_context = self._prepare_context(
             chat_history,
             query_str,
+            kwargs["current_time"],
         )
         response = await self.llm.achat(prepared_context)
 
@@ -1,3 +1,4 @@
+import asyncio
 import pandas as pd
 from typing import Any, Dict, List, Optional
 
@@ -6,10 +7,9 @@ from llama_index.core.query_pipeline import (
     InputComponent,
     FunctionComponent,
 )
-from llama_index.storage.chat_store.redis import RedisChatStore
-from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.core.llms import ChatMessage
-from llama_index.llms.openai import OpenAI
+from sqlalchemy.orm import Session
+from helper.pipelines.registry import pipeline_registry
 import json
 import pandas as pd
 import random, os
@@ -21,54 +21,31 @@ from helper.pipelines.chart_helper.components import (
     CaptionGenerator,
     chart_data_schema_tool,
     chart_validator_tool,
+    chart_output_tool,
 )
 from db.queries.user_documents import UserDocumentQuery
 from db.queries.chart import ChartQuery
-from db import get_db
-from helper.aws_s3 import download_from_s3
+from helper.dataframe_cache import load_user_document
+from helper.concurrency import run_blocking
+from helper.pipelines import get_chat_memory
+from helper.pipelines.dag import arun_pipeline_dag
 from helper.pipelines.chart_helper import extract_backticks_content
 from config import Config
 
 
-def chart_query_pipeline(
-    query_str: str,
-    chat_uuid: str,
-    query_type: str,
-    data_source_id: int,
-    model: str = Config.DEFAULT_OPENAI_MODEL,
-) -> Dict[str, Any]:
+def build_chart_query_pipeline(llm: Any) -> QueryPipeline:
     """
-    Query pipeline for chart queries
-    """
-
-    if query_type not in ["chart", "chart_data"]:
-        raise ValueError("Invalid query type")
+    Build the query pipeline generating the data and the caption of charts.
 
-    user_doc = UserDocumentQuery.get_user_document_by_id(data_source_id)
-    if not user_doc:
-        raise ValueError("Invalid data source id")
+    The pipeline is run with the query, the chat history, the current time, the
+    dataframe (`df`) and its head (`data_schema`).
 
-    file_s3_url = user_doc.document_url
-    object_url = file_s3_url.split("amazonaws.com/")[-1]
-    file_extension = object_url.split(".")[-1]
-    file_name = random.randbytes(10).hex() + "." + file_extension
-    temp_file_path = f"/tmp/{file_name}"
-
-    if not download_from_s3(object_url, temp_file_path):
-        raise Exception("Failed to download the file from s3")
-
-    if file_extension == "csv":
-        df = pd.read_csv(temp_file_path)
-    else:
-        df = pd.read_excel(temp_file_path, sheet_name=None)
-
-    chat_store = RedisChatStore(Config.REDIS_STORE_URL)
-    chat_memory = ChatMemoryBuffer.from_defaults(
-        chat_store=chat_store, chat_store_key=chat_uuid, token_limit=5000
-    )
-    chat_history = chat_memory.get()
-    llm = OpenAI(model=model)
+    Args:
+        llm (Any): The LLM to use.
 
+    Returns:
+        QueryPipeline: The query pipeline.
+    """
     input_component = InputComponent()
     chart_type_selector_component = ChartTypeSelector(
         llm=llm,
@@ -79,7 +56,7 @@ def chart_query_pipeline(
             "4. You must output a JSON with a key 'chart_type' with the value of best chart which fits on the user query."
             '5. Makes sure to have the following output schema: {"chart_type":"<The best chart type which fits on the user query>"}\n'
             "6. You should enclose JSON within 3 backticks.\n"
-            f"7. The current timestamp is {datetime.utcnow()}.\n"
+            "7. The current timestamp is {current_time}.\n"
             "Data Schema:\n"
             "{data_schema}\n"
             "User Query:\n"
@@ -100,7 +77,7 @@ def chart_query_pipeline(
             "5. You should store the final chart data into `chart_data` variable so that it can be captured after `exec()` call.\n"
             "6. You are allowed to use pandas library and the name of the dataframe is `df`. Its context will be provided later through `exec()`.\n"
             "7. You should output the Python code enclosed in 3 backticks.\n"
-            f"8. The current timestamp is {datetime.utcnow()}.\n"
+            "8. The current timestamp is {current_time}.\n"
             "User Query: \n"
             "{query_str}\n"
             "`df.head()` Output: \n"
@@ -111,7 +88,7 @@ def chart_query_pipeline(
             "Python code:\n"
         ),
     )
-    chart_data_code_executor_component = ChartDataCodeExecutor(df=df)
+    chart_data_code_executor_component = ChartDataCodeExecutor()
     chart_validator_tool_component = FunctionComponent(
         fn=chart_validator_tool, output_key="validated_chart_data"
     )
@@ -123,13 +100,14 @@ def chart_query_pipeline(
             "3. You will be given user query and you need to generate the caption for the same.\n"
             "4. Assume that the appropiate chart has already been generated for the user."
             "5. You should output a JSON enclosed with 3 backticks with a key 'caption'."
-            f"6. The current timestamp is {datetime.utcnow()}.\n"
+            "6. The current timestamp is {current_time}.\n"
             "User Query:\n"
             "{query_str}\n"
             "Caption: \n"
         ),
         system_prompt=None,
     )
+    chart_output_component = FunctionComponent(fn=chart_output_tool, output_key="caption")
 
     p = QueryPipeline(verbose=True)
 
@@ -142,6 +120,7 @@ def chart_query_pipeline(
             "chart_data_code_executor_component": chart_data_code_executor_component,
             "chart_validator_tool_component": chart_validator_tool_component,
             "caption_generator_component": caption_generator_component,
+            "chart_output_component": chart_output_component,
         }
     )
 
@@ -208,6 +187,12 @@ def chart_query_pipeline(
         src_key="python_code",
         dest_key="python_code",
     )
+    p.add_link(
+        "input_component",
+        "chart_data_code_executor_component",
+        src_key="df",
+        dest_key="df",
+    )
 
     p.add_link(
         "chart_type_selector_component",
@@ -234,19 +219,58 @@ def chart_query_pipeline(
         src_key="chat_history",
         dest_key="chat_history",
     )
+
+    # the caption only needs the query, it is generated while the data is
+    # generated, and both branches are joined into the output of the pipeline
     p.add_link(
         "chart_validator_tool_component",
-        "caption_generator_component",
+        "chart_output_component",
         src_key="validated_chart_data",
         dest_key="validated_chart_data",
     )
-
-    result, intermediates = p.run_with_intermediates(
-        query_str=query_str, chat_history=chat_history, data_schema=f"{df.head()}"
+    p.add_link(
+        "caption_generator_component",
+        "chart_output_component",
+        src_key="caption",
+        dest_key="caption",
     )
+    for component in [
+        "chart_type_selector_component",
+        "chart_data_generator_component",
+        "caption_generator_component",
+    ]:
+        p.add_link(
+            "input_component", component, src_key="current_time", dest_key="current_time"
+        )
+
+    return p
+
 
-    os.remove(temp_file_path)
+pipeline_registry.register("chart_query", build_chart_query_pipeline)
 
+
+def save_chart_query_result(
+    db: Session,
+    query_str: str,
+    chat_uuid: str,
+    chat_memory: Any,
+    result: Any,
+    intermediates: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Save the chart generated by a run of the chart query pipeline, and update the chat memory.
+
+    Args:
+        db (Session): The database session the chart is saved with.
+        query_str (str): The query describing the chart.
+        chat_uuid (str): The UUID of the chat.
+        chat_memory (Any): The memory of the chat.
+        result (Any): The output of the pipeline, the caption response.
+        intermediates (Dict[str, Any]): The intermediates of the run.
+
+    Returns:
+        Dict[str, Any]: The response of the assistant and the saved chart.
+    """
     chart_type_info = json.loads(
         extract_backticks_content(
             intermediates["chart_type_selector_component"].outputs["chart_type"], "json"
@@ -266,18 +290,137 @@ def chart_query_pipeline(
     )
     # save the chart
     chart = ChartQuery.create_chart(
+        db,
         chat_uuid=chat_uuid,
         chart_type=chart_type_info["chart_type"],
         code=python_code,
         data=chart_data,
         caption=caption_info["caption"],
     )
-
-    db = get_db()
+    db.commit()
 
     # update the memory
     chat_memory.put(ChatMessage(role="user", content=query_str))
     response_message = ChatMessage(
-        role="assistant", content=result.message.content, chart_uuid={"chart_uuid": str(chart.uuid)}
+        role="assistant",
+        content=result.message.content,
+        additional_kwargs={"chart_uuid": str(chart.uuid)},
     )
     chat_memory.put(response_message)
+
+    return {"response": result.message.content, "chart": chart.to_dict()}
+
+
+def chart_query_pipeline(
+    db: Session,
+    query_str: str,
+    chat_uuid: str,
+    query_type: str,
+    data_source_id: int,
+    model: str = Config.DEFAULT_OPENAI_MODEL,
+) -> Dict[str, Any]:
+    """
+    Generate and save a chart for a query on a user document.
+
+    Args:
+        db (Session): The database session the chart is saved with.
+        query_str (str): The query describing the chart.
+        chat_uuid (str): The UUID of the chat.
+        query_type (str): "chart" or "chart_data".
+        data_source_id (int): The ID of the user document.
+        model (str, optional): The OpenAI model to be used. Defaults to Config.DEFAULT_OPENAI_MODEL.
+
+    Returns:
+        Dict[str, Any]: The response of the assistant and the saved chart.
+    """
+
+    if query_type not in ["chart", "chart_data"]:
+        raise ValueError("Invalid query type")
+
+    user_doc = UserDocumentQuery.get_user_document_by_id(db, data_source_id)
+    if not user_doc:
+        raise ValueError("Invalid data source id")
+
+    df = load_user_document(user_doc)
+
+    chat_memory = get_chat_memory(chat_uuid)
+    chat_history = chat_memory.get()
+    p = pipeline_registry.get("chart_query", model)
+
+    result, intermediates = p.run_with_intermediates(
+        query_str=query_str,
+        chat_history=chat_history,
+        data_schema=f"{df.head()}",
+        df=df,
+        current_time=str(datetime.utcnow()),
+    )
+
+    return save_chart_query_result(
+        db, query_str, chat_uuid, chat_memory, result, intermediates
+    )
+
+
+async def achart_query_pipeline(
+    db: Session,
+    query_str: str,
+    chat_uuid: str,
+    query_type: str,
+    data_source_id: int,
+    model: str = Config.DEFAULT_OPENAI_MODEL,
+) -> Dict[str, Any]:
+    """
+    Generate and save a chart for a query on a user document, running the independent
+    stages of the pipeline concurrently.
+
+    The caption is generated while the document loads and the chart data is generated,
+    see `arun_pipeline_dag` for the recorded stage timings.
+
+    Args:
+        db (Session): The database session the chart is saved with.
+        query_str (str): The query describing the chart.
+        chat_uuid (str): The UUID of the chat.
+        query_type (str): "chart" or "chart_data".
+        data_source_id (int): The ID of the user document.
+        model (str, optional): The OpenAI model to be used. Defaults to Config.DEFAULT_OPENAI_MODEL.
+
+    Returns:
+        Dict[str, Any]: The response of the assistant and the saved chart.
+    """
+
+    if query_type not in ["chart", "chart_data"]:
+        raise ValueError("Invalid query type")
+
+    user_doc = await run_blocking(
+        UserDocumentQuery.get_user_document_by_id, db, data_source_id
+    )
+    if not user_doc:
+        raise ValueError("Invalid data source id")
+
+    df = asyncio.ensure_future(run_blocking(load_user_document, user_doc))
+
+    async def get_data_schema() -> str:
+        return f"{(await df).head()}"
+
+    chat_memory = get_chat_memory(chat_uuid)
+    chat_history = await run_blocking(chat_memory.get)
+    p = pipeline_registry.get("chart_query", model)
+
+    result, intermediates = await arun_pipeline_dag(
+        p,
+        "chart_query",
+        query_str=query_str,
+        chat_history=chat_history,
+        data_schema=get_data_schema(),
+        df=df,
+        current_time=str(datetime.utcnow()),
+    )
+
+    return await run_blocking(
+        save_chart_query_result,
+        db,
+        query_str,
+        chat_uuid,
+        chat_memory,
+        result,
+        intermediates,
+    )
@@ -1,21 +1,31 @@
-from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
-import chromadb
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.core import VectorStoreIndex
 from config import Config
 from fastapi import HTTPException, status
 from logger import logger
-from helper.pipelines import post_processed_html_response
+from helper.pipelines import post_processed_html_response, get_chat_memory
+from helper.code_sandbox import (
+    CodeSandboxLimitError,
+    CodeSandboxTimeoutError,
+    code_sandbox,
+    parse_pandas_instructions,
+)
+from helper.concurrency import run_blocking
+from helper.llm_clients import llm_clients
+from helper.pipelines.registry import pipeline_registry
+from helper.vector_store import (
+    collection_cache,
+    get_document_filters,
+    parse_embedding_path,
+)
 import pandas as pd
 from llama_index.core.query_pipeline import (
     QueryPipeline as QP,
     Link,
     InputComponent,
 )
-from llama_index.experimental.query_engine.pandas import PandasInstructionParser
 from llama_index.core import PromptTemplate
 from datetime import datetime
+import asyncio
 import time
 from llama_index.storage.chat_store.redis import RedisChatStore
 from llama_index.core.memory import ChatMemoryBuffer
@@ -23,6 +33,7 @@ from typing import Any, Dict, List, Optional
 from llama_index.core.bridge.pydantic import Field
 from llama_index.core.llms import ChatMessage
 from llama_index.core.query_pipeline import CustomQueryComponent
+from llama_index.core.base.query_pipeline.query import validate_and_convert_stringable
 
 
 class PandasResponseWithChatHistory(CustomQueryComponent):
@@ -92,6 +103,61 @@ class PandasResponseWithChatHistory(CustomQueryComponent):
         return {"response": response}
 
 
+def get_pandas_error_output(error: Exception) -> str:
+    """
+    Format a sandbox error as `PandasInstructionParser` formats the errors of the code,
+    so that the response is synthesized from it.
+
+    Args:
+        error (Exception): The timeout or limit error.
+
+    Returns:
+        str: The output passed on to the response synthesis.
+    """
+    logger.warning(f"Pandas instructions stopped: {error}")
+    return f"There was an error running the output as Python code. Error message: {error}"
+
+
+class PandasInstructionComponent(CustomQueryComponent):
+    """
+    Evaluate the generated pandas expression on the dataframe passed with the run.
+    """
+
+    def _validate_component_inputs(self, input: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate component inputs during run_component."""
+        input["input"] = validate_and_convert_stringable(input["input"])
+        return input
+
+    @property
+    def _input_keys(self) -> set:
+        """Input keys dict."""
+        return {"input", "df"}
+
+    @property
+    def _output_keys(self) -> set:
+        return {"output"}
+
+    def _run_component(self, **kwargs) -> Dict[str, Any]:
+        """Run the component."""
+        try:
+            output = code_sandbox.run(
+                parse_pandas_instructions, kwargs["df"], kwargs["input"]
+            )
+        except (CodeSandboxTimeoutError, CodeSandboxLimitError) as e:
+            output = get_pandas_error_output(e)
+        return {"output": output}
+
+    async def _arun_component(self, **kwargs: Any) -> Dict[str, Any]:
+        """Run the component asynchronously."""
+        try:
+            output = await code_sandbox.arun(
+                parse_pandas_instructions, kwargs["df"], kwargs["input"]
+            )
+        except (CodeSandboxTimeoutError, CodeSandboxLimitError) as e:
+            output = get_pandas_error_output(e)
+        return {"output": output}
+
+
 def csv_pipeline(embedding_path: str, customer_query: str) -> str:
     """
     Load the embedding and query the csv file.
@@ -108,20 +174,15 @@ def csv_pipeline(embedding_path: str, customer_query: str) -> str:
     """
     try:
         logger.debug(f"Querying csv: {embedding_path}")
-        db = chromadb.PersistentClient(path=Config.CHROMA_DB_PATH)
-        embed_model = OpenAIEmbedding(model=Config.DEFAULT_OPENAI_EMBEDDING_MODEL)
-        llm = OpenAI(model=Config.DEFAULT_OPENAI_MODEL)
-        chroma_collection = db.get_or_create_collection(embedding_path)
+        llm = llm_clients.get_llm(Config.DEFAULT_OPENAI_MODEL)
+        collection_name, _ = parse_embedding_path(embedding_path)
+        index = collection_cache.get_index(collection_name)
 
-        vector_store = ChromaVectorStore(
-            chroma_collection=chroma_collection,
-        )
-        index = VectorStoreIndex.from_vector_store(
-            vector_store=vector_store, embed_model=embed_model
+        # documents in a shared collection are told apart by their metadata
+        query_engine = index.as_query_engine(
+            llm=llm, filters=get_document_filters(embedding_path)
         )
 
-        query_engine = index.as_query_engine(llm=llm)
-
         response = query_engine.query(customer_query)
     except Exception as e:
         logger.error(f"Failed to query csv: {e}")
@@ -133,67 +194,32 @@ def csv_pipeline(embedding_path: str, customer_query: str) -> str:
     return str(response)
 
 
-def csv_pipeline_v2(
-    csv_path: str,
-    customer_query: str,
-    chat_uuid: str,
-    model: str = Config.DEFAULT_OPENAI_MODEL,
-) -> str:
-    """
-    Query the csv file using the query pipeline.
+PANDAS_RESPONSE_SYNTHESIS_PROMPT = (
+    "Given an input question, synthesize a response from the query results.\n"
+    "Query: {query_str}\n\n"
+    "Pandas Instructions (optional):\n{pandas_instructions}\n\n"
+    "Pandas Output: {pandas_output}\n\n"
+    "Your response should always be in HTML format inside a <div> tag.\n"
+    "Response: "
+)
 
-    Args:
-        csv_path (str): The path to the csv file.
-        customer_query (str): The query to be executed.
-        model (str, optional): The OpenAI model to be used. Defaults to Config.DEFAULT_OPENAI_MODEL.
 
-    Returns:
-        str: The response from the query.
+def build_pandas_query_pipeline(pandas_prompt: PromptTemplate, llm: OpenAI) -> QP:
     """
-    logger.debug(f"Reading csv file: {csv_path}")
-    df = pd.read_csv(csv_path)
+    Build the query pipeline used to answer customer queries on a dataframe.
 
-    chat_store = RedisChatStore(redis_url=Config.REDIS_STORE_URL)
-    chat_memory = ChatMemoryBuffer.from_defaults(
-        chat_store=chat_store, chat_store_key=chat_uuid, token_limit=5000
-    )
-    chat_history = chat_memory.get()
-    logger.debug(f"Chat history: {chat_history}")
+    The pipeline is run with the query, the chat history, the dataframe (`df`) and the
+    variables of the pandas prompt.
 
-    instruction_str = (
-        "1. Convert the query to executable Python code using Pandas.\n"
-        "2. The final line of code should be a Python expression that can be called with the `eval()` function.\n"
-        "3. The code should represent a solution to the query.\n"
-        "4. PRINT ONLY THE EXPRESSION.\n"
-        "5. Do not quote the expression.\n"
-        f"6. The current timestamp is {datetime.utcnow()}.\n"
-    )
-
-    pandas_prompt_str = (
-        "You are working with a pandas dataframe in Python.\n"
-        "The name of the dataframe is `df`.\n"
-        "This is the result of `print(df.head())`:\n"
-        "{df_str}\n\n"
-        "Follow these instructions:\n"
-        "{instruction_str}\n"
-        "Query: {query_str}\n\n"
-        "Expression:"
-    )
-    response_synthesis_prompt_str = (
-        "Given an input question, synthesize a response from the query results.\n"
-        "Query: {query_str}\n\n"
-        "Pandas Instructions (optional):\n{pandas_instructions}\n\n"
-        "Pandas Output: {pandas_output}\n\n"
-        "Your response should always be in HTML format inside a <div> tag.\n"
-        "Response: "
-    )
+    Args:
+        pandas_prompt (PromptTemplate): The prompt used to generate the pandas expression.
+        llm (OpenAI): The LLM to use.
 
-    pandas_prompt = PromptTemplate(pandas_prompt_str).partial_format(
-        instruction_str=instruction_str, df_str=df.head(5)
-    )
-    pandas_output_parser = PandasInstructionParser(df)
-    response_synthesis_prompt = PromptTemplate(response_synthesis_prompt_str)
-    llm = OpenAI(model=model)
+    Returns:
+        QP: The query pipeline.
+    """
+    pandas_output_parser = PandasInstructionComponent()
+    response_synthesis_prompt = PromptTemplate(PANDAS_RESPONSE_SYNTHESIS_PROMPT)
 
     pandas_response = PandasResponseWithChatHistory(llm=llm)
     qp = QP(
@@ -208,10 +234,12 @@ def csv_pipeline_v2(
         verbose=True,
     )
 
-    qp.add_link("input", "pandas_prompt", src_key="query_str", dest_key="query_str")
+    for key in pandas_prompt.template_vars:
+        qp.add_link("input", "pandas_prompt", src_key=key, dest_key=key)
     qp.add_link("input", "pandas_response", src_key="chat_history", dest_key="chat_history")
     qp.add_link("pandas_prompt", "pandas_response", dest_key="query_str")
-    qp.add_link("pandas_response", "pandas_output_parser")
+    qp.add_link("pandas_response", "pandas_output_parser", dest_key="input")
+    qp.add_link("input", "pandas_output_parser", src_key="df", dest_key="df")
     qp.add_link(
         "pandas_output_parser", "response_synthesis_prompt", dest_key="pandas_output"
     )
@@ -224,6 +252,30 @@ def csv_pipeline_v2(
         "llm2",
     )
 
+    return qp
+
+
+def run_pandas_query_pipeline(
+    qp: QP, customer_query: str, chat_memory: ChatMemoryBuffer, **inputs: Any
+) -> str:
+    """
+    Run a pandas query pipeline with retries and update the chat memory.
+
+    Args:
+        qp (QP): The query pipeline.
+        customer_query (str): The query to be executed.
+        chat_memory (ChatMemoryBuffer): The chat memory of the conversation.
+        **inputs: The dataframe and the variables of the pandas prompt.
+
+    Returns:
+        str: The response from the query.
+
+    Raises:
+        HTTPException: If the pipeline keeps failing after all retries.
+    """
+    chat_history = chat_memory.get()
+    logger.debug(f"Chat history: {chat_history}")
+
     logger.debug("Running the Query Pipeline...")
     max_retry = 3
     while max_retry > 0:
@@ -231,6 +283,7 @@ def csv_pipeline_v2(
             result = qp.run(
                 query_str=customer_query,
                 chat_history=chat_history,
+                **inputs,
             )
             response = result.message.content
             logger.debug(f"Query Pipeline response: {response}")
@@ -248,3 +301,155 @@ def csv_pipeline_v2(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         detail="Failed to run query pipeline",
     )
+
+
+async def arun_pandas_query_pipeline(
+    qp: QP, customer_query: str, chat_memory: ChatMemoryBuffer, **inputs: Any
+) -> str:
+    """
+    Run a pandas query pipeline asynchronously with retries and update the chat memory.
+
+    Args:
+        qp (QP): The query pipeline.
+        customer_query (str): The query to be executed.
+        chat_memory (ChatMemoryBuffer): The chat memory of the conversation.
+        **inputs: The dataframe and the variables of the pandas prompt.
+
+    Returns:
+        str: The response from the query.
+
+    Raises:
+        HTTPException: If the pipeline keeps failing after all retries.
+    """
+    chat_history = await run_blocking(chat_memory.get)
+    logger.debug(f"Chat history: {chat_history}")
+
+    logger.debug("Running the Query Pipeline...")
+    max_retry = 3
+    while max_retry > 0:
+        try:
+            # every attempt gets its own copy as components append to the history
+            result = await qp.arun(
+                query_str=customer_query,
+                chat_history=list(chat_history),
+                **inputs,
+            )
+            response = result.message.content
+            logger.debug(f"Query Pipeline response: {response}")
+            # update chat memory
+            await run_blocking(
+                chat_memory.put, ChatMessage(role="user", content=customer_query)
+            )
+            await run_blocking(chat_memory.put, result.message)
+            return post_processed_html_response(response)
+        except Exception as e:
+            logger.error(f"Failed to run query pipeline: {e}")
+            logger.info("Retrying in 5 seconds...")
+            await asyncio.sleep(5)
+            max_retry -= 1
+
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="Failed to run query pipeline",
+    )
+
+
+CSV_PANDAS_PROMPT = (
+    "You are working with a pandas dataframe in Python.\n"
+    "The name of the dataframe is `df`.\n"
+    "This is the result of `print(df.head())`:\n"
+    "{df_str}\n\n"
+    "Follow these instructions:\n"
+    "{instruction_str}\n"
+    "Query: {query_str}\n\n"
+    "Expression:"
+)
+
+
+def build_csv_query_pipeline(llm: OpenAI) -> QP:
+    """
+    Build the query pipeline answering customer queries on a csv file.
+
+    Args:
+        llm (OpenAI): The LLM to use.
+
+    Returns:
+        QP: The query pipeline.
+    """
+    return build_pandas_query_pipeline(PromptTemplate(CSV_PANDAS_PROMPT), llm)
+
+
+pipeline_registry.register("csv_query", build_csv_query_pipeline)
+
+
+def get_csv_query_inputs(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Get the run inputs of the csv query pipeline for a dataframe.
+
+    Args:
+        df (pd.DataFrame): The dataframe of the csv file.
+
+    Returns:
+        Dict[str, Any]: The dataframe and the variables of the pandas prompt.
+    """
+    instruction_str = (
+        "1. Convert the query to executable Python code using Pandas.\n"
+        "2. The final line of code should be a Python expression that can be called with the `eval()` function.\n"
+        "3. The code should represent a solution to the query.\n"
+        "4. PRINT ONLY THE EXPRESSION.\n"
+        "5. Do not quote the expression.\n"
+        f"6. The current timestamp is {datetime.utcnow()}.\n"
+    )
+
+    return {"df": df, "df_str": str(df.head(5)), "instruction_str": instruction_str}
+
+
+def csv_pipeline_v2(
+    df: pd.DataFrame,
+    customer_query: str,
+    chat_uuid: str,
+    model: str = Config.DEFAULT_OPENAI_MODEL,
+) -> str:
+    """
+    Query the csv file using the query pipeline.
+
+    Args:
+        df (pd.DataFrame): The dataframe of the csv file.
+        customer_query (str): The query to be executed.
+        model (str, optional): The OpenAI model to be used. Defaults to Config.DEFAULT_OPENAI_MODEL.
+
+    Returns:
+        str: The response from the query.
+    """
+    chat_memory = get_chat_memory(chat_uuid)
+    qp = pipeline_registry.get("csv_query", model)
+
+    return run_pandas_query_pipeline(
+        qp, customer_query, chat_memory, **get_csv_query_inputs(df)
+    )
+
+
+async def acsv_pipeline_v2(
+    df: pd.DataFrame,
+    customer_query: str,
+    chat_uuid: str,
+    model: str = Config.DEFAULT_OPENAI_MODEL,
+) -> str:
+    """
+    Query the csv file using the query pipeline without blocking the event loop.
+
+    Args:
+        df (pd.DataFrame): The dataframe of the csv file.
+        customer_query (str): The query to be executed.
+        chat_uuid (str): The UUID of the chat.
+        model (str, optional): The OpenAI model to be used. Defaults to Config.DEFAULT_OPENAI_MODEL.
+
+    Returns:
+        str: The response from the query.
+    """
+    chat_memory = get_chat_memory(chat_uuid)
+    qp = pipeline_registry.get("csv_query", model)
+
+    return await arun_pandas_query_pipeline(
+        qp, customer_query, chat_memory, **get_csv_query_inputs(df)
+    )
@@ -0,0 +1,119 @@
+import asyncio
+import inspect
+import time
+from typing import Any, Dict, Tuple
+from llama_index.core.base.query_pipeline.query import ComponentIntermediates
+from llama_index.core.query_pipeline import QueryPipeline
+from llama_index.core.query_pipeline.query import add_output_to_module_inputs, get_output
+from logger import logger
+from helper.metrics import metrics
+
+
+async def _resolve(value: Any) -> Any:
+    return await value if inspect.isawaitable(value) else value
+
+
+async def arun_pipeline_dag(
+    pipeline: QueryPipeline, name: str, **inputs: Any
+) -> Tuple[Any, Dict[str, ComponentIntermediates]]:
+    """
+    Run a query pipeline, starting every module as soon as the modules it depends on
+    have finished.
+
+    `QueryPipeline.arun_with_intermediates` runs the pipeline level by level, a module
+    waits for every module of the previous level. Here independent branches overlap, so
+    the run takes as long as its slowest path instead of the sum of its levels.
+
+    Inputs may be awaitables, e.g. the loading of a dataframe. A module only waits for
+    the inputs it is linked to, the others start while the inputs load.
+
+    The wall time of every module is recorded as `{name}_{module}_seconds`, the whole run
+    as `{name}_dag_seconds`, and the sum of the module times divided by the run time as
+    `{name}_dag_parallelism`.
+
+    Args:
+        pipeline (QueryPipeline): The pipeline, with a single root and a single leaf module.
+        name (str): The prefix of the recorded metrics.
+        **inputs: The inputs of the root module, or awaitables resolving to them.
+
+    Returns:
+        Tuple[Any, Dict[str, ComponentIntermediates]]: The output of the leaf module, and
+        the inputs and outputs of every module, as `run_with_intermediates` returns them.
+    """
+    dag = pipeline.dag
+    roots = [key for key, degree in dag.in_degree() if degree == 0]
+    leaves = [key for key, degree in dag.out_degree() if degree == 0]
+    if len(roots) != 1 or len(leaves) != 1:
+        raise ValueError("Only pipelines with a single root and a single leaf are supported")
+    if any(attr.get("condition_fn") is not None for _, _, attr in dag.edges(data=True)):
+        raise ValueError("Conditional links are not supported")
+    (root,) = roots
+    (leaf,) = leaves
+
+    start = time.perf_counter()
+    input_tasks = {
+        key: asyncio.ensure_future(_resolve(value)) for key, value in inputs.items()
+    }
+    module_tasks: Dict[str, asyncio.Future] = {}
+    intermediates: Dict[str, ComponentIntermediates] = {}
+    stage_seconds: Dict[str, float] = {}
+
+    async def get_link_output(src: str, src_key: Any) -> Any:
+        if src == root:
+            # the root passes its inputs through, each of them is awaited on its own
+            if src_key is not None:
+                return await input_tasks[src_key]
+            output = {key: await task for key, task in input_tasks.items()}
+        else:
+            output = await module_tasks[src]
+        return get_output(src_key, output)
+
+    async def run_module(key: str) -> Dict[str, Any]:
+        module = pipeline.module_dict[key]
+        module_inputs: Dict[str, Any] = {}
+        for src, _, attr in dag.in_edges(key, data=True):
+            output = await get_link_output(src, attr.get("src_key"))
+            if attr.get("input_fn") is not None:
+                output = attr["input_fn"](output)
+            add_output_to_module_inputs(attr.get("dest_key"), output, module, module_inputs)
+
+        module_start = time.perf_counter()
+        output = await module.arun_component(**module_inputs)
+        stage_seconds[key] = time.perf_counter() - module_start
+        metrics.observe(f"{name}_{key}_seconds", stage_seconds[key])
+        intermediates[key] = ComponentIntermediates(inputs=module_inputs, outputs=output)
+        return output
+
+    for key in dag.nodes:
+        if key != root:
+            module_tasks[key] = asyncio.ensure_future(run_module(key))
+
+    try:
+        # the first failure cancels the modules that are still running
+        await asyncio.gather(*module_tasks.values())
+    except BaseException:
+        tasks = [*module_tasks.values(), *input_tasks.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    output = module_tasks[leaf].result()
+    resolved_inputs = {key: await task for key, task in input_tasks.items()}
+    intermediates[root] = ComponentIntermediates(
+        inputs=resolved_inputs, outputs=resolved_inputs
+    )
+
+    total = time.perf_counter() - start
+    metrics.observe(f"{name}_dag_seconds", total)
+    if total > 0:
+        metrics.observe(f"{name}_dag_parallelism", sum(stage_seconds.values()) / total)
+    logger.debug(
+        f"{name} pipeline ran in {total:.3f}s: "
+        + ", ".join(f"{key}={seconds:.3f}s" for key, seconds in stage_seconds.items())
+    )
+
+    # a single output is returned directly, as `run_with_intermediates` does
+    if isinstance(output, dict) and len(output) == 1:
+        return next(iter(output.values())), intermediates
+    return output, intermediates
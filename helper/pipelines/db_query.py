@@ -1,19 +1,46 @@
-from sqlalchemy import create_engine, MetaData, text
-from sqlalchemy.engine import reflection
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
 from datetime import datetime
 from openai import OpenAI
 from config import Config
 from logger import logger
 import re
+import time
 from helper.openai import openai_chat_completion_with_retry
-from helper.pipelines import post_processed_html_response
+from helper.concurrency import (
+    CancelScope,
+    make_async,
+    run_blocking,
+    run_in_cancel_scope,
+)
+from helper.db_engines import engine_registry
+from helper.db_introspection import reflect_tables, render_db_schema
+from helper.schema_cache import get_cached_db_schema
+from helper.schema_retrieval import get_relevant_db_schema, record_schema_retrieval_hit
+from helper.sql_execution import (
+    execute_sql_query,
+    get_sql_execution_options,
+    summarize_sql_result,
+)
+from helper.sql_cost_guard import (
+    SQLQueryTooExpensiveError,
+    add_limit,
+    estimate_sql_cost,
+    exceeds_thresholds,
+    get_sql_cost_guard_options,
+    is_cost_guard_enabled,
+)
+from helper.metrics import metrics
+from helper.pipelines.registry import pipeline_registry
+from schemas.query import SQLCostEstimate, SQLResult
+from helper.pipelines import post_processed_html_response, get_chat_memory
 from llama_index.core.query_pipeline import QueryPipeline, InputComponent, FnComponent
 from llama_index.core.prompts import PromptTemplate
 from llama_index.storage.chat_store.redis import RedisChatStore
 from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.llms.openai import OpenAI
 from llama_index.core.llms import ChatMessage
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from llama_index.core.bridge.pydantic import Field
 from llama_index.core.llms import ChatMessage
 from llama_index.core.query_pipeline import CustomQueryComponent
@@ -39,7 +66,7 @@ class SQLResponseWithChatHistory(CustomQueryComponent):
         """Input keys dict."""
         # NOTE: These are required inputs. If you have optional inputs please override
         # `optional_input_keys_dict`
-        return {"chat_history", "query_str", "db_schema"}
+        return {"chat_history", "query_str", "db_schema", "current_time"}
 
     @property
     def _output_keys(self) -> set:
@@ -50,6 +77,7 @@ class SQLResponseWithChatHistory(CustomQueryComponent):
         chat_history: List[ChatMessage],
         query_str: str,
         db_schema: str,
+        current_time: str,
     ) -> List[ChatMessage]:
 
         formatted_context = self.context_prompt.format(
@@ -60,8 +88,9 @@ class SQLResponseWithChatHistory(CustomQueryComponent):
         chat_history.append(user_message)
 
         if self.system_prompt is not None:
+            system_prompt = self.system_prompt.format(current_time=current_time)
             chat_history = [
-                ChatMessage(role="system", content=self.system_prompt)
+                ChatMessage(role="system", content=system_prompt)
             ] + chat_history
 
         return chat_history
@@ -72,7 +101,9 @@ class SQLResponseWithChatHistory(CustomQueryComponent):
         query_str = kwargs["query_str"]
         db_schema = kwargs["db_schema"]
 
-        prepared_context = self._prepare_context(chat_history, query_str, db_schema)
+        prepared_context = self._prepare_context(
+            chat_history, query_str, db_schema, kwargs["current_time"]
+        )
 
         response = self.llm.chat(prepared_context)
 
@@ -85,13 +116,165 @@ class SQLResponseWithChatHistory(CustomQueryComponent):
         query_str = kwargs["query_str"]
         db_schema = kwargs["db_schema"]
 
-        prepared_context = self._prepare_context(chat_history, query_str, db_schema)
+        prepared_context = self._prepare_context(
+            chat_history, query_str, db_schema, kwargs["current_time"]
+        )
 
         response = await self.llm.achat(prepared_context)
 
         return {"sql_query": response}
 
 
+class SQLCostGuardComponent(CustomQueryComponent):
+    """
+    Check the EXPLAIN estimate of the generated SQL query before it is executed.
+
+    Above the thresholds of the datasource the query is limited, rewritten once by the
+    LLM, or refused, depending on the configured action.
+    """
+
+    llm: OpenAI = Field(..., description="LLM used to rewrite expensive queries")
+    rewrite_prompt: str = Field(
+        description="Prompt asking the LLM to rewrite an expensive query",
+    )
+
+    @property
+    def _input_keys(self) -> set:
+        return {
+            "sql_query",
+            "query_str",
+            "db_schema",
+            "db_url",
+            "db_config_id",
+            "execution_options",
+            "cost_guard_options",
+        }
+
+    @property
+    def _output_keys(self) -> set:
+        return {"sql_query", "cost_estimate"}
+
+    def _estimate(
+        self,
+        db_url: str,
+        db_config_id: Optional[int],
+        sql_query: str,
+        execution_options: Optional[dict],
+    ):
+        engine = engine_registry.get_engine(db_url, db_config_id)
+        estimate = estimate_sql_cost(engine, sql_query, **(execution_options or {}))
+        if estimate is not None and estimate.estimated_rows is not None:
+            metrics.observe("sql_estimated_rows", estimate.estimated_rows)
+        return estimate
+
+    def _rewrite_messages(
+        self, kwargs: Dict[str, Any], estimate: SQLCostEstimate
+    ) -> List[ChatMessage]:
+        content = self.rewrite_prompt.format(
+            query_str=kwargs["query_str"],
+            db_schema=kwargs["db_schema"],
+            sql_query=kwargs["sql_query"],
+            estimated_rows=estimate.estimated_rows,
+            estimated_cost=estimate.estimated_cost,
+        )
+        return [ChatMessage(role="user", content=content)]
+
+    def _apply_action(
+        self,
+        sql_query: str,
+        estimate: Optional[SQLCostEstimate],
+        options: dict,
+        db_url: str,
+        rewritten: bool = False,
+    ) -> Dict[str, Any]:
+        if estimate is not None and not exceeds_thresholds(estimate, options):
+            if rewritten:
+                estimate.action = "rewrite"
+                metrics.increment("sql_cost_guard_rewrites")
+            return {"sql_query": sql_query, "cost_estimate": estimate}
+
+        estimate = estimate or SQLCostEstimate()
+        if options["action"] == "limit":
+            estimate.action = "limit"
+            metrics.increment("sql_cost_guard_limits")
+            logger.info(f"Limiting expensive SQL query: {estimate}")
+            return {
+                "sql_query": add_limit(
+                    sql_query,
+                    Config.SQL_RESULT_MAX_ROWS + 1,
+                    make_url(db_url).get_backend_name(),
+                ),
+                "cost_estimate": estimate,
+            }
+
+        estimate.action = "refuse"
+        metrics.increment("sql_cost_guard_refusals")
+        logger.info(f"Refusing expensive SQL query: {estimate}")
+        raise SQLQueryTooExpensiveError(estimate)
+
+    def _run_component(self, **kwargs) -> Dict[str, Any]:
+        """Run the component."""
+        options = kwargs["cost_guard_options"]
+        sql_query = kwargs["sql_query"]
+        if not is_cost_guard_enabled(options):
+            return {"sql_query": sql_query, "cost_estimate": None}
+
+        estimate = self._estimate(
+            kwargs["db_url"],
+            kwargs["db_config_id"],
+            sql_query,
+            kwargs["execution_options"],
+        )
+        if estimate is None or not exceeds_thresholds(estimate, options):
+            return {"sql_query": sql_query, "cost_estimate": estimate}
+        if options["action"] != "rewrite":
+            return self._apply_action(sql_query, estimate, options, kwargs["db_url"])
+
+        response = self.llm.chat(self._rewrite_messages(kwargs, estimate))
+        sql_query = extract_sql_query(response)
+        estimate = self._estimate(
+            kwargs["db_url"],
+            kwargs["db_config_id"],
+            sql_query,
+            kwargs["execution_options"],
+        )
+        return self._apply_action(
+            sql_query, estimate, options, kwargs["db_url"], rewritten=True
+        )
+
+    async def _arun_component(self, **kwargs: Any) -> Dict[str, Any]:
+        """Run the component asynchronously."""
+        options = kwargs["cost_guard_options"]
+        sql_query = kwargs["sql_query"]
+        if not is_cost_guard_enabled(options):
+            return {"sql_query": sql_query, "cost_estimate": None}
+
+        estimate = await run_blocking(
+            self._estimate,
+            kwargs["db_url"],
+            kwargs["db_config_id"],
+            sql_query,
+            kwargs["execution_options"],
+        )
+        if estimate is None or not exceeds_thresholds(estimate, options):
+            return {"sql_query": sql_query, "cost_estimate": estimate}
+        if options["action"] != "rewrite":
+            return self._apply_action(sql_query, estimate, options, kwargs["db_url"])
+
+        response = await self.llm.achat(self._rewrite_messages(kwargs, estimate))
+        sql_query = extract_sql_query(response)
+        estimate = await run_blocking(
+            self._estimate,
+            kwargs["db_url"],
+            kwargs["db_config_id"],
+            sql_query,
+            kwargs["execution_options"],
+        )
+        return self._apply_action(
+            sql_query, estimate, options, kwargs["db_url"], rewritten=True
+        )
+
+
 def get_db_connection_string(
     db_type: str,
     db_user: str,
@@ -132,53 +315,79 @@ def get_db_connection_string(
     return db_url
 
 
-def get_db_schema(db_url: str) -> str:
+def get_db_schema(
+    db_url: str, db_config_id: Optional[int] = None, query_str: Optional[str] = None
+) -> str:
     """
     Get the schema of the database.
 
     Args:
         db_url (str): The URL of the database.
+        db_config_id (Optional[int]): The ID of the database configuration, used to reuse its engine
+            and its cached schema.
+        query_str (Optional[str]): The customer query. If given, large schemas are pruned to the
+            tables relevant to the query.
 
     Returns:
         str: The schema of the database.
 
     """
-    engine = create_engine(db_url)
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-
-    inspector = reflection.Inspector.from_engine(engine)
-
-    db_schema = ""
-    for table_name, table in metadata.tables.items():
-        db_schema += f"\n\nTable: {table_name}\n"
-        db_schema += "-" * 30 + "\n"
-        foreign_keys = inspector.get_foreign_keys(table_name)
-        fk_dict = {fk["constrained_columns"][0]: fk for fk in foreign_keys}
-        for column in table.columns:
-            if column.name in fk_dict:
-                fk = fk_dict[column.name]
-                referenced_table = fk["referred_table"]
-                referenced_column = fk["referred_columns"][0]
-                db_schema += f"  {column.name} ({column.type}) [Foreign Key: {referenced_table}.{referenced_column}]\n"
-            else:
-                db_schema += f"  {column.name} ({column.type})\n"
-
-    return db_schema
-
-
-def run_sql_query(db_url: str, sql_query: ChatMessage) -> str:
+    engine = engine_registry.get_engine(db_url, db_config_id)
+    if db_config_id is not None and query_str is not None:
+        return get_relevant_db_schema(engine, db_url, db_config_id, query_str)
+    if db_config_id is not None:
+        return get_cached_db_schema(engine, db_url, db_config_id)
+
+    return render_db_schema(reflect_tables(engine))
+
+
+def run_sql_query(
+    db_url: str,
+    sql_query: ChatMessage,
+    db_config_id: Optional[int] = None,
+    execution_options: Optional[dict] = None,
+) -> SQLResult:
+    """
+    Execute the generated SQL query with bounded result fetching.
+
+    Args:
+        db_url (str): The URL of the database.
+        sql_query (str): The SQL query to execute.
+        db_config_id (Optional[int]): The ID of the database configuration. Defaults to None.
+        execution_options (Optional[dict]): The statement timeout and read-only mode of the
+            datasource, as returned by `get_sql_execution_options`. Defaults to None.
+
+    Returns:
+        SQLResult: The columns and the fetched rows.
+    """
     logger.debug(f"Executing SQL query: {sql_query}")
-    engine = create_engine(db_url)
-    with engine.connect() as conn:
-        result = conn.execute(text(sql_query))
-        # check for empty result
-        if result.rowcount == 0:
-            query_result = "No results found"
-        else:
-            query_result = "\n".join([str(row) for row in result.fetchall()])
+    engine = engine_registry.get_engine(db_url, db_config_id)
+    return execute_sql_query(engine, sql_query, **(execution_options or {}))
 
-    return query_result
+
+def report_schema_retrieval(
+    db_url: str, db_config_id: Optional[int], db_schema: str, sql_query: str
+) -> None:
+    """
+    Record whether the schema sent for SQL generation contained every table the generated
+    query uses.
+
+    Args:
+        db_url (str): The URL of the database.
+        db_config_id (Optional[int]): The ID of the database configuration.
+        db_schema (str): The schema sent to the LLM.
+        sql_query (str): The generated SQL query.
+    """
+    if db_config_id is None:
+        return
+
+    try:
+        engine = engine_registry.get_engine(db_url, db_config_id)
+        record_schema_retrieval_hit(
+            engine, db_url, db_config_id, db_schema, str(sql_query)
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record schema retrieval hit: {e}")
 
 
 def extract_sql_query(sql_query: str) -> str:
@@ -192,50 +401,35 @@ def extract_sql_query(sql_query: str) -> str:
         str: The extracted SQL query.
 
     """
-    sql_query = sql_query.message.content
-    sql_query = re.search(r"```sql(.*)```", sql_query, re.DOTALL)
-    if sql_query:
-        return sql_query.group(1)
+    content = sql_query.message.content
+    match = re.search(r"```sql(.*)```", content, re.DOTALL)
+    if match:
+        return match.group(1)
 
-    sql_query = re.search(r"```(.*)```", sql_query, re.DOTALL)
-    if sql_query:
-        return sql_query.group(1)
+    match = re.search(r"```(.*)```", content, re.DOTALL)
+    if match:
+        return match.group(1)
 
-    return sql_query
+    return content
 
 
-def db_config_pipeline(
-    db_type: str,
-    db_config: dict,
-    query: str,
-    chat_uuid: str,
-    model: str = Config.DEFAULT_OPENAI_MODEL,
-) -> str:
+def build_db_query_pipeline(llm: OpenAI) -> QueryPipeline:
     """
-    Executes a database query pipeline.
+    Build the query pipeline used to answer customer queries on a database.
+
+    The pipeline is run with the query, the chat history, the current time, the database
+    URL and ID, and the execution and cost guard options of the datasource.
 
     Args:
-        db_type (str): The type of the database.
-        db_config (dict): The configuration details for the database.
-        query (str): The query to be executed.
-        model (str, optional): The OpenAI model to be used for query generation. Defaults to Config.DEFAULT_OPENAI_MODEL.
+        llm (OpenAI): The LLM used for SQL generation and result refinement.
 
     Returns:
-        tuple: A tuple containing the refined query result and the generated SQL query.
-
+        QueryPipeline: The query pipeline.
     """
-
-    llm = OpenAI(model=model, temperature=0.0, top_p=0.2, api_key=Config.OPENAI_API_KEY)
-
-    chat_store = RedisChatStore(redis_url=Config.REDIS_STORE_URL)
-    chat_memory = ChatMemoryBuffer.from_defaults(
-        chat_store=chat_store, chat_store_key=chat_uuid, token_limit=5000
-    )
-    chat_history = chat_memory.get()
-    logger.debug(f"Chat history: {chat_history}")
-
     input_component = InputComponent()
-    db_schema_tool = FnComponent(fn=get_db_schema, output_key="db_schema")
+    db_schema_tool = FnComponent(
+        fn=get_db_schema, async_fn=make_async(get_db_schema), output_key="db_schema"
+    )
     generate_sql = SQLResponseWithChatHistory(
         llm=llm,
         context_prompt="""
@@ -246,14 +440,35 @@ def db_config_pipeline(
             Write a SQL query to extract the information from the database.
             SQL query:
             """,
-        system_prompt=f"""
+        system_prompt="""
             You are a data analyst and database expert. You have been given a task to
             write a query to extract the information from the database. The time is now 
-            {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}. You have to write sql query enclosed in triple backticks.
+            {current_time}. You have to write sql query enclosed in triple backticks.
             """,
     )
     extract_sql_query_intermediate = FnComponent(fn=extract_sql_query, output_key="sql_query")
-    sql_result_tool = FnComponent(fn=run_sql_query, output_key="sql_result")
+    sql_cost_guard = SQLCostGuardComponent(
+        llm=llm,
+        rewrite_prompt="""
+            The customer has requested the following query:
+            {query_str}
+            The database schema is as follows:
+            {db_schema}
+            This SQL query was written for it:
+            {sql_query}
+            The database estimates it returns {estimated_rows} rows at a cost of {estimated_cost},
+            which is too expensive to run. Rewrite it to answer the same request with less work,
+            e.g. by filtering, aggregating or selecting fewer columns and rows.
+            Write the SQL query enclosed in triple backticks.
+            SQL query:
+            """,
+    )
+    sql_result_tool = FnComponent(
+        fn=run_sql_query, async_fn=make_async(run_sql_query), output_key="sql_result"
+    )
+    summarize_sql_result_tool = FnComponent(
+        fn=summarize_sql_result, output_key="sql_result"
+    )
     refine_query_result_temp = (
         "You are a data analyst and database expert bot. You have been given a task to "
         "see the user query and query result and convert it into a more readable format. "
@@ -279,12 +494,23 @@ def db_config_pipeline(
             "db_schema_tool": db_schema_tool,
             "generate_sql": generate_sql,
             "extract_sql_query_intermediate": extract_sql_query_intermediate,
+            "sql_cost_guard": sql_cost_guard,
             "sql_result_tool": sql_result_tool,
+            "summarize_sql_result_tool": summarize_sql_result_tool,
             "refine_query_result_temp": refine_query_result_temp,
             "final_response": llm,
         }
     )
     p.add_link("input_component", "db_schema_tool", src_key="db_url", dest_key="db_url")
+    p.add_link(
+        "input_component",
+        "db_schema_tool",
+        src_key="db_config_id",
+        dest_key="db_config_id",
+    )
+    p.add_link(
+        "input_component", "db_schema_tool", src_key="query_str", dest_key="query_str"
+    )
     p.add_link(
         "input_component", "generate_sql", src_key="query_str", dest_key="query_str"
     )
@@ -294,9 +520,27 @@ def db_config_pipeline(
         src_key="chat_history",
         dest_key="chat_history",
     )
+    p.add_link(
+        "input_component",
+        "generate_sql",
+        src_key="current_time",
+        dest_key="current_time",
+    )
     p.add_link(
         "input_component", "sql_result_tool", src_key="db_url", dest_key="db_url"
     )
+    p.add_link(
+        "input_component",
+        "sql_result_tool",
+        src_key="db_config_id",
+        dest_key="db_config_id",
+    )
+    p.add_link(
+        "input_component",
+        "sql_result_tool",
+        src_key="execution_options",
+        dest_key="execution_options",
+    )
     p.add_link(
         "input_component",
         "refine_query_result_temp",
@@ -314,12 +558,35 @@ def db_config_pipeline(
     )
     p.add_link(
         "extract_sql_query_intermediate",
+        "sql_cost_guard",
+        src_key="sql_query",
+        dest_key="sql_query",
+    )
+    for key in [
+        "query_str",
+        "db_url",
+        "db_config_id",
+        "execution_options",
+        "cost_guard_options",
+    ]:
+        p.add_link("input_component", "sql_cost_guard", src_key=key, dest_key=key)
+    p.add_link(
+        "db_schema_tool", "sql_cost_guard", src_key="db_schema", dest_key="db_schema"
+    )
+    p.add_link(
+        "sql_cost_guard",
         "sql_result_tool",
         src_key="sql_query",
         dest_key="sql_query",
     )
     p.add_link(
         "sql_result_tool",
+        "summarize_sql_result_tool",
+        src_key="sql_result",
+        dest_key="result",
+    )
+    p.add_link(
+        "summarize_sql_result_tool",
         "refine_query_result_temp",
         src_key="sql_result",
         dest_key="sql_result",
@@ -329,6 +596,46 @@ def db_config_pipeline(
         "final_response",
     )
 
+    return p
+
+
+pipeline_registry.register("db_query", build_db_query_pipeline)
+
+
+def get_current_time() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def db_config_pipeline(
+    db_type: str,
+    db_config: dict,
+    query: str,
+    chat_uuid: str,
+    model: str = Config.DEFAULT_OPENAI_MODEL,
+    db_config_id: Optional[int] = None,
+) -> str:
+    """
+    Executes a database query pipeline.
+
+    Args:
+        db_type (str): The type of the database.
+        db_config (dict): The configuration details for the database.
+        query (str): The query to be executed.
+        model (str, optional): The OpenAI model to be used for query generation. Defaults to Config.DEFAULT_OPENAI_MODEL.
+        db_config_id (Optional[int]): The ID of the database configuration. Defaults to None.
+
+    Returns:
+        tuple: A tuple containing the refined query result, the generated SQL query and its
+        result rows.
+
+    """
+
+    chat_memory = get_chat_memory(chat_uuid)
+    chat_history = chat_memory.get()
+    logger.debug(f"Chat history: {chat_history}")
+
+    p = pipeline_registry.get("db_query", model, temperature=0.0, top_p=0.2)
+
     logger.debug("Fetching database schema")
 
     db_url = get_db_connection_string(
@@ -343,21 +650,247 @@ def db_config_pipeline(
     logger.debug(f"Database URL: {db_url}")
     result, intermediates = p.run_with_intermediates(
         db_url=db_url,
+        db_config_id=db_config_id,
+        execution_options=get_sql_execution_options(db_config),
+        cost_guard_options=get_sql_cost_guard_options(db_config),
         query_str=query,
         chat_history=chat_history,
+        current_time=get_current_time(),
     )
     # logger.debug(f"Pipeline result: {result}")
     # logger.debug(f"Pipeline intermediates: {intermediates}")
 
     refined_query_result = result.message.content
-    sql_query = intermediates["extract_sql_query_intermediate"].outputs["sql_query"]
+    sql_query = intermediates["sql_cost_guard"].outputs["sql_query"]
+    sql_result = intermediates["sql_result_tool"].outputs["sql_result"]
+    sql_result.cost_estimate = intermediates["sql_cost_guard"].outputs["cost_estimate"]
+    if sql_result.cost_estimate is not None:
+        result.message.additional_kwargs["sql_cost_estimate"] = (
+            sql_result.cost_estimate.model_dump()
+        )
 
     logger.debug(f"Refined query result: {refined_query_result}")
     logger.debug(f"Generated SQL query: {sql_query}")
 
+    db_schema = intermediates["db_schema_tool"].outputs["db_schema"]
+    report_schema_retrieval(db_url, db_config_id, db_schema, sql_query)
+
     # update the memory
     user_msg = ChatMessage(role="user", content=query)
     chat_memory.put(user_msg)
     chat_memory.put(result.message)
 
-    return post_processed_html_response(refined_query_result), sql_query
+    return post_processed_html_response(refined_query_result), sql_query, sql_result
+
+
+async def adb_config_pipeline(
+    db_type: str,
+    db_config: dict,
+    query: str,
+    chat_uuid: str,
+    model: str = Config.DEFAULT_OPENAI_MODEL,
+    db_config_id: Optional[int] = None,
+) -> str:
+    """
+    Executes a database query pipeline asynchronously.
+
+    LLM calls are awaited through `QueryPipeline.arun_with_intermediates`, while schema
+    reflection, SQL execution and chat memory access run on the shared blocking executor.
+
+    Args:
+        db_type (str): The type of the database.
+        db_config (dict): The configuration details for the database.
+        query (str): The query to be executed.
+        chat_uuid (str): The UUID of the chat.
+        model (str, optional): The OpenAI model to be used for query generation. Defaults to Config.DEFAULT_OPENAI_MODEL.
+        db_config_id (Optional[int]): The ID of the database configuration. Defaults to None.
+
+    Returns:
+        tuple: A tuple containing the refined query result, the generated SQL query and its
+        result rows.
+    """
+
+    chat_memory = get_chat_memory(chat_uuid)
+    chat_history = await run_blocking(chat_memory.get)
+    logger.debug(f"Chat history: {chat_history}")
+
+    p = pipeline_registry.get("db_query", model, temperature=0.0, top_p=0.2)
+
+    db_url = get_db_connection_string(
+        db_type=db_type,
+        db_user=db_config["user"],
+        db_password=db_config["password"],
+        db_host=db_config["hostname"],
+        db_port=db_config["port"],
+        db_name=db_config["dbname"],
+    )
+
+    result, intermediates = await p.arun_with_intermediates(
+        db_url=db_url,
+        db_config_id=db_config_id,
+        execution_options=get_sql_execution_options(db_config),
+        cost_guard_options=get_sql_cost_guard_options(db_config),
+        query_str=query,
+        chat_history=chat_history,
+        current_time=get_current_time(),
+    )
+
+    refined_query_result = result.message.content
+    sql_query = intermediates["sql_cost_guard"].outputs["sql_query"]
+    sql_result = intermediates["sql_result_tool"].outputs["sql_result"]
+    sql_result.cost_estimate = intermediates["sql_cost_guard"].outputs["cost_estimate"]
+    if sql_result.cost_estimate is not None:
+        result.message.additional_kwargs["sql_cost_estimate"] = (
+            sql_result.cost_estimate.model_dump()
+        )
+
+    logger.debug(f"Refined query result: {refined_query_result}")
+    logger.debug(f"Generated SQL query: {sql_query}")
+
+    db_schema = intermediates["db_schema_tool"].outputs["db_schema"]
+    await run_blocking(
+        report_schema_retrieval, db_url, db_config_id, db_schema, sql_query
+    )
+
+    # update the memory
+    user_msg = ChatMessage(role="user", content=query)
+    await run_blocking(chat_memory.put, user_msg)
+    await run_blocking(chat_memory.put, result.message)
+
+    return post_processed_html_response(refined_query_result), sql_query, sql_result
+
+
+async def astream_db_config_pipeline(
+    db_type: str,
+    db_config: dict,
+    query: str,
+    chat_uuid: str,
+    model: str = Config.DEFAULT_OPENAI_MODEL,
+    db_config_id: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Execute the database query pipeline and report each stage as soon as it completes.
+
+    The stages of the prebuilt pipeline are run one after the other, so that the
+    generated SQL and its result rows reach the client before the final refine call,
+    whose response is streamed token by token. Cancelling the iteration cancels the
+    running SQL statement.
+
+    Args:
+        db_type (str): The type of the database.
+        db_config (dict): The configuration details for the database.
+        query (str): The query to be executed.
+        chat_uuid (str): The UUID of the chat.
+        model (str, optional): The OpenAI model to be used for query generation. Defaults to Config.DEFAULT_OPENAI_MODEL.
+        db_config_id (Optional[int]): The ID of the database configuration. Defaults to None.
+
+    Yields:
+        Tuple[str, Any]: The events of the pipeline, in this order:
+        `("sql", {"sql_query": str, "cost_estimate": Optional[SQLCostEstimate]})`,
+        `("result", SQLResult)`, `("token", str)` for every refine tokens, and
+        `("response", str)` with the post processed HTML response.
+    """
+    p = pipeline_registry.get("db_query", model, temperature=0.0, top_p=0.2)
+    scope = CancelScope()
+    start = time.perf_counter()
+
+    async def run_stage(name: str, **kwargs: Any) -> Dict[str, Any]:
+        stage_start = time.perf_counter()
+        outputs = await run_in_cancel_scope(
+            scope, p.module_dict[name].arun_component(**kwargs)
+        )
+        metrics.observe(f"db_query_{name}_seconds", time.perf_counter() - stage_start)
+        return outputs
+
+    chat_memory = get_chat_memory(chat_uuid)
+    chat_history = await run_blocking(chat_memory.get)
+    logger.debug(f"Chat history: {chat_history}")
+
+    db_url = get_db_connection_string(
+        db_type=db_type,
+        db_user=db_config["user"],
+        db_password=db_config["password"],
+        db_host=db_config["hostname"],
+        db_port=db_config["port"],
+        db_name=db_config["dbname"],
+    )
+
+    db_schema = (
+        await run_stage(
+            "db_schema_tool", db_url=db_url, db_config_id=db_config_id, query_str=query
+        )
+    )["db_schema"]
+    generated = await run_stage(
+        "generate_sql",
+        chat_history=list(chat_history),
+        query_str=query,
+        db_schema=db_schema,
+        current_time=get_current_time(),
+    )
+    sql_query = (
+        await run_stage("extract_sql_query_intermediate", sql_query=generated["sql_query"])
+    )["sql_query"]
+    execution_options = get_sql_execution_options(db_config)
+    guarded = await run_stage(
+        "sql_cost_guard",
+        sql_query=sql_query,
+        query_str=query,
+        db_schema=db_schema,
+        db_url=db_url,
+        db_config_id=db_config_id,
+        execution_options=execution_options,
+        cost_guard_options=get_sql_cost_guard_options(db_config),
+    )
+    sql_query, cost_estimate = guarded["sql_query"], guarded["cost_estimate"]
+    logger.debug(f"Generated SQL query: {sql_query}")
+    metrics.observe("db_query_time_to_sql_seconds", time.perf_counter() - start)
+    yield "sql", {"sql_query": sql_query, "cost_estimate": cost_estimate}
+
+    sql_result = (
+        await run_stage(
+            "sql_result_tool",
+            db_url=db_url,
+            db_config_id=db_config_id,
+            sql_query=sql_query,
+            execution_options=execution_options,
+        )
+    )["sql_result"]
+    sql_result.cost_estimate = cost_estimate
+    metrics.observe("db_query_time_to_result_seconds", time.perf_counter() - start)
+    yield "result", sql_result
+
+    summary = (await run_stage("summarize_sql_result_tool", result=sql_result))[
+        "sql_result"
+    ]
+    prompt = (
+        await run_stage("refine_query_result_temp", query_str=query, sql_result=summary)
+    )["prompt"]
+    llm = p.module_dict["generate_sql"].llm
+    tokens = []
+    stream = await run_in_cancel_scope(
+        scope, llm.astream_chat([ChatMessage(role="user", content=prompt)])
+    )
+    async for chunk in stream:
+        if not chunk.delta:
+            continue
+        if not tokens:
+            metrics.observe(
+                "db_query_time_to_first_token_seconds", time.perf_counter() - start
+            )
+        tokens.append(chunk.delta)
+        yield "token", chunk.delta
+
+    refined_query_result = "".join(tokens)
+    logger.debug(f"Refined query result: {refined_query_result}")
+    await run_blocking(
+        report_schema_retrieval, db_url, db_config_id, db_schema, sql_query
+    )
+
+    # update the memory
+    response_message = ChatMessage(role="assistant", content=refined_query_result)
+    if cost_estimate is not None:
+        response_message.additional_kwargs["sql_cost_estimate"] = cost_estimate.model_dump()
+    await run_blocking(chat_memory.put, ChatMessage(role="user", content=query))
+    await run_blocking(chat_memory.put, response_message)
+
+    yield "response", post_processed_html_response(refined_query_result)
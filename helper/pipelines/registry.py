@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from llama_index.core.query_pipeline import QueryPipeline
+from llama_index.llms.openai import OpenAI
+from config import Config
+from helper.llm_clients import llm_clients
+from helper.metrics import metrics
+
+
+class PipelineRegistry:
+    """
+    Process-wide cache of built query pipelines.
+
+    Building a pipeline instantiates its components, adds its links and validates the
+    graph. Pipelines keep no state between runs, everything specific to a request (the
+    query, the chat history, the dataframe, the database URL, ...) is passed to `run`,
+    so one pipeline per name, model and LLM parameters is shared by all requests.
+    """
+
+    def __init__(self):
+        self._builders: Dict[str, Callable[[OpenAI], QueryPipeline]] = {}
+        # (name, model, llm parameters) -> pipeline
+        self._pipelines: Dict[Tuple[str, str, str], QueryPipeline] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, builder: Callable[[OpenAI], QueryPipeline]) -> None:
+        """
+        Register the function building a pipeline.
+
+        Args:
+            name (str): The name of the pipeline.
+            builder (Callable[[OpenAI], QueryPipeline]): Builds the pipeline on an LLM.
+        """
+        with self._lock:
+            self._builders[name] = builder
+
+    @property
+    def names(self) -> list:
+        with self._lock:
+            return list(self._builders)
+
+    def get(
+        self, name: str, model: Optional[str] = None, **llm_params: Any
+    ) -> QueryPipeline:
+        """
+        Get a pipeline, building it on first use.
+
+        Args:
+            name (str): The name of the pipeline.
+            model (Optional[str]): The OpenAI model, `Config.DEFAULT_OPENAI_MODEL` by default.
+            **llm_params: Parameters of the LLM, e.g. `temperature`.
+
+        Returns:
+            QueryPipeline: The pipeline.
+
+        Raises:
+            KeyError: If no pipeline is registered under the name.
+        """
+        model = model or Config.DEFAULT_OPENAI_MODEL
+        key = (name, model, json.dumps(llm_params, sort_keys=True, default=str))
+        with self._lock:
+            pipeline = self._pipelines.get(key)
+            builder = self._builders[name]
+        if pipeline is not None:
+            metrics.increment("pipeline_cache_hits")
+            return pipeline
+
+        metrics.increment("pipeline_cache_misses")
+        start = time.perf_counter()
+        pipeline = builder(llm_clients.get_llm(model, **llm_params))
+        metrics.observe(f"{name}_pipeline_build_seconds", time.perf_counter() - start)
+        with self._lock:
+            # keep the pipeline of a thread that built it at the same time
+            return self._pipelines.setdefault(key, pipeline)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pipelines.clear()
+
+
+pipeline_registry = PipelineRegistry()
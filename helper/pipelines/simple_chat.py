@@ -1,16 +1,20 @@
+import time
 from datetime import datetime
 from config import Config
 from logger import logger
 from helper.openai import openai_chat_completion_with_retry
-from helper.pipelines import post_processed_html_response
+from helper.concurrency import run_blocking
+from helper.metrics import metrics
+from helper.pipelines import get_chat_memory, post_processed_html_response
 from llama_index.core.query_pipeline import QueryPipeline, InputComponent
 from llama_index.storage.chat_store.redis import RedisChatStore
 from llama_index.core.memory import ChatMemoryBuffer
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 from llama_index.core.bridge.pydantic import Field
-from llama_index.core.llms import ChatMessage
+from llama_index.core.llms import ChatMessage, ChatResponseAsyncGen
 from llama_index.core.query_pipeline import CustomQueryComponent
 from llama_index.llms.openai import OpenAI
+from helper.pipelines.registry import pipeline_registry
 
 
 class SimpleResponseWithChatHistory(CustomQueryComponent):
@@ -79,27 +83,27 @@ class SimpleResponseWithChatHistory(CustomQueryComponent):
 
         return {"response": response}
 
+    async def astream(
+        self, chat_history: List[ChatMessage], query_str: str
+    ) -> ChatResponseAsyncGen:
+        """Stream the response, every chunk holds the new tokens in its `delta`."""
+        prepared_context = self._prepare_context(chat_history, query_str)
 
-def simple_chat_pipeline(
-    customer_query: str, chat_uuid: str, model: str = Config.DEFAULT_OPENAI_MODEL
-) -> str:
+        return await self.llm.astream_chat(prepared_context)
+
+
+def build_simple_chat_pipeline(llm: OpenAI) -> QueryPipeline:
     """
-    Query the csv file using the query pipeline.
+    Build the query pipeline answering customer queries without a datasource.
+
+    The pipeline is run with the query and the chat history.
 
     Args:
-        customer_query (str): The query requested by the customer.
-        model (str, optional): The OpenAI model to use for generating the response. Defaults to Config.DEFAULT_OPENAI_MODEL.
+        llm (OpenAI): The LLM to use.
 
     Returns:
-        str: The response generated by the OpenAI model.
+        QueryPipeline: The query pipeline.
     """
-    chat_store = RedisChatStore(redis_url=Config.REDIS_STORE_URL)
-    chat_memory = ChatMemoryBuffer.from_defaults(
-        chat_store=chat_store, chat_store_key=chat_uuid, token_limit=5000
-    )
-
-    llm = OpenAI(model=model, temperature=0.0, top_p=0.2, api_key=Config.OPENAI_API_KEY)
-
     response_component = SimpleResponseWithChatHistory(
         llm=llm,
         context_prompt="""
@@ -114,8 +118,6 @@ def simple_chat_pipeline(
             """,
     )
     input_component = InputComponent()
-    chat_history = chat_memory.get()
-    logger.debug(f"Chat history: {chat_history}")
 
     p = QueryPipeline(verbose=True)
     p.add_modules(
@@ -134,6 +136,35 @@ def simple_chat_pipeline(
         "input", "response_component", src_key="chat_history", dest_key="chat_history"
     )
 
+    return p
+
+
+pipeline_registry.register("simple_chat", build_simple_chat_pipeline)
+
+
+def simple_chat_pipeline(
+    customer_query: str, chat_uuid: str, model: str = Config.DEFAULT_OPENAI_MODEL
+) -> str:
+    """
+    Query the csv file using the query pipeline.
+
+    Args:
+        customer_query (str): The query requested by the customer.
+        model (str, optional): The OpenAI model to use for generating the response. Defaults to Config.DEFAULT_OPENAI_MODEL.
+
+    Returns:
+        str: The response generated by the OpenAI model.
+    """
+    chat_store = RedisChatStore(redis_url=Config.REDIS_STORE_URL)
+    chat_memory = ChatMemoryBuffer.from_defaults(
+        chat_store=chat_store, chat_store_key=chat_uuid, token_limit=5000
+    )
+
+    chat_history = chat_memory.get()
+    logger.debug(f"Chat history: {chat_history}")
+
+    p = pipeline_registry.get("simple_chat", model, temperature=0.0, top_p=0.2)
+
     response = p.run(query_str=customer_query, chat_history=chat_history)
 
     # update the memory
@@ -142,3 +173,49 @@ def simple_chat_pipeline(
     chat_memory.put(response.message)
 
     return post_processed_html_response(response.message.content)
+
+
+async def astream_simple_chat_pipeline(
+    customer_query: str, chat_uuid: str, model: str = Config.DEFAULT_OPENAI_MODEL
+) -> AsyncIterator[str]:
+    """
+    Stream the response to a chat query token by token.
+
+    The chat memory is updated once the whole response has been streamed, a stream that
+    is interrupted leaves it unchanged.
+
+    Args:
+        customer_query (str): The query requested by the customer.
+        chat_uuid (str): The UUID of the chat.
+        model (str, optional): The OpenAI model to use for generating the response. Defaults to Config.DEFAULT_OPENAI_MODEL.
+
+    Yields:
+        str: The new tokens of the response.
+    """
+    chat_memory = get_chat_memory(chat_uuid)
+    chat_history = await run_blocking(chat_memory.get)
+    logger.debug(f"Chat history: {chat_history}")
+
+    p = pipeline_registry.get("simple_chat", model, temperature=0.0, top_p=0.2)
+    response_component = p.module_dict["response_component"]
+
+    start = time.perf_counter()
+    tokens = []
+    async for chunk in await response_component.astream(chat_history, customer_query):
+        if not chunk.delta:
+            continue
+        if not tokens:
+            metrics.observe(
+                "simple_chat_time_to_first_token_seconds", time.perf_counter() - start
+            )
+        tokens.append(chunk.delta)
+        yield chunk.delta
+    metrics.observe("simple_chat_stream_seconds", time.perf_counter() - start)
+
+    # update the memory
+    await run_blocking(
+        chat_memory.put, ChatMessage(role="user", content=customer_query)
+    )
+    await run_blocking(
+        chat_memory.put, ChatMessage(role="assistant", content="".join(tokens))
+    )
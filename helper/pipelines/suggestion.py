@@ -5,27 +5,31 @@ from logger import logger
 from schemas.ai_suggestion import AISuggestionRequest
 from db.models.db_config import DBConfig
 from db.models.user_document import UserDocument
-from typing import List, Any
+from typing import List, Any, Optional
 from helper.pipelines.db_query import get_db_schema, get_db_connection_string
-from helper.pipelines.excel_query import get_excel_schema
+from helper.pipelines.excel_query import get_excel_schema_from_sheets
 import pandas as pd
-import re, json, random, os
+import re, json
 from helper.openai import openai_chat_completion_with_retry
-from helper.aws_s3 import download_from_s3
+from helper.dataframe_cache import DocumentDownloadError, load_user_document
+from helper.redis_client import get_redis_client
 
 
-def get_csv_schema(csv_path: str) -> str:
+def get_suggestion_cache_key(document_id: int) -> str:
+    return f"suggestions:document:{document_id}"
+
+
+def get_csv_schema(df: pd.DataFrame) -> str:
     """
     Returns the head of the csv file.
 
     Args:
-        csv_path (str): The path to the CSV file.
+        df (pd.DataFrame): The dataframe of the CSV file.
 
     Returns:
         str: The schema of the CSV file.
 
     """
-    df = pd.read_csv(csv_path)
     csv_schema = f"""
     The schema of the csv file is as follows:
     {df.head()}
@@ -123,13 +127,10 @@ def suggestion_pipeline(
         if isinstance(data_source, UserDocument):
             logger.debug(f"Case 3: Data source is a {data_source.document_type} file")
 
-            doc_s3_url = data_source.document_url
-            object_url = doc_s3_url.split("amazonaws.com/")[-1]
-            file_extension = object_url.split(".")[-1]
-            temp_file_name = random.randbytes(10).hex() + "." + file_extension
-            temp_file_path = f"./tmp/{temp_file_name}"
-            if not download_from_s3(object_url, temp_file_path):
-                logger.error(f"Could not download the file from S3: {object_url}")
+            try:
+                df = load_user_document(data_source)
+            except DocumentDownloadError as e:
+                logger.error(f"Could not download the file from S3: {e}")
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Could not download the file from S3",
@@ -142,14 +143,12 @@ def suggestion_pipeline(
             """
             user_prompt = f"""
             The {data_source.document_type} file has the following schema:
-            {get_csv_schema(temp_file_path) if data_source.document_type == "csv" else get_excel_schema(temp_file_path)}
+            {get_csv_schema(df) if data_source.document_type == "csv" else get_excel_schema_from_sheets(df)}
 
             {last_ques_str}
             Suggest some follow-up question that the user might be interested in.
             {output_format}
             """
-
-            os.remove(temp_file_path)
         else:
             logger.debug("Case 4: Data source is a database")
             db_config = data_source.db_config
@@ -168,7 +167,7 @@ def suggestion_pipeline(
             """
             user_prompt = f"""
             The database schema is as follows:
-            {get_db_schema(db_url)}
+            {get_db_schema(db_url, data_source.id)}
             {last_ques_str}
             Suggest some follow-up question that the user might be interested in.
             {output_format}
@@ -192,3 +191,45 @@ def suggestion_pipeline(
     logger.debug(f"Suggestions: {suggestions['suggestions']}")
 
     return suggestions["suggestions"]
+
+
+def warm_document_suggestions(user_doc: UserDocument) -> List[str]:
+    """
+    Generate the suggestions shown before the first query on a document and cache them.
+
+    Args:
+        user_doc (UserDocument): The csv or excel document.
+
+    Returns:
+        List[str]: The suggested queries.
+    """
+    request = AISuggestionRequest(
+        data_source_id=user_doc.id,
+        query_type=user_doc.document_type,
+        is_first_request=True,
+    )
+    suggestions = suggestion_pipeline(request, user_doc)
+    get_redis_client().set(
+        get_suggestion_cache_key(user_doc.id),
+        json.dumps(suggestions),
+        ex=Config.SUGGESTION_CACHE_TTL,
+    )
+    return suggestions
+
+
+def get_warm_suggestions(document_id: int) -> Optional[List[str]]:
+    """
+    Get the suggestions generated for a document at ingestion time.
+
+    Args:
+        document_id (int): The ID of the user document.
+
+    Returns:
+        Optional[List[str]]: The suggested queries, or None if they were not generated.
+    """
+    try:
+        cached = get_redis_client().get(get_suggestion_cache_key(document_id))
+    except Exception as e:
+        logger.warning(f"Failed to read the suggestions of document {document_id}: {e}")
+        return None
+    return json.loads(cached) if cached is not None else None
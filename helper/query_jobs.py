@@ -0,0 +1,174 @@
+import hashlib
+from typing import Optional
+from fastapi.encoders import jsonable_encoder
+from config import Config
+from logger import logger
+from db import SessionLocal
+from db.queries.db_config import DBConfigQuery
+from db.queries.user_documents import UserDocumentQuery
+from helper.concurrency import run_blocking
+from helper.dataframe_cache import load_user_document
+from helper.job_queue import JobQueue
+from helper.pipelines import post_processed_html_response
+from helper.pipelines.chart_query import achart_query_pipeline
+from helper.pipelines.db_query import db_config_pipeline
+from helper.pipelines.excel_query import excel_pipeline
+from schemas.jobs import Job
+from schemas.query import CustomerQueryRequest, CustomerQueryResponse
+
+
+EXCEL_QUERY_JOB = "excel_query"
+DB_QUERY_JOB = "db_query"
+CHART_QUERY_JOB = "chart_query"
+
+FINISHED_JOB_STATUSES = ("succeeded", "failed")
+
+query_queue = JobQueue("query", result_ttl=Config.QUERY_JOB_RESULT_TTL)
+
+
+class IdempotencyKeyReusedError(ValueError):
+    """Raised when an idempotency key is sent again with a different request."""
+
+
+def get_idempotent_job_id(customer_uuid: str, idempotency_key: str) -> str:
+    # scoped to the customer, so that the keys chosen by different clients never collide
+    key = f"{customer_uuid}:{idempotency_key}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def enqueue_query_job(
+    job_type: str,
+    request: CustomerQueryRequest,
+    customer_uuid: str,
+    idempotency_key: Optional[str] = None,
+) -> Job:
+    """
+    Queue a query for the query worker.
+
+    A request sent again with the same idempotency key gets the job of the first request,
+    until the result of that job expires.
+
+    Args:
+        job_type (str): The type of the query job.
+        request (CustomerQueryRequest): The validated request of the customer.
+        customer_uuid (str): The UUID of the customer the job belongs to.
+        idempotency_key (Optional[str]): The key the client sent with the request.
+
+    Returns:
+        Job: The queued job, or the job of the first request with the same key.
+
+    Raises:
+        IdempotencyKeyReusedError: If the key was used for a different request.
+    """
+    payload = {
+        "customer_uuid": customer_uuid,
+        "request": request.model_dump(mode="json"),
+    }
+    job = query_queue.enqueue(
+        job_type,
+        payload,
+        max_attempts=Config.QUERY_JOB_MAX_ATTEMPTS,
+        job_id=(
+            get_idempotent_job_id(customer_uuid, idempotency_key)
+            if idempotency_key
+            else None
+        ),
+    )
+    if job.type != job_type or job.payload.get("request") != payload["request"]:
+        raise IdempotencyKeyReusedError(
+            f"Idempotency key {idempotency_key} was used for a different request"
+        )
+    return job
+
+
+def run_excel_query_job(job: Job) -> None:
+    request = CustomerQueryRequest(**job.payload["request"])
+
+    db = SessionLocal()
+    try:
+        excel_file = UserDocumentQuery.get_user_document_by_id(db, request.data_source_id)
+        if excel_file is None:
+            raise ValueError(f"Excel file {request.data_source_id} not found")
+        df = load_user_document(excel_file)
+    finally:
+        db.close()
+
+    result = excel_pipeline(df, request.query, str(request.chat_uuid), request.model)
+    job.result = CustomerQueryResponse(
+        query=request.query,
+        response=result,
+        data_source_id=request.data_source_id,
+        chat_uuid=str(request.chat_uuid),
+    ).model_dump(mode="json")
+
+
+def run_db_query_job(job: Job) -> None:
+    request = CustomerQueryRequest(**job.payload["request"])
+
+    db = SessionLocal()
+    try:
+        db_config = DBConfigQuery.get_db_config_by_id(db, request.data_source_id)
+        if db_config is None:
+            raise ValueError(f"DB {request.data_source_id} not found")
+        db_type, db_config_values, db_config_id = (
+            db_config.db_type,
+            db_config.db_config,
+            db_config.id,
+        )
+    finally:
+        db.close()
+
+    result, sql_query, sql_result = db_config_pipeline(
+        db_type,
+        db_config_values,
+        request.query,
+        str(request.chat_uuid),
+        request.model,
+        db_config_id=db_config_id,
+    )
+    job.result = CustomerQueryResponse(
+        query=request.query,
+        response=result,
+        sql_query=sql_query,
+        sql_result=sql_result,
+        data_source_id=request.data_source_id,
+        chat_uuid=str(request.chat_uuid),
+    ).model_dump(mode="json")
+
+
+async def run_chart_query_job(job: Job) -> None:
+    request = CustomerQueryRequest(**job.payload["request"])
+
+    db = SessionLocal()
+    try:
+        result = await achart_query_pipeline(
+            db,
+            request.query,
+            str(request.chat_uuid),
+            "chart",
+            request.data_source_id,
+            request.model,
+        )
+    except Exception:
+        await run_blocking(db.rollback)
+        raise
+    finally:
+        await run_blocking(db.close)
+
+    logger.debug(f"Saved chart {result['chart']['uuid']} of job {job.id}")
+    job.result = {
+        **CustomerQueryResponse(
+            query=request.query,
+            response=post_processed_html_response(result["response"]),
+            data_source_id=request.data_source_id,
+            chat_uuid=str(request.chat_uuid),
+        ).model_dump(mode="json"),
+        "chart": jsonable_encoder(result["chart"]),
+    }
+
+
+QUERY_HANDLERS = {
+    EXCEL_QUERY_JOB: run_excel_query_job,
+    DB_QUERY_JOB: run_db_query_job,
+    CHART_QUERY_JOB: run_chart_query_job,
+}
@@ -0,0 +1,14 @@
+from functools import lru_cache
+import redis
+from config import Config
+
+
+@lru_cache(maxsize=1)
+def get_redis_client() -> redis.Redis:
+    """
+    Get the process-wide redis client.
+
+    Returns:
+        redis.Redis: The redis client connected to `Config.REDIS_STORE_URL`.
+    """
+    return redis.Redis.from_url(Config.REDIS_STORE_URL)
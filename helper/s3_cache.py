@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from config import Config
+from logger import logger
+from helper.aws_s3 import download_from_s3, get_s3_etag
+from helper.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows development setups
+    fcntl = None
+
+
+TEMP_PREFIX = ".tmp-"
+# partial downloads left behind by a crashed worker
+STALE_TEMP_AGE = 3600
+
+
+def get_default_cache_dir() -> str:
+    return os.path.join(tempfile.gettempdir(), "chat-analytics-s3")
+
+
+class S3ObjectCache:
+    """
+    Local disk cache of S3 objects shared by the workers of a host.
+
+    Objects are stored under their ETag, so identical content is kept once and a
+    replaced object never serves stale bytes. The ETag of a key is revalidated with a
+    `head_object` call, or trusted for `ttl` seconds after the last check. Concurrent
+    downloads of the same object are deduplicated within and across worker processes,
+    and the least recently used objects are deleted once the cache holds more than
+    `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        root_dir: Optional[str] = Config.S3_CACHE_DIR,
+        max_bytes: int = Config.S3_CACHE_MAX_BYTES,
+        ttl: int = Config.S3_CACHE_TTL,
+        lock_stripes: int = 64,
+    ):
+        self.root_dir = root_dir or get_default_cache_dir()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._objects_dir = os.path.join(self.root_dir, "objects")
+        self._keys_dir = os.path.join(self.root_dir, "keys")
+        self._locks_dir = os.path.join(self.root_dir, "locks")
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    def _object_path(self, etag: str) -> str:
+        return os.path.join(self._objects_dir, re.sub(r"[^0-9a-zA-Z-]", "_", etag))
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(
+            self._keys_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()
+        )
+
+    def _read_key(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._key_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_key(self, key: str, etag: str) -> None:
+        path = self._key_path(key)
+        temp_path = f"{path}{TEMP_PREFIX}{random.randbytes(8).hex()}"
+        try:
+            os.makedirs(self._keys_dir, exist_ok=True)
+            with open(temp_path, "w") as f:
+                json.dump({"etag": etag, "validated_at": time.time()}, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write the s3 cache entry of {key}: {e}")
+
+    def get_etag(self, key: str) -> Optional[str]:
+        """
+        Get the current ETag of an object, trusting the last check for `ttl` seconds.
+
+        Args:
+            key (str): The S3 key of the object.
+
+        Returns:
+            Optional[str]: The ETag, or None if the object could not be found.
+        """
+        entry = self._read_key(key)
+        if entry and time.time() - entry["validated_at"] < self.ttl:
+            return entry["etag"]
+
+        metrics.increment("s3_cache_revalidations")
+        etag = get_s3_etag(key)
+        if etag is not None:
+            self._write_key(key, etag)
+        return etag
+
+    def get_path(self, key: str, etag: Optional[str] = None) -> Optional[str]:
+        """
+        Get the local path of an object, downloading it if it is not cached.
+
+        The returned file must not be modified or deleted by the caller.
+
+        Args:
+            key (str): The S3 key of the object.
+            etag (Optional[str]): The ETag of the object, if the caller just validated it.
+
+        Returns:
+            Optional[str]: The path of the cached file, or None if the object could not be downloaded.
+        """
+        etag = etag or self.get_etag(key)
+        if etag is None:
+            return None
+
+        path = self.get_cached_path(etag)
+        if path is not None:
+            return path
+
+        path = self._object_path(etag)
+        with self._download_lock(etag):
+            # another request or worker may have downloaded it while we waited
+            if self._touch(path):
+                metrics.increment("s3_cache_deduplicated")
+                return path
+
+            os.makedirs(self._objects_dir, exist_ok=True)
+            temp_path = f"{path}{TEMP_PREFIX}{random.randbytes(8).hex()}"
+            start = time.perf_counter()
+            if not download_from_s3(key, temp_path, etag=etag):
+                # the object changed or is gone, revalidate on the next request
+                self.invalidate(key)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return None
+            os.replace(temp_path, path)
+
+        metrics.increment("s3_cache_misses")
+        metrics.observe("s3_download_seconds", time.perf_counter() - start)
+        self.evict(keep=path)
+        return path
+
+    def get_cached_path(self, etag: str) -> Optional[str]:
+        """
+        Get the local path of an object only if it is already cached.
+
+        Args:
+            etag (str): The ETag of the object.
+
+        Returns:
+            Optional[str]: The path of the cached file, or None if it is not cached.
+        """
+        path = self._object_path(etag)
+        if self._touch(path):
+            metrics.increment("s3_cache_hits")
+            return path
+        return None
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def _download_lock(self, etag: str) -> Iterator[None]:
+        stripe = int(hashlib.md5(etag.encode("utf-8")).hexdigest(), 16) % len(self._locks)
+        with self._locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+
+            os.makedirs(self._locks_dir, exist_ok=True)
+            lock_fd = os.open(
+                os.path.join(self._locks_dir, os.path.basename(self._object_path(etag))),
+                os.O_CREAT | os.O_RDWR,
+            )
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(lock_fd)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Delete the least recently used objects until the cache fits its budget.
+
+        Files that are still open keep their content until they are closed.
+
+        Args:
+            keep (Optional[str]): A path that must not be deleted, e.g. the one just downloaded.
+
+        Returns:
+            int: The number of deleted objects.
+        """
+        entries = []
+        now = time.time()
+        try:
+            names = os.listdir(self._objects_dir)
+        except FileNotFoundError:
+            return 0
+
+        for name in names:
+            path = os.path.join(self._objects_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if TEMP_PREFIX in name:
+                if now - stat.st_mtime > STALE_TEMP_AGE:
+                    self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if self._remove(path):
+                lock_path = os.path.join(self._locks_dir, os.path.basename(path))
+                self._remove(lock_path)
+                total_size -= size
+                evicted += 1
+
+        if evicted:
+            metrics.increment("s3_cache_evictions", evicted)
+        metrics.observe("s3_cache_bytes", total_size)
+        return evicted
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def invalidate(self, key: str) -> None:
+        """
+        Forget the validated ETag of a key, e.g. after the object was replaced or deleted.
+
+        Args:
+            key (str): The S3 key of the object.
+        """
+        self._remove(self._key_path(key))
+
+
+s3_object_cache = S3ObjectCache()
@@ -0,0 +1,188 @@
+import asyncio
+import base64
+import hashlib
+import time
+from typing import Dict, List
+from fastapi import UploadFile
+from config import Config
+from logger import logger
+from helper.aws_s3 import bucket_name, get_s3_obj_url, s3_client
+from helper.concurrency import run_blocking
+from helper.metrics import metrics
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an uploaded file is larger than `UPLOAD_MAX_BYTES`."""
+
+
+class UploadFailedError(Exception):
+    """Raised when an uploaded file could not be stored in S3."""
+
+
+def get_sha256_checksum(data: bytes) -> str:
+    return base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+
+
+async def _read_part(file: UploadFile, part_size: int) -> bytes:
+    # `UploadFile.read` may return less than asked for
+    chunks = []
+    remaining = part_size
+    while remaining > 0:
+        chunk = await file.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _upload_part(key: str, upload_id: str, part_number: int, data: bytes) -> Dict:
+    checksum = get_sha256_checksum(data)
+    result = s3_client.upload_part(
+        Bucket=bucket_name,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=data,
+        ChecksumAlgorithm="SHA256",
+        ChecksumSHA256=checksum,
+    )
+    return {
+        "PartNumber": part_number,
+        "ETag": result["ETag"],
+        "ChecksumSHA256": checksum,
+    }
+
+
+async def upload_file_to_s3(
+    file: UploadFile,
+    key: str,
+    max_bytes: int = Config.UPLOAD_MAX_BYTES,
+    part_size: int = Config.UPLOAD_PART_SIZE,
+    max_concurrency: int = Config.UPLOAD_MAX_CONCURRENCY,
+) -> str:
+    """
+    Stream an uploaded file into S3 without blocking the event loop.
+
+    The file is read in `part_size` chunks, each sent as a part of a multipart upload
+    with a SHA-256 checksum that S3 verifies. At most `max_concurrency` parts are in
+    flight, which also bounds the memory held per upload. The size limit is enforced
+    while reading, and the multipart upload is aborted on any failure so that no
+    incomplete parts are left behind. Files that fit in a single part are sent with
+    one `put_object` call.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        key (str): The S3 key to store the file under.
+        max_bytes (int): The maximum size of the file.
+        part_size (int): The size of every part but the last, at least 5 MiB.
+        max_concurrency (int): The maximum number of parts uploaded at the same time.
+
+    Returns:
+        str: The S3 url of the stored file.
+
+    Raises:
+        UploadTooLargeError: If the file is larger than `max_bytes`.
+        UploadFailedError: If the file could not be stored in S3.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+
+    start = time.perf_counter()
+    await file.seek(0)
+    data = await _read_part(file, part_size)
+    total_size = len(data)
+    if total_size > max_bytes:
+        raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+
+    if total_size < part_size:
+        try:
+            await run_blocking(
+                s3_client.put_object,
+                Bucket=bucket_name,
+                Key=key,
+                Body=data,
+                ChecksumAlgorithm="SHA256",
+                ChecksumSHA256=get_sha256_checksum(data),
+            )
+        except Exception as e:
+            logger.error(f"Failed to upload {key} due to {e}")
+            raise UploadFailedError(f"Failed to upload {key}") from e
+        metrics.observe("s3_upload_seconds", time.perf_counter() - start)
+        return get_s3_obj_url(key)
+
+    try:
+        upload = await run_blocking(
+            s3_client.create_multipart_upload,
+            Bucket=bucket_name,
+            Key=key,
+            ChecksumAlgorithm="SHA256",
+        )
+    except Exception as e:
+        logger.error(f"Failed to start the upload of {key} due to {e}")
+        raise UploadFailedError(f"Failed to upload {key}") from e
+    upload_id = upload["UploadId"]
+
+    slots = asyncio.Semaphore(max_concurrency)
+    failed = asyncio.Event()
+    tasks: List[asyncio.Task] = []
+
+    async def upload_part(part_number: int, part: bytes) -> Dict:
+        try:
+            return await run_blocking(_upload_part, key, upload_id, part_number, part)
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    try:
+        part_number = 1
+        while data:
+            # wait for a free slot before reading, so at most `max_concurrency` parts
+            # are held in memory
+            await slots.acquire()
+            tasks.append(asyncio.create_task(upload_part(part_number, data)))
+            if failed.is_set():
+                # stop reading, gathering the parts raises the error
+                break
+
+            data = await _read_part(file, part_size)
+            total_size += len(data)
+            if total_size > max_bytes:
+                raise UploadTooLargeError(
+                    f"{file.filename} is larger than {max_bytes} bytes"
+                )
+            part_number += 1
+
+        parts = await asyncio.gather(*tasks)
+        await run_blocking(
+            s3_client.complete_multipart_upload,
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException as e:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await run_blocking(
+                s3_client.abort_multipart_upload,
+                Bucket=bucket_name,
+                Key=key,
+                UploadId=upload_id,
+            )
+        except Exception as abort_error:
+            logger.error(f"Failed to abort the upload of {key} due to {abort_error}")
+        metrics.increment("s3_upload_aborts")
+
+        if isinstance(e, (UploadTooLargeError, asyncio.CancelledError)):
+            raise
+        logger.error(f"Failed to upload {key} due to {e}")
+        raise UploadFailedError(f"Failed to upload {key}") from e
+
+    metrics.observe("s3_upload_seconds", time.perf_counter() - start)
+    metrics.observe("s3_upload_parts", len(parts))
+    return get_s3_obj_url(key)
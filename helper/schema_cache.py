@@ -0,0 +1,225 @@
+import hashlib
+import json
+import time
+from typing import Dict, Optional
+import redis
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from config import Config
+from logger import logger
+from helper.redis_client import get_redis_client
+from helper.db_engines import EngineRegistry
+from helper.db_introspection import reflect_tables, render_db_schema
+
+
+SCHEMA_CACHE_KEY_PREFIX = "db_schema"
+
+# One catalog query per dialect returning a (table name, version) row for every base
+# table. The version changes whenever the DDL of the table changes, so only the
+# changed tables have to be reflected again.
+SCHEMA_FINGERPRINT_QUERIES = {
+    # pg_class/pg_attribute/pg_constraint rows are rewritten by ALTER TABLE, so their
+    # transaction ids act as a per-table catalog version
+    "postgresql": """
+        SELECT c.relname,
+               c.xmin::text || ':' || COALESCE(a.version, 0)::text || ':' ||
+               COALESCE(k.version, 0)::text || ':' || COALESCE(k.total, 0)::text
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN (
+            SELECT attrelid, MAX(xmin::text::bigint) AS version
+            FROM pg_attribute GROUP BY attrelid
+        ) a ON a.attrelid = c.oid
+        LEFT JOIN (
+            SELECT conrelid, MAX(xmin::text::bigint) AS version, COUNT(*) AS total
+            FROM pg_constraint GROUP BY conrelid
+        ) k ON k.conrelid = c.oid
+        WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+    """,
+    # CREATE_TIME is reset by table rebuilding ALTERs, the column checksum catches
+    # instant ALTERs. UPDATE_TIME is not used as it moves on every DML statement.
+    "mysql": """
+        SELECT t.TABLE_NAME,
+               CONCAT(COALESCE(t.CREATE_TIME, ''), ':', c.total, ':', c.checksum)
+        FROM information_schema.TABLES t
+        JOIN (
+            SELECT TABLE_NAME, COUNT(*) AS total,
+                   SUM(CRC32(CONCAT_WS(' ', ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE))) AS checksum
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            GROUP BY TABLE_NAME
+        ) c ON c.TABLE_NAME = t.TABLE_NAME
+        WHERE t.TABLE_SCHEMA = DATABASE() AND t.TABLE_TYPE = 'BASE TABLE'
+    """,
+    "sqlite": """
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+    """,
+}
+
+
+def get_schema_cache_key(db_config_id: int) -> str:
+    return f"{SCHEMA_CACHE_KEY_PREFIX}:{db_config_id}"
+
+
+def get_schema_fingerprint(engine: Engine) -> Optional[Dict[str, str]]:
+    """
+    Get the DDL version of every table of the database with a single catalog query.
+
+    Args:
+        engine (Engine): The engine of the database.
+
+    Returns:
+        Optional[Dict[str, str]]: The version of each table keyed by table name, or None
+        if the dialect is not supported.
+    """
+    query = SCHEMA_FINGERPRINT_QUERIES.get(engine.dialect.name)
+    if query is None:
+        return None
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(query)).fetchall()
+
+    return {
+        row[0]: hashlib.md5(str(row[1]).encode("utf-8")).hexdigest() for row in rows
+    }
+
+
+def _load_entry(db_config_id: int) -> Optional[dict]:
+    try:
+        cached = get_redis_client().get(get_schema_cache_key(db_config_id))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read schema cache: {e}")
+        return None
+
+    return json.loads(cached) if cached else None
+
+
+def _store_entry(db_config_id: int, entry: dict) -> None:
+    ttl = max(int(entry["created_at"] + Config.SCHEMA_CACHE_TTL - time.time()), 1)
+    try:
+        get_redis_client().set(
+            get_schema_cache_key(db_config_id), json.dumps(entry), ex=ttl
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Failed to write schema cache: {e}")
+
+
+def _build_entry(
+    engine: Engine, config_hash: str, fingerprint: Optional[Dict[str, str]]
+) -> dict:
+    now = time.time()
+    tables = reflect_tables(engine)
+    return {
+        "config_hash": config_hash,
+        "created_at": now,
+        "checked_at": now,
+        "fingerprint": fingerprint,
+        "tables": tables,
+        "schema_hash": get_schema_hash(tables),
+    }
+
+
+def get_schema_hash(tables: Dict[str, dict]) -> str:
+    """
+    Get the content hash of a database schema.
+
+    Args:
+        tables (Dict[str, dict]): The table information keyed by table name.
+
+    Returns:
+        str: The hex digest of the schema.
+    """
+    return hashlib.sha256(
+        json.dumps(tables, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def get_db_schema_entry(
+    engine: Engine, db_url: str, db_config_id: int, force_refresh: bool = False
+) -> dict:
+    """
+    Get the cached schema of a database, re-reflecting only the tables whose DDL changed.
+
+    Args:
+        engine (Engine): The engine of the database.
+        db_url (str): The URL of the database.
+        db_config_id (int): The ID of the database configuration.
+        force_refresh (bool): Rebuild the whole schema. Defaults to False.
+
+    Returns:
+        dict: The cache entry with the keys `tables`, `schema_hash`, `fingerprint`,
+        `config_hash`, `created_at` and `checked_at`.
+    """
+    config_hash = EngineRegistry.get_config_hash(db_url)
+    entry = None if force_refresh else _load_entry(db_config_id)
+
+    if entry and entry["config_hash"] != config_hash:
+        entry = None
+
+    now = time.time()
+    if entry and now - entry["checked_at"] < Config.SCHEMA_CACHE_CHECK_INTERVAL:
+        return entry
+
+    fingerprint = get_schema_fingerprint(engine)
+
+    if entry is None or now - entry["created_at"] > Config.SCHEMA_CACHE_TTL:
+        logger.debug(f"Reflecting full schema for db config: {db_config_id}")
+        entry = _build_entry(engine, config_hash, fingerprint)
+        _store_entry(db_config_id, entry)
+        return entry
+
+    if fingerprint is None:
+        # no cheap change detection for this dialect, rely on the TTL
+        return entry
+
+    cached_fingerprint = entry["fingerprint"] or {}
+    changed_tables = [
+        table_name
+        for table_name, version in fingerprint.items()
+        if cached_fingerprint.get(table_name) != version
+    ]
+    dropped_tables = set(entry["tables"]) - set(fingerprint)
+
+    if changed_tables:
+        logger.debug(f"Reflecting changed tables: {changed_tables}")
+        entry["tables"].update(reflect_tables(engine, changed_tables))
+    for table_name in dropped_tables:
+        entry["tables"].pop(table_name, None)
+
+    entry["fingerprint"] = fingerprint
+    entry["checked_at"] = now
+    if changed_tables or dropped_tables:
+        entry["schema_hash"] = get_schema_hash(entry["tables"])
+    _store_entry(db_config_id, entry)
+
+    return entry
+
+
+def get_cached_db_schema(engine: Engine, db_url: str, db_config_id: int) -> str:
+    """
+    Get the rendered schema of a database from the schema cache.
+
+    Args:
+        engine (Engine): The engine of the database.
+        db_url (str): The URL of the database.
+        db_config_id (int): The ID of the database configuration.
+
+    Returns:
+        str: The schema of the database.
+    """
+    entry = get_db_schema_entry(engine, db_url, db_config_id)
+    return render_db_schema(entry["tables"])
+
+
+def invalidate_db_schema(db_config_id: int) -> None:
+    """
+    Drop the cached schema of a database configuration.
+
+    Args:
+        db_config_id (int): The ID of the database configuration.
+    """
+    try:
+        get_redis_client().delete(get_schema_cache_key(db_config_id))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to invalidate schema cache: {e}")
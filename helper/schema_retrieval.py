@@ -0,0 +1,282 @@
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Set
+import chromadb
+from llama_index.core.utils import get_tokenizer
+from llama_index.embeddings.openai import OpenAIEmbedding
+from sqlalchemy.engine import Engine
+from config import Config
+from logger import logger
+from helper.metrics import metrics
+from helper.llm_clients import llm_clients
+from helper.db_introspection import render_db_schema, render_table_schema
+from helper.schema_cache import get_db_schema_entry
+from helper.vector_store import collection_cache, get_chroma_client
+
+
+SCHEMA_COLLECTION_PREFIX = "db_schema"
+
+
+def get_schema_collection_name(db_config_id: int) -> str:
+    return f"{SCHEMA_COLLECTION_PREFIX}_{db_config_id}"
+
+
+def get_embed_model() -> OpenAIEmbedding:
+    return llm_clients.get_embed_model()
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+def index_db_schema(db_config_id: int, entry: dict) -> chromadb.Collection:
+    """
+    Embed the table descriptions of a schema into its Chroma collection.
+
+    The collection records the schema hash it was built from, so this is a single
+    metadata lookup until the schema changes. On a change only the tables whose
+    description changed are embedded again.
+
+    Args:
+        db_config_id (int): The ID of the database configuration.
+        entry (dict): The schema cache entry as returned by `get_db_schema_entry`.
+
+    Returns:
+        chromadb.Collection: The collection with one document per table.
+    """
+    # a fresh handle, the schema hash in its metadata may have been updated elsewhere
+    collection = get_chroma_client().get_or_create_collection(
+        get_schema_collection_name(db_config_id)
+    )
+    if (collection.metadata or {}).get("schema_hash") == entry["schema_hash"]:
+        return collection
+
+    documents = {
+        table_name: render_table_schema(table_name, table_info).strip()
+        for table_name, table_info in entry["tables"].items()
+    }
+    document_hashes = {
+        table_name: hashlib.md5(document.encode("utf-8")).hexdigest()
+        for table_name, document in documents.items()
+    }
+
+    indexed = collection.get(include=["metadatas"])
+    indexed_hashes = {
+        table_name: metadata["document_hash"]
+        for table_name, metadata in zip(indexed["ids"], indexed["metadatas"])
+    }
+
+    dropped_tables = [
+        table_name for table_name in indexed_hashes if table_name not in documents
+    ]
+    if dropped_tables:
+        collection.delete(ids=dropped_tables)
+
+    changed_tables = [
+        table_name
+        for table_name, document_hash in document_hashes.items()
+        if indexed_hashes.get(table_name) != document_hash
+    ]
+    if changed_tables:
+        logger.debug(
+            f"Embedding {len(changed_tables)} tables for db config: {db_config_id}"
+        )
+        embeddings = get_embed_model().get_text_embedding_batch(
+            [documents[table_name] for table_name in changed_tables]
+        )
+        collection.upsert(
+            ids=changed_tables,
+            embeddings=embeddings,
+            documents=[documents[table_name] for table_name in changed_tables],
+            metadatas=[
+                {"document_hash": document_hashes[table_name]}
+                for table_name in changed_tables
+            ],
+        )
+        metrics.increment("schema_retrieval_tables_embedded", len(changed_tables))
+
+    collection.modify(metadata={"schema_hash": entry["schema_hash"]})
+    return collection
+
+
+def drop_schema_index(db_config_id: int) -> None:
+    """
+    Delete the table embeddings of a database configuration.
+
+    Args:
+        db_config_id (int): The ID of the database configuration.
+    """
+    collection_cache.delete_collection(get_schema_collection_name(db_config_id))
+
+
+def expand_with_foreign_keys(
+    tables: Dict[str, dict], table_names: Iterable[str], max_tables: int
+) -> List[str]:
+    """
+    Add the tables joined through foreign keys to the selected tables.
+
+    Referenced tables come before referencing ones, so lookups needed for joins are
+    kept when the selection is cut at `max_tables`.
+
+    Args:
+        tables (Dict[str, dict]): The table information keyed by table name.
+        table_names (Iterable[str]): The selected tables, most relevant first.
+        max_tables (int): The maximum number of tables to return.
+
+    Returns:
+        List[str]: The selected tables followed by their foreign key neighbours.
+    """
+    selected = list(dict.fromkeys(table_names))
+    referenced = [
+        fk["referred_table"]
+        for table_name in selected
+        for fk in tables[table_name]["foreign_keys"]
+    ]
+    selected_set = set(selected)
+    referencing = [
+        table_name
+        for table_name, table_info in tables.items()
+        if any(fk["referred_table"] in selected_set for fk in table_info["foreign_keys"])
+    ]
+
+    expanded = dict.fromkeys(selected)
+    for table_name in referenced + referencing:
+        if len(expanded) >= max_tables:
+            break
+        if table_name in tables:
+            expanded.setdefault(table_name)
+
+    return list(expanded)
+
+
+def select_tables(
+    db_config_id: int, entry: dict, query_str: str
+) -> List[str]:
+    """
+    Select the tables relevant to a query: the top-k tables by embedding similarity and
+    their foreign key neighbours.
+
+    Args:
+        db_config_id (int): The ID of the database configuration.
+        entry (dict): The schema cache entry as returned by `get_db_schema_entry`.
+        query_str (str): The customer query.
+
+    Returns:
+        List[str]: The names of the selected tables.
+    """
+    collection = index_db_schema(db_config_id, entry)
+    query_embedding = get_embed_model().get_query_embedding(query_str)
+    result = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=min(Config.SCHEMA_RETRIEVAL_TOP_K, len(entry["tables"])),
+        include=[],
+    )
+
+    return expand_with_foreign_keys(
+        entry["tables"], result["ids"][0], Config.SCHEMA_RETRIEVAL_MAX_TABLES
+    )
+
+
+def get_relevant_db_schema(
+    engine: Engine, db_url: str, db_config_id: int, query_str: str
+) -> str:
+    """
+    Get the schema to send to the LLM for a query.
+
+    Databases with more than `Config.SCHEMA_RETRIEVAL_MIN_TABLES` tables are pruned to
+    the tables relevant to the query, smaller ones are sent whole. Falls back to the
+    whole schema if the retrieval fails.
+
+    Args:
+        engine (Engine): The engine of the database.
+        db_url (str): The URL of the database.
+        db_config_id (int): The ID of the database configuration.
+        query_str (str): The customer query.
+
+    Returns:
+        str: The rendered schema of the selected tables.
+    """
+    entry = get_db_schema_entry(engine, db_url, db_config_id)
+    tables = entry["tables"]
+
+    if len(tables) > Config.SCHEMA_RETRIEVAL_MIN_TABLES:
+        try:
+            selected_tables = select_tables(db_config_id, entry, query_str)
+            tables = {table_name: tables[table_name] for table_name in selected_tables}
+            logger.debug(f"Selected tables: {selected_tables}")
+        except Exception as e:
+            logger.warning(f"Schema retrieval failed, using the full schema: {e}")
+
+    db_schema = render_db_schema(tables)
+    schema_tokens = count_tokens(db_schema)
+    metrics.observe("db_schema_tokens", schema_tokens)
+    metrics.observe("db_schema_tables", len(tables))
+    logger.info(
+        f"Schema context for db config {db_config_id}: {len(tables)}/"
+        f"{len(entry['tables'])} tables, {schema_tokens} tokens"
+    )
+
+    return db_schema
+
+
+def get_schema_tables(db_schema: str) -> Set[str]:
+    """Get the table names of a rendered schema."""
+    return set(re.findall(r"^Table: (.+)$", db_schema, re.MULTILINE))
+
+
+def get_referenced_tables(sql_query: str, table_names: Iterable[str]) -> Set[str]:
+    """
+    Get the tables of the database referenced by a SQL query.
+
+    Args:
+        sql_query (str): The SQL query.
+        table_names (Iterable[str]): The table names of the database.
+
+    Returns:
+        Set[str]: The referenced table names.
+    """
+    identifiers = {
+        identifier.lower()
+        for identifier in re.findall(r"[A-Za-z_][A-Za-z0-9_$]*", sql_query)
+    }
+    return {
+        table_name for table_name in table_names if table_name.lower() in identifiers
+    }
+
+
+def record_schema_retrieval_hit(
+    engine: Engine,
+    db_url: str,
+    db_config_id: int,
+    db_schema: str,
+    sql_query: Optional[str],
+) -> Optional[bool]:
+    """
+    Record whether the generated SQL only used tables present in the pruned schema.
+
+    Args:
+        engine (Engine): The engine of the database.
+        db_url (str): The URL of the database.
+        db_config_id (int): The ID of the database configuration.
+        db_schema (str): The schema sent to the LLM.
+        sql_query (Optional[str]): The generated SQL query.
+
+    Returns:
+        Optional[bool]: Whether the retrieval was a hit, or None if the schema was not
+        pruned.
+    """
+    if not sql_query:
+        return None
+
+    selected_tables = get_schema_tables(db_schema)
+    all_tables = get_db_schema_entry(engine, db_url, db_config_id)["tables"]
+    if len(selected_tables) >= len(all_tables):
+        return None
+
+    missed_tables = get_referenced_tables(sql_query, all_tables) - selected_tables
+    hit = not missed_tables
+    metrics.observe("schema_retrieval_hit", 1.0 if hit else 0.0)
+    if not hit:
+        logger.info(f"Schema retrieval missed tables: {sorted(missed_tables)}")
+
+    return hit
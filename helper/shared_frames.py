@@ -0,0 +1,426 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from typing import Callable, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+from config import Config
+from logger import logger
+from helper.columnar import DocumentData, copy_document
+from helper.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows development setups
+    fcntl = None
+
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+TEMP_PREFIX = ".tmp-"
+TRASH_PREFIX = ".trash-"
+# temp and trash directories left behind by a crashed worker
+STALE_DIR_AGE = 3600
+
+
+def _get_buffer_signature(column: pd.Series) -> Optional[tuple]:
+    values = column.to_numpy(copy=False)
+    interface = getattr(values, "__array_interface__", None)
+    if interface is None:
+        return None
+    return interface["data"][0], interface["shape"], interface["strides"], values.dtype
+
+
+def get_default_store_dir() -> str:
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base_dir, "chat-analytics-frames")
+
+
+class SharedFrame:
+    """
+    A document mapped from the shared store.
+
+    While it is held, the frame keeps a shared lock on its store entry so that no
+    worker evicts it. `release` drops the lock; the mapped data stays valid after that
+    even if the entry is then deleted.
+    """
+
+    def __init__(
+        self,
+        frames: DocumentData,
+        lock_fd: int,
+        entry_dir: str,
+        sheet_names: Optional[List[str]],
+    ):
+        # shallow copies share the mapped columns, the mapped frames are kept alive
+        # for as long as their copies are used
+        self._frames = frames
+        self._lock_fd = lock_fd
+        self._release_lock = threading.Lock()
+        self.entry_dir = entry_dir
+        self.sheet_names = sheet_names
+
+    def holds(self, data: DocumentData) -> bool:
+        """
+        Check if a document is an unchanged copy of the mapped document.
+
+        Every column must still be the one mapped, or be shared with it, not a column
+        added, replaced or written to since, and the rows must be the same.
+
+        Args:
+            data (DocumentData): The dataframe, or the dataframes keyed by sheet name.
+
+        Returns:
+            bool: True if the files of the entry hold the same document.
+        """
+        if isinstance(data, pd.DataFrame):
+            if not isinstance(self._frames, pd.DataFrame):
+                return False
+            pairs = [(self._frames, data)]
+        else:
+            if isinstance(self._frames, pd.DataFrame) or list(data) != list(self._frames):
+                return False
+            pairs = [(self._frames[sheet], df) for sheet, df in data.items()]
+
+        for mapped, df in pairs:
+            if df.shape != mapped.shape or not df.columns.equals(mapped.columns):
+                return False
+            if not df.index.equals(mapped.index):
+                return False
+            for index in range(df.shape[1]):
+                signature = _get_buffer_signature(df.iloc[:, index])
+                if signature is None or signature != _get_buffer_signature(
+                    mapped.iloc[:, index]
+                ):
+                    return False
+        return True
+
+    @property
+    def data(self) -> DocumentData:
+        """
+        Get a shallow copy of the mapped document.
+
+        Columns can be added to or replaced in the copy without changing the mapped
+        frames. Writing into a column in place needs copy-on-write, as enabled for
+        generated code by `CodeSandbox.run`.
+
+        Returns:
+            DocumentData: The dataframe of a csv file, or the dataframes of an excel file keyed by sheet name.
+        """
+        return copy_document(self._frames, deep=False)
+
+    def release(self) -> None:
+        with self._release_lock:
+            if self._lock_fd is None:
+                return
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def __del__(self):
+        self.release()
+
+
+class SharedFrameStore:
+    """
+    Store of parsed documents shared by all worker processes on a host.
+
+    Every document version is materialized once as uncompressed Arrow IPC files, one per
+    excel sheet, in `root_dir` (on `/dev/shm` by default). Workers memory-map the files,
+    so numeric and datetime columns are read zero-copy and their pages are shared
+    between processes instead of being held once per worker.
+
+    Entries are keyed by the `UserDocument.id` and the S3 ETag. A worker holding an
+    entry keeps a shared `flock` on it, which acts as a cross-process reference count:
+    when the store grows over `max_bytes`, the least recently used entries that no
+    worker holds are deleted.
+    """
+
+    def __init__(
+        self,
+        root_dir: Optional[str] = Config.SHARED_DATAFRAME_DIR,
+        max_bytes: int = Config.SHARED_DATAFRAME_MAX_BYTES,
+    ):
+        self.root_dir = root_dir or get_default_store_dir()
+        self.max_bytes = max_bytes
+        self.enabled = fcntl is not None and max_bytes > 0
+        # the documents this process mapped, to find the files of their copies
+        self._mapped: "weakref.WeakSet[SharedFrame]" = weakref.WeakSet()
+        self._mapped_lock = threading.Lock()
+
+    def _entry_dir(self, document_id: int, etag: str) -> str:
+        return os.path.join(self.root_dir, f"{document_id}-{etag}")
+
+    def get(self, document_id: int, etag: str) -> Optional[SharedFrame]:
+        """
+        Map a document from the store.
+
+        Args:
+            document_id (int): The ID of the user document.
+            etag (str): The S3 ETag of the document file.
+
+        Returns:
+            Optional[SharedFrame]: The mapped document, or None if it is not in the store.
+        """
+        if not self.enabled:
+            return None
+
+        shared_frame = self._map_entry(self._entry_dir(document_id, etag))
+        metrics.increment(
+            "shared_frame_hits" if shared_frame is not None else "shared_frame_misses"
+        )
+        return shared_frame
+
+    def put(
+        self, document_id: int, etag: str, data: DocumentData
+    ) -> Optional[SharedFrame]:
+        """
+        Materialize a document in the store and map it back.
+
+        Args:
+            document_id (int): The ID of the user document.
+            etag (str): The S3 ETag of the document file.
+            data (DocumentData): The parsed document.
+
+        Returns:
+            Optional[SharedFrame]: The mapped document, or None if it could not be stored.
+        """
+        if not self.enabled:
+            return None
+
+        entry_dir = self._entry_dir(document_id, etag)
+        sheets = {None: data} if isinstance(data, pd.DataFrame) else data
+        try:
+            tables = [pa.Table.from_pandas(df) for df in sheets.values()]
+        except Exception as e:
+            logger.warning(f"Failed to convert document {document_id} to arrow: {e}")
+            return None
+
+        size = sum(table.nbytes for table in tables)
+        if size > self.max_bytes:
+            logger.debug(
+                f"Document {document_id} is too large for the shared store: {size} bytes"
+            )
+            return None
+
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.evict(reserve=size)
+
+        temp_dir = os.path.join(
+            self.root_dir, f"{TEMP_PREFIX}{random.randbytes(8).hex()}"
+        )
+        try:
+            os.makedirs(temp_dir)
+            for index, table in enumerate(tables):
+                with pa.OSFile(os.path.join(temp_dir, f"{index:04d}.arrow"), "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            open(os.path.join(temp_dir, LOCK_FILE), "wb").close()
+            with open(os.path.join(temp_dir, MANIFEST_FILE), "w") as f:
+                json.dump({"sheets": None if None in sheets else list(sheets)}, f)
+            # another worker may have stored the same version meanwhile, keep theirs
+            try:
+                os.rename(temp_dir, entry_dir)
+            except OSError:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        except OSError as e:
+            logger.warning(f"Failed to store document {document_id} in the shared store: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return None
+
+        return self._map_entry(entry_dir)
+
+    def _map_entry(self, entry_dir: str) -> Optional[SharedFrame]:
+        try:
+            lock_fd = os.open(os.path.join(entry_dir, LOCK_FILE), os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+
+        try:
+            # fails while the entry is being evicted
+            fcntl.flock(lock_fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            with open(os.path.join(entry_dir, MANIFEST_FILE)) as f:
+                sheet_names = json.load(f)["sheets"]
+
+            frames = []
+            for index in range(len(sheet_names) if sheet_names is not None else 1):
+                source = pa.memory_map(os.path.join(entry_dir, f"{index:04d}.arrow"))
+                table = pa.ipc.open_file(source).read_all()
+                # split blocks keeps every column a view of its arrow buffer
+                frames.append(table.to_pandas(split_blocks=True))
+            os.utime(os.path.join(entry_dir, MANIFEST_FILE))
+        except (OSError, ValueError, pa.ArrowException) as e:
+            if not isinstance(e, (BlockingIOError, FileNotFoundError)):
+                logger.warning(f"Failed to map {entry_dir}: {e}")
+            os.close(lock_fd)
+            return None
+
+        data = frames[0] if sheet_names is None else dict(zip(sheet_names, frames))
+        shared_frame = SharedFrame(data, lock_fd, entry_dir, sheet_names)
+        with self._mapped_lock:
+            self._mapped.add(shared_frame)
+        return shared_frame
+
+    def hold_files(
+        self, data: DocumentData
+    ) -> Optional[Tuple[List[str], Optional[List[str]], Callable[[], None]]]:
+        """
+        Find the arrow files of a document mapped from the store, and hold them.
+
+        The entry is not evicted until the returned release function is called, so
+        another process can map the files meanwhile.
+
+        Args:
+            data (DocumentData): A copy of a document mapped by this process.
+
+        Returns:
+            Optional[Tuple[List[str], Optional[List[str]], Callable[[], None]]]: The paths
+            of the files, one per sheet, the sheet names, None for a csv document, and
+            the release function. None if the store does not hold the document.
+        """
+        if not self.enabled:
+            return None
+
+        with self._mapped_lock:
+            shared_frames = list(self._mapped)
+        for shared_frame in shared_frames:
+            if not shared_frame.holds(data):
+                continue
+            entry_dir = shared_frame.entry_dir
+            try:
+                lock_fd = os.open(os.path.join(entry_dir, LOCK_FILE), os.O_RDONLY)
+            except FileNotFoundError:
+                # invalidated meanwhile
+                return None
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except OSError:
+                # being evicted
+                os.close(lock_fd)
+                return None
+
+            sheet_names = shared_frame.sheet_names
+            paths = [
+                os.path.join(entry_dir, f"{index:04d}.arrow")
+                for index in range(len(sheet_names) if sheet_names is not None else 1)
+            ]
+            return paths, sheet_names, lambda: os.close(lock_fd)
+        return None
+
+    def _list_entries(self) -> List[Tuple[str, float, int]]:
+        entries = []
+        try:
+            names = os.listdir(self.root_dir)
+        except FileNotFoundError:
+            return entries
+
+        now = time.time()
+        for name in names:
+            path = os.path.join(self.root_dir, name)
+            try:
+                if name.startswith((TEMP_PREFIX, TRASH_PREFIX)):
+                    if now - os.path.getmtime(path) > STALE_DIR_AGE:
+                        shutil.rmtree(path, ignore_errors=True)
+                    continue
+                last_used = os.path.getmtime(os.path.join(path, MANIFEST_FILE))
+                size = sum(
+                    os.path.getsize(os.path.join(path, file_name))
+                    for file_name in os.listdir(path)
+                )
+            except OSError:
+                continue
+            entries.append((path, last_used, size))
+
+        return entries
+
+    def _delete_entry(self, entry_dir: str, force: bool = False) -> bool:
+        try:
+            lock_fd = os.open(os.path.join(entry_dir, LOCK_FILE), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+
+        try:
+            if not force:
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # still mapped by a worker
+                    return False
+            trash_dir = os.path.join(
+                self.root_dir, f"{TRASH_PREFIX}{random.randbytes(8).hex()}"
+            )
+            try:
+                os.rename(entry_dir, trash_dir)
+            except OSError:
+                return False
+        finally:
+            os.close(lock_fd)
+
+        # workers that still map the files keep their pages until they unmap them
+        shutil.rmtree(trash_dir, ignore_errors=True)
+        return True
+
+    def evict(self, reserve: int = 0) -> int:
+        """
+        Delete the least recently used entries that are not in use until the store fits
+        its budget.
+
+        Args:
+            reserve (int): Bytes to free up on top of the budget, for an entry about to be added.
+
+        Returns:
+            int: The number of deleted entries.
+        """
+        if not self.enabled:
+            return 0
+
+        entries = sorted(self._list_entries(), key=lambda entry: entry[1])
+        total_size = sum(size for _, _, size in entries)
+
+        evicted = 0
+        for entry_dir, _, size in entries:
+            if total_size + reserve <= self.max_bytes:
+                break
+            if self._delete_entry(entry_dir):
+                total_size -= size
+                evicted += 1
+
+        if evicted:
+            metrics.increment("shared_frame_evictions", evicted)
+        metrics.observe("shared_frame_bytes", total_size)
+        return evicted
+
+    def invalidate(self, document_id: int) -> int:
+        """
+        Delete every stored version of a document, even if workers still map it.
+
+        Args:
+            document_id (int): The ID of the user document.
+
+        Returns:
+            int: The number of deleted entries.
+        """
+        if not self.enabled:
+            return 0
+
+        prefix = f"{document_id}-"
+        try:
+            names = [name for name in os.listdir(self.root_dir) if name.startswith(prefix)]
+        except FileNotFoundError:
+            return 0
+
+        return sum(
+            self._delete_entry(os.path.join(self.root_dir, name), force=True)
+            for name in names
+        )
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, _, size in self._list_entries())
+
+
+shared_frame_store = SharedFrameStore()
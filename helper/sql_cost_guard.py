@@ -0,0 +1,259 @@
+import json
+import re
+from typing import Any, Optional
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from config import Config
+from logger import logger
+from helper.sql_execution import statement_guard
+from schemas.query import SQLCostEstimate
+
+
+COST_GUARD_ACTIONS = ("limit", "rewrite", "refuse")
+
+
+class SQLQueryTooExpensiveError(Exception):
+    """Raised when the estimated cost of a generated SQL query is above its threshold."""
+
+    def __init__(self, estimate: SQLCostEstimate):
+        super().__init__(
+            f"Estimated {estimate.estimated_rows} rows / cost {estimate.estimated_cost}"
+        )
+        self.estimate = estimate
+
+
+def get_sql_cost_guard_options(db_config: dict) -> dict:
+    """
+    Get the cost guard thresholds of a datasource.
+
+    The optional `max_estimated_rows`, `max_estimated_cost` and `cost_guard_action` keys
+    of the datasource configuration override the `Config.SQL_COST_GUARD_*` defaults. A
+    threshold of 0 disables it.
+
+    Args:
+        db_config (dict): The configuration details for the database.
+
+    Returns:
+        dict: The thresholds and the action taken above them.
+    """
+    action = db_config.get("cost_guard_action", Config.SQL_COST_GUARD_ACTION)
+    if action not in COST_GUARD_ACTIONS:
+        raise ValueError(f"Invalid cost guard action: {action}")
+
+    return {
+        "max_rows": float(
+            db_config.get("max_estimated_rows", Config.SQL_COST_GUARD_MAX_ROWS)
+        ),
+        "max_cost": float(
+            db_config.get("max_estimated_cost", Config.SQL_COST_GUARD_MAX_COST)
+        ),
+        "action": action,
+    }
+
+
+def is_cost_guard_enabled(options: Optional[dict]) -> bool:
+    return bool(options) and (options["max_rows"] > 0 or options["max_cost"] > 0)
+
+
+def exceeds_thresholds(estimate: SQLCostEstimate, options: dict) -> bool:
+    """
+    Check an estimate against the cost guard thresholds.
+
+    Args:
+        estimate (SQLCostEstimate): The estimate of the query.
+        options (dict): The options as returned by `get_sql_cost_guard_options`.
+
+    Returns:
+        bool: True if an estimate is above its threshold.
+    """
+    return (
+        options["max_rows"] > 0
+        and estimate.estimated_rows is not None
+        and estimate.estimated_rows > options["max_rows"]
+    ) or (
+        options["max_cost"] > 0
+        and estimate.estimated_cost is not None
+        and estimate.estimated_cost > options["max_cost"]
+    )
+
+
+def _strip_sql(sql_query: str) -> str:
+    return sql_query.strip().rstrip(";").strip()
+
+
+def _load_plan(value: Any) -> Any:
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def _find_values(node: Any, key: str) -> list:
+    if isinstance(node, dict):
+        values = [node[key]] if key in node else []
+        for child in node.values():
+            values.extend(_find_values(child, key))
+        return values
+    if isinstance(node, list):
+        return [value for child in node for value in _find_values(child, key)]
+    return []
+
+
+def _estimate_postgresql(conn, sql_query: str) -> SQLCostEstimate:
+    plan = _load_plan(
+        conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql_query}")).scalar()
+    )
+    root = plan[0]["Plan"]
+    return SQLCostEstimate(
+        estimated_rows=float(root["Plan Rows"]),
+        estimated_cost=float(root["Total Cost"]),
+    )
+
+
+def _estimate_mysql(conn, sql_query: str) -> SQLCostEstimate:
+    plan = _load_plan(conn.execute(text(f"EXPLAIN FORMAT=JSON {sql_query}")).scalar())
+    query_block = plan["query_block"]
+    query_cost = query_block.get("cost_info", {}).get("query_cost")
+    # rows produced by the last join of the plan, the closest to the result size
+    produced_rows = [
+        float(rows) for rows in _find_values(query_block, "rows_produced_per_join")
+    ]
+    return SQLCostEstimate(
+        estimated_rows=max(produced_rows) if produced_rows else None,
+        estimated_cost=float(query_cost) if query_cost is not None else None,
+    )
+
+
+SQL_CLAUSE_KEYWORDS = (
+    "where|on|join|inner|left|right|full|cross|natural|outer|using|group|order|limit|"
+    "having|union|from"
+)
+
+# "FROM t", "JOIN t AS a" or ", t a", the alias must not be the next clause keyword
+TABLE_ALIAS_PATTERN = re.compile(
+    r"(?:\bFROM|\bJOIN|,)\s+[\"`\[]?(\w+)[\"`\]]?"
+    rf"(?:\s+(?:AS\s+)?(?!(?:{SQL_CLAUSE_KEYWORDS})\b)(\w+))?",
+    re.IGNORECASE,
+)
+
+
+def _get_table_aliases(sql_query: str) -> dict:
+    return {
+        alias: table_name
+        for table_name, alias in TABLE_ALIAS_PATTERN.findall(sql_query)
+        if alias
+    }
+
+
+def _estimate_sqlite(conn, sql_query: str) -> SQLCostEstimate:
+    # sqlite plans carry no estimates, so the rows visited by nested full scans are
+    # approximated by the product of the scanned tables' max(rowid)
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql_query}")).fetchall()
+    aliases = _get_table_aliases(sql_query)
+    estimated_rows = None
+    for row in rows:
+        match = re.match(r"SCAN (\w+)", row[-1])
+        if not match or match.group(1) == "CONSTANT":
+            continue
+        table_name = aliases.get(match.group(1), match.group(1))
+        try:
+            table_rows = conn.execute(
+                text(f'SELECT max(rowid) FROM "{table_name}"')
+            ).scalar()
+        except Exception:
+            # subqueries, CTEs and WITHOUT ROWID tables
+            continue
+        estimated_rows = (estimated_rows or 1) * float(table_rows or 0)
+
+    return SQLCostEstimate(estimated_rows=estimated_rows)
+
+
+SQL_COST_ESTIMATORS = {
+    "postgresql": _estimate_postgresql,
+    "mysql": _estimate_mysql,
+    "sqlite": _estimate_sqlite,
+}
+
+
+def estimate_sql_cost(
+    engine: Engine,
+    sql_query: str,
+    timeout: Optional[float] = None,
+    read_only: Optional[bool] = None,
+) -> Optional[SQLCostEstimate]:
+    """
+    Estimate the rows and cost of a SQL query with the EXPLAIN of the dialect.
+
+    The EXPLAIN runs with the same statement timeout and read-only mode as the query.
+
+    Args:
+        engine (Engine): The engine of the database.
+        sql_query (str): The SQL query.
+        timeout (Optional[float]): The statement timeout in seconds, 0 to disable.
+            Defaults to Config.SQL_STATEMENT_TIMEOUT.
+        read_only (Optional[bool]): Explain the query in a read-only transaction. Defaults
+            to Config.SQL_READ_ONLY.
+
+    Returns:
+        Optional[SQLCostEstimate]: The estimate, or None if the dialect is not supported or
+        the query could not be explained.
+    """
+    estimator = SQL_COST_ESTIMATORS.get(engine.dialect.name)
+    if estimator is None:
+        return None
+
+    timeout = Config.SQL_STATEMENT_TIMEOUT if timeout is None else timeout
+    read_only = Config.SQL_READ_ONLY if read_only is None else read_only
+    try:
+        with engine.connect() as conn, statement_guard(conn, timeout, read_only):
+            return estimator(conn, _strip_sql(sql_query))
+    except Exception as e:
+        logger.warning(f"Failed to explain SQL query: {e}")
+        return None
+
+
+# SQLAlchemy dialect name -> sqlglot dialect name
+SQLGLOT_DIALECTS = {
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "sqlite": "sqlite",
+}
+
+
+def add_limit(sql_query: str, limit: int, dialect: Optional[str] = None) -> str:
+    """
+    Limit the number of rows returned by a SELECT query.
+
+    The LIMIT of a plain SELECT is added, or lowered if it is above `limit`. Other
+    statements (UNION, ...) and queries that can not be parsed are returned unchanged,
+    their result is still bounded by the rows fetched by `execute_sql_query`.
+
+    Args:
+        sql_query (str): The SQL query.
+        limit (int): The maximum number of rows.
+        dialect (Optional[str]): The SQLAlchemy dialect name of the database.
+
+    Returns:
+        str: The limited query.
+    """
+    sql_query = _strip_sql(sql_query)
+    read = SQLGLOT_DIALECTS.get(dialect)
+    try:
+        expression = sqlglot.parse_one(sql_query, read=read)
+    except sqlglot.errors.ParseError as e:
+        logger.warning(f"Failed to parse SQL query, it is not limited: {e}")
+        return sql_query
+
+    if not isinstance(expression, exp.Select):
+        logger.info(f"Not limiting a {expression.key.upper()} statement")
+        return sql_query
+
+    current_limit = expression.args.get("limit")
+    if (
+        isinstance(current_limit, exp.Limit)
+        and isinstance(current_limit.expression, exp.Literal)
+        and current_limit.expression.is_int
+        and int(current_limit.expression.name) <= limit
+    ):
+        return sql_query
+
+    return expression.limit(int(limit)).sql(dialect=read)
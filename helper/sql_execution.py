@@ -0,0 +1,286 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool
+from config import Config
+from logger import logger
+from helper.concurrency import current_cancel_scope
+from helper.metrics import metrics
+from schemas.query import SQLResult
+
+
+class SQLQueryTimeoutError(Exception):
+    """Raised when a SQL query runs longer than its statement timeout."""
+
+
+class SQLQueryCancelledError(Exception):
+    """Raised when a running SQL query was cancelled, e.g. the client disconnected."""
+
+
+def get_sql_execution_options(db_config: dict) -> dict:
+    """
+    Get the execution options of a datasource.
+
+    The optional `statement_timeout` (seconds) and `read_only` keys of the datasource
+    configuration override `Config.SQL_STATEMENT_TIMEOUT` and `Config.SQL_READ_ONLY`.
+
+    Args:
+        db_config (dict): The configuration details for the database.
+
+    Returns:
+        dict: The keyword arguments for `execute_sql_query`.
+    """
+    return {
+        "timeout": float(
+            db_config.get("statement_timeout", Config.SQL_STATEMENT_TIMEOUT)
+        ),
+        "read_only": bool(db_config.get("read_only", Config.SQL_READ_ONLY)),
+    }
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return value
+
+
+# postgres SQLSTATE query_canceled, raised by statement_timeout
+POSTGRES_TIMEOUT_SQLSTATES = ("57014",)
+# ER_QUERY_TIMEOUT (MAX_EXECUTION_TIME) and ER_QUERY_INTERRUPTED
+MYSQL_TIMEOUT_ERROR_CODES = (3024, 1317)
+
+
+def _is_statement_timeout(dialect: str, error: DBAPIError) -> bool:
+    """
+    Check if a driver error is the abort of a statement by its timeout.
+
+    Args:
+        dialect (str): The name of the dialect.
+        error (DBAPIError): The error raised by the driver.
+
+    Returns:
+        bool: True if the statement was aborted.
+    """
+    orig = error.orig
+    if dialect == "postgresql":
+        sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+        return sqlstate in POSTGRES_TIMEOUT_SQLSTATES
+    if dialect == "mysql":
+        return bool(orig.args) and orig.args[0] in MYSQL_TIMEOUT_ERROR_CODES
+    if dialect == "sqlite":
+        return "interrupted" in str(orig)
+    return False
+
+
+def _kill_mysql_query(engine: Engine, thread_id: int) -> None:
+    # the pool may be exhausted by running queries, the kill must not wait for it
+    kill_engine = create_engine(engine.url, poolclass=NullPool)
+    try:
+        with kill_engine.connect() as conn:
+            conn.execute(text(f"KILL QUERY {int(thread_id)}"))
+    finally:
+        kill_engine.dispose()
+
+
+@contextmanager
+def statement_guard(
+    conn: Connection, timeout: Optional[float], read_only: bool
+) -> Iterator[Callable[[], None]]:
+    """
+    Apply the statement timeout and read-only mode of the dialect to a connection.
+
+    Args:
+        conn (Connection): The connection, before the statement is executed.
+        timeout (Optional[float]): The statement timeout in seconds, 0 or None to disable.
+        read_only (bool): Run the statement in a read-only transaction.
+
+    Yields:
+        Callable: A thread-safe function cancelling the statement running on the connection.
+    """
+    dialect = conn.dialect.name
+    dbapi_conn = conn.connection.dbapi_connection
+    timeout_ms = int(timeout * 1000) if timeout else 0
+    cleanup = []
+
+    if dialect == "postgresql":
+        if read_only:
+            conn.execute(text("SET TRANSACTION READ ONLY"))
+        if timeout_ms:
+            conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        cancel = dbapi_conn.cancel
+    elif dialect == "mysql":
+        if read_only:
+            # applies to the transaction started by the next statement
+            conn.execute(text("SET TRANSACTION READ ONLY"))
+        if timeout_ms:
+            conn.execute(text(f"SET SESSION MAX_EXECUTION_TIME = {timeout_ms}"))
+            cleanup.append(
+                lambda: conn.execute(text("SET SESSION MAX_EXECUTION_TIME = DEFAULT"))
+            )
+        thread_id = dbapi_conn.thread_id()
+        cancel = lambda: _kill_mysql_query(conn.engine, thread_id)
+    elif dialect == "sqlite":
+        if read_only:
+            conn.execute(text("PRAGMA query_only = ON"))
+            cleanup.append(lambda: conn.execute(text("PRAGMA query_only = OFF")))
+        if timeout_ms:
+            deadline = time.monotonic() + timeout
+            dbapi_conn.set_progress_handler(
+                lambda: int(time.monotonic() > deadline), 1000
+            )
+            cleanup.append(lambda: dbapi_conn.set_progress_handler(None, 0))
+        cancel = dbapi_conn.interrupt
+    else:
+        logger.warning(f"No statement timeout support for dialect: {dialect}")
+        cancel = lambda: None
+
+    try:
+        yield cancel
+    finally:
+        for callback in cleanup:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Failed to reset connection settings: {e}")
+
+
+def execute_sql_query(
+    engine: Engine,
+    sql_query: str,
+    max_rows: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    timeout: Optional[float] = None,
+    read_only: Optional[bool] = None,
+) -> SQLResult:
+    """
+    Execute a SQL query and fetch a bounded number of rows.
+
+    Rows are read in batches of `Config.SQL_RESULT_FETCH_SIZE` from a server-side cursor
+    (postgres, mysql), so a large result is never loaded into memory at once. Fetching
+    stops at `max_rows` rows or once the rows take more than `max_bytes`.
+
+    The statement is aborted after `timeout` seconds, and is cancelled on the database
+    when the `CancelScope` of the current request is cancelled.
+
+    Args:
+        engine (Engine): The engine of the database.
+        sql_query (str): The SQL query to execute.
+        max_rows (Optional[int]): The maximum number of rows. Defaults to
+            Config.SQL_RESULT_MAX_ROWS.
+        max_bytes (Optional[int]): The maximum size of the rows, measured as their text
+            representation. Defaults to Config.SQL_RESULT_MAX_BYTES.
+        timeout (Optional[float]): The statement timeout in seconds, 0 to disable.
+            Defaults to Config.SQL_STATEMENT_TIMEOUT.
+        read_only (Optional[bool]): Run the query in a read-only transaction. Defaults to
+            Config.SQL_READ_ONLY.
+
+    Returns:
+        SQLResult: The columns and the fetched rows.
+
+    Raises:
+        SQLQueryTimeoutError: If the statement timed out.
+        SQLQueryCancelledError: If the statement was cancelled.
+    """
+    max_rows = Config.SQL_RESULT_MAX_ROWS if max_rows is None else max_rows
+    max_bytes = Config.SQL_RESULT_MAX_BYTES if max_bytes is None else max_bytes
+    timeout = Config.SQL_STATEMENT_TIMEOUT if timeout is None else timeout
+    read_only = Config.SQL_READ_ONLY if read_only is None else read_only
+
+    cancel_scope = current_cancel_scope.get()
+    if cancel_scope is not None and cancel_scope.cancelled:
+        raise SQLQueryCancelledError("The query was cancelled")
+
+    try:
+        with engine.connect() as conn, statement_guard(
+            conn, timeout, read_only
+        ) as cancel:
+            if cancel_scope is not None:
+                cancel_scope.add_callback(cancel)
+            try:
+                result = _fetch_rows(conn, sql_query, max_rows, max_bytes)
+            finally:
+                if cancel_scope is not None:
+                    cancel_scope.remove_callback(cancel)
+    except DBAPIError as e:
+        if cancel_scope is not None and cancel_scope.cancelled:
+            metrics.increment("sql_statement_cancels")
+            logger.info("SQL query cancelled")
+            raise SQLQueryCancelledError("The query was cancelled") from e
+        if timeout and _is_statement_timeout(engine.dialect.name, e):
+            metrics.increment("sql_statement_timeouts")
+            logger.info(f"SQL query timed out after {timeout}s")
+            raise SQLQueryTimeoutError(
+                f"The query did not finish within {timeout:g} seconds"
+            ) from e
+        raise
+
+    return result
+
+
+def _fetch_rows(
+    conn: Connection, sql_query: str, max_rows: int, max_bytes: int
+) -> SQLResult:
+    result = conn.execution_options(
+        stream_results=True, max_row_buffer=Config.SQL_RESULT_FETCH_SIZE
+    ).execute(text(sql_query))
+    if not result.returns_rows:
+        return SQLResult()
+
+    columns = list(result.keys())
+    rows = []
+    size = 0
+    truncated = False
+    while not truncated:
+        batch = result.fetchmany(Config.SQL_RESULT_FETCH_SIZE)
+        if not batch:
+            break
+
+        for row in batch:
+            size += len(str(row))
+            if len(rows) >= max_rows or size > max_bytes:
+                truncated = True
+                break
+            rows.append([_to_json_value(value) for value in row])
+
+    # closing the result releases the server-side cursor without reading the rest
+    result.close()
+
+    if truncated:
+        logger.debug(f"SQL result truncated at {len(rows)} rows")
+
+    return SQLResult(columns=columns, rows=rows, truncated=truncated)
+
+
+def summarize_sql_result(result: SQLResult, max_rows: Optional[int] = None) -> str:
+    """
+    Render a bounded slice of a SQL result for the LLM prompt.
+
+    Args:
+        result (SQLResult): The SQL result.
+        max_rows (Optional[int]): The maximum number of rows to include. Defaults to
+            Config.SQL_RESULT_PROMPT_ROWS.
+
+    Returns:
+        str: The column names followed by one row per line, and a marker if rows were
+        left out.
+    """
+    max_rows = Config.SQL_RESULT_PROMPT_ROWS if max_rows is None else max_rows
+    if not result.rows:
+        return "No results found"
+
+    lines = [str(tuple(result.columns))]
+    lines.extend(str(tuple(row)) for row in result.rows[:max_rows])
+
+    total = f"{len(result.rows)}+" if result.truncated else str(len(result.rows))
+    if result.truncated or len(result.rows) > max_rows:
+        lines.append(
+            f"... [result truncated: showing {min(max_rows, len(result.rows))} "
+            f"of {total} rows]"
+        )
+
+    return "\n".join(lines)
@@ -0,0 +1,40 @@
+import json
+from typing import Any, AsyncIterator
+from fastapi.responses import StreamingResponse
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """
+    Format a Server-Sent Event.
+
+    The data is JSON encoded, so that tokens containing new lines stay in one event.
+
+    Args:
+        event (str): The name of the event.
+        data (Any): The payload of the event.
+
+    Returns:
+        str: The event as sent on the stream.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Stream formatted events to the client.
+
+    Args:
+        events (AsyncIterator[str]): The events, formatted by `format_sse_event`.
+
+    Returns:
+        StreamingResponse: The `text/event-stream` response.
+    """
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # keep reverse proxies from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
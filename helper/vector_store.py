@@ -0,0 +1,362 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+import chromadb
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.vector_stores import MetadataFilter, MetadataFilters
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from config import Config
+from logger import logger
+from helper.metrics import metrics
+from helper.llm_clients import llm_clients
+
+
+SHARED_COLLECTION_PREFIX = "documents"
+
+# separates the collection from the document in the embedding path of documents
+# stored in a shared collection, collection names can not contain it
+_EMBEDDING_PATH_SEPARATOR = "#"
+
+
+@lru_cache(maxsize=None)
+def _get_chroma_client(path: str) -> chromadb.ClientAPI:
+    return chromadb.PersistentClient(path=path)
+
+
+def get_chroma_client() -> chromadb.ClientAPI:
+    """
+    Get the process-wide Chroma client.
+
+    Returns:
+        chromadb.ClientAPI: The client of the store at `Config.CHROMA_DB_PATH`.
+    """
+    return _get_chroma_client(Config.CHROMA_DB_PATH)
+
+
+def _get_filtered_document_key(where: Optional[dict]) -> Optional[str]:
+    value = (where or {}).get("document_key")
+    if isinstance(value, dict):
+        value = value.get("$eq")
+    return value if isinstance(value, str) else None
+
+
+class DocumentScopedCollection:
+    """
+    Wraps a Chroma collection so that queries filtered to one document of a shared
+    collection are answered by an exact search over the vectors of that document.
+
+    Chroma answers filtered queries by walking the HNSW graph of the whole collection
+    and skipping the vectors the filter rejects, which gets slower the more documents
+    share the collection. A document has few chunks, so comparing the query with all
+    of them is both exact and cheaper. Everything else is passed to the collection.
+    """
+
+    def __init__(self, collection: chromadb.Collection):
+        self._collection = collection
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._collection, name)
+
+    def query(self, query_embeddings, n_results: int = 10, where=None, **kwargs) -> dict:
+        document_key = _get_filtered_document_key(where)
+        if document_key is None or len(where) != 1 or kwargs.get("where_document"):
+            return self._collection.query(
+                query_embeddings=query_embeddings, n_results=n_results, where=where, **kwargs
+            )
+
+        chunks = self._collection.get(
+            where=where, include=["embeddings", "documents", "metadatas"]
+        )
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        if not chunks["ids"]:
+            empty = [[] for _ in range(len(queries))]
+            return {"ids": empty, "documents": empty, "metadatas": empty, "distances": empty}
+
+        vectors = np.asarray(chunks["embeddings"], dtype=np.float32)
+        space = (self._collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            normalized = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+            distances = 1 - normalized @ vectors.T
+        elif space == "ip":
+            distances = 1 - queries @ vectors.T
+        else:
+            # chroma reports squared euclidean distances
+            distances = (
+                (queries**2).sum(axis=1)[:, np.newaxis]
+                - 2 * queries @ vectors.T
+                + (vectors**2).sum(axis=1)[np.newaxis, :]
+            )
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for row in distances:
+            top = np.argsort(row)[:n_results]
+            results["ids"].append([chunks["ids"][i] for i in top])
+            results["documents"].append([chunks["documents"][i] for i in top])
+            results["metadatas"].append([chunks["metadatas"][i] for i in top])
+            results["distances"].append([float(max(row[i], 0)) for i in top])
+        return results
+
+
+class CollectionCache:
+    """
+    Process-wide LRU of opened Chroma collections and the indexes built on them.
+
+    Opening a collection looks it up in the Chroma system database, and building an
+    index on it creates a vector store and an embedding client. Both are reused by
+    the queries on the same document until the entry is evicted or invalidated.
+    """
+
+    def __init__(self, max_collections: int = Config.CHROMA_COLLECTION_CACHE_SIZE):
+        self.max_collections = max_collections
+        # (chroma path, collection name) -> {"collection": ..., "index": ...}
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_entry(self, name: str) -> Dict[str, object]:
+        key = (Config.CHROMA_DB_PATH, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics.increment("chroma_collection_cache_hits")
+                return entry
+
+        metrics.increment("chroma_collection_cache_misses")
+        collection = get_chroma_client().get_or_create_collection(name)
+        with self._lock:
+            # keep the entry of a thread that opened the collection at the same time
+            entry = self._entries.setdefault(key, {"collection": collection, "index": None})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_collections:
+                self._entries.popitem(last=False)
+                metrics.increment("chroma_collection_cache_evictions")
+        return entry
+
+    def get_collection(self, name: str) -> chromadb.Collection:
+        """
+        Get a collection, creating it if it does not exist.
+
+        Args:
+            name (str): The name of the collection.
+
+        Returns:
+            chromadb.Collection: The collection.
+        """
+        return self._get_entry(name)["collection"]
+
+    def get_index(
+        self, name: str, embed_model: Optional[OpenAIEmbedding] = None
+    ) -> VectorStoreIndex:
+        """
+        Get the index of a collection.
+
+        Args:
+            name (str): The name of the collection.
+            embed_model (Optional[OpenAIEmbedding]): The model embedding the queries,
+                `Config.DEFAULT_OPENAI_EMBEDDING_MODEL` by default.
+
+        Returns:
+            VectorStoreIndex: The index querying the collection.
+        """
+        entry = self._get_entry(name)
+        index = entry["index"]
+        if index is None:
+            index = VectorStoreIndex.from_vector_store(
+                vector_store=ChromaVectorStore(
+                    chroma_collection=DocumentScopedCollection(entry["collection"])
+                ),
+                embed_model=embed_model
+                or llm_clients.get_embed_model(),
+            )
+            entry["index"] = index
+        return index
+
+    def invalidate(self, name: str) -> None:
+        """
+        Drop the cached handles of a collection.
+
+        Args:
+            name (str): The name of the collection.
+        """
+        with self._lock:
+            self._entries.pop((Config.CHROMA_DB_PATH, name), None)
+
+    def delete_collection(self, name: str) -> None:
+        """
+        Delete a collection and its cached handles.
+
+        Args:
+            name (str): The name of the collection.
+        """
+        self.invalidate(name)
+        try:
+            get_chroma_client().delete_collection(name)
+        except ValueError:
+            # the collection was never created
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+collection_cache = CollectionCache()
+
+
+def get_document_key(customer_uuid: str, filename: str) -> str:
+    return f"{customer_uuid}_{filename}"
+
+
+def get_shared_collection_name(
+    customer_uuid: str, shards: int = Config.CHROMA_SHARED_SHARDS
+) -> str:
+    """
+    Get the shared collection holding the documents of a customer.
+
+    Args:
+        customer_uuid (str): The UUID of the customer.
+        shards (int): The number of shared collections.
+
+    Returns:
+        str: The name of the collection.
+    """
+    shard = int(hashlib.sha256(str(customer_uuid).encode("utf-8")).hexdigest()[:8], 16)
+    return f"{SHARED_COLLECTION_PREFIX}_{shard % max(shards, 1)}"
+
+
+def get_embedding_path(collection_name: str, document_key: Optional[str] = None) -> str:
+    """
+    Get the embedding path stored on a user document.
+
+    Args:
+        collection_name (str): The collection holding the document.
+        document_key (Optional[str]): The key of the document in a shared collection, None
+            if the collection only holds the document.
+
+    Returns:
+        str: The embedding path.
+    """
+    if document_key is None:
+        return collection_name
+    return f"{collection_name}{_EMBEDDING_PATH_SEPARATOR}{document_key}"
+
+
+def parse_embedding_path(embedding_path: str) -> Tuple[str, Optional[str]]:
+    """
+    Split an embedding path into its collection and document key.
+
+    Args:
+        embedding_path (str): The embedding path of a user document.
+
+    Returns:
+        Tuple[str, Optional[str]]: The collection name, and the document key if the
+        collection is shared.
+    """
+    collection_name, _, document_key = embedding_path.partition(_EMBEDDING_PATH_SEPARATOR)
+    return collection_name, document_key or None
+
+
+def get_document_filters(embedding_path: str) -> Optional[MetadataFilters]:
+    """
+    Get the filters restricting a query to the chunks of one document.
+
+    Args:
+        embedding_path (str): The embedding path of a user document.
+
+    Returns:
+        Optional[MetadataFilters]: The filters, or None if the collection only holds the
+        document.
+    """
+    _, document_key = parse_embedding_path(embedding_path)
+    if document_key is None:
+        return None
+    return MetadataFilters(filters=[MetadataFilter(key="document_key", value=document_key)])
+
+
+def delete_document_vectors(embedding_path: str) -> None:
+    """
+    Delete the vectors of a document.
+
+    In a shared collection the chunks of the document are deleted. A collection that
+    only holds the document is left in place, only its cached handles are dropped.
+
+    Args:
+        embedding_path (str): The embedding path of the user document.
+    """
+    collection_name, document_key = parse_embedding_path(embedding_path)
+    if document_key is None:
+        collection_cache.invalidate(collection_name)
+        return
+
+    collection_cache.get_collection(collection_name).delete(
+        where={"document_key": document_key}
+    )
+    logger.info(f"Deleted the vectors of {document_key} from {collection_name}")
+
+
+def migrate_to_shared_collection(
+    embedding_path: str,
+    customer_uuid: str,
+    document_id: Optional[int] = None,
+    shards: int = Config.CHROMA_SHARED_SHARDS,
+    batch_size: int = 1000,
+) -> str:
+    """
+    Copy the vectors of a per-document collection into the shared collection of its customer.
+
+    The copy is idempotent, so documents sharing a collection can be migrated one after
+    the other. The source collection is left in place.
+
+    Args:
+        embedding_path (str): The embedding path of the user document.
+        customer_uuid (str): The UUID of the customer.
+        document_id (Optional[int]): The ID of the user document.
+        shards (int): The number of shared collections.
+        batch_size (int): The number of vectors copied at once.
+
+    Returns:
+        str: The embedding path of the document in the shared collection.
+    """
+    collection_name, document_key = parse_embedding_path(embedding_path)
+    if document_key is not None:
+        return embedding_path
+
+    client = get_chroma_client()
+    source = client.get_collection(collection_name)
+    document_key = collection_name
+    target_name = get_shared_collection_name(customer_uuid, shards)
+    target = collection_cache.get_collection(target_name)
+
+    tenant_metadata = {"customer_uuid": str(customer_uuid), "document_key": document_key}
+    if document_id is not None:
+        tenant_metadata["document_id"] = document_id
+
+    copied = 0
+    total = source.count()
+    while copied < total:
+        batch = source.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=batch_size,
+            offset=copied,
+        )
+        if not batch["ids"]:
+            break
+        target.upsert(
+            ids=[f"{document_key}/{chunk_id}" for chunk_id in batch["ids"]],
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=[
+                {**(metadata or {}), **tenant_metadata} for metadata in batch["metadatas"]
+            ],
+        )
+        copied += len(batch["ids"])
+
+    logger.info(f"Copied {copied} vectors of {collection_name} into {target_name}")
+    return get_embedding_path(target_name, document_key)
@@ -0,0 +1,77 @@
+"""
+Move the embeddings of user documents from their own Chroma collections into the
+shared collections used with CHROMA_LAYOUT=shared.
+
+Usage:
+    python migrate_vectors.py [--shards 1] [--dry-run] [--delete-old]
+
+Set CHROMA_LAYOUT=shared before running it, so that documents embedded while the
+migration runs already go to the shared collections. The copy is idempotent, so an
+interrupted migration can be run again.
+"""
+
+import argparse
+from config import Config
+from logger import logger
+from db import SessionLocal
+from db.queries.user_documents import UserDocumentQuery
+from helper.vector_store import (
+    collection_cache,
+    migrate_to_shared_collection,
+    parse_embedding_path,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, default=Config.CHROMA_SHARED_SHARDS)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--delete-old",
+        action="store_true",
+        help="delete the per-document collections once all their documents are moved",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    migrated_collections = set()
+    failed_collections = set()
+    try:
+        for user_doc in UserDocumentQuery.get_embedded_user_documents(db):
+            collection_name, document_key = parse_embedding_path(user_doc.embed_url)
+            if document_key is not None:
+                continue
+            if args.dry_run:
+                logger.info(f"Would migrate document {user_doc.id} from {collection_name}")
+                continue
+
+            try:
+                embedding_path = migrate_to_shared_collection(
+                    user_doc.embed_url,
+                    str(user_doc.customer_uuid),
+                    document_id=user_doc.id,
+                    shards=args.shards,
+                )
+            except Exception as e:
+                logger.error(f"Failed to migrate document {user_doc.id}: {e}")
+                failed_collections.add(collection_name)
+                continue
+
+            UserDocumentQuery.update_embedding_path(db, user_doc.id, embedding_path)
+            db.commit()
+            migrated_collections.add(collection_name)
+    finally:
+        db.close()
+
+    if args.delete_old:
+        for collection_name in migrated_collections - failed_collections:
+            collection_cache.delete_collection(collection_name)
+
+    logger.info(
+        f"Migrated {len(migrated_collections)} collections, "
+        f"{len(failed_collections)} failed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,10 @@ class NewDBCreateRequest(BaseModel):
 
     Attributes:
         db_type (str): The type of the database.
-        db_config (dict): The configuration details for the database.
+        db_config (dict): The configuration details for the database. Besides the
+            connection details it may set `statement_timeout` (seconds), `read_only`,
+            `max_estimated_rows`, `max_estimated_cost` and `cost_guard_action` for
+            generated queries.
     """
 
     db_type: str
@@ -40,7 +43,10 @@ class DBConfigUpdateRequest(BaseModel):
 
     Attributes:
         db_type (str): The type of the database.
-        db_config (dict): The configuration details for the database.
+        db_config (dict): The configuration details for the database. Besides the
+            connection details it may set `statement_timeout` (seconds), `read_only`,
+            `max_estimated_rows`, `max_estimated_cost` and `cost_guard_action` for
+            generated queries.
     """
 
     db_type: str
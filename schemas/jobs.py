@@ -0,0 +1,54 @@
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+
+
+class Job(BaseModel):
+    """
+    Represents a job of a background queue.
+
+    Attributes:
+        id (str): The unique identifier of the job.
+        type (str): The name of the handler that runs the job.
+        payload (Dict[str, Any]): The arguments of the job, and the progress it saved.
+        status (str): "queued", "running", "retrying", "succeeded" or "failed".
+        attempts (int): The number of times the job was started.
+        max_attempts (int): The number of attempts before the job is marked as failed.
+        error (Optional[str]): The error of the last failed attempt (default: None).
+        result (Optional[Dict[str, Any]]): The result the handler stored (default: None).
+        enqueued_at (float): The timestamp when the job was enqueued.
+        updated_at (float): The timestamp when the job was last updated.
+    """
+
+    id: str
+    type: str
+    payload: Dict[str, Any] = {}
+    status: str = "queued"
+    attempts: int = 0
+    max_attempts: int = 1
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    enqueued_at: float
+    updated_at: float
+
+
+class JobStatusResponse(BaseModel):
+    """
+    Represents the status of a query job, as returned to its customer.
+
+    Attributes:
+        job_id (str): The unique identifier of the job.
+        type (str): The type of the job.
+        status (str): "queued", "running", "retrying", "succeeded" or "failed".
+        result (Optional[Dict[str, Any]]): The result of a succeeded job (default: None).
+        error (Optional[str]): The error of a failed job (default: None).
+        enqueued_at (float): The timestamp when the job was enqueued.
+        updated_at (float): The timestamp when the job was last updated.
+    """
+
+    job_id: str
+    type: str
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    enqueued_at: float
+    updated_at: float
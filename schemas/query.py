@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, List, Optional
 from config import Config
 from uuid import UUID
 
@@ -20,6 +20,39 @@ class CustomerQueryRequest(BaseModel):
     chat_uuid: Optional[UUID] = None
 
 
+class SQLCostEstimate(BaseModel):
+    """
+    Represents the EXPLAIN estimate of a SQL query.
+
+    Attributes:
+        estimated_rows (Optional[float]): The estimated number of rows (default: None).
+        estimated_cost (Optional[float]): The planner cost, postgres and mysql only (default: None).
+        action (Optional[str]): The cost guard action taken: "limit", "rewrite" or "refuse"
+            (default: None).
+    """
+
+    estimated_rows: Optional[float] = None
+    estimated_cost: Optional[float] = None
+    action: Optional[str] = None
+
+
+class SQLResult(BaseModel):
+    """
+    Represents the bounded result of a SQL query.
+
+    Attributes:
+        columns (List[str]): The column names.
+        rows (List[List[Any]]): The fetched rows.
+        truncated (bool): Whether more rows were available than were fetched.
+        cost_estimate (Optional[SQLCostEstimate]): The estimate of the executed query (default: None).
+    """
+
+    columns: List[str] = []
+    rows: List[List[Any]] = []
+    truncated: bool = False
+    cost_estimate: Optional[SQLCostEstimate] = None
+
+
 class CustomerQueryResponse(BaseModel):
     """
     Represents a customer query response.
@@ -28,11 +61,13 @@ class CustomerQueryResponse(BaseModel):
         query (str): The query string.
         response (str): The response string.
         sql_query (Optional[str]): The SQL query (default: None).
+        sql_result (Optional[SQLResult]): The rows returned by the SQL query (default: None).
         data_source_id (Optional[int]): The ID of the data source (default: None).
     """
 
     query: str
     response: str
     sql_query: Optional[str] = None
+    sql_result: Optional[SQLResult] = None
     data_source_id: Optional[int] = None
     chat_uuid: str
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Any, Dict, Optional
 
 
 class UserDocumentUploadResponse(BaseModel):
@@ -25,4 +26,22 @@ class UserDocumentUpdateRequest(BaseModel):
         document_name (str): The new name for the document.
     """
 
-    document_name: str
\ No newline at end of file
+    document_name: str
+
+class UserDocumentStatusResponse(BaseModel):
+    """
+    Represents the ingestion status of a user document.
+
+    Attributes:
+        document_id (int): The ID of the document.
+        ingestion_status (Optional[str]): "queued", "processing", "retrying", "ready" or "failed".
+        ingestion_error (Optional[str]): The error of the last failed ingestion attempt.
+        is_embedded (bool): Indicates whether the document is embedded.
+        profile (Optional[Dict[str, Any]]): The summary of the columns of the document.
+    """
+
+    document_id: int
+    ingestion_status: Optional[str] = None
+    ingestion_error: Optional[str] = None
+    is_embedded: bool = False
+    profile: Optional[Dict[str, Any]] = None
@@ -0,0 +1,127 @@
+"""Stand-ins and fixtures shared by the test modules."""
+
+import json
+import numpy as np
+import pandas as pd
+
+
+def _to_bytes(value):
+    return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+
+class ListRedis:
+    """In-memory stand-in for the list, sorted set and string commands of redis."""
+
+    def __init__(self):
+        self.store = {}
+        self.lists = {}
+        self.zsets = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = _to_bytes(value)
+        return True
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+    def lpush(self, key, *values):
+        items = self.lists.setdefault(key, [])
+        for value in values:
+            items.insert(0, _to_bytes(value))
+        return len(items)
+
+    def blmove(self, source, destination, timeout, src="LEFT", dest="RIGHT"):
+        items = self.lists.get(source)
+        if not items:
+            return None
+        value = items.pop() if src == "RIGHT" else items.pop(0)
+        if dest == "LEFT":
+            self.lpush(destination, value)
+        else:
+            self.lists.setdefault(destination, []).append(value)
+        return value
+
+    def lrem(self, key, count, value):
+        items = self.lists.get(key, [])
+        value = _to_bytes(value)
+        removed = items.count(value)
+        self.lists[key] = [item for item in items if item != value]
+        return removed
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(
+            {_to_bytes(member): score for member, score in mapping.items()}
+        )
+
+    def zrem(self, key, member):
+        return int(self.zsets.get(key, {}).pop(_to_bytes(member), None) is not None)
+
+    def zrangebyscore(self, key, min, max, start=None, num=None):
+        members = sorted(
+            (score, member)
+            for member, score in self.zsets.get(key, {}).items()
+            if min <= score <= max
+        )
+        members = [member for _, member in members]
+        return members[start : start + num] if start is not None else members
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+
+class DictRedis:
+    """In-memory stand-in for the string commands of redis."""
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+class FakeChatMemory:
+    """In-memory stand-in for the chat memory of a chat."""
+
+    def __init__(self):
+        self.messages = []
+
+    def get(self):
+        return list(self.messages)
+
+    def put(self, message):
+        self.messages.append(message)
+
+
+def parse_events(body: str) -> list:
+    """Split a server-sent events body into (event, data) tuples."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+def make_df(rows: int) -> pd.DataFrame:
+    """Build a sales document with integer, float and string columns."""
+    return pd.DataFrame(
+        {
+            "id": np.arange(rows),
+            "city": [f"city {i}" for i in range(rows)],
+            "sales": np.arange(rows),
+            "amount": np.linspace(0, 1, rows),
+        }
+    )
@@ -1,6 +1,8 @@
 from unittest import TestCase, mock
-from fastapi import Response, status
-from api.base import get_system_health
+from fastapi import FastAPI, Response, status
+from fastapi.testclient import TestClient
+from api.base import get_system_health, router
+from helper.auth import get_current_user
 
 
 class TestSystemHealth(TestCase):
@@ -15,3 +17,23 @@ class TestSystemHealth(TestCase):
 
         mock_logger.info.assert_called_with("Checking system health")
         mock_logger.info.assert_called_with("System is healthy")
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.app = FastAPI()
+        self.app.include_router(router)
+        self.client = TestClient(self.app)
+
+    def test_requires_authentication(self):
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_returns_metrics_to_users(self):
+        self.app.dependency_overrides[get_current_user] = lambda: {"uuid": "customer"}
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("counters", response.json()["data"])
@@ -0,0 +1,121 @@
+import asyncio
+from typing import Any, Sequence
+from unittest import TestCase, mock
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.llms.openai import OpenAI
+from api.v1 import query as query_module
+from helper.metrics import metrics
+from helper.pipelines import simple_chat
+from helper.pipelines.registry import PipelineRegistry
+from helper.sse import format_sse_event
+from helpers import FakeChatMemory, parse_events
+
+
+class StreamingLLM(OpenAI):
+    tokens: list = []
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        async def gen():
+            content = ""
+            for token in self.tokens:
+                content += token
+                yield ChatResponse(
+                    message=ChatMessage(role="assistant", content=content), delta=token
+                )
+
+        return gen()
+
+
+class TestStreamSimpleChat(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.memory = FakeChatMemory()
+        registry = PipelineRegistry()
+        registry.register("simple_chat", simple_chat.build_simple_chat_pipeline)
+        llm = StreamingLLM(model="gpt-4o", api_key="sk-test", tokens=["<div>", "Hi", "</div>"])
+        patchers = [
+            mock.patch.object(simple_chat, "pipeline_registry", registry),
+            mock.patch.object(simple_chat, "get_chat_memory", return_value=self.memory),
+            mock.patch("helper.pipelines.registry.llm_clients.get_llm", return_value=llm),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stream(self) -> list:
+        async def main():
+            return [
+                token
+                async for token in simple_chat.astream_simple_chat_pipeline(
+                    "hello", "chat-uuid", "gpt-4o"
+                )
+            ]
+
+        return asyncio.run(main())
+
+    def test_streams_tokens_and_updates_memory(self):
+        self.assertEqual(self.stream(), ["<div>", "Hi", "</div>"])
+
+        self.assertEqual(
+            [(m.role.value, m.content) for m in self.memory.messages],
+            [("user", "hello"), ("assistant", "<div>Hi</div>")],
+        )
+        observations = metrics.snapshot()["observations"]
+        self.assertEqual(observations["simple_chat_time_to_first_token_seconds"]["count"], 1)
+        self.assertIn("simple_chat_stream_seconds", observations)
+
+    def test_interrupted_stream_leaves_memory_unchanged(self):
+        async def main():
+            stream = simple_chat.astream_simple_chat_pipeline("hello", "chat-uuid", "gpt-4o")
+            await stream.__anext__()
+            await stream.aclose()
+
+        asyncio.run(main())
+
+        self.assertEqual(self.memory.messages, [])
+
+
+class TestChatStreamRoute(TestCase):
+    def respond(self, stream) -> list:
+        request = mock.Mock(query="hello", chat_uuid="chat-uuid", model="gpt-4o")
+
+        async def main():
+            with mock.patch.object(query_module, "astream_simple_chat_pipeline", stream):
+                response = await query_module.chat_stream(
+                    request, db=mock.Mock(), current_user=mock.Mock()
+                )
+                self.assertEqual(response.media_type, "text/event-stream")
+                return "".join([chunk async for chunk in response.body_iterator])
+
+        return parse_events(asyncio.run(main()))
+
+    def test_sends_tokens_then_response(self):
+        async def stream(query, chat_uuid, model):
+            yield "```html<div>Hi"
+            yield "</div>```"
+
+        events = self.respond(stream)
+
+        self.assertEqual(
+            events[:2],
+            [("token", {"token": "```html<div>Hi"}), ("token", {"token": "</div>```"})],
+        )
+        self.assertEqual(events[2][0], "done")
+        self.assertEqual(events[2][1]["response"], "<div>Hi</div>")
+        self.assertEqual(events[2][1]["chat_uuid"], "chat-uuid")
+
+    def test_sends_error_event(self):
+        async def stream(query, chat_uuid, model):
+            yield "Hi"
+            raise RuntimeError("connection reset")
+
+        events = self.respond(stream)
+
+        self.assertEqual(events[0], ("token", {"token": "Hi"}))
+        self.assertEqual(events[1][0], "error")
+
+    def test_events_keep_new_lines_in_data(self):
+        self.assertEqual(
+            format_sse_event("token", {"token": "a\nb"}),
+            'event: token\ndata: {"token": "a\\nb"}\n\n',
+        )
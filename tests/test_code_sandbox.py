@@ -0,0 +1,221 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+import pandas as pd
+import pyarrow as pa
+from helper.code_sandbox import (
+    CodeSandbox,
+    CodeSandboxCancelledError,
+    CodeSandboxError,
+    CodeSandboxLimitError,
+    CodeSandboxTimeoutError,
+    exec_code,
+    parse_pandas_instructions,
+)
+from helper.concurrency import CancelScope, current_cancel_scope
+from helper.metrics import metrics
+from helper.pipelines import csv_query
+from helper.shared_frames import SharedFrameStore
+from helpers import make_df
+
+
+class TestCodeSandbox(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.store_dir = tempfile.TemporaryDirectory()
+        cls.store = SharedFrameStore(root_dir=cls.store_dir.name, max_bytes=2**30)
+        cls.sandbox = CodeSandbox(
+            workers=2,
+            timeout=2,
+            cpu_seconds=1,
+            max_memory_bytes=2**30,
+            frame_dir=cls.tmp_dir.name,
+            frame_store=cls.store,
+        )
+        cls.sandbox.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sandbox.shutdown()
+        cls.tmp_dir.cleanup()
+        cls.store_dir.cleanup()
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_runs_code_on_the_mapped_document(self):
+        df = make_df(100)
+
+        result = self.sandbox.run(
+            exec_code, df, "df['double'] = df.sales * 2\nresult = int(df.double.sum())", "result"
+        )
+
+        self.assertEqual(result, 9900)
+        # the code got a copy, and the mapped files are gone once the call returned
+        self.assertNotIn("double", df)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+        self.assertNotIn("code_sandbox_workers_started", metrics.snapshot()["counters"])
+
+    def test_documents_of_the_shared_store_are_not_exported(self):
+        shared_frame = self.store.put(1, "etag", {"Sales": make_df(3), "Costs": make_df(5)})
+        self.addCleanup(shared_frame.release)
+
+        with mock.patch.object(pa.ipc, "new_file") as new_file:
+            output = self.sandbox.run(
+                parse_pandas_instructions, shared_frame.data, "int(df['Costs'].sales.sum())"
+            )
+
+        self.assertEqual(output, "10")
+        new_file.assert_not_called()
+        self.assertEqual(metrics.snapshot()["counters"]["code_sandbox_shared_frames"], 1)
+        # the entry is no longer held by the call
+        shared_frame.release()
+        self.store.max_bytes = 0
+        self.addCleanup(setattr, self.store, "max_bytes", 2**30)
+        self.store.evict()
+        self.assertFalse(os.path.exists(shared_frame.entry_dir))
+
+    def test_changed_copies_of_a_shared_document_are_exported(self):
+        shared_frame = self.store.put(2, "etag", make_df(5))
+        self.addCleanup(shared_frame.release)
+        df = shared_frame.data
+        df["sales"] = df["sales"] * 2
+
+        for data in [df, shared_frame.data.head(2)]:
+            result = self.sandbox.run(exec_code, data, "result = int(df.sales.sum())", "result")
+            self.assertEqual(result, int(data.sales.sum()))
+
+        self.assertNotIn("code_sandbox_shared_frames", metrics.snapshot()["counters"])
+
+    def test_excel_sheets_are_passed_by_name(self):
+        sheets = {"Sales": make_df(3), "Costs": make_df(5)}
+
+        output = self.sandbox.run(parse_pandas_instructions, sheets, "len(df['Costs'])")
+
+        self.assertEqual(output, "5")
+
+    def test_documents_arrow_can_not_convert_are_pickled(self):
+        df = pd.DataFrame({"mixed": [1, "one"]})
+
+        self.assertEqual(self.sandbox.run(exec_code, df, "n = len(df)", "n"), 2)
+
+    def test_errors_keep_the_worker(self):
+        with self.assertRaisesRegex(CodeSandboxError, "ZeroDivisionError"):
+            self.sandbox.run(exec_code, make_df(1), "result = 1 / 0", "result")
+
+        self.assertEqual(self.sandbox.run(exec_code, make_df(1), "result = 1", "result"), 1)
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["code_sandbox_errors"], 1)
+        self.assertNotIn("code_sandbox_workers_started", counters)
+
+    def test_timeout_replaces_the_worker(self):
+        start = time.perf_counter()
+        with self.assertRaises(CodeSandboxTimeoutError):
+            self.sandbox.run(exec_code, make_df(1), "import time\ntime.sleep(30)", "result")
+
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual(self.sandbox.run(exec_code, make_df(1), "result = 1", "result"), 1)
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["code_sandbox_timeouts"], 1)
+        self.assertEqual(counters["code_sandbox_workers_started"], 1)
+
+    def test_cpu_time_limit(self):
+        # the CPU time limit has a granularity of a second, the timeout must not win
+        with mock.patch.object(self.sandbox, "timeout", 10), self.assertRaisesRegex(
+            CodeSandboxLimitError, "CPU time"
+        ):
+            self.sandbox.run(exec_code, make_df(1), "while True:\n    pass", "result")
+
+    def test_memory_limit(self):
+        with self.assertRaisesRegex(CodeSandboxLimitError, "memory"):
+            self.sandbox.run(exec_code, make_df(1), "result = bytearray(2**31)", "result")
+
+        self.assertEqual(self.sandbox.run(exec_code, make_df(1), "result = 1", "result"), 1)
+
+    def test_crashed_worker_is_replaced(self):
+        with self.assertRaises(CodeSandboxLimitError):
+            self.sandbox.run(exec_code, make_df(1), "import os\nos._exit(1)", "result")
+
+        self.assertEqual(self.sandbox.run(exec_code, make_df(1), "result = 1", "result"), 1)
+        self.assertEqual(metrics.snapshot()["counters"]["code_sandbox_crashes"], 1)
+
+    def test_cancel_scope_kills_the_worker(self):
+        scope = CancelScope()
+        token = current_cancel_scope.set(scope)
+        timer = threading.Timer(0.2, scope.cancel)
+        timer.start()
+        try:
+            start = time.perf_counter()
+            with self.assertRaises(CodeSandboxCancelledError):
+                self.sandbox.run(exec_code, make_df(1), "import time\ntime.sleep(30)", "result")
+            self.assertLess(time.perf_counter() - start, 1)
+        finally:
+            timer.cancel()
+            current_cancel_scope.reset(token)
+
+    def test_calls_run_in_parallel(self):
+        code = "import time\ntime.sleep(0.5)\nresult = len(df)"
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(
+                executor.map(
+                    lambda rows: self.sandbox.run(exec_code, make_df(rows), code, "result"),
+                    [1, 2],
+                )
+            )
+
+        self.assertEqual(results, [1, 2])
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+    def test_frames_are_removed_when_no_worker_starts(self):
+        with mock.patch.object(
+            self.sandbox, "_acquire", side_effect=OSError("no more processes")
+        ), self.assertRaises(OSError):
+            self.sandbox.run(exec_code, make_df(100), "result = 1", "result")
+
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_disabled_sandbox_runs_in_process(self):
+        sandbox = CodeSandbox(workers=0)
+        df = make_df(3)
+        df.loc[2, "sales"] = None
+        code = (
+            "df['seen'] = True\n"
+            "df.loc[df.city == 'city 0', 'city'] = 'New York'\n"
+            "df['sales'] += 100\n"
+            "df.fillna(0, inplace=True)\n"
+            "result = df.sales.tolist()"
+        )
+
+        result = sandbox.run(exec_code, df, code, "result")
+
+        self.assertEqual(result, [100, 101, 0])
+        # in-place writes of the code do not reach the cached document
+        self.assertNotIn("seen", df)
+        self.assertEqual(df.city.tolist(), ["city 0", "city 1", "city 2"])
+        self.assertEqual(df.sales.tolist()[:2], [0, 1])
+        self.assertFalse(pd.get_option("mode.copy_on_write"))
+
+
+class TestPandasInstructionComponent(TestCase):
+    def test_timeout_is_passed_on_as_an_error_output(self):
+        sandbox = mock.Mock()
+        sandbox.run.side_effect = CodeSandboxTimeoutError(
+            "The code did not finish within 30 seconds"
+        )
+
+        with mock.patch.object(csv_query, "code_sandbox", sandbox):
+            output = csv_query.PandasInstructionComponent().run_component(
+                input="df.groupby('city').sum()", df=make_df(1)
+            )
+
+        self.assertEqual(
+            output["output"],
+            "There was an error running the output as Python code. "
+            "Error message: The code did not finish within 30 seconds",
+        )
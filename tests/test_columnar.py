@@ -0,0 +1,140 @@
+import hashlib
+import io
+import tempfile
+from unittest import TestCase, mock
+import pandas as pd
+from helper import columnar
+from helper import s3_cache
+from helper.columnar import (
+    load_columnar_copy,
+    optimize_dtypes,
+    store_columnar_copy,
+)
+from helper.s3_cache import S3ObjectCache
+
+
+class DictS3:
+    def __init__(self):
+        self.objects = {}
+
+    def upload(self, data, key):
+        self.objects[key] = data
+        return True
+
+    def download(self, key, output_path, etag=None):
+        if key not in self.objects:
+            return False
+        with open(output_path, "wb") as f:
+            f.write(self.objects[key])
+        return True
+
+    def list_etags(self, prefix):
+        return {
+            key: hashlib.md5(data).hexdigest()
+            for key, data in self.objects.items()
+            if key.startswith(prefix)
+        }
+
+    def delete_prefix(self, prefix):
+        for key in self.list_etags(prefix):
+            del self.objects[key]
+        return True
+
+
+class TestColumnar(TestCase):
+    def setUp(self):
+        self.s3 = DictS3()
+        for name, fn in [
+            ("upload_bytes_to_s3", self.s3.upload),
+            ("list_s3_etags", self.s3.list_etags),
+            ("delete_s3_prefix", self.s3.delete_prefix),
+        ]:
+            patcher = mock.patch.object(columnar, name, side_effect=fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        for patcher in [
+            mock.patch.object(
+                columnar, "s3_object_cache", S3ObjectCache(root_dir=tmp_dir.name)
+            ),
+            mock.patch.object(s3_cache, "download_from_s3", side_effect=self.s3.download),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_optimize_dtypes(self):
+        df = pd.DataFrame(
+            {
+                "id": [1, 2, 3],
+                "created_at": ["2024-01-01", "2024-02-01 10:00:00", None],
+                "year_or_date": ["2024-01-05", "2023", "2022-12-31"],
+                "name": ["a", "b", "c"],
+                "amount": [1.5, 2.0, 3.25],
+            }
+        )
+
+        optimized = optimize_dtypes(df)
+
+        self.assertEqual(optimized["id"].dtype, "int64")
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(optimized["created_at"]))
+        self.assertEqual(optimized["year_or_date"].dtype, object)
+        self.assertEqual(optimized["name"].dtype, object)
+        self.assertEqual(optimized["amount"].dtype, "float64")
+        # the input is left untouched
+        self.assertEqual(df["created_at"].dtype, object)
+
+    def test_integer_products_do_not_overflow(self):
+        df = optimize_dtypes(pd.DataFrame({"qty": [60000, 70000], "price": [50000, 40000]}))
+
+        self.assertEqual((df["qty"] * df["price"]).tolist(), [3_000_000_000, 2_800_000_000])
+
+    def test_csv_round_trip(self):
+        csv = io.BytesIO(b"id,name,amount\n1,a,1.5\n2,b,2.5\n")
+
+        self.assertTrue(store_columnar_copy(csv, "uuid/csv/data.csv", "csv", "v1"))
+        df = load_columnar_copy("uuid/csv/data.csv", "csv", "v1")
+
+        self.assertEqual(list(self.s3.objects), ["uuid/csv/data.csv.columnar/0000.parquet"])
+        self.assertEqual(df["name"].tolist(), ["a", "b"])
+        self.assertEqual(df["amount"].tolist(), [1.5, 2.5])
+
+    def test_copy_of_a_previous_upload_is_ignored(self):
+        csv = io.BytesIO(b"id,name\n1,a\n")
+        store_columnar_copy(csv, "uuid/csv/data.csv", "csv", "v1")
+
+        # the file was uploaded again, the worker has not rebuilt the copy yet
+        self.assertIsNone(load_columnar_copy("uuid/csv/data.csv", "csv", "v2"))
+        self.assertIsNotNone(load_columnar_copy("uuid/csv/data.csv", "csv", "v1"))
+
+    def test_excel_round_trip_keeps_sheet_order(self):
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer) as writer:
+            pd.DataFrame({"a": [1, 2]}).to_excel(writer, sheet_name="Sales", index=False)
+            pd.DataFrame({"b": ["x"]}).to_excel(writer, sheet_name="Costs", index=False)
+        buffer.seek(0)
+
+        self.assertTrue(store_columnar_copy(buffer, "uuid/excel/data.xlsx", "excel", "v1"))
+        sheets = load_columnar_copy("uuid/excel/data.xlsx", "excel", "v1")
+
+        self.assertEqual(list(sheets), ["Sales", "Costs"])
+        self.assertEqual(sheets["Sales"]["a"].tolist(), [1, 2])
+        self.assertEqual(sheets["Costs"]["b"].tolist(), ["x"])
+
+    def test_reupload_replaces_previous_copy(self):
+        self.s3.upload(b"stale", "uuid/excel/data.xlsx.columnar/0001.parquet")
+
+        store_columnar_copy(io.BytesIO(b"id\n1\n"), "uuid/excel/data.xlsx", "csv", "v1")
+
+        self.assertEqual(
+            list(self.s3.objects), ["uuid/excel/data.xlsx.columnar/0000.parquet"]
+        )
+
+    def test_unconvertible_document(self):
+        self.assertFalse(
+            store_columnar_copy(
+                io.BytesIO(b"not an excel file"), "uuid/excel/a.xlsx", "excel", "v1"
+            )
+        )
+        self.assertIsNone(load_columnar_copy("uuid/excel/a.xlsx", "excel", "v1"))
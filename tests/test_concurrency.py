@@ -0,0 +1,99 @@
+import asyncio
+import inspect
+import threading
+from unittest import TestCase
+from helper.concurrency import (
+    CancelScope,
+    ClientDisconnectedError,
+    cancel_on_disconnect,
+    current_cancel_scope,
+    make_async,
+    run_blocking,
+    run_in_cancel_scope,
+)
+
+
+def blocking_add(a: int, b: int = 1) -> int:
+    return a + b
+
+
+class DisconnectingRequest:
+    def __init__(self, disconnect_after: int):
+        self.checks = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        self.checks += 1
+        return self.checks >= self.disconnect_after
+
+
+class TestConcurrency(TestCase):
+    def test_run_blocking_runs_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+
+        async def main():
+            return await run_blocking(threading.get_ident)
+
+        self.assertNotEqual(asyncio.run(main()), loop_thread)
+
+    def test_make_async_keeps_signature(self):
+        async_add = make_async(blocking_add)
+
+        self.assertTrue(inspect.iscoroutinefunction(async_add))
+        self.assertEqual(
+            inspect.signature(async_add), inspect.signature(blocking_add)
+        )
+        self.assertEqual(asyncio.run(async_add(2, b=3)), 5)
+
+    def test_cancel_on_disconnect_cancels_blocking_work(self):
+        cancelled = threading.Event()
+
+        def blocking_work():
+            current_cancel_scope.get().add_callback(cancelled.set)
+            cancelled.wait(timeout=5)
+
+        async def main():
+            return await cancel_on_disconnect(
+                DisconnectingRequest(disconnect_after=2),
+                run_blocking(blocking_work),
+                poll_interval=0.01,
+            )
+
+        with self.assertRaises(ClientDisconnectedError):
+            asyncio.run(main())
+        self.assertTrue(cancelled.is_set())
+
+    def test_cancel_on_disconnect_returns_result(self):
+        async def main():
+            return await cancel_on_disconnect(
+                DisconnectingRequest(disconnect_after=100),
+                run_blocking(blocking_add, 1),
+                poll_interval=0.01,
+            )
+
+        self.assertEqual(asyncio.run(main()), 2)
+        self.assertIsNone(current_cancel_scope.get())
+
+    def test_run_in_cancel_scope_cancels_scope_with_task(self):
+        scope = CancelScope()
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        def blocking_work():
+            current_cancel_scope.get().add_callback(cancelled.set)
+            started.set()
+            cancelled.wait(timeout=5)
+
+        async def main():
+            task = asyncio.ensure_future(
+                run_in_cancel_scope(scope, run_blocking(blocking_work))
+            )
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        self.assertTrue(scope.cancelled)
+        self.assertIsNone(current_cancel_scope.get())
@@ -0,0 +1,210 @@
+import tempfile
+from unittest import TestCase, mock
+import pandas as pd
+from helper import dataframe_cache as dataframe_cache_module
+from helper.dataframe_cache import (
+    DataFrameCache,
+    DocumentDownloadError,
+    get_dataframe_size,
+    invalidate_user_document,
+    load_user_document,
+    read_user_document,
+)
+from helper.metrics import metrics
+from helper.s3_cache import S3ObjectCache
+from helper.shared_frames import SharedFrameStore
+from helpers import make_df
+
+
+def write_file(key, output_path, etag=None):
+    with open(output_path, "w") as f:
+        f.write("id,name\n")
+    return True
+
+
+class TestDataFrameCache(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_hit_and_miss(self):
+        cache = DataFrameCache(max_bytes=10**7)
+        df = make_df(10)
+
+        self.assertIsNone(cache.get(1, "etag"))
+        cache.put(1, "etag", df)
+        cached = cache.get(1, "etag")
+
+        pd.testing.assert_frame_equal(cached, df)
+        self.assertIsNone(cache.get(1, "other-etag"))
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["dataframe_cache_hits"], 1)
+        self.assertEqual(counters["dataframe_cache_misses"], 2)
+
+    def test_returns_copies(self):
+        cache = DataFrameCache(max_bytes=10**7)
+        cache.put(1, "etag", make_df(10))
+
+        df = cache.get(1, "etag")
+        df["extra"] = 1
+
+        self.assertNotIn("extra", cache.get(1, "etag").columns)
+
+    def test_new_etag_replaces_old_version(self):
+        cache = DataFrameCache(max_bytes=10**7)
+        cache.put(1, "v1", make_df(10))
+        cache.put(1, "v2", make_df(20))
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, get_dataframe_size(make_df(20)))
+
+    def test_evicts_least_recently_used_by_size(self):
+        size = get_dataframe_size(make_df(100))
+        cache = DataFrameCache(max_bytes=size * 2)
+        cache.put(1, "etag", make_df(100))
+        cache.put(2, "etag", make_df(100))
+        cache.get(1, "etag")
+        cache.put(3, "etag", make_df(100))
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(1, "etag"))
+        self.assertIsNone(cache.get(2, "etag"))
+        self.assertEqual(metrics.snapshot()["counters"]["dataframe_cache_evictions"], 1)
+
+    def test_skips_documents_over_budget(self):
+        cache = DataFrameCache(max_bytes=10)
+
+        self.assertFalse(cache.put(1, "etag", make_df(100)))
+        self.assertEqual(len(cache), 0)
+
+    def test_excel_sheets_size(self):
+        sheets = {"a": make_df(10), "b": make_df(20)}
+
+        self.assertEqual(
+            get_dataframe_size(sheets),
+            get_dataframe_size(make_df(10)) + get_dataframe_size(make_df(20)),
+        )
+
+    def test_invalidate(self):
+        cache = DataFrameCache(max_bytes=10**7)
+        cache.put(1, "etag", make_df(10))
+        cache.put(2, "etag", make_df(10))
+
+        self.assertEqual(cache.invalidate(1), 1)
+        self.assertEqual(cache.invalidate(1), 0)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, get_dataframe_size(make_df(10)))
+
+
+class TestLoadUserDocument(TestCase):
+    def setUp(self):
+        self.cache = DataFrameCache(max_bytes=10**7)
+        patcher = mock.patch.object(dataframe_cache_module, "dataframe_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.store = SharedFrameStore(
+            root_dir=self.tmp_dir.name + "/frames", max_bytes=10**7
+        )
+        store_patcher = mock.patch.object(
+            dataframe_cache_module, "shared_frame_store", self.store
+        )
+        store_patcher.start()
+        self.addCleanup(store_patcher.stop)
+
+        self.s3_cache = S3ObjectCache(root_dir=self.tmp_dir.name + "/s3")
+        s3_cache_patcher = mock.patch.object(
+            dataframe_cache_module, "s3_object_cache", self.s3_cache
+        )
+        s3_cache_patcher.start()
+        self.addCleanup(s3_cache_patcher.stop)
+
+        columnar_patcher = mock.patch.object(
+            dataframe_cache_module, "load_columnar_copy", return_value=None
+        )
+        self.mock_load_columnar_copy = columnar_patcher.start()
+        self.addCleanup(columnar_patcher.stop)
+
+        self.user_doc = mock.Mock(
+            id=1,
+            document_type="csv",
+            document_url="https://bucket.s3.region.amazonaws.com/uuid/csv/data.csv",
+        )
+
+    @mock.patch("helper.dataframe_cache.read_document")
+    @mock.patch("helper.s3_cache.download_from_s3", side_effect=write_file)
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value="etag")
+    def test_downloads_once(self, mock_get_s3_etag, mock_download, mock_read):
+        mock_read.return_value = make_df(10)
+
+        first = load_user_document(self.user_doc)
+        second = load_user_document(self.user_doc)
+
+        pd.testing.assert_frame_equal(first, second)
+        mock_download.assert_called_once()
+        self.assertEqual(mock_download.call_args[0][0], "uuid/csv/data.csv")
+        self.assertEqual(mock_download.call_args[1]["etag"], "etag")
+
+    @mock.patch("helper.dataframe_cache.read_document")
+    @mock.patch("helper.s3_cache.download_from_s3", side_effect=write_file)
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value="etag")
+    def test_reparses_cached_file_after_invalidation(
+        self, mock_get_s3_etag, mock_download, mock_read
+    ):
+        mock_read.return_value = make_df(10)
+
+        load_user_document(self.user_doc)
+        invalidate_user_document(1)
+        load_user_document(self.user_doc)
+
+        self.assertEqual(mock_read.call_count, 2)
+        mock_download.assert_called_once()
+
+    @mock.patch("helper.s3_cache.download_from_s3")
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value=None)
+    def test_missing_object(self, mock_get_s3_etag, mock_download):
+        with self.assertRaises(DocumentDownloadError):
+            load_user_document(self.user_doc)
+        mock_download.assert_not_called()
+        self.assertEqual(len(self.cache), 0)
+
+    @mock.patch("helper.s3_cache.download_from_s3", return_value=False)
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value="etag")
+    def test_download_failure(self, mock_get_s3_etag, mock_download):
+        with self.assertRaises(DocumentDownloadError):
+            load_user_document(self.user_doc)
+
+    @mock.patch("helper.s3_cache.download_from_s3")
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value="etag")
+    def test_prefers_columnar_copy(self, mock_get_s3_etag, mock_download):
+        self.mock_load_columnar_copy.return_value = make_df(10)
+
+        pd.testing.assert_frame_equal(load_user_document(self.user_doc), make_df(10))
+        self.mock_load_columnar_copy.assert_called_once_with("uuid/csv/data.csv", "csv", "etag")
+        mock_download.assert_not_called()
+
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value="etag")
+    def test_read_is_not_cached(self, mock_get_s3_etag):
+        self.mock_load_columnar_copy.return_value = make_df(10)
+
+        pd.testing.assert_frame_equal(read_user_document(self.user_doc), make_df(10))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.store.size, 0)
+
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value="etag")
+    def test_loads_from_shared_store(self, mock_get_s3_etag):
+        self.store.put(1, "etag", make_df(10)).release()
+
+        pd.testing.assert_frame_equal(load_user_document(self.user_doc), make_df(10))
+        self.mock_load_columnar_copy.assert_not_called()
+
+    @mock.patch("helper.s3_cache.get_s3_etag", return_value="etag")
+    def test_cache_holds_shared_frame_until_dropped(self, mock_get_s3_etag):
+        self.mock_load_columnar_copy.return_value = make_df(10)
+        load_user_document(self.user_doc)
+        self.store.max_bytes = 1
+
+        self.assertEqual(self.store.evict(), 0)
+        self.cache.clear()
+        self.assertEqual(self.store.evict(), 1)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from helper.db_engines import EngineRegistry
+
+
+class TestEngineRegistry(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.registry = EngineRegistry(max_engines=2, idle_timeout=60)
+
+    def tearDown(self):
+        self.registry.dispose_all()
+        self.tmp_dir.cleanup()
+
+    def db_url(self, name: str) -> str:
+        return f"sqlite:///{os.path.join(self.tmp_dir.name, name)}"
+
+    def test_reuses_engine_for_same_config(self):
+        engine = self.registry.get_engine(self.db_url("a.db"), 1)
+
+        self.assertIs(self.registry.get_engine(self.db_url("a.db"), 1), engine)
+        self.assertEqual(len(self.registry), 1)
+
+    def test_config_change_disposes_old_engine(self):
+        engine = self.registry.get_engine(self.db_url("a.db"), 1)
+
+        with mock.patch.object(engine, "dispose") as mock_dispose:
+            new_engine = self.registry.get_engine(self.db_url("b.db"), 1)
+
+        self.assertIsNot(new_engine, engine)
+        mock_dispose.assert_called_once()
+        self.assertEqual(len(self.registry), 1)
+
+    def test_evicts_least_recently_used(self):
+        first = self.registry.get_engine(self.db_url("a.db"), 1)
+        self.registry.get_engine(self.db_url("b.db"), 2)
+        self.registry.get_engine(self.db_url("a.db"), 1)
+        self.registry.get_engine(self.db_url("c.db"), 3)
+
+        self.assertEqual(len(self.registry), 2)
+        self.assertIs(self.registry.get_engine(self.db_url("a.db"), 1), first)
+
+    def test_evicts_idle_engines(self):
+        with mock.patch("helper.db_engines.time.monotonic", return_value=0):
+            self.registry.get_engine(self.db_url("a.db"), 1)
+        with mock.patch("helper.db_engines.time.monotonic", return_value=120):
+            self.registry.get_engine(self.db_url("b.db"), 2)
+
+        self.assertEqual(len(self.registry), 1)
+
+    def test_dispose_by_config_id(self):
+        self.registry.get_engine(self.db_url("a.db"), 1)
+        self.registry.get_engine(self.db_url("b.db"), 2)
+
+        self.assertEqual(self.registry.dispose(1), 1)
+        self.assertEqual(self.registry.dispose(1), 0)
+        self.assertEqual(len(self.registry), 1)
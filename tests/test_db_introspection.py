@@ -0,0 +1,112 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.dialects.mysql.base import MySQLDialect
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from helper.db_introspection import (
+    reflect_tables,
+    reflect_tables_with_inspector,
+    render_column_type,
+    render_db_schema,
+)
+
+
+class TestDbIntrospection(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}"
+        )
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name varchar(20))"))
+            conn.execute(
+                text(
+                    "CREATE TABLE orders (id INTEGER PRIMARY KEY, "
+                    "user_id INTEGER REFERENCES users(id), total REAL)"
+                )
+            )
+            conn.execute(
+                text(
+                    "CREATE TABLE refunds (order_id INTEGER REFERENCES orders, "
+                    "reason TEXT)"
+                )
+            )
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_matches_inspector_reflection(self):
+        self.assertEqual(
+            reflect_tables(self.engine), reflect_tables_with_inspector(self.engine)
+        )
+
+    def test_renders_foreign_keys(self):
+        db_schema = render_db_schema(reflect_tables(self.engine))
+
+        self.assertIn("  user_id (INTEGER) [Foreign Key: users.id]\n", db_schema)
+        self.assertIn("  order_id (INTEGER) [Foreign Key: orders.id]\n", db_schema)
+        self.assertIn("  name (VARCHAR(20))\n", db_schema)
+
+    def test_filters_tables(self):
+        tables = reflect_tables(self.engine, ["refunds"])
+
+        self.assertEqual(list(tables), ["refunds"])
+        self.assertEqual(
+            tables["refunds"]["foreign_keys"][0]["referred_column"], "id"
+        )
+        self.assertEqual(reflect_tables(self.engine, []), {})
+
+    def test_query_count_does_not_grow_with_tables(self):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(self.engine, "before_cursor_execute", listener)
+        self.addCleanup(event.remove, self.engine, "before_cursor_execute", listener)
+
+        reflect_tables(self.engine, ["users", "orders"])
+
+        self.assertEqual(len(statements), 2)
+
+    def test_unsupported_dialect_uses_inspector(self):
+        with mock.patch.object(self.engine.dialect, "name", "mssql"), mock.patch(
+            "helper.db_introspection.reflect_tables_with_inspector", return_value={}
+        ) as mock_inspector:
+            reflect_tables(self.engine)
+
+        mock_inspector.assert_called_once_with(self.engine, None)
+
+
+class TestRenderColumnType(TestCase):
+    def test_postgresql_types_match_reflection(self):
+        dialect = PGDialect_psycopg2()
+        for column_type, rendered in [
+            ("character varying(255)", "VARCHAR(255)"),
+            ("timestamp without time zone", "TIMESTAMP"),
+            ("timestamp(3) with time zone", "TIMESTAMP"),
+            ("numeric(10,2)", "NUMERIC(10, 2)"),
+            ("double precision", "DOUBLE PRECISION"),
+            ("character(3)", "CHAR(3)"),
+            ("integer", "INTEGER"),
+            ("jsonb", "JSONB"),
+            # an enum or a domain
+            ("mood", "MOOD"),
+        ]:
+            self.assertEqual(render_column_type(dialect, column_type), rendered)
+
+    def test_mysql_types_match_reflection(self):
+        dialect = MySQLDialect()
+        for column_type, rendered in [
+            ("int(11) unsigned", "INTEGER"),
+            ("bigint(20)", "BIGINT"),
+            ("varchar(255)", "VARCHAR(255)"),
+            ("decimal(10,2)", "DECIMAL(10, 2)"),
+            ("datetime(6)", "DATETIME"),
+            ("tinyint(1)", "TINYINT"),
+            ("enum('a','b')", "ENUM"),
+        ]:
+            self.assertEqual(render_column_type(dialect, column_type), rendered)
+
+    def test_unparsed_types_are_kept(self):
+        self.assertEqual(render_column_type(MySQLDialect(), None), "NULL")
+        self.assertEqual(render_column_type(MySQLDialect(), "geometry"), "GEOMETRY")
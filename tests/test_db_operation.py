@@ -1,6 +1,13 @@
+import asyncio
+import os
+import tempfile
 from unittest import TestCase, mock
 from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from api.v1 import db_operation
 from api.v1.db_operation import create_new_db, get_db_config
+from helper.db_engines import engine_registry
 from schemas.db_config import NewDBCreateRequest
 from data_response.base_response import APIResponseBase
 from sqlalchemy.orm import Session
@@ -66,3 +73,42 @@ class TestDBOperation(TestCase):
             db, current_user.uuid
         )
         mock_logger.error.assert_not_called()
+
+    def test_connection_test_does_not_keep_an_engine(self):
+        request = NewDBCreateRequest(
+            db_type="sqlite",
+            db_config={
+                "user": "",
+                "password": "",
+                "hostname": "",
+                "port": "",
+                "dbname": "test.db",
+            },
+        )
+        engines = []
+
+        def tracked_create_engine(*args, **kwargs):
+            engine = create_engine(*args, **kwargs)
+            engine.dispose = mock.Mock(wraps=engine.dispose)
+            engines.append(engine)
+            return engine
+
+        with tempfile.TemporaryDirectory() as tmp_dir, mock.patch(
+            "api.v1.db_operation.get_db_connection_string",
+            return_value=f"sqlite:///{os.path.join(tmp_dir, 'test.db')}",
+        ), mock.patch(
+            "api.v1.db_operation.create_engine", side_effect=tracked_create_engine
+        ), mock.patch.object(
+            engine_registry, "get_engine"
+        ) as get_engine:
+            result = asyncio.run(
+                db_operation.test_db_connection(
+                    request, mock.Mock(), mock.Mock(spec=Session), mock.Mock()
+                )
+            )
+
+        self.assertEqual(result.status_code, status.HTTP_200_OK)
+        get_engine.assert_not_called()
+        self.assertEqual(len(engines), 1)
+        self.assertIsInstance(engines[0].pool, NullPool)
+        engines[0].dispose.assert_called_once()
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import tempfile
+from typing import Any, Sequence
+from unittest import TestCase, mock
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.llms.openai import OpenAI
+from sqlalchemy import create_engine, text
+from api.v1 import query as query_module
+from helper.db_engines import engine_registry
+from helper.metrics import metrics
+from helper.pipelines import db_query
+from helper.pipelines.registry import PipelineRegistry
+from helper.sql_execution import SQLQueryTimeoutError
+from schemas.query import SQLResult
+from helpers import FakeChatMemory, parse_events
+
+
+class SQLStreamingLLM(OpenAI):
+    sql_query: str = ""
+    tokens: list = []
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        content = f"```sql\n{self.sql_query}\n```"
+        return ChatResponse(message=ChatMessage(role="assistant", content=content))
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self.chat(messages)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        async def gen():
+            for token in self.tokens:
+                yield ChatResponse(
+                    message=ChatMessage(role="assistant", content=token), delta=token
+                )
+
+        return gen()
+
+
+class TestStreamDBConfigPipeline(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.db_path = os.path.join(self.tmp_dir.name, "test.db")
+        engine = create_engine(f"sqlite:///{self.db_path}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+            conn.execute(
+                text("INSERT INTO users (name) VALUES (:name)"),
+                [{"name": f"user {i}"} for i in range(3)],
+            )
+        engine.dispose()
+        self.addCleanup(engine_registry.dispose_all)
+
+        self.memory = FakeChatMemory()
+        registry = PipelineRegistry()
+        registry.register("db_query", db_query.build_db_query_pipeline)
+        self.llm = SQLStreamingLLM(
+            model="gpt-4o",
+            api_key="sk-test",
+            sql_query="SELECT name FROM users ORDER BY id",
+            tokens=["<div>", "3 users", "</div>"],
+        )
+        patchers = [
+            mock.patch.object(db_query, "pipeline_registry", registry),
+            mock.patch.object(db_query, "get_chat_memory", return_value=self.memory),
+            mock.patch("helper.pipelines.registry.llm_clients.get_llm", return_value=self.llm),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stream(self) -> list:
+        async def main():
+            return [
+                event
+                async for event in db_query.astream_db_config_pipeline(
+                    "sqlite",
+                    {
+                        "user": "",
+                        "password": "",
+                        "hostname": "",
+                        "port": 0,
+                        "dbname": self.db_path,
+                    },
+                    "list the users",
+                    "chat-uuid",
+                    "gpt-4o",
+                )
+            ]
+
+        return asyncio.run(main())
+
+    def test_emits_sql_then_rows_then_tokens(self):
+        events = self.stream()
+
+        self.assertEqual(
+            [name for name, _ in events],
+            ["sql", "result", "token", "token", "token", "response"],
+        )
+        self.assertEqual(
+            events[0][1]["sql_query"].strip(), "SELECT name FROM users ORDER BY id"
+        )
+        self.assertIsInstance(events[1][1], SQLResult)
+        self.assertEqual(events[1][1].rows, [["user 0"], ["user 1"], ["user 2"]])
+        self.assertEqual(events[-1][1], "<div>3 users</div>")
+
+        self.assertEqual(
+            [(m.role.value, m.content) for m in self.memory.messages],
+            [("user", "list the users"), ("assistant", "<div>3 users</div>")],
+        )
+        observations = metrics.snapshot()["observations"]
+        for name in [
+            "db_query_time_to_sql_seconds",
+            "db_query_time_to_result_seconds",
+            "db_query_time_to_first_token_seconds",
+            "db_query_sql_result_tool_seconds",
+        ]:
+            self.assertIn(name, observations)
+
+    def test_failed_stage_stops_the_stream(self):
+        self.llm.sql_query = "SELECT * FROM missing"
+
+        with self.assertRaises(Exception):
+            self.stream()
+
+        self.assertEqual(self.memory.messages, [])
+
+
+class TestQueryDBStreamRoute(TestCase):
+    def respond(self, stream):
+        request = mock.Mock(query="list the users", chat_uuid="chat-uuid", model="gpt-4o")
+        request.data_source_id = 1
+        current_user = mock.Mock(uuid="customer")
+        db_config = mock.Mock(customer_uuid="customer", db_type="sqlite", db_config={}, id=1)
+
+        async def main():
+            with mock.patch.object(
+                query_module, "astream_db_config_pipeline", stream
+            ), mock.patch.object(
+                query_module.ChatHistoryQuery, "is_valid_chat_history", return_value=True
+            ), mock.patch.object(
+                query_module.DBConfigQuery, "get_db_config_by_id", return_value=db_config
+            ):
+                response = await query_module.query_db_stream(
+                    request, mock.Mock(), current_user=current_user, db=mock.Mock()
+                )
+                return "".join([chunk async for chunk in response.body_iterator])
+
+        return parse_events(asyncio.run(main()))
+
+    def test_sends_stage_events(self):
+        sql_result = SQLResult(columns=["name"], rows=[["user 0"]])
+
+        async def stream(*args, **kwargs):
+            yield "sql", {"sql_query": "SELECT name FROM users", "cost_estimate": None}
+            yield "result", sql_result
+            yield "token", "<div>1 user</div>"
+            yield "response", "<div>1 user</div>"
+
+        events = self.respond(stream)
+
+        self.assertEqual([name for name, _ in events], ["sql", "result", "token", "done"])
+        self.assertEqual(events[1][1]["rows"], [["user 0"]])
+        self.assertEqual(events[3][1]["sql_query"], "SELECT name FROM users")
+        self.assertEqual(events[3][1]["sql_result"]["rows"], [["user 0"]])
+
+    def test_sends_error_event(self):
+        async def stream(*args, **kwargs):
+            yield "sql", {"sql_query": "SELECT 1", "cost_estimate": None}
+            raise SQLQueryTimeoutError("timeout")
+
+        events = self.respond(stream)
+
+        self.assertEqual(events[-1][0], "error")
+        self.assertIn("took too long", events[-1][1]["message"])
@@ -0,0 +1,142 @@
+import asyncio
+import io
+import tempfile
+from unittest import TestCase, mock
+from fastapi import status
+from helper import downloads
+from helper.downloads import (
+    RangeNotSatisfiableError,
+    create_download_response,
+    get_content_disposition,
+    parse_range,
+)
+from helper.s3_cache import S3ObjectCache
+
+
+CONTENT = b"id,name\n" + b"".join(f"{i},name {i}\n".encode() for i in range(100))
+
+
+class FakeBody:
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+        self.closed = False
+
+    def iter_chunks(self, chunk_size):
+        while chunk := self.stream.read(chunk_size):
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def read_body(response) -> bytes:
+    async def read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(read())
+
+
+class TestParseRange(TestCase):
+    def test_ranges(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=90-200", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-200", 100), (0, 99))
+
+    def test_ignores_unsupported_ranges(self):
+        self.assertIsNone(parse_range("bytes=0-9,20-29", 100))
+        self.assertIsNone(parse_range("items=0-9", 100))
+        self.assertIsNone(parse_range("bytes=9-0", 100))
+
+    def test_unsatisfiable_ranges(self):
+        with self.assertRaises(RangeNotSatisfiableError):
+            parse_range("bytes=100-", 100)
+        with self.assertRaises(RangeNotSatisfiableError):
+            parse_range("bytes=-0", 100)
+
+    def test_content_disposition(self):
+        self.assertEqual(get_content_disposition("a.csv"), 'attachment; filename="a.csv"')
+        self.assertEqual(
+            get_content_disposition("ventes é.csv"),
+            "attachment; filename*=utf-8''ventes%20%C3%A9.csv",
+        )
+
+
+class TestCreateDownloadResponse(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = S3ObjectCache(root_dir=self.tmp_dir.name)
+        self.bodies = []
+
+        for patcher in [
+            mock.patch.object(downloads, "s3_object_cache", self.cache),
+            mock.patch.object(
+                downloads,
+                "get_s3_obj_info",
+                return_value={"etag": "etag", "size": len(CONTENT)},
+            ),
+            mock.patch.object(downloads, "get_s3_obj_body", side_effect=self.get_body),
+            mock.patch.object(downloads.Config, "DOWNLOAD_CHUNK_SIZE", 64),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_body(self, key, byte_range=None, etag=None):
+        start, end = byte_range or (0, len(CONTENT) - 1)
+        self.bodies.append(FakeBody(CONTENT[start : end + 1]))
+        return self.bodies[-1]
+
+    def test_streams_from_s3(self):
+        response = create_download_response("uuid/csv/a.csv", "a.csv")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["content-length"], str(len(CONTENT)))
+        self.assertEqual(response.headers["accept-ranges"], "bytes")
+        self.assertEqual(read_body(response), CONTENT)
+        self.assertTrue(self.bodies[0].closed)
+
+    def test_range_request(self):
+        response = create_download_response("uuid/csv/a.csv", "a.csv", "bytes=10-19")
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response.headers["content-range"], f"bytes 10-19/{len(CONTENT)}")
+        self.assertEqual(read_body(response), CONTENT[10:20])
+
+    def test_unsatisfiable_range(self):
+        response = create_download_response("uuid/csv/a.csv", "a.csv", "bytes=5000-")
+
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(self.bodies, [])
+
+    @mock.patch("helper.s3_cache.download_from_s3")
+    def test_streams_cached_file(self, mock_download):
+        def write_file(key, output_path, etag=None):
+            with open(output_path, "wb") as f:
+                f.write(CONTENT)
+            return True
+
+        mock_download.side_effect = write_file
+        self.cache.get_path("uuid/csv/a.csv", "etag")
+
+        response = create_download_response("uuid/csv/a.csv", "a.csv", "bytes=-5")
+
+        self.assertEqual(read_body(response), CONTENT[-5:])
+        self.assertEqual(self.bodies, [])
+
+    @mock.patch.object(downloads, "get_s3_presigned_url", return_value="https://signed")
+    def test_redirect(self, mock_presign):
+        with mock.patch.object(downloads.Config, "DOWNLOAD_REDIRECT", True):
+            response = create_download_response("uuid/csv/a.csv", "a.csv")
+
+        self.assertEqual(response.status_code, status.HTTP_307_TEMPORARY_REDIRECT)
+        self.assertEqual(response.headers["location"], "https://signed")
+        self.assertEqual(self.bodies, [])
+
+    def test_missing_object(self):
+        with mock.patch.object(downloads, "get_s3_obj_info", return_value=None):
+            self.assertIsNone(create_download_response("uuid/csv/a.csv", "a.csv"))
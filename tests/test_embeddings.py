@@ -0,0 +1,230 @@
+import os
+import shutil
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import TestCase, mock
+import chromadb
+import httpx
+import openai
+from helper import openai as openai_module
+from helper.embeddings import (
+    EmbeddingRateLimiter,
+    embed_texts,
+    get_retry_after,
+    parse_duration,
+)
+from helper.metrics import metrics
+from helper.vector_store import CollectionCache, parse_embedding_path
+
+
+class FakeRawResponse:
+    def __init__(self, texts, headers):
+        self.texts = texts
+        self.headers = headers
+
+    def parse(self):
+        # out of order on purpose, the api returns an index per embedding
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text)), float(i)])
+            for i, text in reversed(list(enumerate(self.texts)))
+        ]
+        return SimpleNamespace(
+            data=data, usage=SimpleNamespace(total_tokens=sum(len(t) for t in self.texts))
+        )
+
+
+class FakeEmbeddingsClient:
+    def __init__(self, rate_limited_calls=0, headers=None):
+        self.rate_limited_calls = rate_limited_calls
+        self.headers = headers or {}
+        self.calls = []
+        self.lock = threading.Lock()
+        self.embeddings = SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self.create)
+        )
+
+    def create(self, input, model):
+        with self.lock:
+            self.calls.append(list(input))
+            if self.rate_limited_calls:
+                self.rate_limited_calls -= 1
+                response = httpx.Response(
+                    429,
+                    headers={"retry-after-ms": "5"},
+                    request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"),
+                )
+                raise openai.RateLimitError("rate limited", response=response, body=None)
+        return FakeRawResponse(input, self.headers)
+
+
+class TestEmbedTexts(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_batches_keep_order(self):
+        client = FakeEmbeddingsClient()
+        texts = [f"text {i}" * (i + 1) for i in range(7)]
+
+        embeddings, tokens = embed_texts(texts, client=client, batch_size=3, concurrency=2)
+
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual([embedding[0] for embedding in embeddings], [len(t) for t in texts])
+        self.assertEqual(tokens, sum(len(t) for t in texts))
+
+    def test_retries_rate_limited_requests(self):
+        client = FakeEmbeddingsClient(rate_limited_calls=2)
+
+        embeddings, _ = embed_texts(["a", "b"], client=client, batch_size=1, concurrency=1)
+
+        self.assertEqual(len(embeddings), 2)
+        self.assertEqual(len(client.calls), 4)
+        self.assertEqual(metrics.snapshot()["counters"]["embedding_rate_limited"], 2)
+
+    def test_gives_up_after_max_retries(self):
+        client = FakeEmbeddingsClient(rate_limited_calls=5)
+
+        with self.assertRaises(openai.RateLimitError):
+            embed_texts(["a"], client=client, max_retries=1)
+
+    def test_empty_input(self):
+        self.assertEqual(embed_texts([], client=FakeEmbeddingsClient()), ([], 0))
+
+
+class TestRateLimitHeaders(TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("1s"), 1)
+        self.assertEqual(parse_duration("6m0s"), 360)
+        self.assertAlmostEqual(parse_duration("20ms"), 0.02)
+        self.assertEqual(parse_duration("2.5"), 2.5)
+        self.assertIsNone(parse_duration("soon"))
+
+    def test_get_retry_after(self):
+        self.assertAlmostEqual(get_retry_after({"retry-after-ms": "250"}), 0.25)
+        self.assertEqual(get_retry_after({"retry-after": "3"}), 3)
+        self.assertEqual(
+            get_retry_after(
+                {"x-ratelimit-reset-requests": "1s", "x-ratelimit-reset-tokens": "2s"}
+            ),
+            2,
+        )
+        self.assertIsNone(get_retry_after({}))
+
+    def test_pauses_when_token_budget_runs_out(self):
+        rate_limiter = EmbeddingRateLimiter()
+
+        with mock.patch.object(rate_limiter, "pause") as pause:
+            rate_limiter.update(
+                {
+                    "x-ratelimit-remaining-requests": "100",
+                    "x-ratelimit-remaining-tokens": "500",
+                    "x-ratelimit-reset-tokens": "3s",
+                },
+                reserve_tokens=1000,
+            )
+            rate_limiter.update(
+                {"x-ratelimit-remaining-requests": "100", "x-ratelimit-remaining-tokens": "5000"},
+                reserve_tokens=1000,
+            )
+
+        pause.assert_called_once_with(3)
+
+
+class TestCreateDocumentEmbedding(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.document_path = os.path.join(self.tmp_dir.name, "notes.txt")
+        self.client = FakeEmbeddingsClient()
+
+        chroma_path = os.path.join(self.tmp_dir.name, "chroma")
+        patchers = [
+            mock.patch.object(openai_module.Config, "CHROMA_DB_PATH", chroma_path),
+            mock.patch.object(openai_module, "collection_cache", CollectionCache()),
+            mock.patch.object(
+                openai_module,
+                "embed_texts",
+                lambda texts: embed_texts(texts, client=self.client, batch_size=2),
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.chroma = chromadb.PersistentClient(path=chroma_path)
+
+    def write_document(self, paragraphs):
+        # paragraphs that fill most of a chunk, so that every one becomes its own chunk
+        with open(self.document_path, "w") as f:
+            f.write("\n\n".join(f"{p} " * 900 for p in paragraphs))
+
+    def embedded_texts(self):
+        return [text for call in self.client.calls for text in call]
+
+    def test_reembeds_only_changed_chunks(self):
+        self.write_document(["alpha", "beta", "gamma"])
+        name = openai_module.create_document_embedding(self.document_path, "customer")
+        collection = self.chroma.get_collection(name)
+        first_ids = set(collection.get(include=[])["ids"])
+        first_count = len(self.embedded_texts())
+        self.assertEqual(len(first_ids), first_count)
+
+        self.client.calls.clear()
+        openai_module.create_document_embedding(self.document_path, "customer")
+        self.assertEqual(self.embedded_texts(), [])
+
+        self.write_document(["alpha", "beta", "delta"])
+        openai_module.create_document_embedding(self.document_path, "customer")
+        changed = self.embedded_texts()
+        self.assertTrue(changed)
+        self.assertLess(len(changed), first_count)
+        self.assertTrue(all("gamma" not in text for text in changed))
+
+        ids = set(collection.get(include=[])["ids"])
+        self.assertEqual(len(ids), first_count)
+        self.assertEqual(len(ids - first_ids), len(changed))
+        self.assertGreater(metrics.snapshot()["counters"]["embedding_chunks_reused"], 0)
+
+    def test_same_file_from_another_directory_is_not_reembedded(self):
+        self.write_document(["alpha", "beta"])
+        name = openai_module.create_document_embedding(self.document_path, "customer")
+        ids = set(self.chroma.get_collection(name).get(include=[])["ids"])
+
+        # ingestion reads every upload from a fresh temporary directory
+        with tempfile.TemporaryDirectory() as other_dir:
+            other_path = os.path.join(other_dir, "notes.txt")
+            shutil.copy(self.document_path, other_path)
+            self.client.calls.clear()
+            openai_module.create_document_embedding(other_path, "customer")
+
+        self.assertEqual(self.embedded_texts(), [])
+        self.assertEqual(set(self.chroma.get_collection(name).get(include=[])["ids"]), ids)
+
+    def test_shared_layout_filters_by_document(self):
+        self.write_document(["alpha", "beta"])
+        first = openai_module.create_document_embedding(
+            self.document_path, "customer", document_id=1, layout="shared"
+        )
+        self.write_document(["gamma"])
+        second = openai_module.create_document_embedding(
+            self.document_path, "other", document_id=2, layout="shared"
+        )
+
+        collection_name, document_key = parse_embedding_path(first)
+        self.assertEqual(collection_name, parse_embedding_path(second)[0])
+        collection = self.chroma.get_collection(collection_name)
+        chunks = collection.get(where={"document_key": document_key}, include=["metadatas"])
+        self.assertEqual(len(chunks["ids"]), 2)
+        self.assertTrue(all(m["customer_uuid"] == "customer" for m in chunks["metadatas"]))
+        self.assertEqual(collection.count(), 3)
+
+        # the tenant metadata is not part of the embedded text
+        self.assertTrue(all("customer" not in text for text in self.embedded_texts()))
+
+        self.client.calls.clear()
+        self.write_document(["alpha", "beta"])
+        openai_module.create_document_embedding(
+            self.document_path, "customer", document_id=3, layout="shared"
+        )
+        self.assertEqual(self.embedded_texts(), [])
+        self.assertEqual(collection.count(), 3)
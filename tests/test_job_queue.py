@@ -0,0 +1,249 @@
+import asyncio
+from unittest import TestCase, mock
+import pandas as pd
+from helper import ingestion
+from helper.ingestion import ingest_document, profile_document
+from helper.job_queue import JobQueue
+from helper.job_worker import JobWorker
+from helper.metrics import metrics
+from helpers import ListRedis
+
+
+class TestJobQueue(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.redis = ListRedis()
+        self.queue = JobQueue(
+            "test", redis_client=self.redis, visibility_timeout=60, retry_backoff=0
+        )
+
+    def test_enqueue_reserve_complete(self):
+        job = self.queue.enqueue("echo", {"value": 1})
+
+        self.assertEqual(self.queue.depth(), {"ready": 1, "delayed": 0, "running": 0})
+        reserved = self.queue.reserve(0)
+        self.assertEqual(reserved.id, job.id)
+        self.assertEqual(reserved.attempts, 1)
+        self.assertEqual(reserved.status, "running")
+        self.assertEqual(self.queue.depth(), {"ready": 0, "delayed": 0, "running": 1})
+
+        self.queue.complete(reserved)
+
+        self.assertEqual(self.queue.get(job.id).status, "succeeded")
+        self.assertEqual(self.queue.depth(), {"ready": 0, "delayed": 0, "running": 0})
+        self.assertIsNone(self.queue.reserve(0))
+        self.assertEqual(metrics.snapshot()["counters"]["test_jobs_succeeded"], 1)
+
+    def test_jobs_are_reserved_in_order(self):
+        first = self.queue.enqueue("echo", {})
+        second = self.queue.enqueue("echo", {})
+
+        self.assertEqual(self.queue.reserve(0).id, first.id)
+        self.assertEqual(self.queue.reserve(0).id, second.id)
+
+    def test_failed_job_is_retried_until_out_of_attempts(self):
+        job = self.queue.enqueue("echo", {}, max_attempts=2)
+
+        self.assertTrue(self.queue.fail(self.queue.reserve(0), "boom"))
+        self.assertEqual(self.queue.get(job.id).status, "retrying")
+        retried = self.queue.reserve(0)
+        self.assertEqual(retried.attempts, 2)
+
+        self.assertFalse(self.queue.fail(retried, "boom again"))
+        failed = self.queue.get(job.id)
+        self.assertEqual(failed.status, "failed")
+        self.assertEqual(failed.error, "boom again")
+        self.assertIsNone(self.queue.reserve(0))
+
+    def test_enqueue_with_existing_id_returns_existing_job(self):
+        job = self.queue.enqueue("echo", {"value": 1}, job_id="same")
+
+        duplicate = self.queue.enqueue("echo", {"value": 2}, job_id="same")
+
+        self.assertEqual(duplicate.id, job.id)
+        self.assertEqual(duplicate.payload, {"value": 1})
+        self.assertEqual(self.queue.depth()["ready"], 1)
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["test_jobs_enqueued"], 1)
+        self.assertEqual(counters["test_jobs_deduplicated"], 1)
+
+    def test_retry_waits_for_backoff(self):
+        self.queue.retry_backoff = 60
+        self.queue.enqueue("echo", {}, max_attempts=2)
+
+        self.queue.fail(self.queue.reserve(0), "boom")
+
+        self.assertIsNone(self.queue.reserve(0))
+        self.assertEqual(self.queue.depth()["delayed"], 1)
+
+    def test_retry_delay_grows_exponentially(self):
+        self.queue.retry_backoff = 10
+        self.queue.retry_backoff_max = 25
+
+        with mock.patch("helper.job_queue.random.uniform", return_value=1):
+            delays = [self.queue.get_retry_delay(attempts) for attempts in (1, 2, 3)]
+
+        self.assertEqual(delays, [10, 20, 25])
+
+    def test_expired_lease_is_requeued(self):
+        job = self.queue.enqueue("echo", {}, max_attempts=2)
+        self.queue.reserve(0)
+
+        with mock.patch("helper.job_queue.time.time", return_value=10**12):
+            self.assertEqual(self.queue.requeue_expired(), 1)
+            self.assertEqual(self.queue.get(job.id).status, "retrying")
+            self.assertEqual(self.queue.reserve(0).attempts, 2)
+
+
+class TestJobWorker(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.queue = JobQueue("test", redis_client=ListRedis(), retry_backoff=0)
+
+    def test_runs_handler(self):
+        calls = []
+        worker = JobWorker(self.queue, {"echo": lambda job: calls.append(job.payload)})
+        job = self.queue.enqueue("echo", {"value": 1})
+
+        self.assertTrue(worker.run_once(0))
+
+        self.assertEqual(calls, [{"value": 1}])
+        self.assertEqual(self.queue.get(job.id).status, "succeeded")
+        self.assertIsNone(worker.run_once(0))
+
+    def test_failing_handler_fails_job(self):
+        def fail(job):
+            raise ValueError("bad input")
+
+        worker = JobWorker(self.queue, {"echo": fail})
+        job = self.queue.enqueue("echo", {}, max_attempts=1)
+
+        self.assertFalse(worker.run_once(0))
+
+        failed = self.queue.get(job.id)
+        self.assertEqual(failed.status, "failed")
+        self.assertEqual(failed.error, "ValueError: bad input")
+
+    def test_coroutine_handlers_share_one_event_loop(self):
+        loops = []
+
+        async def echo(job):
+            loops.append(asyncio.get_running_loop())
+            job.result = job.payload
+
+        worker = JobWorker(self.queue, {"echo": echo})
+        first = self.queue.enqueue("echo", {"value": 1})
+        self.queue.enqueue("echo", {"value": 2})
+
+        self.assertTrue(worker.run_once(0))
+        self.assertTrue(worker.run_once(0))
+
+        self.assertEqual(len(loops), 2)
+        self.assertIs(loops[0], loops[1])
+        self.assertEqual(self.queue.get(first.id).result, {"value": 1})
+
+    def test_unknown_job_type_is_not_retried(self):
+        worker = JobWorker(self.queue, {})
+        job = self.queue.enqueue("unknown", {}, max_attempts=3)
+
+        self.assertFalse(worker.run_once(0))
+
+        self.assertEqual(self.queue.get(job.id).status, "failed")
+
+
+class TestIngestion(TestCase):
+    def setUp(self):
+        self.queue = JobQueue("ingestion", redis_client=ListRedis(), retry_backoff=0)
+        self.db = mock.MagicMock()
+        self.user_doc = mock.MagicMock(id=1)
+        self.calls = []
+        self.fail_step = None
+
+        def make_step(name):
+            def step(db, user_doc):
+                if name == self.fail_step:
+                    raise RuntimeError(f"{name} failed")
+                self.calls.append(name)
+
+            return step
+
+        patchers = [
+            mock.patch.object(ingestion, "ingestion_queue", self.queue),
+            mock.patch.object(ingestion, "SessionLocal", return_value=self.db),
+            mock.patch.object(
+                ingestion,
+                "INGESTION_STEPS",
+                {name: make_step(name) for name in ("columnar", "profile", "embedding")},
+            ),
+            mock.patch.object(
+                ingestion.Config, "INGESTION_STEPS", ["columnar", "profile", "embedding"]
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        query_patcher = mock.patch.object(ingestion, "UserDocumentQuery")
+        self.query = query_patcher.start()
+        self.addCleanup(query_patcher.stop)
+        self.query.get_user_document_by_id.return_value = self.user_doc
+
+    def statuses(self):
+        return [c.args[2] for c in self.query.update_ingestion_status.call_args_list]
+
+    def test_runs_steps_in_order(self):
+        job = self.queue.enqueue(ingestion.INGEST_DOCUMENT_JOB, {"document_id": 1})
+
+        ingest_document(self.queue.reserve(0))
+
+        self.assertEqual(self.calls, ["columnar", "profile", "embedding"])
+        self.assertEqual(self.statuses(), ["processing", "ready"])
+        self.assertEqual(
+            self.queue.get(job.id).payload["completed_steps"],
+            ["columnar", "profile", "embedding"],
+        )
+
+    def test_retry_resumes_after_completed_steps(self):
+        self.queue.enqueue(ingestion.INGEST_DOCUMENT_JOB, {"document_id": 1}, max_attempts=2)
+        self.fail_step = "embedding"
+
+        job = self.queue.reserve(0)
+        with self.assertRaises(RuntimeError):
+            ingest_document(job)
+        self.queue.fail(job, "embedding failed")
+        self.assertEqual(self.statuses()[-1], "retrying")
+
+        self.fail_step = None
+        self.calls.clear()
+        ingest_document(self.queue.reserve(0))
+
+        self.assertEqual(self.calls, ["embedding"])
+        self.assertEqual(self.statuses()[-1], "ready")
+
+    def test_skips_deleted_document(self):
+        self.query.get_user_document_by_id.return_value = None
+        self.queue.enqueue(ingestion.INGEST_DOCUMENT_JOB, {"document_id": 1})
+
+        ingest_document(self.queue.reserve(0))
+
+        self.assertEqual(self.calls, [])
+        self.query.update_ingestion_status.assert_not_called()
+
+
+class TestProfileDocument(TestCase):
+    def test_profiles_columns(self):
+        df = pd.DataFrame({"id": [1, 2, None], "name": ["a", "b", "b"]})
+
+        profile = profile_document(df)
+
+        self.assertEqual(profile["rows"], 3)
+        id_column, name_column = profile["columns"]
+        self.assertEqual(id_column["nulls"], 1)
+        self.assertEqual((id_column["min"], id_column["max"]), (1.0, 2.0))
+        self.assertEqual(name_column["distinct"], 2)
+        self.assertNotIn("min", name_column)
+
+    def test_profiles_every_sheet(self):
+        profile = profile_document({"Sheet1": pd.DataFrame({"id": [1]})})
+
+        self.assertEqual(profile["sheets"]["Sheet1"]["rows"], 1)
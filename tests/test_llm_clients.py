@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+from helper import llm_clients as llm_clients_module
+from helper.llm_clients import LLMClientRegistry
+from helper.metrics import metrics
+
+
+class ChatCompletionHandler(BaseHTTPRequestHandler):
+    # keep the connection open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(
+            {
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4o",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "hello"},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLLMClientRegistry(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ChatCompletionHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/v1"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        metrics.reset()
+        patcher = mock.patch.object(llm_clients_module.Config, "OPENAI_API_KEY", "sk-test")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = LLMClientRegistry(max_connections=4, max_keepalive_connections=2)
+        self.addCleanup(self.registry.clear)
+
+    def complete(self, client):
+        return client.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "hi"}]
+        )
+
+    def test_reuses_connections(self):
+        client = self.registry.get_openai_client(base_url=self.base_url)
+        for _ in range(3):
+            self.assertEqual(self.complete(client).choices[0].message.content, "hello")
+
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["llm_http_requests"], 3)
+        self.assertEqual(counters["llm_http_connections_opened"], 1)
+
+    def test_reuses_async_connections(self):
+        client = self.registry.get_async_openai_client(base_url=self.base_url)
+
+        async def main():
+            for _ in range(3):
+                await self.complete(client)
+            await self.registry.get_async_http_client().aclose()
+
+        asyncio.run(main())
+
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["llm_http_requests"], 3)
+        self.assertEqual(counters["llm_http_connections_opened"], 1)
+
+    def test_clients_share_the_http_pool(self):
+        first = self.registry.get_openai_client(base_url=self.base_url)
+        second = self.registry.get_openai_client(base_url=self.base_url, max_retries=0)
+        self.assertIsNot(first, second)
+        self.complete(first)
+        self.complete(second)
+
+        self.assertEqual(metrics.snapshot()["counters"]["llm_http_connections_opened"], 1)
+
+    def test_llms_are_keyed_by_model_and_parameters(self):
+        llm = self.registry.get_llm("gpt-4o", temperature=0.0, top_p=0.2)
+
+        self.assertIs(self.registry.get_llm("gpt-4o", top_p=0.2, temperature=0.0), llm)
+        self.assertIsNot(self.registry.get_llm("gpt-4o", temperature=0.5), llm)
+        self.assertIsNot(self.registry.get_llm("gpt-3.5-turbo-0125"), llm)
+        self.assertIs(llm._http_client, self.registry.get_http_client())
+        self.assertIs(llm._async_http_client, self.registry.get_async_http_client())
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["llm_client_cache_hits"], 1)
+        self.assertEqual(counters["llm_client_cache_misses"], 3)
+
+    def test_embed_model_uses_both_pools(self):
+        embed_model = self.registry.get_embed_model("text-embedding-3-large")
+
+        self.assertIs(self.registry.get_embed_model("text-embedding-3-large"), embed_model)
+        self.assertIs(embed_model._http_client, self.registry.get_http_client())
+        self.assertIs(
+            embed_model._get_aclient()._client, self.registry.get_async_http_client()
+        )
+
+    def test_clear_closes_the_pool(self):
+        http_client = self.registry.get_http_client()
+        llm = self.registry.get_llm("gpt-4o")
+
+        self.registry.clear()
+
+        self.assertTrue(http_client.is_closed)
+        self.assertIsNot(self.registry.get_llm("gpt-4o"), llm)
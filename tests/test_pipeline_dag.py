@@ -0,0 +1,190 @@
+import asyncio
+import time
+from typing import Any, Sequence
+from unittest import TestCase, mock
+import pandas as pd
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.core.query_pipeline import FunctionComponent, InputComponent, QueryPipeline
+from llama_index.llms.openai import OpenAI
+from helper.code_sandbox import CodeSandbox
+from helper.metrics import metrics
+from helper.pipelines import chart_query
+from helper.pipelines.chart_helper import components
+from helper.pipelines.dag import arun_pipeline_dag
+
+
+def build_diamond_pipeline(delay: float, events: list) -> QueryPipeline:
+    def stage(name: str):
+        async def run(value: Any) -> Any:
+            events.append(f"{name} started")
+            await asyncio.sleep(delay)
+            return f"{name}({value})"
+
+        return FunctionComponent(fn=lambda value: None, async_fn=run, output_key="output")
+
+    async def join(left: Any, right: Any) -> Any:
+        return f"{left}+{right}"
+
+    p = QueryPipeline()
+    p.add_modules(
+        {
+            "input": InputComponent(),
+            "left": stage("left"),
+            "right": stage("right"),
+            "join": FunctionComponent(
+                fn=lambda left, right: None, async_fn=join, output_key="output"
+            ),
+        }
+    )
+    p.add_link("input", "left", src_key="fast", dest_key="value")
+    p.add_link("input", "right", src_key="slow", dest_key="value")
+    p.add_link("left", "join", src_key="output", dest_key="left")
+    p.add_link("right", "join", src_key="output", dest_key="right")
+    return p
+
+
+class TestArunPipelineDag(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_independent_branches_overlap(self):
+        events = []
+        p = build_diamond_pipeline(0.2, events)
+
+        async def slow_input():
+            await asyncio.sleep(0.1)
+            events.append("slow input loaded")
+            return "slow"
+
+        start = time.perf_counter()
+        output, intermediates = asyncio.run(
+            arun_pipeline_dag(p, "diamond", fast="fast", slow=slow_input())
+        )
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(output, "left(fast)+right(slow)")
+        # the left branch ran while the slow input loaded, and while the right one ran
+        self.assertEqual(events, ["left started", "slow input loaded", "right started"])
+        self.assertLess(elapsed, 0.45)
+        self.assertEqual(intermediates["right"].inputs, {"value": "slow"})
+        self.assertEqual(intermediates["input"].outputs, {"fast": "fast", "slow": "slow"})
+
+        observations = metrics.snapshot()["observations"]
+        for name in ["left", "right", "join", "dag"]:
+            self.assertIn(f"diamond_{name}_seconds", observations)
+        self.assertGreater(observations["diamond_dag_parallelism"]["last"], 1)
+
+    def test_failure_cancels_running_modules(self):
+        events = []
+        p = build_diamond_pipeline(5, events)
+
+        async def failing_input():
+            raise RuntimeError("download failed")
+
+        async def main():
+            with self.assertRaises(RuntimeError):
+                await arun_pipeline_dag(p, "diamond", fast="fast", slow=failing_input())
+            return [
+                task
+                for task in asyncio.all_tasks()
+                if task is not asyncio.current_task() and not task.done()
+            ]
+
+        start = time.perf_counter()
+        self.assertEqual(asyncio.run(main()), [])
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_several_leaves_are_rejected(self):
+        p = build_diamond_pipeline(0, [])
+        p.add_modules({"extra": FunctionComponent(fn=lambda value: value)})
+        p.add_link("input", "extra", src_key="fast", dest_key="value")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(arun_pipeline_dag(p, "diamond", fast="fast", slow="slow"))
+
+
+class ChartLLM(OpenAI):
+    """Answers every chart prompt after a delay, as the OpenAI api would."""
+
+    delay: float = 0.1
+    prompts: list = []
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        prompt = messages[-1].content
+        self.prompts.append((time.perf_counter(), len(messages), prompt))
+        await asyncio.sleep(self.delay)
+        if "pick the best chart type" in prompt:
+            content = '```json\n{"chart_type": "bar"}\n```'
+        elif "python code" in prompt:
+            content = (
+                "```python\nchart_data = [{'name': str(r['city']), "
+                "'values': {'sales': float(r['sales'])}} for _, r in df.iterrows()]\n```"
+            )
+        else:
+            content = '```json\n{"caption": "Sales by city"}\n```'
+        return ChatResponse(message=ChatMessage(role="assistant", content=content))
+
+
+class TestChartQueryDag(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # the worker is forked up front, as the app does on startup
+        cls.sandbox = CodeSandbox(workers=1)
+        cls.sandbox.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sandbox.shutdown()
+
+    def setUp(self):
+        patcher = mock.patch.object(components, "code_sandbox", self.sandbox)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_caption_overlaps_the_data_generation(self):
+        metrics.reset()
+        llm = ChartLLM(model="gpt-4o", api_key="sk-test", prompts=[])
+        p = chart_query.build_chart_query_pipeline(llm)
+        df = pd.DataFrame({"city": ["Paris", "Rome"], "sales": [3, 4]})
+        chat_history = [ChatMessage(role="user", content="earlier question")]
+
+        async def load_df():
+            await asyncio.sleep(0.1)
+            return df
+
+        async def main():
+            df_task = asyncio.ensure_future(load_df())
+
+            async def data_schema():
+                return f"{(await df_task).head()}"
+
+            return await arun_pipeline_dag(
+                p,
+                "chart_query",
+                query_str="sales by city",
+                chat_history=chat_history,
+                data_schema=data_schema(),
+                df=df_task,
+                current_time="2024-01-01 00:00:00",
+            )
+
+        start = time.perf_counter()
+        result, intermediates = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+
+        self.assertIn("Sales by city", result.message.content)
+        self.assertEqual(
+            intermediates["chart_validator_tool_component"].outputs["validated_chart_data"],
+            [
+                {"name": "Paris", "values": {"sales": 3.0}},
+                {"name": "Rome", "values": {"sales": 4.0}},
+            ],
+        )
+        # the caption prompt was sent first, while the dataframe loaded
+        self.assertIn("generate caption", llm.prompts[0][2])
+        self.assertLess(llm.prompts[0][0] - start, 0.05)
+        # load, chart type and code generation are on the critical path, not the caption
+        self.assertLess(elapsed, 0.38)
+        # every prompt extends the chat history without changing it for the others
+        self.assertEqual([count for _, count, _ in llm.prompts], [2, 2, 2])
+        self.assertEqual(len(chat_history), 1)
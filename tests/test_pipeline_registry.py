@@ -0,0 +1,94 @@
+from typing import Any, Sequence
+from unittest import TestCase, mock
+import pandas as pd
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.llms.openai import OpenAI
+from helper.metrics import metrics
+from helper.pipelines import registry as registry_module
+from helper.pipelines.csv_query import get_csv_query_inputs
+from helper.pipelines.excel_query import get_excel_query_inputs
+from helper.pipelines.registry import PipelineRegistry, pipeline_registry
+
+# importing the pipelines registers them
+import helper.pipelines.chart_query  # noqa: F401
+import helper.pipelines.db_query  # noqa: F401
+import helper.pipelines.simple_chat  # noqa: F401
+
+
+class ExpressionLLM(OpenAI):
+    """Answers every prompt with the same pandas expression."""
+
+    expression: str = ""
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return ChatResponse(message=ChatMessage(role="assistant", content=self.expression))
+
+
+class TestPipelineRegistry(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.registry = PipelineRegistry()
+        for name in pipeline_registry.names:
+            self.registry.register(name, pipeline_registry._builders[name])
+        self.expression = "df['amount'].sum()"
+        patcher = mock.patch.object(
+            registry_module.llm_clients,
+            "get_llm",
+            side_effect=lambda *args, **kwargs: ExpressionLLM(
+                model="gpt-4o", api_key="sk-test", expression=self.expression
+            ),
+        )
+        self.get_llm = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_all_pipelines_are_registered(self):
+        self.assertEqual(
+            set(self.registry.names),
+            {"csv_query", "excel_query", "db_query", "simple_chat", "chart_query"},
+        )
+        for name in self.registry.names:
+            self.assertIsNotNone(self.registry.get(name, "gpt-4o"))
+
+    def test_builds_each_pipeline_once(self):
+        pipeline = self.registry.get("db_query", "gpt-4o", temperature=0.0, top_p=0.2)
+
+        self.assertIs(
+            self.registry.get("db_query", "gpt-4o", top_p=0.2, temperature=0.0), pipeline
+        )
+        self.assertIsNot(self.registry.get("db_query", "gpt-4o-mini"), pipeline)
+        self.assertEqual(self.get_llm.call_count, 2)
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["pipeline_cache_hits"], 1)
+        self.assertEqual(counters["pipeline_cache_misses"], 2)
+        self.assertIn("db_query_pipeline_build_seconds", metrics.snapshot()["observations"])
+
+    def test_unknown_pipeline(self):
+        with self.assertRaises(KeyError):
+            self.registry.get("unknown")
+
+    def test_dataframes_are_run_inputs(self):
+        pipeline = self.registry.get("csv_query", "gpt-4o")
+
+        outputs = []
+        for amounts in ([1, 2], [10, 20, 30]):
+            df = pd.DataFrame({"amount": amounts})
+            _, intermediates = pipeline.run_with_intermediates(
+                query_str="total amount?", chat_history=[], **get_csv_query_inputs(df)
+            )
+            outputs.append(intermediates["pandas_output_parser"].outputs["output"])
+            prompt = intermediates["pandas_prompt"].outputs["prompt"]
+            self.assertIn(str(df.head(5)), prompt)
+
+        self.assertEqual(outputs, ["3", "60"])
+
+    def test_excel_sheets_are_run_inputs(self):
+        self.expression = "df['Sheet1']['amount'].max()"
+        pipeline = self.registry.get("excel_query", "gpt-4o")
+        df = {"Sheet1": pd.DataFrame({"amount": [4, 5]})}
+
+        _, intermediates = pipeline.run_with_intermediates(
+            query_str="largest amount?", chat_history=[], **get_excel_query_inputs(df)
+        )
+
+        self.assertEqual(intermediates["pandas_output_parser"].outputs["output"], "5")
+        self.assertIn("Sheet Name: 'Sheet1'", intermediates["pandas_prompt"].outputs["prompt"])
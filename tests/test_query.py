@@ -26,7 +26,9 @@ class TestQuery(TestCase):
         mock_get_db_config_by_id.return_value = None
         mock_csv_pipeline.return_value = "csv_result"
 
-        result = await query("csv", request, response, current_user=current_user, db=db)
+        result = await query(
+            "csv", request, response, mock.Mock(), current_user=current_user, db=db
+        )
 
         self.assertEqual(result.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(result.message, "This API is deprecated. Please use v2 API")
@@ -34,10 +36,10 @@ class TestQuery(TestCase):
         response.status_code.assert_called_with(status.HTTP_400_BAD_REQUEST)
 
     @mock.patch("api.v1.query.DBConfigQuery.get_db_config_by_id")
-    @mock.patch("api.v1.query.db_config_pipeline")
+    @mock.patch("api.v1.query.adb_config_pipeline")
     async def test_query_db(
         self,
-        mock_db_config_pipeline,
+        mock_adb_config_pipeline,
         mock_get_db_config_by_id,
     ):
         request = mock.Mock()
@@ -46,9 +48,11 @@ class TestQuery(TestCase):
         current_user = mock.Mock(spec=AccessTokenData)
 
         mock_get_db_config_by_id.return_value = "db_config"
-        mock_db_config_pipeline.return_value = ("db_result", "sql_query")
+        mock_adb_config_pipeline.return_value = ("db_result", "sql_query", None)
 
-        result = await query("db", request, response, current_user=current_user, db=db)
+        result = await query(
+            "db", request, response, mock.Mock(), current_user=current_user, db=db
+        )
 
         self.assertEqual(result.status_code, status.HTTP_200_OK)
         self.assertEqual(result.message, "Query successful")
@@ -71,7 +75,12 @@ class TestQuery(TestCase):
         current_user = mock.Mock(spec=AccessTokenData)
 
         result = await query(
-            "invalid_type", request, response, current_user=current_user, db=db
+            "invalid_type",
+            request,
+            response,
+            mock.Mock(),
+            current_user=current_user,
+            db=db,
         )
 
         self.assertEqual(result.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,160 @@
+import asyncio
+import uuid
+from unittest import TestCase, mock
+from fastapi import Response, status
+from api.v1 import jobs as jobs_module
+from api.v1 import query as query_module
+from helper import query_jobs
+from helper.job_queue import JobQueue
+from helper.job_worker import JobWorker
+from helper.metrics import metrics
+from helper.query_jobs import (
+    DB_QUERY_JOB,
+    QUERY_HANDLERS,
+    IdempotencyKeyReusedError,
+    enqueue_query_job,
+)
+from schemas.query import CustomerQueryRequest, SQLResult
+from helpers import ListRedis, parse_events
+
+
+class QueryJobTestCase(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.queue = JobQueue("query", redis_client=ListRedis())
+        for module in (query_jobs, jobs_module):
+            patcher = mock.patch.object(module, "query_queue", self.queue)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.chat_uuid = uuid.uuid4()
+        self.request = CustomerQueryRequest(
+            query="total sales?", data_source_id=1, model="gpt-4o", chat_uuid=self.chat_uuid
+        )
+
+
+class TestEnqueueQueryJob(QueryJobTestCase):
+    def test_idempotency_key_returns_the_first_job(self):
+        job = enqueue_query_job(DB_QUERY_JOB, self.request, "customer", "key-1")
+
+        self.assertEqual(
+            enqueue_query_job(DB_QUERY_JOB, self.request, "customer", "key-1").id, job.id
+        )
+        self.assertNotEqual(
+            enqueue_query_job(DB_QUERY_JOB, self.request, "other customer", "key-1").id,
+            job.id,
+        )
+        self.assertNotEqual(
+            enqueue_query_job(DB_QUERY_JOB, self.request, "customer").id, job.id
+        )
+        self.assertEqual(self.queue.depth()["ready"], 3)
+
+    def test_idempotency_key_reused_for_another_request(self):
+        enqueue_query_job(DB_QUERY_JOB, self.request, "customer", "key-1")
+        other_request = self.request.model_copy(update={"query": "total costs?"})
+
+        with self.assertRaises(IdempotencyKeyReusedError):
+            enqueue_query_job(DB_QUERY_JOB, other_request, "customer", "key-1")
+
+    def test_worker_stores_the_result(self):
+        job = enqueue_query_job(DB_QUERY_JOB, self.request, "customer")
+        db_config = mock.Mock(db_type="sqlite", db_config={}, id=1)
+        sql_result = SQLResult(columns=["total"], rows=[[42]])
+
+        with mock.patch.object(query_jobs, "SessionLocal"), mock.patch.object(
+            query_jobs.DBConfigQuery, "get_db_config_by_id", return_value=db_config
+        ), mock.patch.object(
+            query_jobs,
+            "db_config_pipeline",
+            return_value=("<div>42</div>", "SELECT 42", sql_result),
+        ) as pipeline:
+            self.assertTrue(JobWorker(self.queue, QUERY_HANDLERS).run_once(0))
+
+        pipeline.assert_called_once_with(
+            "sqlite", {}, "total sales?", str(self.chat_uuid), "gpt-4o", db_config_id=1
+        )
+        finished = self.queue.get(job.id)
+        self.assertEqual(finished.status, "succeeded")
+        self.assertEqual(finished.result["response"], "<div>42</div>")
+        self.assertEqual(finished.result["sql_result"]["rows"], [[42]])
+        self.assertIn("query_job_wait_seconds", metrics.snapshot()["observations"])
+        self.assertIn("query_queue_depth", metrics.snapshot()["observations"])
+
+
+class TestQueryJobRoutes(QueryJobTestCase):
+    def query(self, prefer, idempotency_key=None):
+        db_config = mock.Mock(customer_uuid="customer", db_type="sqlite", db_config={}, id=1)
+        response = Response()
+
+        async def main():
+            with mock.patch.object(
+                query_module.ChatHistoryQuery, "is_valid_chat_history", return_value=True
+            ), mock.patch.object(
+                query_module.DBConfigQuery, "get_db_config_by_id", return_value=db_config
+            ), mock.patch.object(
+                query_module, "adb_config_pipeline"
+            ) as pipeline:
+                result = await query_module.query(
+                    "db",
+                    self.request,
+                    response,
+                    mock.Mock(),
+                    current_user=mock.Mock(uuid="customer"),
+                    db=mock.Mock(),
+                    prefer=prefer,
+                    idempotency_key=idempotency_key,
+                )
+                pipeline.assert_not_called()
+                return result
+
+        return asyncio.run(main()), response
+
+    def test_respond_async_queues_the_query(self):
+        result, response = self.query("respond-async, wait=10", "key-1")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(result.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(result.data.status, "queued")
+        self.assertEqual(response.headers["Location"], f"/v1/jobs/{result.data.job_id}")
+        retried = self.query("respond-async", "key-1")[0]
+        self.assertEqual(retried.data.job_id, result.data.job_id)
+        self.assertEqual(self.queue.depth()["ready"], 1)
+
+    def test_jobs_of_other_customers_are_not_found(self):
+        job_id = self.query("respond-async")[0].data.job_id
+
+        async def get_job(customer_uuid):
+            response = Response()
+            result = await jobs_module.get_job(
+                job_id, response, current_user=mock.Mock(uuid=customer_uuid)
+            )
+            return result.status_code
+
+        self.assertEqual(asyncio.run(get_job("customer")), status.HTTP_200_OK)
+        self.assertEqual(asyncio.run(get_job("other customer")), status.HTTP_404_NOT_FOUND)
+
+    def test_events_follow_the_job_until_it_finishes(self):
+        job_id = self.query("respond-async")[0].data.job_id
+        job = self.queue.reserve(0)
+        get = self.queue.get
+
+        def finish(*args, **kwargs):
+            job.result = {"response": "<div>42</div>"}
+            self.queue.complete(job)
+            return get(job_id)
+
+        async def main():
+            response = await jobs_module.subscribe_job(
+                job_id, Response(), current_user=mock.Mock(uuid="customer")
+            )
+            with mock.patch.object(
+                jobs_module.Config, "QUERY_JOB_POLL_INTERVAL", 0
+            ), mock.patch.object(self.queue, "get", side_effect=finish):
+                return "".join([chunk async for chunk in response.body_iterator])
+
+        events = parse_events(asyncio.run(main()))
+
+        self.assertEqual(events[0], ("status", {"job_id": job_id, "status": "running"}))
+        self.assertEqual(events[1][0], "done")
+        self.assertEqual(events[1][1]["status"], "succeeded")
+        self.assertEqual(events[1][1]["result"], {"response": "<div>42</div>"})
@@ -0,0 +1,202 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+import boto3
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from helper import aws_s3
+from helper.aws_s3 import download_from_s3
+from helper.metrics import metrics
+from helper.s3_cache import S3ObjectCache
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+        self.lock = threading.Lock()
+
+    def get_etag(self, key):
+        return self.objects[key][0] if key in self.objects else None
+
+    def download(self, key, output_path, etag=None):
+        with self.lock:
+            self.downloads += 1
+        if key not in self.objects or self.objects[key][0] != etag:
+            return False
+        time.sleep(0.05)
+        with open(output_path, "wb") as f:
+            f.write(self.objects[key][1])
+        return True
+
+
+class TestS3ObjectCache(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.s3 = FakeS3()
+        for name, fn in [
+            ("get_s3_etag", self.s3.get_etag),
+            ("download_from_s3", self.s3.download),
+        ]:
+            patcher = mock.patch(f"helper.s3_cache.{name}", side_effect=fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_cache(self, **kwargs) -> S3ObjectCache:
+        return S3ObjectCache(root_dir=self.tmp_dir.name, **kwargs)
+
+    def read(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_downloads_once(self):
+        cache = self.make_cache()
+        self.s3.objects["a.csv"] = ("v1", b"a")
+
+        first = cache.get_path("a.csv")
+        second = cache.get_path("a.csv")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.read(first), b"a")
+        self.assertEqual(self.s3.downloads, 1)
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["s3_cache_misses"], 1)
+        self.assertEqual(counters["s3_cache_hits"], 1)
+
+    def test_revalidates_replaced_object(self):
+        cache = self.make_cache()
+        self.s3.objects["a.csv"] = ("v1", b"a")
+        cache.get_path("a.csv")
+
+        self.s3.objects["a.csv"] = ("v2", b"b")
+
+        self.assertEqual(self.read(cache.get_path("a.csv")), b"b")
+        self.assertEqual(self.s3.downloads, 2)
+
+    def test_trusts_etag_within_ttl(self):
+        cache = self.make_cache(ttl=60)
+        self.s3.objects["a.csv"] = ("v1", b"a")
+
+        cache.get_etag("a.csv")
+        self.s3.objects["a.csv"] = ("v2", b"b")
+
+        self.assertEqual(cache.get_etag("a.csv"), "v1")
+        cache.invalidate("a.csv")
+        self.assertEqual(cache.get_etag("a.csv"), "v2")
+
+    def test_same_content_is_stored_once(self):
+        cache = self.make_cache()
+        self.s3.objects["a.csv"] = ("v1", b"a")
+        self.s3.objects["copy.csv"] = ("v1", b"a")
+
+        self.assertEqual(cache.get_path("a.csv"), cache.get_path("copy.csv"))
+        self.assertEqual(self.s3.downloads, 1)
+
+    def test_deduplicates_concurrent_downloads(self):
+        cache = self.make_cache()
+        self.s3.objects["a.csv"] = ("v1", b"a")
+
+        threads = [threading.Thread(target=cache.get_path, args=("a.csv",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.s3.downloads, 1)
+
+    def test_failed_download(self):
+        cache = self.make_cache(ttl=60)
+        self.s3.objects["a.csv"] = ("v1", b"a")
+        cache.get_etag("a.csv")
+        self.s3.objects["a.csv"] = ("v2", b"b")
+
+        # the trusted etag no longer matches, the next call revalidates
+        self.assertIsNone(cache.get_path("a.csv"))
+        self.assertEqual(self.read(cache.get_path("a.csv")), b"b")
+        self.assertIsNone(cache.get_path("missing.csv"))
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir.name, "objects")), ["v2"])
+
+    def test_evicts_least_recently_used(self):
+        cache = self.make_cache(max_bytes=2)
+        for key in ["a", "b", "c"]:
+            self.s3.objects[key] = (key, key.encode("utf-8"))
+
+        path_a = cache.get_path("a")
+        path_b = cache.get_path("b")
+        os.utime(path_a, (0, 0))
+        os.utime(path_b, (1, 1))
+        path_c = cache.get_path("c")
+
+        self.assertFalse(os.path.exists(path_a))
+        self.assertTrue(os.path.exists(path_b))
+        self.assertTrue(os.path.exists(path_c))
+        self.assertEqual(metrics.snapshot()["counters"]["s3_cache_evictions"], 1)
+
+
+def make_body(data: bytes) -> StreamingBody:
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+class TestDownloadFromS3(TestCase):
+    """Runs against a stubbed client, through the argument checks of s3transfer."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, "data.csv")
+
+        client = boto3.client(
+            "s3",
+            region_name="us-east-1",
+            aws_access_key_id="x",
+            aws_secret_access_key="x",
+        )
+        self.stubber = Stubber(client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        for name, value in [("s3_client", client), ("bucket_name", "bucket")]:
+            patcher = mock.patch.object(aws_s3, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_download_with_etag_is_conditional(self):
+        self.stubber.add_response(
+            "get_object",
+            {"Body": make_body(b"id,name\n"), "ETag": '"v1"'},
+            {"Bucket": "bucket", "Key": "uuid/data.csv", "IfMatch": "v1"},
+        )
+
+        self.assertTrue(download_from_s3("uuid/data.csv", self.path, etag="v1"))
+
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"id,name\n")
+        self.stubber.assert_no_pending_responses()
+
+    def test_replaced_object_is_not_downloaded(self):
+        self.stubber.add_client_error(
+            "get_object", "PreconditionFailed", http_status_code=412
+        )
+
+        self.assertFalse(download_from_s3("uuid/data.csv", self.path, etag="v1"))
+
+    def test_download_without_etag(self):
+        self.stubber.add_response(
+            "head_object",
+            {"ContentLength": 8, "ETag": '"v1"'},
+            {"Bucket": "bucket", "Key": "uuid/data.csv"},
+        )
+        self.stubber.add_response(
+            "get_object",
+            {"Body": make_body(b"id,name\n"), "ETag": '"v1"'},
+            {"Bucket": "bucket", "Key": "uuid/data.csv"},
+        )
+
+        self.assertTrue(download_from_s3("uuid/data.csv", self.path))
+
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"id,name\n")
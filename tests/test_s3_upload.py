@@ -0,0 +1,111 @@
+import asyncio
+import io
+import threading
+from unittest import TestCase, mock
+from fastapi import UploadFile
+from helper import s3_upload
+from helper.s3_upload import (
+    UploadFailedError,
+    UploadTooLargeError,
+    get_sha256_checksum,
+    upload_file_to_s3,
+)
+
+
+class FakeS3Client:
+    def __init__(self, fail_part: int = None):
+        self.fail_part = fail_part
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ChecksumAlgorithm, ChecksumSHA256):
+        assert ChecksumSHA256 == get_sha256_checksum(Body)
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key, ChecksumAlgorithm):
+        self.parts["upload-id"] = {}
+        return {"UploadId": "upload-id"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        assert kwargs["ChecksumSHA256"] == get_sha256_checksum(Body)
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if PartNumber == self.fail_part:
+                raise ConnectionError("connection reset")
+            self.parts[UploadId][PartNumber] = Body
+            return {"ETag": f'"etag-{PartNumber}"'}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = MultipartUpload["Parts"]
+        assert [part["PartNumber"] for part in parts] == list(range(1, len(parts) + 1))
+        self.objects[Key] = b"".join(self.parts[UploadId][part["PartNumber"]] for part in parts)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+        self.parts.pop(UploadId, None)
+
+
+def make_file(data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), size=len(data), filename="data.csv")
+
+
+class TestUploadFileToS3(TestCase):
+    def setUp(self):
+        self.client = FakeS3Client()
+        patcher = mock.patch.object(s3_upload, "s3_client", self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, data: bytes, **kwargs) -> str:
+        kwargs = {"max_bytes": 1000, "part_size": 10, "max_concurrency": 2, **kwargs}
+        return asyncio.run(upload_file_to_s3(make_file(data), "uuid/csv/data.csv", **kwargs))
+
+    def test_small_file_is_put_at_once(self):
+        url = self.upload(b"id,name\n")
+
+        self.assertTrue(url.endswith("/uuid/csv/data.csv"))
+        self.assertEqual(self.client.objects["uuid/csv/data.csv"], b"id,name\n")
+        self.assertEqual(self.client.parts, {})
+
+    def test_multipart_upload(self):
+        data = bytes(range(256)) * 2
+
+        self.upload(data)
+
+        self.assertEqual(self.client.objects["uuid/csv/data.csv"], data)
+        self.assertLessEqual(self.client.max_in_flight, 2)
+        self.assertEqual(self.client.aborted, [])
+
+    def test_rejects_declared_size_over_limit(self):
+        with self.assertRaises(UploadTooLargeError):
+            self.upload(b"x" * 2000)
+        self.assertEqual(self.client.objects, {})
+        self.assertEqual(self.client.parts, {})
+
+    def test_aborts_when_limit_is_exceeded_while_reading(self):
+        file = make_file(b"x" * 2000)
+        file.size = None
+
+        with self.assertRaises(UploadTooLargeError):
+            asyncio.run(
+                upload_file_to_s3(file, "uuid/csv/data.csv", max_bytes=1000, part_size=10)
+            )
+        self.assertEqual(self.client.aborted, ["upload-id"])
+        self.assertNotIn("uuid/csv/data.csv", self.client.objects)
+
+    def test_aborts_when_a_part_fails(self):
+        self.client.fail_part = 3
+
+        with self.assertRaises(UploadFailedError):
+            self.upload(b"x" * 100)
+        self.assertEqual(self.client.aborted, ["upload-id"])
+        self.assertNotIn("uuid/csv/data.csv", self.client.objects)
@@ -0,0 +1,86 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from sqlalchemy import create_engine, text
+from helper import schema_cache
+from helper.db_introspection import reflect_tables
+from helpers import DictRedis
+
+
+class TestSchemaCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}"
+        self.engine = create_engine(self.db_url)
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+            conn.execute(
+                text(
+                    "CREATE TABLE orders (id INTEGER PRIMARY KEY, "
+                    "user_id INTEGER REFERENCES users(id), total REAL)"
+                )
+            )
+
+        self.redis = DictRedis()
+        patcher = mock.patch.object(
+            schema_cache, "get_redis_client", return_value=self.redis
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # always verify the fingerprint
+        interval_patcher = mock.patch.object(
+            schema_cache.Config, "SCHEMA_CACHE_CHECK_INTERVAL", -1
+        )
+        interval_patcher.start()
+        self.addCleanup(interval_patcher.stop)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_renders_schema_with_foreign_keys(self):
+        db_schema = schema_cache.get_cached_db_schema(self.engine, self.db_url, 1)
+
+        self.assertIn("Table: orders", db_schema)
+        self.assertIn("  user_id (INTEGER) [Foreign Key: users.id]\n", db_schema)
+        self.assertIn("  name (TEXT)\n", db_schema)
+
+    def test_only_changed_tables_are_reflected(self):
+        entry = schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+        with self.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE users ADD COLUMN email TEXT"))
+
+        with mock.patch.object(
+            schema_cache, "reflect_tables", side_effect=reflect_tables
+        ) as mock_reflect:
+            new_entry = schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+
+        mock_reflect.assert_called_once_with(self.engine, ["users"])
+        self.assertNotEqual(new_entry["schema_hash"], entry["schema_hash"])
+        self.assertIn(
+            {"name": "email", "type": "TEXT"}, new_entry["tables"]["users"]["columns"]
+        )
+
+    def test_unchanged_schema_is_not_reflected(self):
+        schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+
+        with mock.patch.object(schema_cache, "reflect_tables") as mock_reflect:
+            schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+
+        mock_reflect.assert_not_called()
+
+    def test_dropped_tables_are_removed(self):
+        schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP TABLE orders"))
+
+        entry = schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+
+        self.assertEqual(list(entry["tables"]), ["users"])
+
+    def test_invalidate_drops_entry(self):
+        schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+        schema_cache.invalidate_db_schema(1)
+
+        self.assertEqual(self.redis.store, {})
@@ -0,0 +1,141 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from llama_index.core.embeddings import MockEmbedding
+from sqlalchemy import create_engine, text
+from helper import schema_cache, schema_retrieval
+from helper.metrics import metrics
+from helpers import DictRedis
+
+
+class TestSchemaRetrieval(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}"
+        self.engine = create_engine(self.db_url)
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+            conn.execute(
+                text(
+                    "CREATE TABLE orders (id INTEGER PRIMARY KEY, "
+                    "user_id INTEGER REFERENCES users(id), total REAL)"
+                )
+            )
+            for i in range(4):
+                conn.execute(text(f"CREATE TABLE log_{i} (id INTEGER PRIMARY KEY)"))
+
+        self.embed_model = MockEmbedding(embed_dim=8)
+        patchers = [
+            mock.patch.object(
+                schema_cache, "get_redis_client", return_value=DictRedis()
+            ),
+            mock.patch.object(
+                schema_retrieval, "get_embed_model", return_value=self.embed_model
+            ),
+            mock.patch.object(
+                schema_retrieval.Config,
+                "CHROMA_DB_PATH",
+                os.path.join(self.tmp_dir.name, "chroma"),
+            ),
+            mock.patch.object(schema_retrieval.Config, "SCHEMA_RETRIEVAL_MIN_TABLES", 3),
+            mock.patch.object(schema_retrieval.Config, "SCHEMA_RETRIEVAL_TOP_K", 1),
+            mock.patch.object(schema_cache.Config, "SCHEMA_CACHE_CHECK_INTERVAL", -1),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        metrics.reset()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_expand_with_foreign_keys(self):
+        tables = {
+            "users": {"foreign_keys": []},
+            "orders": {
+                "foreign_keys": [{"referred_table": "users", "referred_column": "id"}]
+            },
+            "items": {
+                "foreign_keys": [{"referred_table": "orders", "referred_column": "id"}]
+            },
+            "logs": {"foreign_keys": []},
+        }
+
+        self.assertEqual(
+            schema_retrieval.expand_with_foreign_keys(tables, ["orders"], 10),
+            ["orders", "users", "items"],
+        )
+        self.assertEqual(
+            schema_retrieval.expand_with_foreign_keys(tables, ["orders"], 2),
+            ["orders", "users"],
+        )
+
+    def test_get_referenced_tables(self):
+        sql_query = "SELECT u.name FROM Users u JOIN orders o ON o.user_id = u.id"
+
+        self.assertEqual(
+            schema_retrieval.get_referenced_tables(
+                sql_query, ["users", "orders", "log_0"]
+            ),
+            {"users", "orders"},
+        )
+
+    def test_prunes_large_schemas(self):
+        with mock.patch.object(
+            schema_retrieval, "select_tables", return_value=["orders", "users"]
+        ):
+            db_schema = schema_retrieval.get_relevant_db_schema(
+                self.engine, self.db_url, 1, "total per user"
+            )
+
+        self.assertEqual(
+            schema_retrieval.get_schema_tables(db_schema), {"orders", "users"}
+        )
+        self.assertEqual(metrics.snapshot()["observations"]["db_schema_tables"]["last"], 2)
+
+    def test_small_schemas_are_sent_whole(self):
+        with mock.patch.object(
+            schema_retrieval.Config, "SCHEMA_RETRIEVAL_MIN_TABLES", 10
+        ), mock.patch.object(schema_retrieval, "select_tables") as mock_select:
+            db_schema = schema_retrieval.get_relevant_db_schema(
+                self.engine, self.db_url, 1, "total per user"
+            )
+
+        mock_select.assert_not_called()
+        self.assertEqual(len(schema_retrieval.get_schema_tables(db_schema)), 6)
+
+    def test_only_changed_tables_are_embedded(self):
+        entry = schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+        schema_retrieval.select_tables(1, entry, "total per user")
+
+        with self.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE users ADD COLUMN email TEXT"))
+        entry = schema_cache.get_db_schema_entry(self.engine, self.db_url, 1)
+
+        selected_tables = schema_retrieval.select_tables(1, entry, "total per user")
+        schema_retrieval.select_tables(1, entry, "total per user")
+
+        self.assertEqual(
+            metrics.snapshot()["counters"]["schema_retrieval_tables_embedded"], 7
+        )
+        self.assertTrue(set(selected_tables) <= set(entry["tables"]))
+
+    def test_records_retrieval_hits(self):
+        db_schema = "\n\nTable: orders\n"
+
+        hit = schema_retrieval.record_schema_retrieval_hit(
+            self.engine, self.db_url, 1, db_schema, "SELECT * FROM orders"
+        )
+        miss = schema_retrieval.record_schema_retrieval_hit(
+            self.engine, self.db_url, 1, db_schema, "SELECT * FROM users"
+        )
+
+        self.assertTrue(hit)
+        self.assertFalse(miss)
+        self.assertEqual(
+            metrics.snapshot()["observations"]["schema_retrieval_hit"]["mean"], 0.5
+        )
+
+    def test_drop_missing_index(self):
+        schema_retrieval.drop_schema_index(42)
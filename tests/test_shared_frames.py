@@ -0,0 +1,115 @@
+import multiprocessing
+import tempfile
+from unittest import TestCase
+import pandas as pd
+from helper.code_sandbox import CodeSandbox, exec_code
+from helper.dataframe_cache import get_dataframe_size
+from helper.shared_frames import SharedFrameStore
+from helpers import make_df
+
+
+def hold_entry(root_dir, held, done):
+    store = SharedFrameStore(root_dir=root_dir, max_bytes=10**7)
+    shared_frame = store.get(1, "etag")
+    held.set()
+    done.wait(10)
+    shared_frame.release()
+
+
+class TestSharedFrameStore(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.store = SharedFrameStore(root_dir=self.tmp_dir.name, max_bytes=10**7)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.store.get(1, "etag"))
+
+        self.store.put(1, "etag", make_df(100)).release()
+        shared_frame = self.store.get(1, "etag")
+
+        pd.testing.assert_frame_equal(shared_frame.data, make_df(100))
+        shared_frame.release()
+
+    def test_excel_sheets(self):
+        sheets = {"Sales": make_df(10), "Costs": make_df(5)}
+
+        shared_frame = self.store.put(1, "etag", sheets)
+
+        self.assertEqual(list(shared_frame.data), ["Sales", "Costs"])
+        pd.testing.assert_frame_equal(shared_frame.data["Costs"], make_df(5))
+        shared_frame.release()
+
+    def test_numeric_columns_are_mapped(self):
+        shared_frame = self.store.put(1, "etag", make_df(100))
+        df = shared_frame.data
+
+        self.assertFalse(df["id"].to_numpy().flags.writeable)
+        # only the string column is private to the worker
+        self.assertEqual(
+            get_dataframe_size(df),
+            get_dataframe_size(make_df(100)[["city"]]),
+        )
+        # generated code run in process writes to copies of the mapped columns
+        result = CodeSandbox(workers=0).run(
+            exec_code,
+            shared_frame.data,
+            "df.loc[0, 'id'] = 42\ndf['id'] += 1\nresult = int(df.loc[0, 'id'])",
+            "result",
+        )
+        self.assertEqual(result, 43)
+        self.assertEqual(self.store.get(1, "etag").data.loc[0, "id"], 0)
+        shared_frame.release()
+
+    def test_pandas_options_are_left_alone(self):
+        self.store.put(1, "etag", make_df(10)).release()
+
+        self.assertFalse(pd.get_option("mode.copy_on_write"))
+
+    def test_evicts_least_recently_used_unheld_entries(self):
+        for document_id in (1, 2, 3):
+            self.store.put(document_id, "etag", make_df(1000)).release()
+        entry_size = self.store.size // 3
+        held = self.store.get(1, "etag")
+        self.store.max_bytes = entry_size
+
+        self.assertEqual(self.store.evict(), 2)
+        self.assertIsNotNone(self.store.get(1, "etag"))
+        self.assertIsNone(self.store.get(2, "etag"))
+        held.release()
+
+    def test_held_by_another_process(self):
+        self.store.put(1, "etag", make_df(1000)).release()
+        context = multiprocessing.get_context("fork")
+        held, done = context.Event(), context.Event()
+        process = context.Process(
+            target=hold_entry, args=(self.tmp_dir.name, held, done)
+        )
+        process.start()
+        try:
+            self.assertTrue(held.wait(10))
+            self.store.max_bytes = 1
+
+            self.assertEqual(self.store.evict(), 0)
+        finally:
+            done.set()
+            process.join(10)
+
+        self.assertEqual(self.store.evict(), 1)
+
+    def test_invalidate_deletes_held_entries(self):
+        shared_frame = self.store.put(1, "v1", make_df(10))
+        self.store.put(2, "v1", make_df(10)).release()
+
+        self.assertEqual(self.store.invalidate(1), 1)
+        self.assertIsNone(self.store.get(1, "v1"))
+        self.assertIsNotNone(self.store.get(2, "v1"))
+        # the mapping stays valid after the files are deleted
+        pd.testing.assert_frame_equal(shared_frame.data, make_df(10))
+        shared_frame.release()
+
+    def test_disabled_store(self):
+        store = SharedFrameStore(root_dir=self.tmp_dir.name, max_bytes=0)
+
+        self.assertIsNone(store.put(1, "etag", make_df(10)))
+        self.assertIsNone(store.get(1, "etag"))
@@ -0,0 +1,180 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.llms.openai import OpenAI
+from sqlalchemy import create_engine, text
+from config import Config
+from helper.db_engines import engine_registry
+from helper.pipelines.db_query import SQLCostGuardComponent
+from helper.sql_cost_guard import (
+    SQLQueryTooExpensiveError,
+    add_limit,
+    estimate_sql_cost,
+    get_sql_cost_guard_options,
+)
+from helper.sql_execution import statement_guard
+
+
+class TestSqlCostGuard(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}"
+        self.engine = create_engine(self.db_url)
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+            conn.execute(
+                text("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER)")
+            )
+            conn.execute(
+                text("INSERT INTO users (name) VALUES (:name)"),
+                [{"name": f"user {i}"} for i in range(20)],
+            )
+            conn.execute(
+                text("INSERT INTO orders (user_id) VALUES (:user_id)"),
+                [{"user_id": i % 20} for i in range(50)],
+            )
+
+        self.guard = SQLCostGuardComponent(
+            llm=OpenAI(api_key="sk-test"),
+            rewrite_prompt="{query_str} {db_schema} {sql_query} {estimated_rows} {estimated_cost}",
+        )
+
+    def tearDown(self):
+        self.engine.dispose()
+        engine_registry.dispose_all()
+        self.tmp_dir.cleanup()
+
+    def run_guard(self, sql_query: str, **options):
+        return self.guard.run_component(
+            sql_query=sql_query,
+            query_str="all users",
+            db_schema="",
+            db_url=self.db_url,
+            db_config_id=None,
+            execution_options={"timeout": 5, "read_only": True},
+            cost_guard_options=get_sql_cost_guard_options(options),
+        )
+
+    def test_sqlite_estimates(self):
+        self.assertEqual(
+            estimate_sql_cost(self.engine, "SELECT * FROM users").estimated_rows, 20
+        )
+        self.assertEqual(
+            estimate_sql_cost(
+                self.engine, "SELECT * FROM users u, orders AS o;"
+            ).estimated_rows,
+            1000,
+        )
+        self.assertIsNone(
+            estimate_sql_cost(
+                self.engine, "SELECT * FROM users WHERE id = 1"
+            ).estimated_rows
+        )
+        self.assertIsNone(estimate_sql_cost(self.engine, "SELECT * FROM missing"))
+
+    def test_explain_runs_under_the_statement_guard(self):
+        with mock.patch(
+            "helper.sql_cost_guard.statement_guard", wraps=statement_guard
+        ) as guard:
+            estimate = estimate_sql_cost(
+                self.engine, "SELECT * FROM users", timeout=5, read_only=True
+            )
+
+        self.assertEqual(estimate.estimated_rows, 20)
+        guard.assert_called_once_with(mock.ANY, 5, True)
+
+    def test_add_limit(self):
+        self.assertEqual(
+            add_limit(" SELECT * FROM users;\n", 10), "SELECT * FROM users LIMIT 10"
+        )
+        # a CTE is part of the top-level SELECT
+        self.assertEqual(
+            add_limit("WITH u AS (SELECT * FROM users) SELECT name FROM u", 10, "sqlite"),
+            "WITH u AS (SELECT * FROM users) SELECT name FROM u LIMIT 10",
+        )
+
+    def test_add_limit_keeps_a_lower_limit(self):
+        self.assertEqual(
+            add_limit("SELECT * FROM users LIMIT 5", 10, "postgresql"),
+            "SELECT * FROM users LIMIT 5",
+        )
+        self.assertEqual(
+            add_limit("SELECT * FROM users LIMIT 500 OFFSET 20", 10, "postgresql"),
+            "SELECT * FROM users LIMIT 10 OFFSET 20",
+        )
+        self.assertEqual(
+            add_limit("SELECT `name` FROM users LIMIT 20, 500", 10, "mysql"),
+            "SELECT `name` FROM users LIMIT 10 OFFSET 20",
+        )
+
+    def test_add_limit_leaves_other_statements(self):
+        for sql_query in [
+            "SELECT name FROM users UNION SELECT name FROM users",
+            "DELETE FROM users",
+            "SELEC name FROM (",
+        ]:
+            self.assertEqual(add_limit(sql_query, 10, "sqlite"), sql_query)
+
+    def test_invalid_action(self):
+        with self.assertRaises(ValueError):
+            get_sql_cost_guard_options({"cost_guard_action": "drop"})
+
+    def test_disabled_guard_passes_through(self):
+        output = self.run_guard("SELECT * FROM orders")
+
+        self.assertEqual(output["sql_query"], "SELECT * FROM orders")
+        self.assertIsNone(output["cost_estimate"])
+
+    def test_cheap_query_is_kept(self):
+        output = self.run_guard("SELECT * FROM users", max_estimated_rows=100)
+
+        self.assertEqual(output["sql_query"], "SELECT * FROM users")
+        self.assertEqual(output["cost_estimate"].estimated_rows, 20)
+        self.assertIsNone(output["cost_estimate"].action)
+
+    def test_limit_action(self):
+        output = self.run_guard(
+            "SELECT * FROM orders", max_estimated_rows=10, cost_guard_action="limit"
+        )
+
+        self.assertEqual(
+            output["sql_query"],
+            f"SELECT * FROM orders LIMIT {Config.SQL_RESULT_MAX_ROWS + 1}",
+        )
+        self.assertEqual(output["cost_estimate"].action, "limit")
+
+    def test_refuse_action(self):
+        with self.assertRaises(SQLQueryTooExpensiveError) as context:
+            self.run_guard(
+                "SELECT * FROM orders", max_estimated_rows=10, cost_guard_action="refuse"
+            )
+
+        self.assertEqual(context.exception.estimate.estimated_rows, 50)
+
+    def test_rewrite_action(self):
+        rewritten = ChatResponse(
+            message=ChatMessage(
+                role="assistant", content="```sql\nSELECT * FROM orders WHERE id = 1\n```"
+            )
+        )
+        with mock.patch.object(OpenAI, "chat", return_value=rewritten) as mock_chat:
+            output = self.run_guard(
+                "SELECT * FROM orders", max_estimated_rows=10, cost_guard_action="rewrite"
+            )
+
+        mock_chat.assert_called_once()
+        self.assertEqual(output["sql_query"].strip(), "SELECT * FROM orders WHERE id = 1")
+        self.assertEqual(output["cost_estimate"].action, "rewrite")
+
+    def test_failed_rewrite_is_refused(self):
+        rewritten = ChatResponse(
+            message=ChatMessage(role="assistant", content="```SELECT * FROM orders```")
+        )
+        with mock.patch.object(OpenAI, "chat", return_value=rewritten):
+            with self.assertRaises(SQLQueryTooExpensiveError):
+                self.run_guard(
+                    "SELECT * FROM orders",
+                    max_estimated_rows=10,
+                    cost_guard_action="rewrite",
+                )
@@ -0,0 +1,173 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+from helper.concurrency import CancelScope, current_cancel_scope
+from helper.metrics import metrics
+from helper.sql_execution import (
+    SQLQueryCancelledError,
+    SQLQueryTimeoutError,
+    _is_statement_timeout,
+    _kill_mysql_query,
+    execute_sql_query,
+    get_sql_execution_options,
+    summarize_sql_result,
+)
+from schemas.query import SQLResult
+
+
+class TestSqlExecution(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}"
+        )
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+            conn.execute(
+                text("INSERT INTO items (name) VALUES (:name)"),
+                [{"name": f"item {i}"} for i in range(10)],
+            )
+
+        metrics.reset()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_fetches_all_rows_under_the_caps(self):
+        result = execute_sql_query(self.engine, "SELECT id, name FROM items")
+
+        self.assertEqual(result.columns, ["id", "name"])
+        self.assertEqual(len(result.rows), 10)
+        self.assertEqual(result.rows[0], [1, "item 0"])
+        self.assertFalse(result.truncated)
+
+    def test_row_cap(self):
+        result = execute_sql_query(self.engine, "SELECT * FROM items", max_rows=3)
+
+        self.assertEqual(len(result.rows), 3)
+        self.assertTrue(result.truncated)
+
+        result = execute_sql_query(self.engine, "SELECT * FROM items", max_rows=10)
+        self.assertFalse(result.truncated)
+
+    def test_byte_cap(self):
+        result = execute_sql_query(self.engine, "SELECT * FROM items", max_bytes=30)
+
+        self.assertEqual(len(result.rows), 2)
+        self.assertTrue(result.truncated)
+
+    def test_summary_marks_truncation(self):
+        result = SQLResult(
+            columns=["id"], rows=[[i] for i in range(5)], truncated=True
+        )
+
+        summary = summarize_sql_result(result, max_rows=2)
+
+        self.assertEqual(
+            summary.splitlines(),
+            ["('id',)", "(0,)", "(1,)", "... [result truncated: showing 2 of 5+ rows]"],
+        )
+
+    def test_summary_of_empty_result(self):
+        result = execute_sql_query(self.engine, "SELECT * FROM items WHERE id < 0")
+
+        self.assertEqual(summarize_sql_result(result), "No results found")
+
+    def test_statement_timeout(self):
+        endless_query = (
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+            "SELECT max(i) FROM n"
+        )
+
+        with self.assertRaises(SQLQueryTimeoutError):
+            execute_sql_query(self.engine, endless_query, timeout=0.2)
+        self.assertEqual(metrics.snapshot()["counters"]["sql_statement_timeouts"], 1)
+
+        # the progress handler is removed from the pooled connection
+        result = execute_sql_query(self.engine, "SELECT count(*) FROM items", timeout=0)
+        self.assertEqual(result.rows, [[10]])
+
+    def test_slow_failure_is_not_a_timeout(self):
+        def fail_slowly(*args):
+            time.sleep(0.3)
+            raise OperationalError("SELECT 1", {}, Exception("disk I/O error"))
+
+        # an error raised after the timeout elapsed is only a timeout if the driver says so
+        with mock.patch(
+            "helper.sql_execution._fetch_rows", side_effect=fail_slowly
+        ), self.assertRaises(OperationalError):
+            execute_sql_query(self.engine, "SELECT 1", timeout=0.2)
+
+        self.assertNotIn("sql_statement_timeouts", metrics.snapshot()["counters"])
+
+    def test_cancel_scope_interrupts_query(self):
+        endless_query = (
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+            "SELECT max(i) FROM n"
+        )
+        scope = CancelScope()
+        token = current_cancel_scope.set(scope)
+        self.addCleanup(current_cancel_scope.reset, token)
+        threading.Timer(0.2, scope.cancel).start()
+
+        with self.assertRaises(SQLQueryCancelledError):
+            execute_sql_query(self.engine, endless_query, timeout=0)
+        self.assertEqual(metrics.snapshot()["counters"]["sql_statement_cancels"], 1)
+
+    def test_read_only(self):
+        with self.assertRaises(OperationalError):
+            execute_sql_query(self.engine, "DELETE FROM items", read_only=True)
+
+        execute_sql_query(self.engine, "SELECT * FROM items", read_only=True)
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM items WHERE id = 1"))
+
+    def test_execution_options_from_db_config(self):
+        self.assertEqual(
+            get_sql_execution_options({"statement_timeout": 5, "read_only": False}),
+            {"timeout": 5.0, "read_only": False},
+        )
+
+
+class DriverError(Exception):
+    def __init__(self, *args, pgcode=None):
+        super().__init__(*args)
+        self.pgcode = pgcode
+
+
+class TestStatementTimeoutErrors(TestCase):
+    def check(self, dialect: str, orig: Exception) -> bool:
+        return _is_statement_timeout(dialect, OperationalError("SELECT 1", {}, orig))
+
+    def test_postgres_query_canceled(self):
+        self.assertTrue(self.check("postgresql", DriverError(pgcode="57014")))
+        self.assertFalse(self.check("postgresql", DriverError(pgcode="42P01")))
+
+    def test_mysql_execution_time_exceeded(self):
+        self.assertTrue(
+            self.check("mysql", DriverError(3024, "maximum statement execution time exceeded"))
+        )
+        self.assertTrue(self.check("mysql", DriverError(1317, "Query execution was interrupted")))
+        self.assertFalse(self.check("mysql", DriverError(1146, "Table doesn't exist")))
+
+    def test_sqlite_interrupted(self):
+        self.assertTrue(self.check("sqlite", DriverError("interrupted")))
+        self.assertFalse(self.check("sqlite", DriverError("no such table: missing")))
+
+    def test_mysql_kill_uses_its_own_connection(self):
+        engine = mock.Mock()
+        with mock.patch("helper.sql_execution.create_engine") as create_kill_engine:
+            _kill_mysql_query(engine, 42)
+
+        create_kill_engine.assert_called_once_with(engine.url, poolclass=NullPool)
+        kill_engine = create_kill_engine.return_value
+        conn = kill_engine.connect.return_value.__enter__.return_value
+        self.assertEqual(str(conn.execute.call_args.args[0]), "KILL QUERY 42")
+        kill_engine.dispose.assert_called_once()
+        engine.connect.assert_not_called()
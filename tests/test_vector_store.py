@@ -0,0 +1,184 @@
+import tempfile
+import numpy as np
+from unittest import TestCase, mock
+from llama_index.core import MockEmbedding
+from helper import vector_store
+from helper.metrics import metrics
+from helper.vector_store import (
+    CollectionCache,
+    DocumentScopedCollection,
+    delete_document_vectors,
+    get_chroma_client,
+    get_document_filters,
+    get_embedding_path,
+    get_shared_collection_name,
+    migrate_to_shared_collection,
+    parse_embedding_path,
+)
+
+
+class TestCollectionCache(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        patcher = mock.patch.object(vector_store.Config, "CHROMA_DB_PATH", self.tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = CollectionCache(max_collections=2)
+
+    def test_reuses_collections(self):
+        first = self.cache.get_collection("docs")
+        second = self.cache.get_collection("docs")
+
+        self.assertIs(first, second)
+        self.assertIs(get_chroma_client(), get_chroma_client())
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["chroma_collection_cache_hits"], 1)
+        self.assertEqual(counters["chroma_collection_cache_misses"], 1)
+
+    def test_reuses_indexes(self):
+        embed_model = MockEmbedding(embed_dim=2)
+
+        index = self.cache.get_index("docs", embed_model=embed_model)
+
+        self.assertIs(self.cache.get_index("docs", embed_model=embed_model), index)
+        self.assertIs(
+            index.vector_store._collection._collection, self.cache.get_collection("docs")
+        )
+
+    def test_evicts_least_recently_used(self):
+        first = self.cache.get_collection("doc_a")
+        self.cache.get_collection("doc_b")
+        self.cache.get_collection("doc_a")
+        self.cache.get_collection("doc_c")
+
+        self.assertIs(self.cache.get_collection("doc_a"), first)
+        self.assertEqual(metrics.snapshot()["counters"]["chroma_collection_cache_evictions"], 1)
+        misses = metrics.snapshot()["counters"]["chroma_collection_cache_misses"]
+        self.cache.get_collection("doc_b")
+        self.assertEqual(
+            metrics.snapshot()["counters"]["chroma_collection_cache_misses"], misses + 1
+        )
+
+    def test_invalidate(self):
+        first = self.cache.get_collection("docs")
+
+        self.cache.invalidate("docs")
+
+        self.assertIsNot(self.cache.get_collection("docs"), first)
+
+    def test_delete_collection(self):
+        self.cache.get_collection("docs").add(ids=["1"], embeddings=[[0.0, 1.0]])
+
+        self.cache.delete_collection("docs")
+        self.cache.delete_collection("missing")
+
+        self.assertEqual(self.cache.get_collection("docs").count(), 0)
+
+
+class TestSharedLayout(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        patchers = [
+            mock.patch.object(vector_store.Config, "CHROMA_DB_PATH", self.tmp_dir.name),
+            mock.patch.object(vector_store, "collection_cache", CollectionCache()),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_embedding_paths(self):
+        path = get_embedding_path("documents_0", "customer_data.csv")
+
+        self.assertEqual(parse_embedding_path(path), ("documents_0", "customer_data.csv"))
+        self.assertEqual(parse_embedding_path("customer_data.csv"), ("customer_data.csv", None))
+        self.assertIsNone(get_document_filters("customer_data.csv"))
+        self.assertEqual(get_document_filters(path).filters[0].value, "customer_data.csv")
+
+    def test_shared_collection_name_is_stable(self):
+        names = {get_shared_collection_name(f"customer-{i}", shards=4) for i in range(50)}
+
+        self.assertEqual(names, {f"documents_{i}" for i in range(4)})
+        self.assertEqual(
+            get_shared_collection_name("customer-1", shards=4),
+            get_shared_collection_name("customer-1", shards=4),
+        )
+
+    def test_delete_document_vectors(self):
+        shared = vector_store.collection_cache.get_collection("documents_0")
+        shared.add(
+            ids=[f"{key}/chunk" for key in ["customer_a.csv", "customer_b.csv"]],
+            embeddings=[[0.0, 1.0], [1.0, 0.0]],
+            metadatas=[{"document_key": key} for key in ["customer_a.csv", "customer_b.csv"]],
+        )
+        single = vector_store.collection_cache.get_collection("customer_c.csv")
+        single.add(ids=["chunk"], embeddings=[[0.0, 1.0]])
+
+        delete_document_vectors(get_embedding_path("documents_0", "customer_a.csv"))
+        delete_document_vectors("customer_c.csv")
+
+        self.assertEqual(shared.get(include=[])["ids"], ["customer_b.csv/chunk"])
+        # only the handles of a collection holding one document are dropped
+        self.assertIsNot(vector_store.collection_cache.get_collection("customer_c.csv"), single)
+        self.assertEqual(get_chroma_client().get_collection("customer_c.csv").count(), 1)
+
+    def test_migrate_to_shared_collection(self):
+        client = get_chroma_client()
+        client.create_collection("customer_data.csv").add(
+            ids=[f"chunk-{i}" for i in range(5)],
+            embeddings=[[float(i), 1.0] for i in range(5)],
+            documents=[f"text {i}" for i in range(5)],
+            metadatas=[{"file_name": "data.csv"} for _ in range(5)],
+        )
+
+        path = migrate_to_shared_collection(
+            "customer_data.csv", "customer", document_id=7, batch_size=2
+        )
+        # a second run copies nothing new
+        migrate_to_shared_collection("customer_data.csv", "customer", document_id=7)
+
+        collection_name, document_key = parse_embedding_path(path)
+        self.assertEqual(collection_name, "documents_0")
+        self.assertEqual(document_key, "customer_data.csv")
+        shared = client.get_collection(collection_name)
+        self.assertEqual(shared.count(), 5)
+        chunks = shared.get(where={"document_key": "customer_data.csv"}, include=["metadatas"])
+        self.assertIn("customer_data.csv/chunk-0", chunks["ids"])
+        self.assertEqual(
+            chunks["metadatas"][0],
+            {
+                "file_name": "data.csv",
+                "customer_uuid": "customer",
+                "document_key": "customer_data.csv",
+                "document_id": 7,
+            },
+        )
+        self.assertEqual(migrate_to_shared_collection(path, "customer"), path)
+
+    def test_document_scoped_query_matches_chroma(self):
+        rng = np.random.default_rng(0)
+        for space in ("l2", "cosine"):
+            collection = get_chroma_client().create_collection(
+                f"documents_{space}", metadata={"hnsw:space": space}
+            )
+            collection.add(
+                ids=[f"doc-{i % 3}/{i}" for i in range(30)],
+                embeddings=rng.random((30, 8)).tolist(),
+                documents=[f"text {i}" for i in range(30)],
+                metadatas=[{"document_key": f"doc-{i % 3}"} for i in range(30)],
+            )
+            query = rng.random(8).tolist()
+            where = {"document_key": {"$eq": "doc-1"}}
+
+            expected = collection.query(query_embeddings=[query], n_results=4, where=where)
+            actual = DocumentScopedCollection(collection).query(
+                query_embeddings=[query], n_results=4, where=where
+            )
+
+            self.assertEqual(actual["ids"], expected["ids"])
+            np.testing.assert_allclose(
+                actual["distances"][0], expected["distances"][0], rtol=1e-4, atol=1e-5
+            )
+            self.assertEqual(actual["documents"], expected["documents"])
@@ -0,0 +1,42 @@
+import argparse
+import signal
+from config import Config
+from helper.code_sandbox import code_sandbox
+from helper.ingestion import INGESTION_HANDLERS, ingestion_queue
+from helper.job_worker import JobWorker
+from helper.query_jobs import QUERY_HANDLERS, query_queue
+
+
+WORKERS = {
+    # the ingestion of uploaded documents
+    "ingestion": lambda: JobWorker(
+        ingestion_queue,
+        INGESTION_HANDLERS,
+        concurrency=Config.INGESTION_WORKER_CONCURRENCY,
+    ),
+    # the long excel, db and chart queries sent with `Prefer: respond-async`
+    "query": lambda: JobWorker(
+        query_queue,
+        QUERY_HANDLERS,
+        concurrency=Config.QUERY_WORKER_CONCURRENCY,
+    ),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queue", nargs="?", choices=sorted(WORKERS), default="ingestion")
+    args = parser.parse_args()
+
+    worker = WORKERS[args.queue]()
+    if args.queue == "query":
+        # the excel and chart queries run generated code in the sandbox workers
+        code_sandbox.start()
+
+    # finish the running jobs before exiting, unfinished ones are retried after their
+    # lease expires
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+
+    worker.run()
+    code_sandbox.shutdown()